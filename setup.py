@@ -119,6 +119,8 @@ setup(name='Zope2',
           'zopectl=Zope2.Startup.zopectl:run',
           'zpasswd=Zope2.utilities.zpasswd:main',
           'addzope2user=Zope2.utilities.adduser:main',
+          'zopebench=Zope2.utilities.benchmark:main',
+          'convertblobs=Zope2.utilities.convertblobs:main',
       ],
     },
 )
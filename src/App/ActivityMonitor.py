@@ -0,0 +1,141 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Database activity monitor keeping connection statistics
+
+The ZODB activity monitor only logs the loads and stores of the
+connections closed during its history.  This one also counts, since it
+was created or reset, how long opening a connection took (the wait for
+the database lock and for a connection of the pool, or for a new one),
+how many connections had to be created because the pool had none left,
+and the loads and stores per connection close, which is per request for
+the connections opened by the publisher.
+"""
+
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+from ZODB.ActivityMonitor import ActivityMonitor as BaseActivityMonitor
+
+
+class ActivityMonitor(BaseActivityMonitor):
+    """ZODB load/store activity monitor with connection statistics
+    """
+
+    def __init__(self, history_length=3600):
+        BaseActivityMonitor.__init__(self, history_length)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.since = time.time()
+            self.opened = 0
+            self.created = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.closed = 0
+            self.loads = 0
+            self.stores = 0
+            self.loads_max = 0
+            self.stores_max = 0
+            # connection -> [closes, loads, stores]
+            self._connections = WeakKeyDictionary()
+        finally:
+            self.lock.release()
+
+    def openedConnection(self, conn, wait):
+        """Record that opening 'conn' took 'wait' seconds
+        """
+        self.lock.acquire()
+        try:
+            self.opened += 1
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+            if conn not in self._connections:
+                self.created += 1
+                self._connections[conn] = [0, 0, 0]
+        finally:
+            self.lock.release()
+
+    def closedConnection(self, conn):
+        now = time.time()
+        loads, stores = conn.getTransferCounts(1)
+        self.log.append((now, loads, stores))
+        self.trim(now)
+        self.lock.acquire()
+        try:
+            self.closed += 1
+            self.loads += loads
+            self.stores += stores
+            if loads > self.loads_max:
+                self.loads_max = loads
+            if stores > self.stores_max:
+                self.stores_max = stores
+            counts = self._connections.get(conn)
+            if counts is None:
+                counts = self._connections[conn] = [0, 0, 0]
+            counts[0] += 1
+            counts[1] += loads
+            counts[2] += stores
+        finally:
+            self.lock.release()
+
+    def getConnectionCounts(self, conn):
+        """Return the closes, loads and stores of 'conn'
+        """
+        self.lock.acquire()
+        try:
+            return tuple(self._connections.get(conn, (0, 0, 0)))
+        finally:
+            self.lock.release()
+
+    def getStatistics(self):
+        """Return the counters as a mapping
+        """
+        self.lock.acquire()
+        try:
+            opened = self.opened
+            closed = self.closed
+            return {
+                'since': self.since,
+                'opened': opened,
+                'created': self.created,
+                'wait_avg': opened and self.wait_total / opened or 0.0,
+                'wait_max': self.wait_max,
+                'closed': closed,
+                'loads_avg': closed and float(self.loads) / closed or 0.0,
+                'loads_max': self.loads_max,
+                'stores_avg': closed and float(self.stores) / closed or 0.0,
+                'stores_max': self.stores_max,
+                }
+        finally:
+            self.lock.release()
+
+
+def openConnection(db, open=None):
+    """Open a connection of 'db', recording the wait with its monitor
+
+    'open' opens the connection, db.open by default.
+    """
+    if open is None:
+        open = db.open
+    start = time.time()
+    conn = open()
+    wait = time.time() - start
+    am = db.getActivityMonitor()
+    if am is not None and hasattr(am, 'openedConnection'):
+        am.openedConnection(conn, wait)
+    return conn
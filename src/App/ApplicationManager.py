@@ -35,6 +35,8 @@ from OFS.SimpleItem import SimpleItem
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from zExceptions import Redirect
 from ZPublisher import Publish
+from ZPublisher import retrypolicy
+from ZPublisher import timing
 
 LOG = getLogger('ApplicationManager')
 
@@ -52,6 +54,7 @@ class DatabaseManager(Item, Implicit):
         {'label':'Database', 'action':'manage_main'},
         {'label':'Activity', 'action':'manage_activity'},
         {'label':'Cache Parameters', 'action':'manage_cacheParameters'},
+        {'label':'Connections', 'action':'manage_connections'},
         {'label':'Flush Cache', 'action':'manage_cacheGC'},
         ))
 
@@ -60,6 +63,7 @@ class DatabaseManager(Item, Implicit):
     manage_activity = DTMLFile('dtml/activity', globals())
     manage_cacheParameters = DTMLFile('dtml/cacheParameters', globals())
     manage_cacheGC = DTMLFile('dtml/cacheGC', globals())
+    manage_connections = DTMLFile('dtml/connections', globals())
 
 InitializeClass(DatabaseManager)
 
@@ -112,6 +116,16 @@ class DatabaseChooser(SimpleItem):
             return self[name]
         return getattr(self, name)
 
+    def getConnectionStatistics(self):
+        """Return the connection statistics of the opened databases by name
+        """
+        opened = getConfiguration().dbtab.databases
+        res = {}
+        for name in self.getDatabaseNames():
+            if name in opened:
+                res[name] = self[name].getConnectionStatistics()
+        return res
+
     def tpValues(self):
         names = self.getDatabaseNames()
         res = []
@@ -142,6 +156,8 @@ class DebugManager(Item, Implicit):
     manage_options=((
         {'label':'Debugging Info', 'action':'manage_main'},
         {'label':'Profiling', 'action':'manage_profile'},
+        {'label':'Request Timing', 'action':'manage_timing'},
+        {'label':'Conflicts', 'action':'manage_conflicts'},
         ))
 
     manage_debug = DTMLFile('dtml/debug', globals())
@@ -236,6 +252,33 @@ class DebugManager(Item, Implicit):
     def manage_getSysPath(self):
         return list(sys.path)
 
+    # Request timing
+
+    manage_timing = DTMLFile('dtml/timing', globals())
+
+    def getRequestTimings(self):
+        return timing.statistics.getStatistics()
+
+    def getRequestTimingBuckets(self):
+        return timing.statistics.getBuckets()
+
+    def manage_timing_reset(self):
+        """ Reset request timing data
+        """
+        timing.statistics.reset()
+
+    # Conflict errors
+
+    manage_conflicts = DTMLFile('dtml/conflicts', globals())
+
+    def getConflictStatistics(self):
+        return retrypolicy.policy.getStatistics()
+
+    def manage_conflicts_reset(self):
+        """ Reset conflict error counters
+        """
+        retrypolicy.policy.reset()
+
 InitializeClass(DebugManager)
 
 
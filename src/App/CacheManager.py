@@ -15,9 +15,13 @@
 This class is mixed into the database manager in App.ApplicationManager.
 '''
 
+import heapq
+from operator import itemgetter
+
 from AccessControl.class_init import InitializeClass
 from App.special_dtml import DTMLFile
 from DateTime.DateTime import DateTime
+from ZODB.utils import oid_repr
 
 class CacheManager:
     """Cache management mix-in
@@ -28,6 +32,7 @@ class CacheManager:
 
     manage_cacheParameters = DTMLFile('dtml/cacheParameters', globals())
     manage_cacheGC = DTMLFile('dtml/cacheGC', globals())
+    manage_connections = DTMLFile('dtml/connections', globals())
 
     def _getDB(self):
         return self._p_jar.db()
@@ -70,6 +75,31 @@ class CacheManager:
             response=REQUEST['RESPONSE']
             response.redirect(REQUEST['URL1']+'/manage_cacheParameters')
 
+    def manage_cache_size_bytes(self, value, REQUEST=None):
+        "set cache size in bytes"
+        value = int(value)
+        if value < 0:
+            raise ValueError, 'size can not be negative'
+        self._getDB().setCacheSizeBytes(value)
+
+        if REQUEST is not None:
+            response = REQUEST['RESPONSE']
+            response.redirect(REQUEST['URL1'] + '/manage_connections')
+
+    def pool_size(self):
+        return self._getDB().getPoolSize()
+
+    def manage_pool_size(self, value, REQUEST=None):
+        "set connection pool size"
+        value = int(value)
+        if value < 1:
+            raise ValueError, 'pool size must be positive'
+        self._getDB().setPoolSize(value)
+
+        if REQUEST is not None:
+            response = REQUEST['RESPONSE']
+            response.redirect(REQUEST['URL1'] + '/manage_connections')
+
     def manage_full_sweep(self,value,REQUEST):
         "Perform a full sweep through the cache"
         db = self._getDB()
@@ -146,6 +176,85 @@ class CacheManager:
             return None
         return am
 
+    def getConnectionStatistics(self):
+        """Returns the connection pool and cache statistics of the database.
+
+        The connections are those of the pool, open or not, with the
+        objects and estimated bytes in their caches, and the requests
+        they served and their loads and stores since the activity
+        monitor was reset.  A load is a cache miss.
+        """
+        db = self._getDB()
+        am = self._getActivityMonitor()
+        connections = []
+
+        def f(conn):
+            cache = conn._cache
+            if am is not None and hasattr(am, 'getConnectionCounts'):
+                requests, loads, stores = am.getConnectionCounts(conn)
+            else:
+                requests = loads = stores = 0
+            connections.append({
+                'connection': repr(conn),
+                'open': conn.opened is not None,
+                'size': len(cache),
+                'ngsize': cache.cache_non_ghost_count,
+                'bytes': cache.total_estimated_size,
+                'requests': requests,
+                'loads': loads,
+                'stores': stores,
+                'loads_per_request': requests and float(loads) / requests,
+                })
+
+        db._connectionMap(f)
+        connections.sort(key=lambda info: info['connection'])
+        if am is not None and hasattr(am, 'getStatistics'):
+            stats = am.getStatistics()
+        else:
+            stats = {}
+        stats.update({
+            'pool_size': db.getPoolSize(),
+            'cache_size': db.getCacheSize(),
+            'cache_size_bytes': db.getCacheSizeBytes(),
+            'open': len([c for c in connections if c['open']]),
+            'connections': connections,
+            })
+        return stats
+
+    def getLargestCachedObjects(self, limit=20):
+        """Returns the objects in the caches with the largest estimated size.
+        """
+        objects = []
+
+        def f(conn):
+            name = repr(conn)
+            for oid, ob in conn._cache.lru_items():
+                objects.append((ob._p_estimated_size, oid, ob, name))
+
+        self._getDB()._connectionMap(f)
+        objects = heapq.nlargest(int(limit), objects, key=itemgetter(0))
+        res = []
+        for size, oid, ob, name in objects:
+            klass = ob.__class__
+            res.append({
+                'oid': oid_repr(oid),
+                'klass': '%s.%s' % (klass.__module__, klass.__name__),
+                'size': size,
+                'connection': name,
+                })
+        return res
+
+    def manage_resetConnectionStatistics(self, REQUEST=None):
+        """Reset the connection statistics of the activity monitor.
+        """
+        am = self._getActivityMonitor()
+        if am is not None and hasattr(am, 'reset'):
+            am.reset()
+
+        if REQUEST is not None:
+            response = REQUEST['RESPONSE']
+            response.redirect(REQUEST['URL1'] + '/manage_connections')
+
     def getHistoryLength(self):
         am = self._getActivityMonitor()
         if am is None:
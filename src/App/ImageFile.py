@@ -24,7 +24,11 @@ from App.Common import package_home
 from App.Common import rfc1123_date
 from App.config import getConfiguration
 from DateTime.DateTime import DateTime
+from zope.component import adapts
 from zope.contenttype import guess_content_type
+from zope.interface import implements
+from ZPublisher.HTTPResponse import compress_static
+from ZPublisher.interfaces import IHTTPValidators
 from ZPublisher.Iterators import filestream_iterator
 
 import Zope2
@@ -117,8 +121,21 @@ class ImageFile(Explicit):
                     RESPONSE.setStatus(304)
                     return ''
 
+        # Text resources are compressed once, on the first request
+        # accepting gzip.
+        compressed = compress_static(self, self._read, self.content_type,
+                                     REQUEST, RESPONSE)
+        if compressed is not None:
+            return compressed
         return filestream_iterator(self.path, mode='rb')
 
+    def _read(self):
+        f = open(self.path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
     security.declarePublic('HEAD')
     def HEAD(self, REQUEST, RESPONSE):
         """ """
@@ -134,3 +151,22 @@ class ImageFile(Explicit):
         return '<img src="%s" alt="" />' % self.__name__
 
 InitializeClass(ImageFile)
+
+
+class ImageFileValidators(object):
+    """HTTP validators of image files
+
+    Lets the publisher answer conditional requests for 'index_html'.
+    """
+
+    implements(IHTTPValidators)
+    adapts(ImageFile)
+
+    def __init__(self, context):
+        self.context = context
+
+    def getETag(self):
+        return None
+
+    def getLastModified(self):
+        return getattr(self.context, 'lmt', None)
@@ -19,6 +19,8 @@ and used when bobo publishes a bobo_application object.
 
 import transaction
 
+from App.ActivityMonitor import openConnection
+
 connection_open_hooks = []
 
 class ZApplicationWrapper:
@@ -40,12 +42,16 @@ class ZApplicationWrapper:
 
     def __bobo_traverse__(self, REQUEST=None, name=None):
         db, aname = self._stuff
-        conn = db.open()
+        conn = openConnection(db)
 
         if connection_open_hooks:
             for hook in connection_open_hooks:
                 hook(conn)
 
+        timer = getattr(REQUEST, '_timer', None)
+        if timer is not None:
+            timer.watchConnection(conn)
+
         # arrange for the connection to be closed when the request goes away
         cleanup = Cleanup(conn)
         REQUEST._hold(cleanup)
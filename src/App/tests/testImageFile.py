@@ -39,6 +39,49 @@ class TestImageFile(unittest.TestCase):
         App.ImageFile.ImageFile('www/zopelogo.png', prefix)
         self.assertFalse(self.warningshook.warnings)
 
+    def test_index_html_compressed(self):
+        import tempfile
+        import zlib
+        from ZPublisher.HTTPRequest import HTTPRequest
+        from ZPublisher.HTTPResponse import HTTPResponse
+        fd, path = tempfile.mkstemp('.css')
+        try:
+            os.write(fd, 'body { color: black; }\n' * 100)
+            os.close(fd)
+            image = App.ImageFile.ImageFile(path)
+            response = HTTPResponse()
+            request = HTTPRequest(None, {'SERVER_NAME': 'localhost',
+                                         'SERVER_PORT': '80',
+                                         'HTTP_ACCEPT_ENCODING': 'gzip'},
+                                  response)
+            result = image.index_html(request, response)
+            self.assertEqual(response.getHeader('Content-Encoding'), 'gzip')
+            self.assertEqual(response.getHeader('Content-Length'),
+                             str(len(result)))
+            self.assertEqual(zlib.decompress(result, 16 + zlib.MAX_WBITS),
+                             'body { color: black; }\n' * 100)
+            # The compressed data is reused, even if the file is gone
+            os.remove(path)
+            response = HTTPResponse()
+            self.assertTrue(image.index_html(request, response) is result)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_index_html_not_compressed_wo_accept_encoding(self):
+        from ZPublisher.HTTPRequest import HTTPRequest
+        from ZPublisher.HTTPResponse import HTTPResponse
+        from ZPublisher.Iterators import filestream_iterator
+        prefix = os.path.dirname(App.__file__)
+        image = App.ImageFile.ImageFile('www/zopelogo.png', prefix)
+        response = HTTPResponse()
+        request = HTTPRequest(None, {'SERVER_NAME': 'localhost',
+                                     'SERVER_PORT': '80'}, response)
+        result = image.index_html(request, response)
+        self.assertTrue(isinstance(result, filestream_iterator))
+        result.close()
+        self.assertEqual(response.getHeader('Content-Encoding'), None)
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(TestImageFile),
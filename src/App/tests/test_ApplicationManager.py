@@ -77,6 +77,20 @@ class DatabaseChooserTests(ConfigTestBase, unittest.TestCase):
         self.assertTrue(isinstance(conn, FakeConnection))
         self.assertTrue(conn.db() is foo)
 
+    def test_getConnectionStatistics(self):
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        db = DB(MappingStorage())
+        config = self._makeConfig(foo=db, bar=object())
+        # bar wasn't opened yet
+        del config.dbtab.databases['bar']
+        root = self._makeRoot()
+        dc = self._makeOne('test').__of__(root)
+        stats = dc.getConnectionStatistics()
+        self.assertEqual(stats.keys(), ['foo'])
+        self.assertEqual(stats['foo']['pool_size'], db.getPoolSize())
+        db.close()
+
     def test___bobo_traverse___miss(self):
         self._makeConfig(foo=object(), bar=object(), qux=object())
         dc = self._makeOne('test')
@@ -471,6 +485,7 @@ class AltDatabaseManagerTests(DBProxyTestsBase,
 class DummyDBTab:
     def __init__(self, databases=None):
         self._databases = databases or {}
+        self.databases = dict(self._databases)
 
     def listDatabaseNames(self):
         return self._databases.keys()
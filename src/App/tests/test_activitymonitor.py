@@ -0,0 +1,72 @@
+import unittest
+
+
+class ActivityMonitorTests(unittest.TestCase):
+
+    def setUp(self):
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        self.db = DB(MappingStorage())
+        self.db.setActivityMonitor(self._makeOne())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _makeOne(self):
+        from App.ActivityMonitor import ActivityMonitor
+        return ActivityMonitor()
+
+    def _open(self):
+        from App.ActivityMonitor import openConnection
+        return openConnection(self.db)
+
+    def _store(self, conn, name, value):
+        import transaction
+        conn.root()[name] = value
+        transaction.commit()
+
+    def test_transfer_counts(self):
+        from persistent.mapping import PersistentMapping
+        conn = self._open()
+        self._store(conn, 'a', PersistentMapping())
+        conn.close()
+        conn = self._open()
+        conn.root()['a'].keys()
+        conn.close()
+        am = self.db.getActivityMonitor()
+        stats = am.getStatistics()
+        self.assertEqual(stats['closed'], 2)
+        self.assertEqual(stats['stores_avg'], 1.0)
+        self.assertEqual(stats['stores_max'], 2)
+        self.assertEqual(am.getConnectionCounts(conn), (2, am.loads, 2))
+        # the ZODB log is still kept for the activity chart
+        self.assertEqual(len(am.log), 2)
+
+    def test_waits(self):
+        am = self.db.getActivityMonitor()
+        first = self._open()
+        second = self._open()
+        first.close()
+        self._open().close()
+        stats = am.getStatistics()
+        self.assertEqual(stats['opened'], 3)
+        # the third open reused the first connection from the pool
+        self.assertEqual(stats['created'], 2)
+        self.failUnless(stats['wait_max'] >= stats['wait_avg'] >= 0)
+        second.close()
+
+    def test_reset(self):
+        am = self.db.getActivityMonitor()
+        self._open().close()
+        am.reset()
+        stats = am.getStatistics()
+        self.assertEqual((stats['opened'], stats['closed']), (0, 0))
+        self.assertEqual(stats['loads_avg'], 0.0)
+
+    def test_openConnection_without_monitor(self):
+        self.db.setActivityMonitor(None)
+        self._open().close()
+
+
+def test_suite():
+    return unittest.makeSuite(ActivityMonitorTests)
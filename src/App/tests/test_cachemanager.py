@@ -58,5 +58,94 @@ class CacheManagerTestCase(unittest.TestCase):
         self.assertEqual(manager.cache_size(), 12)
 
 
+class ConnectionStatisticsTests(unittest.TestCase):
+
+    def setUp(self):
+        from App.ActivityMonitor import ActivityMonitor
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        self.db = DB(MappingStorage(), pool_size=3)
+        self.db.setActivityMonitor(ActivityMonitor())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _makeOne(self):
+        from App.CacheManager import CacheManager
+        manager = CacheManager()
+        manager._getDB = lambda: self.db
+        return manager
+
+    def _populate(self):
+        import transaction
+        from persistent.mapping import PersistentMapping
+        from App.ActivityMonitor import openConnection
+        conn = openConnection(self.db)
+        root = conn.root()
+        root['small'] = PersistentMapping()
+        root['large'] = PersistentMapping({'data': 'x' * 10000})
+        transaction.commit()
+        return conn
+
+    def test_getConnectionStatistics(self):
+        conn = self._populate()
+        stats = self._makeOne().getConnectionStatistics()
+        self.assertEqual(stats['pool_size'], 3)
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['opened'], 1)
+        info, = stats['connections']
+        self.assertEqual(info['open'], True)
+        self.assertEqual(info['requests'], 0)
+        conn.close()
+        stats = self._makeOne().getConnectionStatistics()
+        self.assertEqual(stats['open'], 0)
+        info, = stats['connections']
+        self.assertEqual((info['requests'], info['stores']), (1, 3))
+        self.assertEqual(stats['stores_max'], 3)
+
+    def test_getConnectionStatistics_plain_monitor(self):
+        from ZODB.ActivityMonitor import ActivityMonitor
+        self.db.setActivityMonitor(ActivityMonitor())
+        self._populate().close()
+        stats = self._makeOne().getConnectionStatistics()
+        self.failIf('since' in stats)
+        self.assertEqual(stats['connections'][0]['requests'], 0)
+
+    def test_getLargestCachedObjects(self):
+        conn = self._populate()
+        largest = self._makeOne().getLargestCachedObjects(2)
+        self.assertEqual(len(largest), 2)
+        from ZODB.utils import oid_repr
+        self.assertEqual(largest[0]['oid'],
+                         oid_repr(conn.root()['large']._p_oid))
+        self.assertEqual(largest[0]['klass'],
+                         'persistent.mapping.PersistentMapping')
+        self.failUnless(largest[0]['size'] >= 10000)
+        self.failUnless(largest[1]['size'] < 10000)
+        conn.close()
+
+    def test_manage_pool_size(self):
+        manager = self._makeOne()
+        manager.manage_pool_size('5')
+        self.assertEqual(self.db.getPoolSize(), 5)
+        self.assertEqual(manager.pool_size(), 5)
+        self.assertRaises(ValueError, manager.manage_pool_size, 0)
+
+    def test_manage_cache_size_bytes(self):
+        manager = self._makeOne()
+        manager.manage_cache_size_bytes(1 << 20)
+        self.assertEqual(self.db.getCacheSizeBytes(), 1 << 20)
+        self.assertEqual(manager.cache_length_bytes(), 1 << 20)
+
+    def test_manage_resetConnectionStatistics(self):
+        self._populate().close()
+        manager = self._makeOne()
+        manager.manage_resetConnectionStatistics()
+        self.assertEqual(manager.getConnectionStatistics()['closed'], 0)
+
+
 def test_suite():
-    return unittest.makeSuite(CacheManagerTestCase)
+    return unittest.TestSuite((
+        unittest.makeSuite(CacheManagerTestCase),
+        unittest.makeSuite(ConnectionStatisticsTests),
+    ))
@@ -23,6 +23,16 @@ _shutdown_timeout = 30 # seconds per phase
 # of time that it has currently been in that phase. This method should return
 # true if it does not yet want shutdown to proceed to the next phase.
 
+# The function polling the sockets in the main loop, called with a timeout
+# and the socket map like asyncore.poll
+_poll = asyncore.poll
+
+def setPoller(poll):
+    # Make the main loop poll its sockets with 'poll' instead of
+    # asyncore.poll, e.g. with an epoll based poller
+    global _poll
+    _poll = poll
+
 def shutdown(exit_code,fast = 0):
     global _shutdown_phase
     global _shutdown_timeout
@@ -50,7 +60,7 @@ def lifetime_loop():
     map = asyncore.socket_map
     timeout = 30.0
     while map and _shutdown_phase == 0:
-        asyncore.poll(timeout, map)
+        _poll(timeout, map)
 
         
 def graceful_shutdown_loop():
@@ -75,7 +85,7 @@ def graceful_shutdown_loop():
         if veto and time_in_this_phase<_shutdown_timeout:
             # Any open socket handler can veto moving on to the next shutdown
             # phase.  (but not forever)
-            asyncore.poll(timeout, map)
+            _poll(timeout, map)
         else:
             # No vetos? That is one step closer to shutting down
             _shutdown_phase += 1
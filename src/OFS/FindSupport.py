@@ -13,7 +13,12 @@
 """Find support
 """
 
+import Queue
 from string import translate
+import sys
+import threading
+
+import transaction
 
 from AccessControl import ClassSecurityInfo
 from AccessControl.class_init import InitializeClass
@@ -69,83 +74,20 @@ class FindSupport(Base):
                  REQUEST=None, result=None, pre=''):
         """Zope Find interface"""
 
+        criteria = FindCriteria(obj_ids, obj_metatypes,
+                                obj_searchterm, obj_expr,
+                                obj_mtime, obj_mspec,
+                                obj_permission, obj_roles,
+                                prepare=result is None)
         if result is None:
             result=[]
 
-            if obj_metatypes and 'all' in obj_metatypes:
-                obj_metatypes=None
-
-            if obj_mtime and type(obj_mtime)==type('s'):
-                obj_mtime=DateTime(obj_mtime).timeTime()
-
-            if obj_permission:
-                obj_permission=p_name(obj_permission)
-
-            if obj_roles and type(obj_roles) is type('s'):
-                obj_roles=[obj_roles]
-
-            if obj_expr:
-                # Setup expr machinations
-                md=td()
-                obj_expr=(Eval(obj_expr), md, md._push, md._pop)
-
-        base = aq_base(obj)
-
-        if hasattr(base, 'objectItems'):
-            try:    items=obj.objectItems()
-            except: return result
-        else:
-            return result
-
         try: add_result=result.append
         except:
             raise AttributeError, `result`
 
-        for id, ob in items:
-            if pre: p="%s/%s" % (pre, id)
-            else:   p=id
-
-            dflag=0
-            if hasattr(ob, '_p_changed') and (ob._p_changed == None):
-                dflag=1
-
-            bs = aq_base(ob)
-            if (
-                (not obj_ids or absattr(bs.getId()) in obj_ids)
-                and
-                (not obj_metatypes or (hasattr(bs, 'meta_type') and
-                 bs.meta_type in obj_metatypes))
-                and
-                (not obj_searchterm or
-                 (hasattr(ob, 'PrincipiaSearchSource') and
-                  ob.PrincipiaSearchSource().find(str(obj_searchterm)) >= 0
-                  )
-                 or
-                 (hasattr(ob, 'SearchableText') and
-                  ob.SearchableText().find(str(obj_searchterm)) >= 0)
-                 )
-                and
-                (not obj_expr or expr_match(ob, obj_expr))
-                and
-                (not obj_mtime or mtime_match(ob, obj_mtime, obj_mspec))
-                and
-                ( (not obj_permission or not obj_roles) or \
-                   role_match(ob, obj_permission, obj_roles)
-                )
-                ):
-                add_result((p, ob))
-                dflag=0
-
-            if search_sub and (hasattr(bs, 'objectItems')):
-                subob = ob
-                sub_p = p
-                self.ZopeFind(subob, obj_ids, obj_metatypes,
-                                   obj_searchterm, obj_expr,
-                                   obj_mtime, obj_mspec,
-                                   obj_permission, obj_roles,
-                                   search_sub,
-                                   REQUEST, result, sub_p)
-            if dflag: ob._p_deactivate()
+        for found in _find(obj, criteria, search_sub, pre, keep_found=1):
+            add_result(found)
 
         return result
 
@@ -154,6 +96,33 @@ class FindSupport(Base):
     security.declareProtected(view_management_screens, 'PrincipiaFind')
     PrincipiaFind=ZopeFind
 
+    security.declareProtected(view_management_screens, 'ZopeFindIter')
+    def ZopeFindIter(self, obj, obj_ids=None, obj_metatypes=None,
+                     obj_searchterm=None, obj_expr=None,
+                     obj_mtime=None, obj_mspec=None,
+                     obj_permission=None, obj_roles=None,
+                     search_sub=0,
+                     REQUEST=None, pre='', workers=0):
+        """Zope Find interface generating the results
+
+        The (path, object) pairs are generated as they are found, and
+        the objects which were ghosts are ghosted again once they and
+        their subobjects were looked at.  With 'workers', the subtrees
+        of 'obj' are walked by as many threads with connections of
+        their own, and the results come in no particular order.  The
+        workers see the last committed state of the database, so the
+        search is only done in parallel when the current transaction
+        holds no changes, and the objects found which no longer exist
+        in the current transaction's view are left out.
+        """
+        criteria = FindCriteria(obj_ids, obj_metatypes,
+                                obj_searchterm, obj_expr,
+                                obj_mtime, obj_mspec,
+                                obj_permission, obj_roles)
+        if workers > 0 and search_sub:
+            return _parallelFind(obj, criteria, pre, workers)
+        return _find(obj, criteria, search_sub, pre)
+
     security.declareProtected(view_management_screens, 'ZopeFindAndApply')
     def ZopeFindAndApply(self, obj, obj_ids=None, obj_metatypes=None,
                          obj_searchterm=None, obj_expr=None,
@@ -161,12 +130,57 @@ class FindSupport(Base):
                          obj_permission=None, obj_roles=None,
                          search_sub=0,
                          REQUEST=None, result=None, pre='',
-                         apply_func=None, apply_path=''):
+                         apply_func=None, apply_path='', workers=0):
         """Zope Find interface and apply"""
 
+        criteria = FindCriteria(obj_ids, obj_metatypes,
+                                obj_searchterm, obj_expr,
+                                obj_mtime, obj_mspec,
+                                obj_permission, obj_roles,
+                                prepare=result is None,
+                                searchable_text=False)
         if result is None:
             result=[]
 
+        try: add_result=result.append
+        except:
+            raise AttributeError, `result`
+
+        if workers > 0 and search_sub:
+            found = _parallelFind(obj, criteria, pre, workers)
+        else:
+            found = _find(obj, criteria, search_sub, pre,
+                          keep_found=not apply_func)
+        for p, ob in found:
+            if apply_func:
+                apply_func(ob, (apply_path+'/'+p))
+            else:
+                add_result((p, ob))
+
+        return result
+
+InitializeClass(FindSupport)
+
+
+class td(RestrictedDTML, TemplateDict):
+    pass
+
+
+class FindCriteria:
+    """What ZopeFind looks for
+
+    Unless 'prepare' is false, the arguments are given as by the find
+    form: the meta types may include 'all', the modification time may
+    be a string, the permission is a name and the expression is a
+    source.
+    """
+
+    def __init__(self, obj_ids=None, obj_metatypes=None,
+                 obj_searchterm=None, obj_expr=None,
+                 obj_mtime=None, obj_mspec=None,
+                 obj_permission=None, obj_roles=None,
+                 prepare=1, searchable_text=1):
+        if prepare:
             if obj_metatypes and 'all' in obj_metatypes:
                 obj_metatypes=None
 
@@ -184,68 +198,241 @@ class FindSupport(Base):
                 md=td()
                 obj_expr=(Eval(obj_expr), md, md._push, md._pop)
 
-        base = aq_base(obj)
-
-        if not hasattr(base, 'objectItems'):
-            return result
+        self.ids = obj_ids
+        self.metatypes = obj_metatypes
+        self.searchterm = obj_searchterm
+        self.expr = obj_expr
+        self.mtime = obj_mtime
+        self.mspec = obj_mspec
+        self.permission = obj_permission
+        self.roles = obj_roles
+        self.searchable_text = searchable_text
+
+    def needsContext(self):
+        """Tell whether matching needs the acquisition context
+        """
+        return bool(self.expr or (self.permission and self.roles))
+
+    def wants(self, id, meta_type):
+        """Tell whether an object of 'id' and 'meta_type' may match
+
+        This is known from the meta data kept by the container, without
+        loading the object.
+        """
+        return ((not self.ids or id in self.ids) and
+                (not self.metatypes or meta_type in self.metatypes))
+
+    def match(self, ob):
+        """Tell whether 'ob' matches
+        """
+        bs = aq_base(ob)
+        searchterm = self.searchterm
+        if self.searchable_text:
+            searchterm = str(searchterm)
+        return (
+            (not self.ids or absattr(bs.getId()) in self.ids)
+            and
+            (not self.metatypes or (hasattr(bs, 'meta_type') and
+             bs.meta_type in self.metatypes))
+            and
+            (not self.searchterm or
+             (hasattr(ob, 'PrincipiaSearchSource') and
+              ob.PrincipiaSearchSource().find(searchterm) >= 0
+              )
+             or
+             (self.searchable_text and hasattr(ob, 'SearchableText') and
+              ob.SearchableText().find(searchterm) >= 0)
+             )
+            and
+            (not self.expr or expr_match(ob, self.expr))
+            and
+            (not self.mtime or mtime_match(ob, self.mtime, self.mspec))
+            and
+            ( (not self.permission or not self.roles) or \
+               role_match(ob, self.permission, self.roles)
+            )
+            )
+
+
+def _contents(obj, criteria, search_sub):
+    # Generate the (id, subobject, wanted) triples of the subobjects of
+    # obj to look at.  When the container keeps the meta types of its
+    # subobjects, the ones which can't match aren't looked at, and
+    # aren't even got if the subobjects aren't searched.
+    from OFS.ObjectManager import ObjectManager
+    base = aq_base(obj)
+    if not hasattr(base, 'objectItems'):
+        return
+    objectItems = getattr(base.__class__, 'objectItems', None)
+    if getattr(objectItems, 'im_func', objectItems) is \
+       ObjectManager.objectItems.im_func:
+        try:    entries=obj.objectMap()
+        except: return
+        for entry in entries:
+            id = entry['id']
+            wanted = criteria.wants(id, entry['meta_type'])
+            if wanted or search_sub:
+                ob = obj._getOb(id, None)
+                if ob is not None:
+                    yield id, ob, wanted
+    else:
         try:    items=obj.objectItems()
-        except: return result
+        except: return
+        for id, ob in items:
+            yield id, ob, 1
 
-        try: add_result=result.append
-        except:
-            raise AttributeError, `result`
 
-        for id, ob in items:
-            if pre: p="%s/%s" % (pre, id)
-            else:   p=id
-
-            dflag=0
-            if hasattr(ob, '_p_changed') and (ob._p_changed == None):
-                dflag=1
-
-            bs = aq_base(ob)
-            if (
-                (not obj_ids or absattr(bs.getId()) in obj_ids)
-                and
-                (not obj_metatypes or (hasattr(bs, 'meta_type') and
-                 bs.meta_type in obj_metatypes))
-                and
-                (not obj_searchterm or
-                 (hasattr(ob, 'PrincipiaSearchSource') and
-                  ob.PrincipiaSearchSource().find(obj_searchterm) >= 0
-                  ))
-                and
-                (not obj_expr or expr_match(ob, obj_expr))
-                and
-                (not obj_mtime or mtime_match(ob, obj_mtime, obj_mspec))
-                and
-                ( (not obj_permission or not obj_roles) or \
-                   role_match(ob, obj_permission, obj_roles)
-                )
-                ):
-                if apply_func:
-                    apply_func(ob, (apply_path+'/'+p))
-                else:
-                    add_result((p, ob))
-                    dflag=0
-
-            if search_sub and hasattr(bs, 'objectItems'):
-                self.ZopeFindAndApply(ob, obj_ids, obj_metatypes,
-                                      obj_searchterm, obj_expr,
-                                      obj_mtime, obj_mspec,
-                                      obj_permission, obj_roles,
-                                      search_sub,
-                                      REQUEST, result, p,
-                                      apply_func, apply_path)
-            if dflag: ob._p_deactivate()
+def _isContainer(ob):
+    # Ask the class, which doesn't load a ghost
+    return hasattr(aq_base(ob).__class__, 'objectItems')
 
-        return result
 
-InitializeClass(FindSupport)
+def _find(obj, criteria, search_sub, pre='', keep_found=0, _subtree=None):
+    # Generate the (path, object) pairs found in obj.  The objects found
+    # are ghosted again too unless keep_found.  With _subtree, the
+    # subobjects which are persistent containers holding no changes are
+    # passed to it rather than searched.
+    for id, ob, wanted in _contents(obj, criteria, search_sub):
+        if pre: p="%s/%s" % (pre, id)
+        else:   p=id
 
+        bs = aq_base(ob)
+        dflag = getattr(bs, '_p_changed', 0) is None
 
-class td(RestrictedDTML, TemplateDict):
-    pass
+        if wanted and criteria.match(ob):
+            yield p, ob
+            if keep_found:
+                dflag=0
+
+        if search_sub and _isContainer(bs):
+            if (_subtree is not None and
+                getattr(bs, '_p_oid', None) is not None and
+                not getattr(bs, '_p_changed', 0)):
+                _subtree(id, p, bs._p_oid)
+            else:
+                for found in _find(ob, criteria, search_sub, p, keep_found):
+                    yield found
+        if dflag: bs._p_deactivate()
+
+
+def _parallelFind(obj, criteria, pre, workers):
+    # Search the subtrees of obj in worker threads.  The workers have
+    # connections of their own, which don't see the changes of the
+    # current transaction, and which may see a more recent state than
+    # the connection of obj.  The changes could be anywhere below obj, so
+    # everything is searched here when the connection holds any, as it
+    # is when matching needs the acquisition context of the objects.
+    jar = getattr(aq_base(obj), '_p_jar', None)
+    if (jar is None or getattr(jar, '_registered_objects', None) or
+        criteria.needsContext()):
+        return _find(obj, criteria, 1, pre)
+    return _ParallelFind(jar.db(), obj, criteria, pre, workers)
+
+
+class _ParallelFind:
+
+    # The most results the workers may hold before the consumer takes them
+    queue_size = 100
+
+    def __init__(self, db, obj, criteria, pre, workers):
+        self.db = db
+        self.obj = obj
+        self.criteria = criteria
+        self.pre = pre
+        self.workers = workers
+        self.tasks = Queue.Queue()
+        self.results = Queue.Queue(self.queue_size)
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+        try:
+            running = self.workers
+            local = _find(self.obj, self.criteria, 1, self.pre,
+                          _subtree=self.submit)
+            for found in local:
+                yield found
+                for found in self.ready(block=False):
+                    yield found
+            for thread in threads:
+                self.tasks.put(None)
+            while running:
+                for found in self.ready(block=True):
+                    if found is None:
+                        running -= 1
+                    else:
+                        yield found
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                self.tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+    def submit(self, id, p, oid):
+        self.tasks.put((id, p, oid))
+
+    def ready(self, block):
+        # Generate the results of the workers, resolved in the
+        # connection of obj, and None for each worker done.  Objects
+        # added after the connection's snapshot are left out.
+        while 1:
+            try:
+                item = self.results.get(block)
+            except Queue.Empty:
+                return
+            block = False
+            if item is None:
+                yield None
+                continue
+            if isinstance(item, tuple) and len(item) == 3:
+                raise item[0], item[1], item[2]
+            ob = self.obj
+            try:
+                for id in item.split('/'):
+                    ob = ob._getOb(id)
+            except (AttributeError, KeyError):
+                continue
+            if self.pre:
+                yield "%s/%s" % (self.pre, item), ob
+            else:
+                yield item, ob
+
+    def put(self, item):
+        while not self.stopped.isSet():
+            try:
+                self.results.put(item, True, 0.1)
+            except Queue.Full:
+                continue
+            return
+
+    def work(self):
+        conn = self.db.open(transaction_manager=transaction.TransactionManager())
+        try:
+            try:
+                while not self.stopped.isSet():
+                    task = self.tasks.get()
+                    if task is None:
+                        break
+                    id, p, oid = task
+                    ob = conn.get(oid)
+                    dflag = ob._p_changed is None
+                    for path, found in _find(ob, self.criteria, 1, id):
+                        self.put(path)
+                        if self.stopped.isSet():
+                            break
+                    if dflag: ob._p_deactivate()
+            except:
+                self.put(sys.exc_info())
+        finally:
+            conn.transaction_manager.abort()
+            conn.close()
+            self.put(None)
 
 
 def expr_match(ob, ed, c=InstanceDict, r=0):
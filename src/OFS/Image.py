@@ -16,6 +16,7 @@
 from cgi import escape
 from cStringIO import StringIO
 from mimetools import choose_boundary
+import os
 import struct
 
 from AccessControl.class_init import InitializeClass
@@ -26,6 +27,7 @@ from AccessControl.Permissions import ftp_access
 from AccessControl.Permissions import delete_objects
 from AccessControl.SecurityInfo import ClassSecurityInfo
 from Acquisition import Implicit
+from Acquisition import aq_base
 from App.special_dtml import DTMLFile
 from DateTime.DateTime import DateTime
 from Persistence import Persistent
@@ -34,7 +36,13 @@ from webdav.interfaces import IWriteLock
 from webdav.Lockable import ResourceLockedError
 from ZPublisher import HTTPRangeSupport
 from ZPublisher.HTTPRequest import FileUpload
+from ZPublisher.interfaces import IHTTPValidators
+from ZPublisher.Iterators import filestream_iterator
 from zExceptions import Redirect
+from ZODB.blob import Blob
+from ZODB.interfaces import BlobError
+import transaction
+from zope.component import adapts
 from zope.contenttype import guess_content_type
 from zope.interface import implementedBy
 from zope.interface import implements
@@ -54,10 +62,11 @@ manage_addFileForm = DTMLFile('dtml/imageAdd',
                               kind='file',
                              )
 def manage_addFile(self, id, file='', title='', precondition='',
-                   content_type='', REQUEST=None):
+                   content_type='', REQUEST=None, blob=False):
     """Add a new File object.
 
-    Creates a new File object 'id' with the contents of 'file'"""
+    Creates a new File object 'id' with the contents of 'file'. If 'blob'
+    is true, the contents are stored in a ZODB blob."""
 
     id = str(id)
     title = str(title)
@@ -69,7 +78,8 @@ def manage_addFile(self, id, file='', title='', precondition='',
     self=self.this()
 
     # First, we create the file without data:
-    self._setObject(id, File(id,title,'',content_type, precondition))
+    self._setObject(id, File(id, title, '', content_type, precondition,
+                             blob=blob))
     
     newFile = self._getOb(id)
     
@@ -106,6 +116,9 @@ class File(Persistent, Implicit, PropertyManager,
 
     precondition=''
     size=None
+    # The ZODB blob holding the data, if the file uses blob storage. The
+    # 'data' attribute is empty then.
+    _blob=None
 
     manage_editForm  =DTMLFile('dtml/fileEdit',globals(),
                                Kind='File',kind='file')
@@ -131,10 +144,13 @@ class File(Persistent, Implicit, PropertyManager,
                  {'id':'content_type', 'type':'string'},
                  )
 
-    def __init__(self, id, title, file, content_type='', precondition=''):
+    def __init__(self, id, title, file, content_type='', precondition='',
+                 blob=False):
         self.__name__=id
         self.title=title
         self.precondition=precondition
+        if blob:
+            self._blob = Blob()
 
         data, size = self._read_data(file)
         content_type=self._get_content_type(file, data, id, content_type)
@@ -185,6 +201,9 @@ class File(Persistent, Implicit, PropertyManager,
             if if_range is not None:
                 # Only send ranges if the data isn't modified, otherwise send
                 # the whole object. Support both ETags and Last-Modified dates!
+                # The ETag header is sent quoted, see FileValidators.
+                if len(if_range) > 1 and if_range[0] == '"':
+                    if_range = if_range[1:-1]
                 if len(if_range) > 1 and if_range[:2] == 'ts':
                     # ETag:
                     if if_range != self.http__etag():
@@ -243,34 +262,19 @@ class File(Persistent, Implicit, PropertyManager,
                         'bytes %d-%d/%d' % (start, end - 1, self.size))
                     RESPONSE.setStatus(206) # Partial content
 
+                    if self._blob is not None:
+                        for chunk in blob_chunks(self._blob, start, end):
+                            RESPONSE.write(chunk)
+                        return True
+
                     data = self.data
                     if isinstance(data, str):
                         RESPONSE.write(data[start:end])
                         return True
 
-                    # Linked Pdata objects. Urgh.
-                    pos = 0
-                    while data is not None:
-                        l = len(data.data)
-                        pos = pos + l
-                        if pos > start:
-                            # We are within the range
-                            lstart = l - (pos - start)
-
-                            if lstart < 0: lstart = 0
-
-                            # find the endpoint
-                            if end <= pos:
-                                lend = l - (pos - end)
-
-                                # Send and end transmission
-                                RESPONSE.write(data[lstart:lend])
-                                break
-
-                            # Not yet at the end, transmit what we have.
-                            RESPONSE.write(data[lstart:])
-
-                        data = data.next
+                    # Linked Pdata objects.
+                    for chunk in pdata_chunks(data, start, end):
+                        RESPONSE.write(chunk)
 
                     return True
 
@@ -315,48 +319,22 @@ class File(Persistent, Implicit, PropertyManager,
                             'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
                                 start, end - 1, self.size))
 
-                        if isinstance(data, str):
+                        if self._blob is not None:
+                            for chunk in blob_chunks(self._blob, start, end):
+                                RESPONSE.write(chunk)
+
+                        elif isinstance(data, str):
                             RESPONSE.write(data[start:end])
 
                         else:
-                            # Yippee. Linked Pdata objects. The following
-                            # calculations allow us to fast-forward through the
-                            # Pdata chain without a lot of dereferencing if we
-                            # did the work already.
-                            first_size = len(pdata_map[0].data)
-                            if start < first_size:
-                                closest_pos = 0
-                            else:
-                                closest_pos = (
-                                    ((start - first_size) >> 16 << 16) +
-                                    first_size)
-                            pos = min(closest_pos, max(pdata_map.keys()))
-                            data = pdata_map[pos]
-
-                            while data is not None:
-                                l = len(data.data)
-                                pos = pos + l
-                                if pos > start:
-                                    # We are within the range
-                                    lstart = l - (pos - start)
-
-                                    if lstart < 0: lstart = 0
-
-                                    # find the endpoint
-                                    if end <= pos:
-                                        lend = l - (pos - end)
-
-                                        # Send and loop to next range
-                                        RESPONSE.write(data[lstart:lend])
-                                        break
-
-                                    # Not yet at the end, transmit what we have.
-                                    RESPONSE.write(data[lstart:])
-
-                                data = data.next
-                                # Store a reference to a Pdata chain link so we
-                                # don't have to deref during this request again.
-                                pdata_map[pos] = data
+                            # Linked Pdata objects. Start at the closest link
+                            # we already know the offset of, so we can
+                            # fast-forward through the Pdata chain without a
+                            # lot of dereferencing if we did the work already.
+                            pos = max([p for p in pdata_map if p <= start])
+                            for chunk in pdata_chunks(pdata_map[pos], start,
+                                                      end, pos, pdata_map):
+                                RESPONSE.write(chunk)
 
                     # Do not keep the link references around.
                     del pdata_map
@@ -413,14 +391,24 @@ class File(Persistent, Implicit, PropertyManager,
 
         self.ZCacheable_set(None)
 
+        if self._blob is not None:
+            try:
+                # Let the server send the committed blob file, so the data
+                # never has to pass through the ZODB or this thread.
+                return filestream_iterator(self._blob.committed(), 'rb')
+            except BlobError:
+                # Changed in this transaction, there is no committed file.
+                for chunk in blob_chunks(self._blob):
+                    RESPONSE.write(chunk)
+                return ''
+
         data=self.data
         if isinstance(data, str):
             RESPONSE.setBase(None)
             return data
 
-        while data is not None:
-            RESPONSE.write(data.data)
-            data=data.next
+        for chunk in pdata_chunks(data):
+            RESPONSE.write(chunk)
 
         return ''
 
@@ -436,9 +424,31 @@ class File(Persistent, Implicit, PropertyManager,
         """ Allow file objects to be searched.
         """
         if self.content_type.startswith('text/'):
-            return str(self.data)
+            return self._get_data()
         return ''
 
+    def _get_data(self):
+        # Return all of the data as a string
+        if self._blob is not None:
+            f = self._blob.open('r')
+            try:
+                return f.read()
+            finally:
+                f.close()
+        return str(self.data)
+
+    def _get_data_head(self, data, size=1 << 16):
+        # Return the first bytes of data, for guessing the content type
+        if isinstance(data, Blob):
+            f = data.open('r')
+            try:
+                return f.read(size)
+            finally:
+                f.close()
+        if not isinstance(data, str):
+            return data.data
+        return data
+
     security.declarePrivate('update_data')
     def update_data(self, data, content_type=None, size=None):
         if isinstance(data, unicode):
@@ -446,7 +456,7 @@ class File(Persistent, Implicit, PropertyManager,
                             'Unicode objects are expressly forbidden.')
 
         if content_type is not None: self.content_type=content_type
-        if size is None: size=len(data)
+        data, size = self._store_data(data, size)
         self.size=size
         self.data=data
         self.ZCacheable_invalidate()
@@ -470,6 +480,8 @@ class File(Persistent, Implicit, PropertyManager,
             self.update_data(filedata, content_type, len(filedata))
         else:
             self.ZCacheable_invalidate()
+            # The content type is sent with the data
+            self.http__refreshEtag()
         
         notify(ObjectModifiedEvent(self))
         
@@ -503,14 +515,74 @@ class File(Persistent, Implicit, PropertyManager,
         if headers and 'content-type' in headers:
             content_type=headers['content-type']
         else:
-            if not isinstance(body, str): body=body.data
+            body=self._get_data_head(body)
             content_type, enc=guess_content_type(
                 getattr(file, 'filename',id), body, content_type)
         return content_type
 
+    def _store_data(self, data, size=None):
+        # In blob mode, data which didn't come from _read_data is written
+        # to the blob here. Return the data and size to store.
+        if self._blob is not None:
+            if not isinstance(data, Blob):
+                data, size = self._read_blob(data)
+            return '', size
+        if size is None: size=len(data)
+        return data, size
+
+    def _read_blob(self, file):
+        # Write the data of file into the blob, return the blob and size
+        blob = self._blob
+        if getattr(file, '_spooled_filename', None) and file:
+            # The upload was spooled to a temporary file by the publisher,
+            # let the blob take it over instead of copying the data.
+            file.flush()
+            file.seek(0, 2)
+            size = file.tell()
+            filename = file._spooled_filename
+            linkname = '%s.blob' % filename
+            try:
+                os.link(filename, linkname)
+            except (OSError, AttributeError):
+                pass
+            else:
+                try:
+                    blob.consumeFile(linkname)
+                except:
+                    if os.path.exists(linkname):
+                        os.remove(linkname)
+                    raise
+                return blob, size
+        f = blob.open('w')
+        size = 0
+        try:
+            if isinstance(file, str):
+                f.write(file)
+                size = len(file)
+            elif isinstance(file, Pdata):
+                for chunk in pdata_chunks(file):
+                    f.write(chunk)
+                    size = size + len(chunk)
+            else:
+                if isinstance(file, FileUpload) and not file:
+                    raise ValueError, 'File not specified'
+                file.seek(0)
+                while True:
+                    chunk = file.read(1 << 16)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size = size + len(chunk)
+        finally:
+            f.close()
+        return blob, size
+
     def _read_data(self, file):
         import transaction
 
+        if self._blob is not None:
+            return self._read_blob(file)
+
         n=1 << 16
 
         if isinstance(file, str):
@@ -563,6 +635,7 @@ class File(Persistent, Implicit, PropertyManager,
             data = Pdata(read(end-pos))
             self._p_jar.add(data)
             data.next = next
+            data.size = size - pos
 
             # Save the object so that we can release its memory.
             transaction.savepoint(optimistic=True)
@@ -617,9 +690,23 @@ class File(Persistent, Implicit, PropertyManager,
         return self.content_type
 
 
-    def __str__(self): return str(self.data)
+    def __str__(self): return self._get_data()
     def __len__(self): return 1
 
+    security.declareProtected(change_images_and_files, 'convertToBlob')
+    def convertToBlob(self):
+        """Move the data of the File or Image into a ZODB blob.
+
+        The object keeps its identity, etag and modification behavior;
+        only the way the data is stored changes. Does nothing if the data
+        is already stored in a blob.
+        """
+        if self._blob is not None:
+            return
+        self._blob = Blob()
+        self._read_blob(self.data)
+        self.data = ''
+
     security.declareProtected(ftp_access, 'manage_FTPstat')
     security.declareProtected(ftp_access, 'manage_FTPlist')
 
@@ -639,14 +726,18 @@ class File(Persistent, Implicit, PropertyManager,
                 RESPONSE.setHeader('Content-Length', self.size)
                 return result
 
+        if self._blob is not None:
+            for chunk in blob_chunks(self._blob):
+                RESPONSE.write(chunk)
+            return ''
+
         data = self.data
         if isinstance(data, str):
             RESPONSE.setBase(None)
             return data
 
-        while data is not None:
-            RESPONSE.write(data.data)
-            data = data.next
+        for chunk in pdata_chunks(data):
+            RESPONSE.write(chunk)
 
         return ''
 
@@ -656,11 +747,12 @@ InitializeClass(File)
 manage_addImageForm=DTMLFile('dtml/imageAdd',globals(),
                              Kind='Image',kind='image')
 def manage_addImage(self, id, file, title='', precondition='', content_type='',
-                    REQUEST=None):
+                    REQUEST=None, blob=False):
     """
     Add a new Image object.
 
-    Creates a new Image object 'id' with the contents of 'file'.
+    Creates a new Image object 'id' with the contents of 'file'. If 'blob'
+    is true, the contents are stored in a ZODB blob.
     """
 
     id=str(id)
@@ -673,7 +765,8 @@ def manage_addImage(self, id, file, title='', precondition='', content_type='',
     self=self.this()
 
     # First, we create the image without data:
-    self._setObject(id, Image(id,title,'',content_type, precondition))
+    self._setObject(id, Image(id, title, '', content_type, precondition,
+                              blob=blob))
     
     newFile = self._getOb(id)
     
@@ -750,6 +843,49 @@ def getImageInfo(data):
     return content_type, width, height
 
 
+class FileValidators(object):
+    """HTTP validators of files and images
+
+    Lets the publisher answer conditional requests for 'index_html'.
+    """
+
+    implements(IHTTPValidators)
+    adapts(File)
+
+    def __init__(self, context):
+        self.context = context
+
+    def getETag(self):
+        return self.context.http__etag(readonly=1)
+
+    def getLastModified(self):
+        return self.context._p_mtime
+
+
+def convertToBlobs(ob, batch_size=100):
+    """Move the data of the Files and Images in and below ob into blobs
+
+    A transaction is committed after every 'batch_size' objects converted,
+    and at the end, so a large site is converted without holding all of
+    its data in one transaction, and a conversion which was interrupted
+    can be run again.  Returns the number of objects converted.
+    """
+    converted = 0
+    if isinstance(aq_base(ob), File):
+        found = [('', ob)]
+    else:
+        found = ob.ZopeFindIter(ob, search_sub=1)
+    for path, sub in found:
+        base = aq_base(sub)
+        if isinstance(base, File) and base._blob is None:
+            sub.convertToBlob()
+            converted += 1
+            if converted % batch_size == 0:
+                transaction.commit()
+    transaction.commit()
+    return converted
+
+
 class Image(File):
     """Image objects can be GIF, PNG or JPEG and have the same methods
     as File objects.  Images also have a string representation that
@@ -810,12 +946,15 @@ class Image(File):
             raise TypeError('Data can only be str or file-like.  '
                             'Unicode objects are expressly forbidden.')
         
-        if size is None: size=len(data)
+        head = data
+        if isinstance(data, Blob):
+            head = self._get_data_head(data, 1 << 18)
+        data, size = self._store_data(data, size)
 
         self.size=size
         self.data=data
 
-        ct, width, height = getImageInfo(data)
+        ct, width, height = getImageInfo(head)
         if ct:
             content_type = ct
         if width >= 0 and height >= 0:
@@ -909,6 +1048,9 @@ class Pdata(Persistent, Implicit):
     # Wrapper for possibly large data
 
     next=None
+    # The length of the data of this link and all links after it, set when
+    # File._read_data builds the chain. Older chains don't have it.
+    size=None
 
     def __init__(self, data):
         self.data=data
@@ -917,8 +1059,14 @@ class Pdata(Persistent, Implicit):
         return self.data[i:j]
 
     def __len__(self):
-        data = str(self)
-        return len(data)
+        if self.next is None:
+            return len(self.data)
+        if self.size is not None:
+            return self.size
+        size = len(self.data)
+        for chunk in pdata_chunks(self.next):
+            size = size + len(chunk)
+        return size
 
     def __str__(self):
         next=self.next
@@ -931,3 +1079,57 @@ class Pdata(Persistent, Implicit):
             next=self.next
 
         return ''.join(r)
+
+
+def pdata_chunks(data, start=0, end=None, pos=0, links=None):
+    """Iterate over the data of a chain of Pdata objects, link by link.
+
+    Only the bytes between the offsets 'start' and 'end' are returned.
+    'data' is the link starting at offset 'pos' of the chain. Every link is
+    deactivated once its data has been returned, so serving a large file
+    doesn't fill up the ZODB cache. If a 'links' mapping is passed, the
+    offset of each link visited is recorded in it.
+
+    The links are loaded from the database while iterating, so this must
+    only be used while the connection is open, and not as an
+    IStreamIterator.
+    """
+    while data is not None:
+        if links is not None:
+            links[pos] = data
+        chunk = data.data
+        next = data.next
+        l = len(chunk)
+        if pos + l > start:
+            lstart = max(start - pos, 0)
+            if end is not None and end <= pos + l:
+                yield chunk[lstart:end - pos]
+                data._p_deactivate()
+                return
+            if lstart:
+                chunk = chunk[lstart:]
+            yield chunk
+        data._p_deactivate()
+        pos = pos + l
+        data = next
+
+
+def blob_chunks(blob, start=0, end=None, size=1 << 16):
+    """Iterate over the data of a ZODB blob between 'start' and 'end'.
+    """
+    f = blob.open('r')
+    try:
+        f.seek(start)
+        pos = start
+        while end is None or pos < end:
+            if end is None:
+                n = size
+            else:
+                n = min(size, end - pos)
+            chunk = f.read(n)
+            if not chunk:
+                break
+            pos = pos + len(chunk)
+            yield chunk
+    finally:
+        f.close()
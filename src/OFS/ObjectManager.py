@@ -36,6 +36,8 @@ from AccessControl.Permissions import import_export_objects
 from AccessControl import getSecurityManager
 from AccessControl.ZopeSecurityPolicy import getRoles
 from Acquisition import aq_base
+from Acquisition import aq_inner
+from Acquisition import aq_parent
 from Acquisition import Implicit
 from App.Common import is_acquired
 from App.config import getConfiguration
@@ -44,6 +46,10 @@ from App.FactoryDispatcher import ProductDispatcher
 from App.Management import Navigation
 from App.Management import Tabs
 from App.special_dtml import DTMLFile
+from BTrees.Length import Length
+from BTrees.OIBTree import OIBTree
+from BTrees.OIBTree import union
+from BTrees.OOBTree import OOBTree
 from DateTime import DateTime
 from Persistence import Persistent
 from webdav.Collection import Collection
@@ -66,6 +72,9 @@ from OFS.subscribers import compatibilityCall
 from OFS.XMLExportImport import importXML
 from OFS.XMLExportImport import exportXML
 from OFS.XMLExportImport import magic
+from OFS.XMLExportImport import ResponseFile
+from OFS.ZEXPImport import getImportStatus
+from OFS.ZEXPImport import Importer
 
 # Constants: __replaceable__ flags:
 NOT_REPLACEABLE = 0
@@ -138,6 +147,62 @@ class BreakoutException(Exception):
 _marker=[]
 
 
+class LazyMap(object):
+    """A sequence calling a function on the items of another one on access
+    """
+
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __init__(self, func, seq):
+        self._func = func
+        self._seq = seq
+
+    def __len__(self):
+        return len(self._seq)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyMap(self._func, self._seq[index])
+        return self._func(self._seq[index])
+
+    def __iter__(self):
+        func = self._func
+        for item in self._seq:
+            yield func(item)
+
+
+def _getSubobject(self, name):
+    # __getattr__ of the containers in the large container mode, whose
+    # subobjects are kept in a BTree instead of instance attributes
+    tree = self._tree
+    if tree is not None and name[:1] != '_':
+        ob = tree.get(name, None)
+        if ob is not None:
+            return ob
+    raise AttributeError(name)
+
+
+def _makeLargeClass(klass):
+    # Make the class the containers of klass are switched to by
+    # manage_convertToBTree. It only adds a __getattr__ finding the
+    # subobjects, so that the containers which aren't converted don't
+    # pay for a Python hook on every attribute miss. The class is kept in
+    # the module of klass, so that the converted containers are pickled
+    # and loaded with it.
+    module = sys.modules.get(klass.__module__)
+    if module is None:
+        return
+    name = '_Large%s' % klass.__name__
+    large = type(klass)(name, (klass,), {
+        '__module__': klass.__module__,
+        '__doc__': klass.__doc__,
+        '__getattr__': _getSubobject,
+        '_plain_class': klass,
+        })
+    klass._large_class = large
+    setattr(module, name, large)
+
+
 class ObjectManager(CopyContainer,
                     Navigation,
                     Tabs,
@@ -165,6 +230,12 @@ class ObjectManager(CopyContainer,
 
     _objects = ()
 
+    # In the large container mode the subobjects are kept in a BTree
+    # instead of attributes, see manage_convertToBTree.
+    _tree = None      # OOBTree: { id -> object }
+    _mt_index = None  # OOBTree: { meta_type -> OIBTree: { id -> 1 } }
+    _count = None     # BTrees.Length.Length: the number of subobjects
+
     security.declareProtected(view_management_screens, 'manage_main')
     manage_main=DTMLFile('dtml/main', globals())
 
@@ -208,6 +279,19 @@ class ObjectManager(CopyContainer,
 
         InitializeClass(self) # default__class_init__
 
+        if '_plain_class' not in self.__dict__:
+            _makeLargeClass(self)
+
+    def __setstate__(self, state):
+        Persistent.__setstate__(self, state)
+        if self._tree is not None:
+            # Loaded through a reference naming the class the container
+            # had before it was converted, or invalidated after another
+            # connection converted it.
+            large = self.__class__.__dict__.get('_large_class')
+            if large is not None:
+                self.__class__ = large
+
     def all_meta_types(self, interfaces=None):
         # A list of products registered elsewhere
         import Products
@@ -276,13 +360,109 @@ class ObjectManager(CopyContainer,
 
     _checkId = checkValidId
 
+    # Large container mode
+
+    def _listsObjects(self):
+        # Whether _objects lists the subobjects. Unless the subobjects
+        # are ordered, it doesn't in the large container mode.
+        return self._tree is None or self.has_order_support
+
+    def _indexMetaType(self, id, object):
+        meta_type = getattr(object, 'meta_type', None)
+        if meta_type is not None:
+            ids = self._mt_index.get(meta_type, None)
+            if ids is None:
+                ids = self._mt_index[meta_type] = OIBTree()
+            ids[id] = 1
+
+    def _unindexMetaType(self, id, object):
+        meta_type = getattr(object, 'meta_type', None)
+        if meta_type is not None:
+            ids = self._mt_index.get(meta_type, None)
+            if ids is not None and id in ids:
+                del ids[id]
+                if not ids:
+                    del self._mt_index[meta_type]
+
+    security.declareProtected(view_management_screens,
+                              'manage_convertToBTree')
+    def manage_convertToBTree(self, REQUEST=None):
+        """Keep the subobjects in a BTree.
+
+        Adding or removing a subobject then changes some BTree buckets
+        instead of this object's pickle, which holds the references to
+        all of the subobjects otherwise, and concurrent additions
+        rarely conflict. The conversion is done in place, keeping the
+        identity of the object and of its subobjects, which are still
+        found as attributes and acquired. The object is switched to a
+        subclass of its class, which looks up the attributes it doesn't
+        have in the BTree.
+        """
+        if self._tree is None:
+            base = aq_base(self)
+            large = base.__class__.__dict__.get('_large_class')
+            if large is None:
+                raise BadRequest('%s objects can not keep their contents '
+                                 'in a BTree.' % base.__class__.__name__)
+            base.__class__ = large
+            tree = OOBTree()
+            self._mt_index = OOBTree()
+            for info in self._objects:
+                id = info['id']
+                ob = aq_base(getattr(aq_base(self), id))
+                try:
+                    delattr(self, id)
+                except AttributeError:
+                    # Not an instance attribute
+                    pass
+                tree[id] = ob
+                self._indexMetaType(id, ob)
+            self._count = Length(len(tree))
+            self._tree = tree
+            if not self.has_order_support:
+                self._objects = ()
+            # The references to this object name its class, so store the
+            # container holding it again
+            parent = aq_parent(aq_inner(self))
+            if getattr(aq_base(parent), '_p_jar', None) is not None:
+                parent._p_changed = 1
+        if REQUEST is not None:
+            return self.manage_main(self, REQUEST,
+                manage_tabs_message='The contents are kept in a BTree.')
+
     def _setOb(self, id, object):
-        setattr(self, id, object)
+        tree = self._tree
+        if tree is None:
+            setattr(self, id, object)
+            return
+        old = tree.get(id, None)
+        if old is None:
+            self._count.change(1)
+        else:
+            self._unindexMetaType(id, old)
+        tree[id] = object
+        self._indexMetaType(id, object)
 
     def _delOb(self, id):
-        delattr(self, id)
+        tree = self._tree
+        if tree is None or id not in tree:
+            delattr(self, id)
+            return
+        self._unindexMetaType(id, tree[id])
+        del tree[id]
+        self._count.change(-1)
 
     def _getOb(self, id, default=_marker):
+        tree = self._tree
+        if tree is not None:
+            try:
+                ob = tree.get(id, None)
+            except TypeError:
+                ob = None
+            if ob is not None:
+                if hasattr(ob, '__of__'):
+                    return ob.__of__(self)
+                return ob
         # FIXME: what we really need to do here is ensure that only
         # sub-items are returned. That could have a measurable hit
         # on performance as things are currently implemented, so for
@@ -305,6 +485,8 @@ class ObjectManager(CopyContainer,
             id.startswith('aq_') or
             id.endswith('__')):
             return False
+        if self._tree is not None and id in self._tree:
+            return True
         return getattr(aq_base(self), id, None) is not None
 
     def _setObject(self, id, object, roles=None, user=None, set_owner=1,
@@ -320,15 +502,20 @@ class ObjectManager(CopyContainer,
         t = getattr(ob, 'meta_type', None)
 
         # If an object by the given id already exists, remove it.
-        for object_info in self._objects:
-            if object_info['id'] == id:
+        if self._tree is not None:
+            if id in self._tree:
                 self._delObject(id)
-                break
+        else:
+            for object_info in self._objects:
+                if object_info['id'] == id:
+                    self._delObject(id)
+                    break
 
         if not suppress_events:
             notify(ObjectWillBeAddedEvent(ob, self, id))
 
-        self._objects = self._objects + ({'id': id, 'meta_type': t},)
+        if self._listsObjects():
+            self._objects = self._objects + ({'id': id, 'meta_type': t},)
         self._setOb(id, ob)
         ob = self._getOb(id)
 
@@ -381,8 +568,9 @@ class ObjectManager(CopyContainer,
         if not suppress_events:
             notify(ObjectWillBeRemovedEvent(ob, self, id))
 
-        self._objects = tuple([i for i in self._objects
-                               if i['id'] != id])
+        if self._listsObjects():
+            self._objects = tuple([i for i in self._objects
+                                   if i['id'] != id])
         self._delOb(id)
 
         # Indicate to the object that it has been deleted. This is
@@ -404,6 +592,19 @@ class ObjectManager(CopyContainer,
         # Returns a list of subobject ids of the current object.
         # If 'spec' is specified, returns objects whose meta_type
         # matches 'spec'.
+        # In the large container mode, returns a lazy sequence of the
+        # ids in sort order, unless the subobjects are ordered.
+        if not self._listsObjects():
+            if spec is None:
+                return self._tree.keys()
+            if isinstance(spec, str):
+                spec = [spec]
+            ids = None
+            for meta_type in spec:
+                ids = union(ids, self._mt_index.get(meta_type, None))
+            if ids is None:
+                return ()
+            return ids.keys()
         if spec is not None:
             if type(spec)==type('s'):
                 spec=[spec]
@@ -419,6 +620,8 @@ class ObjectManager(CopyContainer,
         # Returns a list of actual subobjects of the current object.
         # If 'spec' is specified, returns only objects whose meta_type
         # match 'spec'.
+        if not self._listsObjects():
+            return LazyMap(self._getOb, self.objectIds(spec))
         return [ self._getOb(id) for id in self.objectIds(spec) ]
 
     security.declareProtected(access_contents_information, 'objectItems')
@@ -426,10 +629,21 @@ class ObjectManager(CopyContainer,
         # Returns a list of (id, subobject) tuples of the current object.
         # If 'spec' is specified, returns only objects whose meta_type match
         # 'spec'
+        if not self._listsObjects():
+            return LazyMap(lambda id, _getOb=self._getOb: (id, _getOb(id)),
+                           self.objectIds(spec))
         return [ (id, self._getOb(id)) for id in self.objectIds(spec) ]
 
     def objectMap(self):
         # Return a tuple of mappings containing subobject meta-data
+        if not self._listsObjects():
+            meta_types = {}
+            for meta_type, ids in self._mt_index.items():
+                for id in ids.keys():
+                    meta_types[id] = meta_type
+            return LazyMap(lambda id: {'id': id,
+                                       'meta_type': meta_types.get(id)},
+                           self._tree.keys())
         return tuple(d.copy() for d in self._objects)
 
     def objectIds_d(self, t=None):
@@ -455,7 +669,10 @@ class ObjectManager(CopyContainer,
     def objectMap_d(self, t=None):
         if hasattr(self, '_reserved_names'): n=self._reserved_names
         else: n=()
-        if not n: return self._objects
+        if not n:
+            if not self._listsObjects():
+                return self.objectMap()
+            return self._objects
         r=[]
         a=r.append
         for d in self._objects:
@@ -474,7 +691,13 @@ class ObjectManager(CopyContainer,
         while x < 100:
             if not hasattr(obj,'_getOb'): break
             get=obj._getOb
-            if hasattr(obj,'_objects'):
+            if getattr(aq_base(obj), '_tree', None) is not None:
+                for id in obj.objectIds(t):
+                    physicalPath = relativePhysicalPath + (id,)
+                    if physicalPath not in seen:
+                        vals.append(get(id))
+                        seen[physicalPath]=1
+            elif hasattr(obj,'_objects'):
                 for i in obj._objects:
                     try:
                         id=i['id']
@@ -545,7 +768,7 @@ class ObjectManager(CopyContainer,
                 if hasattr(self, id):
                     r.append(self._getOb(id))
         else:
-            obj_ids=self.objectIds()
+            obj_ids=list(self.objectIds())
             obj_ids.sort()
             for id in obj_ids:
                 o=self._getOb(id)
@@ -568,16 +791,22 @@ class ObjectManager(CopyContainer,
         suffix=toxml and 'xml' or 'zexp'
 
         if download:
-            f=StringIO()
-            if toxml:
-                exportXML(ob._p_jar, ob._p_oid, f)
+            if RESPONSE is None:
+                f=StringIO()
             else:
-                ob._p_jar.exportFile(ob._p_oid, f)
-            if RESPONSE is not None:
                 RESPONSE.setHeader('Content-type','application/data')
                 RESPONSE.setHeader('Content-Disposition',
                                    'inline;filename=%s.%s' % (id, suffix))
-            return f.getvalue()
+                # Stream the export while the records are read
+                f=ResponseFile(RESPONSE)
+            if toxml:
+                exportXML(ob._p_jar, ob._p_oid, f)
+            else:
+                ob._p_jar.exportFile(ob._p_oid, f)
+            if RESPONSE is None:
+                return f.getvalue()
+            f.flush()
+            return RESPONSE
 
         cfg = getConfiguration()
         f = os.path.join(cfg.clienthome, '%s.%s' % (id, suffix))
@@ -597,21 +826,14 @@ class ObjectManager(CopyContainer,
     manage_importExportForm=DTMLFile('dtml/importExport',globals())
 
     security.declareProtected(import_export_objects, 'manage_importObject')
-    def manage_importObject(self, file, REQUEST=None, set_owner=1):
+    def manage_importObject(self, file, REQUEST=None, set_owner=1,
+                            batch_size=0):
         """Import an object from a file"""
-        dirname, file=os.path.split(file)
-        if dirname:
-            raise BadRequest, 'Invalid file name %s' % escape(file)
-
-        for impath in self._getImportPaths():
-            filepath = os.path.join(impath, 'import', file)
-            if os.path.exists(filepath):
-                break
-        else:
-            raise BadRequest, 'File does not exist: %s' % escape(file)
+        filepath=self._getImportFilePath(file)
 
         self._importObjectFromFile(filepath, verify=not not REQUEST,
-                                   set_owner=set_owner)
+                                   set_owner=set_owner,
+                                   batch_size=batch_size)
 
         if REQUEST is not None:
             return self.manage_main(
@@ -620,7 +842,24 @@ class ObjectManager(CopyContainer,
                 title='Object imported',
                 update_menu=1)
 
-    def _importObjectFromFile(self, filepath, verify=1, set_owner=1):
+    security.declareProtected(import_export_objects, 'getImportStatus')
+    def getImportStatus(self, file):
+        """Return the progress of the last batched import of a file"""
+        return getImportStatus(self._getImportFilePath(file))
+
+    def _getImportFilePath(self, file):
+        dirname, file=os.path.split(file)
+        if dirname:
+            raise BadRequest, 'Invalid file name %s' % escape(file)
+
+        for impath in self._getImportPaths():
+            filepath = os.path.join(impath, 'import', file)
+            if os.path.exists(filepath):
+                return filepath
+        raise BadRequest, 'File does not exist: %s' % escape(file)
+
+    def _importObjectFromFile(self, filepath, verify=1, set_owner=1,
+                              batch_size=0):
         # locate a valid connection
         connection=self._p_jar
         obj=self
@@ -628,8 +867,22 @@ class ObjectManager(CopyContainer,
         while connection is None:
             obj=obj.aq_parent
             connection=obj._p_jar
-        ob=connection.importFile(
-            filepath, customImporters=customImporters)
+        importer=None
+        if batch_size:
+            f=open(filepath, 'rb')
+            try:
+                zexp=f.read(4)=='ZEXP'
+            finally:
+                f.close()
+            if zexp:
+                # Store the records in transactions of their own,
+                # resuming an interrupted import of the file
+                importer=Importer(connection.db(), filepath, batch_size)
+        if importer is None:
+            ob=connection.importFile(
+                filepath, customImporters=customImporters)
+        else:
+            ob=connection.get(importer.run())
         if verify: self._verifyObjectPaste(ob, validate_src=0)
         id=ob.id
         if hasattr(id, 'im_func'): id=id()
@@ -639,6 +892,10 @@ class ObjectManager(CopyContainer,
         # that the object was imported into.
         ob=self._getOb(id)
         ob.manage_changeOwnershipType(explicit=0)
+        if importer is not None:
+            # Keep the checkpoint until the object is linked for good
+            connection.transaction_manager.get().addAfterCommitHook(
+                lambda status: status and importer.finish())
 
     def _getImportPaths(self):
         cfg = getConfiguration()
@@ -721,7 +978,7 @@ class ObjectManager(CopyContainer,
     def manage_hasId(self, REQUEST):
         """ check if the folder has an object with REQUEST['id'] """
 
-        if not REQUEST['id'] in self.objectIds():
+        if not REQUEST['id'] in self:
             raise KeyError(REQUEST['id'])
 
     security.declareProtected(ftp_access, 'manage_FTPstat')
@@ -774,12 +1031,19 @@ class ObjectManager(CopyContainer,
         return self._setObject(key, value)
 
     def __contains__(self, name):
+        if self._tree is not None:
+            try:
+                return name in self._tree
+            except TypeError:
+                return False
         return name in self.objectIds()
 
     def __iter__(self):
         return iter(self.objectIds())
 
     def __len__(self):
+        if self._tree is not None:
+            return self._count()
         return len(self.objectIds())
 
     def __nonzero__(self):
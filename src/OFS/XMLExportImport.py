@@ -11,6 +11,7 @@
 #
 ##############################################################################
 from base64 import encodestring
+from collections import deque
 from cStringIO import StringIO
 from ZODB.serialize import referencesf
 from ZODB.ExportImport import TemporaryFile, export_end_marker
@@ -41,15 +42,13 @@ def exportXML(jar, oid, file=None):
     write=file.write
     write('<?xml version="1.0"?>\012<ZopeData>\012')
     ref=referencesf
-    oids=[oid]
-    done_oids={}
-    done=done_oids.has_key
+    oids=deque([oid])
+    done_oids=set()
     load=jar._storage.load
     while oids:
-        oid=oids[0]
-        del oids[0]
-        if done(oid): continue
-        done_oids[oid]=1
+        oid=oids.popleft()
+        if oid in done_oids: continue
+        done_oids.add(oid)
         try:
             try:
                 p, serial = load(oid)
@@ -65,6 +64,40 @@ def exportXML(jar, oid, file=None):
     write('</ZopeData>\n')
     return file
 
+
+class ResponseFile:
+    """Write an export to a response in chunks
+
+    The response is streamed, so an export doesn't need to be held in
+    memory before it is sent.
+    """
+
+    # The bytes written to the response at once
+    chunk_size=1 << 16
+
+    def __init__(self, response):
+        self.response=response
+        self._chunk=[]
+        self._size=0
+
+    def write(self, data):
+        self._chunk.append(data)
+        self._size=self._size+len(data)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def flush(self):
+        if self._chunk:
+            data=''.join(self._chunk)
+            self._chunk=[]
+            self._size=0
+            self.response.write(data)
+
+
 class zopedata:
     def __init__(self, parser, tag, attrs):
         self.file=parser.file
@@ -72,33 +105,20 @@ class zopedata:
         write('ZEXP')
 
     def append(self, data):
-        file=self.file
-        write=file.write
-        pos=file.tell()
-        file.seek(pos)
-        write(data)
+        # The records are written out as they are parsed
+        self.file.write(data)
 
 def start_zopedata(parser, tag, data):
     return zopedata(parser, tag, data)
 
 def save_zopedata(parser, tag, data):
-    file=parser.file
-    write=file.write
-    pos=file.tell()
-    file.seek(pos)
-    write(export_end_marker)
+    parser.file.write(export_end_marker)
 
 def save_record(parser, tag, data):
-    file=parser.file
-    write=file.write
-    pos=file.tell()
-    file.seek(pos)
     a=data[1]
     if a.has_key('id'): oid=a['id']
     oid=p64(int(oid))
-    v=''
-    for x in data[2:]:
-        v=v+x
+    v=''.join(data[2:])
     l=p64(len(v))
     v=oid+l+v
     return v
@@ -108,7 +128,6 @@ def importXML(jar, file, clue=''):
     if type(file) is str:
         file=open(file, 'rb')
     outfile=TemporaryFile()
-    data=file.read()
     F=ppml.xmlPickler()
     F.end_handlers['record'] = save_record
     F.end_handlers['ZopeData'] = save_zopedata
@@ -119,6 +138,7 @@ def importXML(jar, file, clue=''):
     p.CharacterDataHandler=F.handle_data
     p.StartElementHandler=F.unknown_starttag
     p.EndElementHandler=F.unknown_endtag
-    r=p.Parse(data)
+    # Parse the file as it is read, converting a record at a time
+    r=p.ParseFile(file)
     outfile.seek(0)
     return jar.importFile(outfile,clue)
@@ -0,0 +1,349 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Import of .zexp files in batches
+
+Connection.importFile stores all of the records of an export within the
+current transaction, so a big import is committed at once, and starts
+over after a failure.  An Importer stores the records in transactions of
+its own, batch_size records at a time, while a thread reads the next
+ones from the file.  The records stored aren't reachable until the
+imported object is added to a container.  After each batch the state of
+the import is saved to a checkpoint file, from which an interrupted
+import resumes.  The progress of an import can be asked for with
+getImportStatus while it runs, and for an hour after it finished.  Only
+one import of a file runs at a time.
+"""
+
+import cPickle
+from cStringIO import StringIO
+import os
+import Queue
+import sys
+import threading
+import time
+
+from ZODB.ExportImport import blob_begin_marker
+from ZODB.ExportImport import export_end_marker
+from ZODB.ExportImport import Ghost
+from ZODB.ExportImport import persistent_id
+from ZODB.POSException import ExportError
+from ZODB.utils import cp
+from ZODB.utils import mktemp
+from ZODB.utils import u64
+import transaction
+
+
+class ImportStatus:
+    """The progress of an import
+    """
+
+    def __init__(self, filepath, size):
+        self.filepath = filepath
+        self.size = size
+        self.state = 'running'
+        self.position = 0
+        self.records = 0
+        self.batches = 0
+        self.resumed = 0
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    def getStatus(self):
+        """Return the progress as a mapping
+        """
+        finished = self.finished or time.time()
+        return {
+            'filepath': self.filepath,
+            'state': self.state,
+            'size': self.size,
+            'position': self.position,
+            'progress': self.size and float(self.position) / self.size or 1.0,
+            'records': self.records,
+            'batches': self.batches,
+            'resumed': self.resumed,
+            'error': self.error,
+            'started': self.started,
+            'elapsed': finished - self.started,
+            }
+
+
+_statuses = {}
+_statuses_lock = threading.Lock()
+
+# The seconds the status of a finished import is kept
+STATUS_LIFETIME = 3600
+
+def _pruneStatuses(now):
+    # Must be called with the lock held
+    for filepath, status in _statuses.items():
+        if status.finished and now - status.finished > STATUS_LIFETIME:
+            del _statuses[filepath]
+
+def getImportStatus(filepath):
+    """Return the progress of the last import of filepath, or None
+    """
+    _statuses_lock.acquire()
+    try:
+        status = _statuses.get(filepath)
+    finally:
+        _statuses_lock.release()
+    if status is not None:
+        return status.getStatus()
+
+
+class Importer:
+    """Import a .zexp file into a database in batches
+    """
+
+    # The records stored per transaction
+    batch_size = 1000
+
+    # The records read ahead of the ones stored
+    queue_size = 100
+
+    def __init__(self, db, filepath, batch_size=None, checkpoint=None):
+        self.db = db
+        self.filepath = filepath
+        if batch_size:
+            self.batch_size = batch_size
+        if checkpoint is None:
+            checkpoint = filepath + '.checkpoint'
+        self.checkpoint = checkpoint
+        stat = os.stat(filepath)
+        self._file_id = (stat.st_size, stat.st_mtime)
+        self.status = ImportStatus(filepath, stat.st_size)
+        # old oid -> new oid, or (new oid, class)
+        self.oids = {}
+        self.root = None
+        self.done = False
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Store the records not stored yet, returning the oid of the
+        imported object
+        """
+        status = self.status
+        _statuses_lock.acquire()
+        try:
+            _pruneStatuses(time.time())
+            running = _statuses.get(self.filepath)
+            if (running is not None and running is not status and
+                running.state == 'running'):
+                raise ExportError(
+                    "An import of %s is already running" % self.filepath)
+            _statuses[self.filepath] = status
+        finally:
+            _statuses_lock.release()
+        try:
+            self._load()
+            if not self.done:
+                self._store()
+        except:
+            status.state = 'failed'
+            status.error = str(sys.exc_info()[1])
+            status.finished = time.time()
+            raise
+        status.state = 'done'
+        status.position = status.size
+        status.finished = time.time()
+        return self.root
+
+    def finish(self):
+        """Forget the checkpoint once the imported object is linked
+        """
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def _load(self):
+        # Resume from the checkpoint of the same file
+        if not os.path.exists(self.checkpoint):
+            return
+        f = open(self.checkpoint, 'rb')
+        try:
+            state = cPickle.load(f)
+        finally:
+            f.close()
+        if state['file'] != self._file_id:
+            return
+        self.oids = state['oids']
+        self.root = state['root']
+        self.done = state['done']
+        status = self.status
+        status.position = state['position']
+        status.records = state['records']
+        status.batches = state['batches']
+        status.resumed = 1
+
+    def _save(self):
+        status = self.status
+        state = {
+            'file': self._file_id,
+            'oids': self.oids,
+            'root': self.root,
+            'done': self.done,
+            'position': status.position,
+            'records': status.records,
+            'batches': status.batches,
+            }
+        path = self.checkpoint + '.tmp'
+        f = open(path, 'wb')
+        try:
+            cPickle.dump(state, f, 2)
+        finally:
+            f.close()
+        os.rename(path, self.checkpoint)
+
+    def _store(self):
+        records = Queue.Queue(self.queue_size)
+        reader = threading.Thread(target=self._read, args=(records,))
+        reader.setDaemon(True)
+        reader.start()
+        try:
+            end = False
+            while not end:
+                batch = []
+                while len(batch) < self.batch_size:
+                    record = records.get()
+                    if record is None:
+                        end = True
+                        break
+                    if isinstance(record, tuple) and len(record) == 3:
+                        raise record[0], record[1], record[2]
+                    batch.append(record)
+                self._storeBatch(batch, end)
+        finally:
+            self._stopped.set()
+            reader.join()
+
+    def _storeBatch(self, batch, end):
+        storage = self.db.storage
+        status = self.status
+        t = transaction.Transaction()
+        t.note('Import of %s' % self.filepath)
+        storage.tpc_begin(t)
+        try:
+            for ooid, data, blob_filename, position in batch:
+                oid = self._oid(ooid)
+                data = self._remap(data)
+                if blob_filename is not None:
+                    storage.storeBlob(oid, None, data, blob_filename, '', t)
+                else:
+                    storage.store(oid, None, data, '', t)
+            storage.tpc_vote(t)
+        except:
+            storage.tpc_abort(t)
+            raise
+        storage.tpc_finish(t)
+        if batch:
+            status.position = batch[-1][3]
+            status.records += len(batch)
+        status.batches += 1
+        self.done = end
+        self._save()
+
+    def _oid(self, ooid):
+        # The new oid of a record
+        oids = self.oids
+        if ooid in oids:
+            oid = oids[ooid]
+            if isinstance(oid, tuple):
+                oid = oid[0]
+        else:
+            oids[ooid] = oid = self.db.storage.new_oid()
+        if self.root is None:
+            self.root = oid
+        return oid
+
+    def _persistent_load(self, ooid):
+        # Remap a persistent id to a new oid, as ZODB's import does
+        klass = None
+        if isinstance(ooid, tuple):
+            ooid, klass = ooid
+        oids = self.oids
+        if ooid in oids:
+            oid = oids[ooid]
+        else:
+            if klass is None:
+                oid = self.db.storage.new_oid()
+            else:
+                oid = self.db.storage.new_oid(), klass
+            oids[ooid] = oid
+        return Ghost(oid)
+
+    def _remap(self, data):
+        unpickler = cPickle.Unpickler(StringIO(data))
+        unpickler.persistent_load = self._persistent_load
+        newp = StringIO()
+        pickler = cPickle.Pickler(newp, 1)
+        pickler.inst_persistent_id = persistent_id
+        pickler.dump(unpickler.load())
+        pickler.dump(unpickler.load())
+        return newp.getvalue()
+
+    def _put(self, records, item):
+        while not self._stopped.isSet():
+            try:
+                records.put(item, True, 0.1)
+            except Queue.Full:
+                continue
+            return
+
+    def _read(self, records):
+        # Put the (old oid, pickle, blob file name, position after the
+        # record) of the records from the position reached into records
+        try:
+            try:
+                f = open(self.filepath, 'rb')
+                try:
+                    if f.read(4) != 'ZEXP':
+                        raise ExportError("Invalid export header")
+                    if self.status.position:
+                        f.seek(self.status.position)
+                    while not self._stopped.isSet():
+                        record = self._readRecord(f)
+                        if record is None:
+                            break
+                        self._put(records, record)
+                finally:
+                    f.close()
+            except:
+                self._put(records, sys.exc_info())
+        finally:
+            self._put(records, None)
+
+    def _readRecord(self, f):
+        header = f.read(16)
+        if header == export_end_marker:
+            return None
+        if len(header) != 16:
+            raise ExportError("Truncated export file")
+        ooid = header[:8]
+        length = u64(header[8:16])
+        data = f.read(length)
+        if len(data) != length:
+            raise ExportError("Truncated export file")
+        blob_begin = f.read(len(blob_begin_marker))
+        if blob_begin == blob_begin_marker:
+            # Copy the blob data to a temporary file
+            blob_len = u64(f.read(8))
+            blob_filename = mktemp()
+            blob_file = open(blob_filename, "wb")
+            try:
+                cp(f, blob_file, blob_len)
+            finally:
+                blob_file.close()
+        else:
+            f.seek(-len(blob_begin), 1)
+            blob_filename = None
+        return ooid, data, blob_filename, f.tell()
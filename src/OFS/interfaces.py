@@ -571,10 +571,13 @@ class IObjectManager(IZopeObject, ICopyContainer, INavigation, IManageable,
                             RESPONSE=None, REQUEST=None):
         """Exports an object to a file and returns that file."""
 
-    def manage_importObject(file, REQUEST=None, set_owner=1):
+    def manage_importObject(file, REQUEST=None, set_owner=1, batch_size=0):
         """Import an object from a file"""
 
-    def _importObjectFromFile(filepath, verify=1, set_owner=1):
+    def getImportStatus(file):
+        """Return the progress of the last batched import of a file"""
+
+    def _importObjectFromFile(filepath, verify=1, set_owner=1, batch_size=0):
         """
         """
 
@@ -601,13 +604,21 @@ class IFindSupport(Interface):
 
     PrincipiaFind = ZopeFind
 
+    def ZopeFindIter(obj, obj_ids=None, obj_metatypes=None,
+                     obj_searchterm=None, obj_expr=None,
+                     obj_mtime=None, obj_mspec=None,
+                     obj_permission=None, obj_roles=None,
+                     search_sub=0,
+                     REQUEST=None, pre='', workers=0):
+        """Zope Find interface generating the results"""
+
     def ZopeFindAndApply(obj, obj_ids=None, obj_metatypes=None,
                          obj_searchterm=None, obj_expr=None,
                          obj_mtime=None, obj_mspec=None,
                          obj_permission=None, obj_roles=None,
                          search_sub=0,
                          REQUEST=None, result=None, pre='',
-                         apply_func=None, apply_path=''):
+                         apply_func=None, apply_path='', workers=0):
         """Zope Find interface and apply"""
 
 
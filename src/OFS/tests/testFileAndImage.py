@@ -200,6 +200,44 @@ class FileTests(unittest.TestCase):
         data, size = self.file._read_data(s)
         self.assertNotEqual(data.next, None)
 
+    def testPdataSize(self):
+        s = "abcd" * (1 << 16)
+        data, size = self.file._read_data(StringIO(s))
+        self.assertNotEqual(data.next, None)
+        self.assertEqual(data.size, len(s))
+        self.assertEqual(len(data), len(s))
+        self.assertEqual(len(data.next), len(s) - len(data.data))
+
+    def testPdataSizeWithoutCachedSize(self):
+        first = Pdata('abc')
+        first.next = Pdata('defg')
+        self.assertEqual(len(first), 7)
+
+    def testPdataChunks(self):
+        from OFS.Image import pdata_chunks
+        first = Pdata('abc')
+        first.next = second = Pdata('defg')
+        second.next = Pdata('hi')
+        self.assertEqual(list(pdata_chunks(first)), ['abc', 'defg', 'hi'])
+        self.assertEqual(list(pdata_chunks(first, 2, 8)), ['c', 'defg', 'h'])
+        self.assertEqual(list(pdata_chunks(first, 4, 6)), ['ef'])
+        links = {}
+        self.assertEqual(list(pdata_chunks(second, 5, 9, 3, links)),
+                         ['fg', 'hi'])
+        self.assertEqual(sorted(links.keys()), [3, 7])
+
+    def testPdataChunksDeactivatesLinks(self):
+        from OFS.Image import pdata_chunks
+        s = "a" * (1 << 16) * 3
+        self.file.manage_upload(s)
+        transaction.commit()
+        data = self.file.data
+        chunks = list(pdata_chunks(data))
+        self.assertEqual(''.join(chunks), s)
+        while data is not None:
+            self.assertEqual(data._p_changed, None)
+            data = data.next
+
     def testManageEditWithFileData(self):
         self.file.manage_edit('foobar', 'text/plain', filedata='ASD')
         self.assertEqual(self.file.title, 'foobar')
@@ -217,6 +255,11 @@ class FileTests(unittest.TestCase):
         self.assertEquals(1, len(self.eventCatcher.modified))
         self.assertTrue(self.eventCatcher.modified[0].object is self.file)
 
+    def testManageEditRefreshesEtag(self):
+        self.file._EtagSupport__etag = 'ts1'
+        self.file.manage_edit('foobar', 'text/plain')
+        self.assertNotEqual(self.file.http__etag(readonly=1), 'ts1')
+
     def testManageUpload(self):
         f = StringIO('jammyjohnson')
         self.file.manage_upload(f)
@@ -280,6 +323,34 @@ class FileTests(unittest.TestCase):
         self.file.index_html(self.app.REQUEST, self.app.REQUEST.RESPONSE)
         self.assert_(not self.app.REQUEST.RESPONSE._wrote)
 
+    def testValidators(self):
+        from OFS.Image import FileValidators
+        validators = FileValidators(self.file)
+        self.assertEqual(validators.getETag(),
+                         self.file.http__etag(readonly=1))
+        self.assertEqual(validators.getLastModified(), self.file._p_mtime)
+
+    def testConditionalRequestWithPrecondition(self):
+        from zope.component import getGlobalSiteManager
+        from OFS.Image import FileValidators
+        from ZPublisher.conditional import handle_conditional_request
+        from ZPublisher.interfaces import IHTTPValidators
+        if IHTTPValidators(self.file, None) is None:
+            gsm = getGlobalSiteManager()
+            gsm.registerAdapter(FileValidators)
+            self.addCleanup(gsm.unregisterAdapter, FileValidators)
+        request = self.app.REQUEST
+        request.environ['REQUEST_METHOD'] = 'GET'
+        request.environ['HTTP_IF_NONE_MATCH'] = '"%s"' % (
+            self.file.http__etag(readonly=1))
+        self.assertTrue(handle_conditional_request(
+            request, request.RESPONSE, self.file.index_html))
+        request.RESPONSE.setStatus(200)
+        self.file.precondition = 'precondition_check'
+        self.assertFalse(handle_conditional_request(
+            request, request.RESPONSE, self.file.index_html))
+        self.assertEqual(request.RESPONSE.getStatus(), 200)
+
     def testStr(self):
         self.assertEqual(str(self.file), self.data)
 
@@ -353,8 +424,171 @@ class ImageTests(FileTests):
 
         verifyClass(IWriteLock, Image)
 
+class BlobFileTests(unittest.TestCase):
+    data = open(filedata, 'rb').read()
+    factory = 'manage_addFile'
+
+    def setUp(self):
+        self.connection = makeConnection()
+        try:
+            r = self.connection.root()
+            a = Application()
+            r['Application'] = a
+            self.root = a
+            self.app = makerequest(self.root, stdout=StringIO())
+            factory = getattr(self.app, self.factory)
+            factory('file', file=self.data, blob=True)
+            transaction.commit()
+        except:
+            self.connection.close()
+            raise
+        transaction.begin()
+        self.file = getattr(self.app, 'file')
+
+    def tearDown(self):
+        del self.file
+        transaction.abort()
+        self.connection.close()
+        del self.app
+        del self.root
+        del self.connection
+
+    def testDataInBlob(self):
+        self.assertNotEqual(self.file._blob, None)
+        self.assertEqual(self.file.data, '')
+        self.assertEqual(self.file.size, len(self.data))
+        self.assertEqual(self.file._get_data(), self.data)
+
+    def testManageUpload(self):
+        s = 'a' * (3 << 16)
+        self.file.manage_upload(StringIO(s))
+        self.assertEqual(self.file.data, '')
+        self.assertEqual(self.file.size, len(s))
+        self.assertEqual(self.file._get_data(), s)
+
+    def testManageUploadSpooledFile(self):
+        # A spooled upload is taken over by the blob instead of copied
+        from ZPublisher.HTTPRequest import FileUpload
+        from ZPublisher.HTTPRequest import ZopeFieldStorage
+        s = 'b' * (3 << 16)
+        fs = ZopeFieldStorage(fp=StringIO(), environ={})
+        fs.file = fs.make_file('b')
+        fs.file.write(s)
+        fs.filename = 'upload.bin'
+        upload = FileUpload(fs)
+        self.assertTrue(upload._spooled_filename)
+        self.file.manage_upload(upload)
+        self.assertEqual(self.file.size, len(s))
+        self.assertEqual(self.file._get_data(), s)
+        self.assertFalse(os.path.exists(upload._spooled_filename + '.blob'))
+        transaction.commit()
+        self.assertEqual(self.file._get_data(), s)
+
+    def testManageEditWithFileData(self):
+        self.file.manage_edit('foobar', 'text/plain', filedata='ASD')
+        self.assertEqual(self.file.data, '')
+        self.assertEqual(self.file.size, 3)
+        self.assertEqual(self.file.PrincipiaSearchSource(), 'ASD')
+
+    def testIndexHtmlCommitted(self):
+        from ZPublisher.Iterators import IStreamIterator
+        request = self.app.REQUEST
+        result = self.file.index_html(request, request.RESPONSE)
+        self.assertTrue(IStreamIterator.providedBy(result))
+        try:
+            self.assertEqual(''.join(result), self.data)
+        finally:
+            result.close()
+        self.assertEqual(request.RESPONSE.getHeader('Content-Length'),
+                         str(len(self.data)))
+
+    def testIndexHtmlUncommitted(self):
+        self.file.manage_upload('uncommitted')
+        request = self.app.REQUEST
+        result = self.file.index_html(request, request.RESPONSE)
+        self.assertEqual(result, '')
+        self.assertTrue(request.RESPONSE._wrote)
+
+    def testRange(self):
+        request = self.app.REQUEST
+        request.environ['HTTP_RANGE'] = 'bytes=2-5'
+        self.file.index_html(request, request.RESPONSE)
+        self.assertEqual(request.RESPONSE.getStatus(), 206)
+        self.assertTrue(request.RESPONSE.stdout.getvalue().endswith(
+            self.data[2:6]))
+
+    def testConvertToBlob(self):
+        s = 'a' * (3 << 16)
+        self.app.manage_addFile('pfile', file=s)
+        pfile = self.app.pfile
+        self.assertEqual(pfile._blob, None)
+        etag = pfile.http__etag()
+        pfile.convertToBlob()
+        self.assertNotEqual(pfile._blob, None)
+        self.assertEqual(pfile.data, '')
+        self.assertEqual(pfile._get_data(), s)
+        self.assertEqual(pfile.http__etag(), etag)
+        transaction.commit()
+        self.assertEqual(open(pfile._blob.committed()).read(), s)
+
+    def testConvertToBlobs(self):
+        from OFS.Folder import Folder
+        from OFS.Image import convertToBlobs
+        self.app._setObject('folder', Folder('folder'))
+        folder = self.app.folder
+        folder._setObject('sub', Folder('sub'))
+        for container in (self.app, folder, folder.sub):
+            container.manage_addFile('pfile', file='data')
+        folder.sub.manage_addImage('pimage', file=self.data)
+        transaction.commit()
+        synch = CommitCounter()
+        transaction.manager.registerSynch(synch)
+        transaction.begin()
+        try:
+            self.assertEqual(convertToBlobs(folder, batch_size=2), 3)
+        finally:
+            transaction.manager.unregisterSynch(synch)
+        # a commit after the first two, and one for the rest
+        self.assertEqual(synch.commits, 2)
+        self.assertEqual(self.app.pfile._blob, None)
+        for ob in (folder.pfile, folder.sub.pfile, folder.sub.pimage):
+            self.assertNotEqual(ob._blob, None)
+            self.assertFalse(ob._p_changed)
+        self.assertEqual(folder.sub.pfile._get_data(), 'data')
+        self.assertEqual(folder.sub.pimage._get_data(), self.data)
+        # converted objects are left alone
+        self.assertEqual(convertToBlobs(folder), 0)
+        self.assertEqual(convertToBlobs(self.app.pfile), 1)
+
+
+class CommitCounter:
+    # A transaction manager synchronizer counting the commits
+
+    commits = 0
+
+    def beforeCompletion(self, txn):
+        pass
+
+    def afterCompletion(self, txn):
+        self.commits += 1
+
+    def newTransaction(self, txn):
+        pass
+
+
+class BlobImageTests(BlobFileTests):
+    factory = 'manage_addImage'
+
+    def testImageInfo(self):
+        self.assertEqual(self.file.content_type, 'image/gif')
+        self.assertEqual(self.file.width, 16)
+        self.assertEqual(self.file.height, 16)
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(FileTests),
         unittest.makeSuite(ImageTests),
+        unittest.makeSuite(BlobFileTests),
+        unittest.makeSuite(BlobImageTests),
         ))
@@ -1,5 +1,21 @@
 import unittest
 
+import transaction
+from OFS.Folder import Folder
+from OFS.SimpleItem import SimpleItem
+
+
+class Document(SimpleItem):
+
+    meta_type = 'Document'
+
+    def __init__(self, id, text=''):
+        self.id = id
+        self.text = text
+
+    def PrincipiaSearchSource(self):
+        return self.text
+
 
 class TestFindSupport(unittest.TestCase):
 
@@ -11,7 +27,171 @@ class TestFindSupport(unittest.TestCase):
         verifyClass(IFindSupport, FindSupport)
 
 
+class FindTests(unittest.TestCase):
+
+    def setUp(self):
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        self.db = DB(MappingStorage())
+        self.tm = transaction.TransactionManager()
+        self.conn = self.db.open(transaction_manager=self.tm)
+        root = self._makeTree()
+        self.conn.root()['root'] = root
+        self.tm.commit()
+
+    def tearDown(self):
+        self.tm.abort()
+        self.conn.close()
+        self.db.close()
+
+    def _makeTree(self):
+        root = Folder('root')
+        for name in ('a', 'b', 'c'):
+            folder = Folder(name)
+            root._setObject(name, folder)
+            folder = root._getOb(name)
+            folder._setObject('doc', Document('doc', 'text of %s' % name))
+            folder._setObject('sub', Folder('sub'))
+            folder.sub._setObject('deep', Document('deep', 'deep text'))
+        root._setObject('top', Document('top', 'top text'))
+        return root
+
+    def _root(self):
+        return self.conn.root()['root']
+
+    def _paths(self, found):
+        return sorted(p for p, ob in found)
+
+    def test_ZopeFind(self):
+        root = self._root()
+        found = root.ZopeFind(root, obj_metatypes=['Document'],
+                              search_sub=1)
+        self.assertEqual(self._paths(found),
+                         ['a/doc', 'a/sub/deep', 'b/doc', 'b/sub/deep',
+                          'c/doc', 'c/sub/deep', 'top'])
+        p, ob = found[0]
+        self.assertEqual(ob.aq_parent.getId(), p.split('/')[-2])
+
+    def test_ZopeFind_searchterm(self):
+        root = self._root()
+        found = root.ZopeFind(root, obj_searchterm='deep', search_sub=1)
+        self.assertEqual(self._paths(found),
+                         ['a/sub/deep', 'b/sub/deep', 'c/sub/deep'])
+
+    def test_ZopeFind_not_sub(self):
+        root = self._root()
+        found = root.ZopeFind(root, obj_ids=['a', 'top'])
+        self.assertEqual(self._paths(found), ['a', 'top'])
+
+    def test_ZopeFindIter_is_lazy(self):
+        root = self._root()
+        found = root.ZopeFindIter(root, obj_metatypes=['all'], search_sub=1)
+        self.assertEqual(found.next()[0], 'a')
+
+    def test_unwanted_objects_are_not_loaded(self):
+        root = self._root()
+        root._p_activate()
+        for name in ('a', 'b', 'c', 'top'):
+            root._getOb(name)._p_deactivate()
+        found = list(root.ZopeFindIter(root, obj_ids=['top']))
+        self.assertEqual(self._paths(found), ['top'])
+        self.assertEqual(root.a._p_changed, None)
+
+    def test_visited_objects_are_ghosted(self):
+        root = self._root()
+        self.conn.cacheMinimize()
+        found = root.ZopeFindAndApply(root, obj_searchterm='text of',
+                                      search_sub=1)
+        self.assertEqual(self._paths(found), ['a/doc', 'b/doc', 'c/doc'])
+        a = aq_base(root._getOb('a'))
+        self.assertEqual(a._p_changed, None)
+        # but not the ones found
+        self.assertEqual(aq_base(found[0][1])._p_changed, False)
+
+    def test_found_objects_are_ghosted_when_generated(self):
+        root = self._root()
+        self.conn.cacheMinimize()
+        found = list(root.ZopeFindIter(root, obj_searchterm='text of',
+                                       search_sub=1))
+        self.assertEqual(aq_base(found[0][1])._p_changed, None)
+
+    def test_ZopeFindAndApply(self):
+        root = self._root()
+        applied = []
+        root.ZopeFindAndApply(root, obj_metatypes=['Document'],
+                              obj_searchterm='text of', search_sub=1,
+                              apply_func=lambda ob, p: applied.append(p),
+                              apply_path='/root')
+        self.assertEqual(sorted(applied),
+                         ['/root/a/doc', '/root/b/doc', '/root/c/doc'])
+
+    def test_parallel(self):
+        root = self._root()
+        found = list(root.ZopeFindIter(root, obj_metatypes=['Document'],
+                                       search_sub=1, workers=2))
+        self.assertEqual(self._paths(found),
+                         ['a/doc', 'a/sub/deep', 'b/doc', 'b/sub/deep',
+                          'c/doc', 'c/sub/deep', 'top'])
+        # The objects are got from the connection of the caller
+        for p, ob in found:
+            self.assertTrue(aq_base(ob)._p_jar is self.conn)
+            self.assertEqual(ob.getId(), p.split('/')[-1])
+
+    def test_parallel_sees_changes(self):
+        root = self._root()
+        root.b._setObject('new', Document('new'))
+        found = list(root.ZopeFindIter(root, obj_ids=['new'],
+                                       search_sub=1, workers=2))
+        self.assertEqual(self._paths(found), ['b/new'])
+
+    def test_parallel_sees_deep_changes(self):
+        root = self._root()
+        root.b.sub._setObject('new', Document('new'))
+        found = list(root.ZopeFindIter(root, obj_ids=['new'],
+                                       search_sub=1, workers=2))
+        self.assertEqual(self._paths(found), ['b/sub/new'])
+
+    def test_parallel_skips_objects_added_since_snapshot(self):
+        root = self._root()
+        root._p_activate()
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            other = conn.root()['root']
+            other.b.sub._setObject('late', Document('late'))
+            tm.commit()
+        finally:
+            conn.close()
+        found = list(root.ZopeFindIter(root, obj_metatypes=['Document'],
+                                       search_sub=1, workers=2))
+        self.assertEqual(self._paths(found),
+                         ['a/doc', 'a/sub/deep', 'b/doc', 'b/sub/deep',
+                          'c/doc', 'c/sub/deep', 'top'])
+
+    def test_parallel_ZopeFindAndApply(self):
+        root = self._root()
+        applied = []
+        root.ZopeFindAndApply(root, obj_ids=['deep'], search_sub=1,
+                              apply_func=lambda ob, p: applied.append(p),
+                              workers=3)
+        self.assertEqual(sorted(applied),
+                         ['/a/sub/deep', '/b/sub/deep', '/c/sub/deep'])
+
+    def test_parallel_stops(self):
+        root = self._root()
+        found = iter(root.ZopeFindIter(root, obj_metatypes=['all'],
+                                       search_sub=1, workers=2))
+        found.next()
+        del found
+
+
+def aq_base(ob):
+    from Acquisition import aq_base
+    return aq_base(ob)
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(TestFindSupport),
+        unittest.makeSuite(FindTests),
         ))
@@ -6,6 +6,7 @@ from AccessControl.SecurityManagement import noSecurityManager
 from AccessControl.SecurityManager import setSecurityPolicy
 from AccessControl.SpecialUsers import emergency_user, nobody, system
 from AccessControl.User import User # before SpecialUsers
+from Acquisition import aq_base
 from Acquisition import Implicit
 from App.config import getConfiguration
 from logging import getLogger
@@ -491,7 +492,235 @@ class ObjectManagerTests(PlacelessSetup, unittest.TestCase):
             self.assertTrue(filename.endswith('.zexp') or
                             filename.endswith('.xml'))
 
+
+class BTreeObjectManagerTests(ObjectManagerTests):
+    # Runs the ObjectManager tests in the large container mode
+
+    def _makeOne( self, *args, **kw ):
+        om = self._getTargetClass()( *args, **kw )
+        om.manage_convertToBTree()
+        return om.__of__( FauxRoot() )
+
+    def test_children_are_kept_in_tree(self):
+        om = self._makeOne()
+        si = SimpleItem('foo')
+        om._setObject('foo', si)
+        self.assertFalse('foo' in om.__dict__)
+        self.assertTrue(om._tree['foo'] is si)
+        # but are found as attributes, by id, by key and by traversal
+        self.assertTrue(hasattr(aq_base(om), 'foo'))
+        self.assertTrue(om.foo.aq_base is si)
+        self.assertTrue(om.foo.aq_parent is om)
+        self.assertTrue(om._getOb('foo').aq_base is si)
+        self.assertTrue(om._getOb('foo').aq_parent is om)
+        self.assertTrue(om['foo'].aq_base is si)
+        self.assertTrue(om.unrestrictedTraverse('foo').aq_base is si)
+        self.assertRaises(AttributeError, om._getOb, 'bar')
+        self.assertRaises(AttributeError, getattr, om, '_foo')
+
+    def test_converted_class(self):
+        om = self._makeOne()
+        klass = aq_base(om).__class__
+        self.assertTrue(klass is self._getTargetClass()._large_class)
+        self.assertTrue(isinstance(om, self._getTargetClass()))
+        # the containers which aren't converted have no __getattr__
+        self.assertFalse(hasattr(self._getTargetClass(), '__getattr__'))
+        self.assertFalse(hasattr(ObjectManager, '__getattr__'))
+        import OFS.tests.testObjectManager as module
+        self.assertTrue(getattr(module, klass.__name__) is klass)
+
+    def test_children_are_acquired(self):
+        om = self._makeOne()
+        om._setObject('helper', SimpleItem('helper'), set_owner=0,
+                      suppress_events=True)
+        om._setObject('sub', self._getTargetClass()(), set_owner=0,
+                      suppress_events=True)
+        sub = om.sub
+        self.assertTrue(aq_base(sub.helper) is aq_base(om.helper))
+
+    def test_children_shadow_acquired_objects(self):
+        root = FauxRoot()
+        root.foo = SimpleItem('acquired')
+        om = self._getTargetClass()()
+        om.manage_convertToBTree()
+        om = om.__of__(root)
+        foo = SimpleItem('foo')
+        om._setObject('foo', foo)
+        self.assertTrue(aq_base(om.unrestrictedTraverse('foo')) is foo)
+
+    def test_non_acquirer_child(self):
+        om = self._makeOne()
+        child = object()
+        om._setOb('plain', child)
+        self.assertTrue(om._getOb('plain') is child)
+
+    def test_duplicate_id(self):
+        from OFS.ObjectManager import checkValidId
+        om = self._makeOne()
+        om._setObject('foo', SimpleItem('foo'))
+        self.assertRaises(BadRequest, checkValidId, om, 'foo')
+        self.assertRaises(BadRequest, om._setObject, 'foo', SimpleItem('foo'))
+
+    def test_objectIds_are_sorted_and_lazy(self):
+        om = self._makeOne()
+        for id in ('c', 'a', 'b'):
+            om._setObject(id, SimpleItem(id))
+        ids = om.objectIds()
+        self.assertFalse(isinstance(ids, list))
+        self.assertEqual(list(ids), ['a', 'b', 'c'])
+        self.assertEqual(len(om.objectValues()), 3)
+        self.assertEqual(om.objectValues()[1].aq_base, om._tree['b'])
+        self.assertEqual([id for id, ob in om.objectItems()],
+                         ['a', 'b', 'c'])
+        self.assertEqual(list(om.objectMap()),
+                         [{'id': id, 'meta_type': 'simple item'}
+                          for id in 'abc'])
+        self.assertEqual(len(om), 3)
+
+    def test_meta_type_index(self):
+        om = self._makeOne()
+        om._setObject('item', SimpleItem('item'))
+        other = ItemForDeletion()
+        other.meta_type = 'other item'
+        om._setObject('sub', other)
+        self.assertEqual(list(om.objectIds('simple item')), ['item'])
+        self.assertEqual(list(om.objectIds(['simple item', 'other item'])),
+                         ['item', 'sub'])
+        self.assertEqual(list(om.objectIds('nothing')), [])
+        self.assertEqual(list(om.superValues('other item')), [om._getOb('sub')])
+        om._delObject('item')
+        self.assertFalse('simple item' in om._mt_index)
+        self.assertEqual(om._count(), 1)
+
+    def test_manage_convertToBTree(self):
+        om = self._getTargetClass()()
+        for id in ('b', 'a'):
+            om._setObject(id, SimpleItem(id))
+        a = aq_base(om._getOb('a'))
+        om.manage_convertToBTree()
+        self.assertEqual(om._objects, ())
+        self.assertFalse('a' in om.__dict__)
+        self.assertTrue(om._tree['a'] is a)
+        self.assertEqual(list(om.objectIds()), ['a', 'b'])
+        self.assertEqual(len(om), 2)
+        self.assertEqual(list(om.objectIds('simple item')), ['a', 'b'])
+        # Converting again does nothing
+        om.manage_convertToBTree()
+        self.assertEqual(len(om), 2)
+
+    def test_ordered_container(self):
+        from OFS.OrderSupport import OrderSupport
+
+        class OrderedObjectManager(OrderSupport, ObjectManagerWithIItem):
+            pass
+
+        om = OrderedObjectManager()
+        om._setObject('b', SimpleItem('b'))
+        om.manage_convertToBTree()
+        om._setObject('a', SimpleItem('a'))
+        self.assertEqual(om.objectIds(), ['b', 'a'])
+        om.moveObjectsToTop(['a'])
+        self.assertEqual(om.objectIds(), ['a', 'b'])
+        self.assertTrue(om._tree['b'] is aq_base(om._getOb('b')))
+        om._delObject('a')
+        self.assertEqual(om.objectIds(), ['b'])
+        self.assertEqual(len(om), 1)
+
+
+class LargeContainerTests(unittest.TestCase):
+    # Converted folders in a database and published
+
+    def setUp(self):
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        from OFS.Application import Application
+        from OFS.Folder import Folder
+        from OFS.Image import File
+        self.db = DB(MappingStorage())
+        self.conn = self.db.open()
+        app = self.conn.root()['Application'] = Application()
+        app._setObject('f', Folder('f'))
+        f = app.f
+        f._setObject('sub', Folder('sub'))
+        f._setObject('index_html', File('index_html', '', 'default view'))
+        f._setObject('helper', File('helper', '', 'helper'))
+        f.manage_convertToBTree()
+        transaction.commit()
+        self.app = app
+
+    def tearDown(self):
+        import transaction
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+
+    def test_attributes(self):
+        from OFS.Folder import Folder
+        f = self.app.f
+        self.assertTrue(isinstance(aq_base(f), Folder._large_class))
+        self.assertEqual(f.index_html.data, 'default view')
+        self.assertEqual(f.sub.getId(), 'sub')
+        self.assertTrue(hasattr(f, 'index_html'))
+
+    def test_restrictedTraverse_acquires_sibling(self):
+        newSecurityManager(None, system)
+        try:
+            helper = self.app.restrictedTraverse('f/sub/helper')
+        finally:
+            noSecurityManager()
+        self.assertEqual(helper.data, 'helper')
+        self.assertTrue(aq_base(helper) is aq_base(self.app.f.helper))
+
+    def test_default_view(self):
+        from ZPublisher.BaseRequest import BaseRequest
+        from ZPublisher.HTTPResponse import HTTPResponse
+        request = BaseRequest({'URL': '', 'PARENTS': [self.app],
+                               'steps': [], '_hacked_path': 0,
+                               'response': HTTPResponse()})
+        newSecurityManager(None, system)
+        try:
+            ob = request.traverse('f')
+        finally:
+            noSecurityManager()
+        self.assertEqual(request.URL, '/f/index_html')
+        self.assertTrue(aq_base(ob) is aq_base(self.app.f.index_html))
+
+    def test_loaded_with_converted_class(self):
+        from OFS.Folder import Folder
+        conn = self.db.open()
+        try:
+            f = conn.root()['Application'].f
+            self.assertTrue(type(aq_base(f)) is Folder._large_class)
+            self.assertEqual(f.sub.getId(), 'sub')
+        finally:
+            conn.close()
+
+    def test_converted_in_other_connection(self):
+        import transaction
+        from OFS.Folder import Folder
+        self.app._setObject('g', Folder('g'))
+        self.app.g._setObject('sub', Folder('sub'))
+        transaction.commit()
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            g = conn.root()['Application'].g
+            self.assertEqual(g.sub.getId(), 'sub')
+            self.app.g.manage_convertToBTree()
+            transaction.commit()
+            tm.begin()
+            self.assertEqual(g._getOb('sub').getId(), 'sub')
+            self.assertTrue(type(aq_base(g)) is Folder._large_class)
+            self.assertEqual(g.sub.getId(), 'sub')
+        finally:
+            tm.abort()
+            conn.close()
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest( unittest.makeSuite( ObjectManagerTests ) )
+    suite.addTest( unittest.makeSuite( BTreeObjectManagerTests ) )
+    suite.addTest( unittest.makeSuite( LargeContainerTests ) )
     return suite
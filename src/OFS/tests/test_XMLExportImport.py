@@ -190,6 +190,118 @@ class XMLExportImportTests(unittest.TestCase):
         self.assertEqual(repr(img.getProperty('prop12')),
                          repr(u''))
 
+    def test_exportXML_each_record_once(self):
+        from OFS.Folder import Folder
+        from OFS.XMLExportImport import exportXML
+
+        connection, app = self._makeJarAndRoot()
+        sub = Folder('sub')
+        app._setObject('sub', sub)
+        sub = app._getOb('sub')
+        for i in range(20):
+            sub._setObject('f%d' % i, Folder('f%d' % i))
+            # referenced twice
+            sub._getOb('f%d' % i).sibling = sub
+        transaction.savepoint(optimistic=True)
+
+        stream = StringIO()
+        exportXML(connection, sub._p_oid, stream)
+        data = stream.getvalue()
+        self.assertEqual(data.count('<record '), 21)
+        # the records of sub come first
+        self.assertTrue(data.find('aka="%s"' % _aka(sub._p_oid)) <
+                        data.find('aka="%s"' % _aka(sub.f0._p_oid)))
+
+    def test_importXML_reads_in_parts(self):
+        from OFS.XMLExportImport import importXML
+
+        class PartFile:
+            def __init__(self, path):
+                self.file = open(path, 'rb')
+            def read(self, size):
+                return self.file.read(size)
+
+        connection, app = self._makeJarAndRoot()
+        newobj = importXML(connection, PartFile(xmldata))
+        img = newobj._getOb('image')
+        self.assertEqual(img.data, open(imagedata, 'rb').read())
+
+    def test_ResponseFile(self):
+        from OFS.XMLExportImport import ResponseFile
+        response = DummyResponse()
+        f = ResponseFile(response)
+        f.chunk_size = 10
+        f.write('12345')
+        self.assertEqual(response.written, [])
+        f.write('678901')
+        f.write('abc')
+        self.assertEqual(response.written, ['12345678901'])
+        f.flush()
+        f.flush()
+        self.assertEqual(response.written, ['12345678901', 'abc'])
+
+    def test_manage_exportObject_download(self):
+        from OFS.DTMLMethod import DTMLMethod
+        from OFS.XMLExportImport import importXML
+
+        connection, app = self._makeJarAndRoot()
+        dm = DTMLMethod('test')
+        dm.munge(_LONG_DTML)
+        app._setObject('test', dm)
+        transaction.savepoint(optimistic=True) # need an OID!
+
+        response = DummyResponse()
+        result = app.manage_exportObject('test', download=1, toxml=1,
+                                         RESPONSE=response)
+        self.assertTrue(result is response)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         'inline;filename=test.xml')
+        data = ''.join(response.written)
+        self.assertEqual(data, app.manage_exportObject('test', download=1,
+                                                       toxml=1))
+        newobj = importXML(connection, StringIO(data))
+        self.assertEqual(newobj.read(), dm.read())
+
+    def test_manage_exportObject_download_zexp(self):
+        from OFS.DTMLMethod import DTMLMethod
+
+        connection, app = self._makeJarAndRoot()
+        dm = DTMLMethod('test')
+        dm.munge(_LONG_DTML)
+        app._setObject('test', dm)
+        transaction.savepoint(optimistic=True) # need an OID!
+
+        response = DummyResponse()
+        result = app.manage_exportObject('test', download=1,
+                                         RESPONSE=response)
+        self.assertTrue(result is response)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         'inline;filename=test.zexp')
+        data = ''.join(response.written)
+        self.assertTrue(data.startswith('ZEXP'))
+        self.assertEqual(data, app.manage_exportObject('test', download=1))
+        newobj = connection.importFile(StringIO(data))
+        self.assertEqual(newobj.read(), dm.read())
+
+
+class DummyResponse:
+
+    def __init__(self):
+        self.headers = {}
+        self.written = []
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def write(self, data):
+        self.written.append(data)
+
+
+def _aka(oid):
+    from base64 import encodestring
+    return encodestring(oid)[:-1]
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(XMLExportImportTests),
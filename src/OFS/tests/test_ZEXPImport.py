@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import transaction
+
+
+class ImporterTests(unittest.TestCase):
+
+    def setUp(self):
+        from OFS.Folder import Folder
+        from ZODB.DB import DB
+        from ZODB.DemoStorage import DemoStorage
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = DB(DemoStorage())
+        self.connection = self.db.open()
+        root = self.connection.root()
+        app = root['app'] = Folder('app')
+        sub = Folder('sub')
+        app._setObject('sub', sub)
+        sub = app._getOb('sub')
+        for i in range(10):
+            sub._setObject('f%d' % i, Folder('f%d' % i))
+        transaction.commit()
+        self.app = app
+        self.path = os.path.join(self.tmpdir, 'sub.zexp')
+        self.connection.exportFile(sub._p_oid, self.path)
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, batch_size=3):
+        from OFS.ZEXPImport import Importer
+        return Importer(self.db, self.path, batch_size)
+
+    def _checkImported(self, oid):
+        ob = self.connection.get(oid)
+        self.assertEqual(ob.getId(), 'sub')
+        self.assertEqual(len(ob.objectIds()), 10)
+        self.assertEqual(ob.f9.getId(), 'f9')
+        self.assertNotEqual(oid, self.app.sub._p_oid)
+
+    def test_run(self):
+        importer = self._makeOne()
+        oid = importer.run()
+        self._checkImported(oid)
+        status = importer.status.getStatus()
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual(status['records'], 11)
+        self.assertEqual(status['batches'], 4)
+        self.assertEqual(status['progress'], 1.0)
+        self.assertEqual(status['resumed'], 0)
+        self.assertTrue(os.path.exists(importer.checkpoint))
+        importer.finish()
+        self.assertFalse(os.path.exists(importer.checkpoint))
+
+    def test_resume(self):
+        from OFS.ZEXPImport import getImportStatus
+        from OFS.ZEXPImport import Importer
+
+        class Failing(Importer):
+            def _storeBatch(self, batch, end):
+                if self.status.batches == 2:
+                    raise IOError('disk full')
+                Importer._storeBatch(self, batch, end)
+
+        importer = Failing(self.db, self.path, 3)
+        self.assertRaises(IOError, importer.run)
+        status = getImportStatus(self.path)
+        self.assertEqual(status['state'], 'failed')
+        self.assertEqual(status['error'], 'disk full')
+        self.assertEqual(status['records'], 6)
+        self.assertTrue(0 < status['progress'] < 1)
+
+        importer = self._makeOne()
+        oid = importer.run()
+        self._checkImported(oid)
+        status = getImportStatus(self.path)
+        self.assertEqual(status['resumed'], 1)
+        self.assertEqual(status['records'], 11)
+        self.assertEqual(status['batches'], 4)
+
+    def test_refuses_concurrent_import(self):
+        from ZODB.POSException import ExportError
+        from OFS.ZEXPImport import getImportStatus
+        first = self._makeOne()
+        second = self._makeOne()
+
+        # Start the second import while the first stores its first batch
+        errors = []
+        store_batch = first._storeBatch
+        def _storeBatch(batch, end):
+            if not errors:
+                try:
+                    second.run()
+                except ExportError, e:
+                    errors.append(e)
+            store_batch(batch, end)
+        first._storeBatch = _storeBatch
+        oid = first.run()
+        self.assertEqual(len(errors), 1)
+        self._checkImported(oid)
+        self.assertEqual(getImportStatus(self.path)['state'], 'done')
+        # once it's done, the file can be imported again
+        self.assertEqual(second.run(), oid)
+
+    def test_finished_statuses_are_dropped(self):
+        from OFS import ZEXPImport
+        importer = self._makeOne()
+        importer.run()
+        importer.status.finished -= ZEXPImport.STATUS_LIFETIME + 1
+        other = os.path.join(self.tmpdir, 'other.zexp')
+        self.connection.exportFile(self.app._p_oid, other)
+        ZEXPImport.Importer(self.db, other).run()
+        self.assertEqual(ZEXPImport.getImportStatus(self.path), None)
+        self.assertEqual(ZEXPImport.getImportStatus(other)['state'], 'done')
+
+    def test_checkpoint_of_another_file(self):
+        importer = self._makeOne()
+        importer.run()
+        self.connection.exportFile(self.app._p_oid, self.path)
+        importer = self._makeOne()
+        oid = importer.run()
+        self.assertEqual(importer.status.resumed, 0)
+        self.assertEqual(self.connection.get(oid).getId(), 'app')
+
+    def test_truncated(self):
+        from ZODB.POSException import ExportError
+        data = open(self.path, 'rb').read()
+        open(self.path, 'wb').write(data[:-20])
+        importer = self._makeOne()
+        self.assertRaises(ExportError, importer.run)
+        self.assertEqual(importer.status.state, 'failed')
+
+    def test_importObjectFromFile(self):
+        from OFS.Folder import Folder
+        self.app._setObject('target', Folder('target'))
+        target = self.app._getOb('target')
+        target._importObjectFromFile(self.path, verify=0, set_owner=0,
+                                     batch_size=4)
+        self.assertEqual(len(target.sub.objectIds()), 10)
+        self.assertTrue(os.path.exists(self.path + '.checkpoint'))
+        transaction.commit()
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(ImporterTests),
+        ))
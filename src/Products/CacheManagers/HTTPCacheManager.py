@@ -0,0 +1,273 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""HTTP accelerator cache manager
+
+Doesn't store anything itself, but sets the response headers which let
+front-end proxies (e.g. Varnish or Squid) cache the results, and purges
+the proxies when an object is invalidated.
+"""
+
+import httplib
+import logging
+import os
+import threading
+import time
+import urlparse
+from hashlib import md5
+
+from AccessControl.class_init import InitializeClass
+from AccessControl.Permissions import view_management_screens
+from AccessControl.SecurityInfo import ClassSecurityInfo
+from AccessControl.SecurityManagement import getSecurityManager
+from Acquisition import aq_get
+from App.Common import rfc1123_date
+from OFS.Cache import Cache
+from OFS.Cache import CacheManager
+from OFS.Cache import ChangeCacheSettingsPermission
+from OFS.SimpleItem import SimpleItem
+import OFS.Cache
+from Products.PageTemplates.PageTemplateFile import PageTemplateFile
+import transaction
+from ZPublisher.conditional import get_validators
+from ZPublisher.conditional import quote_etag
+
+from Products.CacheManagers.RAMCacheManager import freeze
+
+LOG = logging.getLogger('Zope.HTTPCacheManager')
+
+_www = os.path.join(os.path.dirname(__file__), 'www')
+
+PURGE_METHODS = ('PURGE', 'BAN')
+
+# Seconds to wait for a proxy to answer a purge request
+purge_timeout = 5
+
+
+def purge(method, url):
+    """Send one purge request, return the response status
+    """
+    scheme, host, path, query, fragment = urlparse.urlsplit(url)
+    if scheme == 'https':
+        conn = httplib.HTTPSConnection(host, timeout=purge_timeout)
+    else:
+        conn = httplib.HTTPConnection(host, timeout=purge_timeout)
+    if query:
+        path = '%s?%s' % (path, query)
+    try:
+        conn.request(method, path or '/')
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def purge_all(requests):
+    """Send purge requests, logging failures
+    """
+    for method, url in requests:
+        try:
+            status = purge(method, url)
+        except Exception:
+            LOG.warn('%s %s failed' % (method, url), exc_info=True)
+        else:
+            if status >= 400 and status != 404:
+                LOG.warn('%s %s answered %d' % (method, url, status))
+
+
+class PurgeQueue:
+    """The purge requests of one transaction
+
+    Registered as an after commit hook, the requests are sent in a
+    separate thread once the transaction has been committed, and dropped
+    if it is aborted.
+    """
+
+    thread = None
+
+    def __init__(self):
+        self.requests = []
+
+    def add(self, method, url):
+        if (method, url) not in self.requests:
+            self.requests.append((method, url))
+
+    def __call__(self, status):
+        if not status or not self.requests:
+            return
+        self.thread = threading.Thread(target=purge_all,
+                                       args=(self.requests,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+
+def queuePurge(method, url, txn=None):
+    """Purge 'url' from a proxy after the current transaction commits
+    """
+    if txn is None:
+        txn = transaction.get()
+    for hook, args, kws in txn.getAfterCommitHooks():
+        if isinstance(hook, PurgeQueue):
+            break
+    else:
+        hook = PurgeQueue()
+        txn.addAfterCommitHook(hook)
+    hook.add(method, url)
+
+
+class HTTPCache(Cache):
+    """Sets caching headers on responses and purges proxies
+    """
+
+    def __init__(self, settings):
+        self.max_age = settings['max_age']
+        self.surrogate_max_age = settings['surrogate_max_age']
+        self.anonymous_only = settings['anonymous_only']
+        self.vary = settings['vary']
+        self.proxy_urls = settings['proxy_urls']
+        self.purge_method = settings['purge_method']
+
+    def ZCache_get(self, ob, view_name='', keywords=None,
+                   mtime_func=None, default=None):
+        return default
+
+    def ZCache_set(self, ob, data, view_name='', keywords=None,
+                   mtime_func=None):
+        request = aq_get(ob, 'REQUEST', None, 1)
+        response = getattr(request, 'RESPONSE', None)
+        if response is None:
+            return
+        if self.anonymous_only:
+            user = getSecurityManager().getUser()
+            if user is not None and user.getUserName() != 'Anonymous User':
+                return
+        mtime = ob.ZCacheable_getModTime(mtime_func)
+        if mtime:
+            response.setHeader('Last-Modified', rfc1123_date(mtime))
+        if not response.getHeader('ETag'):
+            # Prefer the entity tag the publisher checks conditional
+            # requests against.
+            validators = get_validators(ob)
+            tag = validators is not None and validators.getETag() or None
+            if tag is None:
+                tag = md5(repr((ob.getPhysicalPath(), view_name,
+                                freeze(keywords), mtime))).hexdigest()
+            response.setHeader('ETag', quote_etag(tag))
+        if self.max_age:
+            response.setHeader('Cache-Control',
+                               'public, max-age=%d' % self.max_age)
+            response.setHeader('Expires',
+                               rfc1123_date(time.time() + self.max_age))
+        if self.surrogate_max_age:
+            response.setHeader('Surrogate-Control',
+                               'max-age=%d' % self.surrogate_max_age)
+        if self.vary:
+            vary = response.getHeader('Vary') or ''
+            names = [v.strip().lower() for v in vary.split(',')]
+            if self.vary.lower() not in names:
+                response.appendHeader('Vary', self.vary)
+
+    def ZCache_invalidate(self, ob):
+        if not self.proxy_urls:
+            return 'No proxies to purge.'
+        path = ob.absolute_url_path()
+        for proxy in self.proxy_urls:
+            queuePurge(self.purge_method, proxy.rstrip('/') + path)
+        return ('%s of %s queued for %d proxies.' %
+                (self.purge_method, path, len(self.proxy_urls)))
+
+
+class HTTPCacheManager(CacheManager, SimpleItem):
+    """Cache manager for HTTP accelerators
+
+    Sets 'Cache-Control', 'Expires', 'Surrogate-Control', 'Last-Modified',
+    'ETag' and 'Vary' headers on the responses of associated objects and
+    sends PURGE or BAN requests to the configured proxies after a
+    transaction invalidating an object has been committed.
+    """
+
+    meta_type = 'HTTP Accelerator Cache Manager'
+
+    max_age = 3600
+    surrogate_max_age = 0
+    anonymous_only = True
+    vary = 'Accept-Encoding'
+    proxy_urls = ()
+    purge_method = 'PURGE'
+
+    security = ClassSecurityInfo()
+
+    manage_options = (
+        {'label': 'Properties', 'action': 'manage_main'},
+        ) + CacheManager.manage_options + SimpleItem.manage_options
+
+    security.declareProtected(view_management_screens, 'manage_main')
+    manage_main = PageTemplateFile('http_main.pt', _www)
+
+    def __init__(self, id, title=''):
+        self.id = id
+        self.title = title
+
+    security.declarePrivate('ZCacheManager_getCache')
+    def ZCacheManager_getCache(self):
+        # The cache only holds a copy of the settings, so it can be used
+        # from any thread.
+        return HTTPCache(self.getSettings())
+
+    security.declareProtected(view_management_screens, 'getSettings')
+    def getSettings(self):
+        return {'max_age': self.max_age,
+                'surrogate_max_age': self.surrogate_max_age,
+                'anonymous_only': self.anonymous_only,
+                'vary': self.vary,
+                'proxy_urls': self.proxy_urls,
+                'purge_method': self.purge_method,
+               }
+
+    security.declareProtected(view_management_screens, 'getPurgeMethods')
+    def getPurgeMethods(self):
+        return PURGE_METHODS
+
+    security.declareProtected(ChangeCacheSettingsPermission, 'setSettings')
+    def setSettings(self, title='', max_age=max_age, surrogate_max_age=0,
+                    anonymous_only=False, vary='', proxy_urls=(),
+                    purge_method=purge_method, RESPONSE=None):
+        """Change the settings of this cache manager
+        """
+        if purge_method not in PURGE_METHODS:
+            raise ValueError('Invalid purge method: %r' % purge_method)
+        self.title = str(title)
+        self.max_age = int(max_age)
+        self.surrogate_max_age = int(surrogate_max_age)
+        self.anonymous_only = not not anonymous_only
+        self.vary = str(vary).strip()
+        self.proxy_urls = tuple(filter(None, [str(url).strip()
+                                              for url in proxy_urls]))
+        self.purge_method = purge_method
+        # Make the cacheable objects pick up the new settings
+        OFS.Cache.manager_timestamp = time.time()
+        if RESPONSE is not None:
+            RESPONSE.redirect(
+                '%s/manage_main?manage_tabs_message=Settings+changed.' %
+                self.absolute_url())
+
+InitializeClass(HTTPCacheManager)
+
+
+manage_addHTTPCacheManagerForm = PageTemplateFile(
+    'http_add.pt', _www, __name__='manage_addHTTPCacheManagerForm')
+
+def manage_addHTTPCacheManager(self, id, title='', REQUEST=None):
+    """Add an HTTP accelerator cache manager
+    """
+    self._setObject(id, HTTPCacheManager(id, title))
+    if REQUEST is not None:
+        return self.manage_main(self, REQUEST)
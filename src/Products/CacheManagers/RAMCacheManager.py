@@ -0,0 +1,385 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""RAM cache manager
+
+Keeps the results of Cacheable objects (e.g. rendered DTML methods and
+page templates) in memory, shared by all threads.
+"""
+
+from cPickle import dumps
+from collections import OrderedDict
+import os
+from thread import allocate_lock
+import time
+
+from AccessControl.class_init import InitializeClass
+from AccessControl.Permissions import view_management_screens
+from AccessControl.SecurityInfo import ClassSecurityInfo
+from Acquisition import aq_base
+from Acquisition import aq_get
+from OFS.Cache import Cache
+from OFS.Cache import CacheManager
+from OFS.Cache import ChangeCacheSettingsPermission
+from OFS.SimpleItem import SimpleItem
+from Products.PageTemplates.PageTemplateFile import PageTemplateFile
+
+add_cache_managers = 'Add Cache Managers'
+
+_www = os.path.join(os.path.dirname(__file__), 'www')
+
+_basic_types = (str, unicode, int, long, float, bool, type(None))
+
+
+def freeze(value):
+    """Return a hashable cache key for a keyword value
+
+    Objects with a physical path are represented by the path, users by
+    their name and anything else which isn't a basic type by its repr.
+    """
+    if isinstance(value, _basic_types):
+        return value
+    if isinstance(value, dict):
+        items = [(k, freeze(v)) for k, v in value.items()]
+        items.sort()
+        return tuple(items)
+    if isinstance(value, (list, tuple)):
+        return tuple([freeze(v) for v in value])
+    if getattr(aq_base(value), 'getPhysicalPath', None) is not None:
+        return value.getPhysicalPath()
+    if getattr(aq_base(value), 'getUserName', None) is not None:
+        return value.getUserName()
+    return repr(value)
+
+
+def estimate_size(data):
+    """Return the approximate number of bytes held by a cached value
+
+    Returns None for values which can't be measured; they are not cached.
+    """
+    if isinstance(data, str):
+        return len(data)
+    if isinstance(data, unicode):
+        return len(data) * 2
+    try:
+        return len(dumps(data, 1))
+    except Exception:
+        return None
+
+
+class _Entry:
+
+    __slots__ = ('data', 'size', 'mtime', 'created')
+
+    def __init__(self, data, size, mtime, created):
+        self.data = data
+        self.size = size
+        self.mtime = mtime
+        self.created = created
+
+
+class RAMCache(Cache):
+    """A thread-safe, size bounded LRU cache
+
+    Entries are keyed by the physical path of the object, the view name,
+    the keywords and the values of the configured request variables. An
+    entry is dropped when the object has been modified since it was
+    stored, when it is older than 'max_age' seconds, or when the least
+    recently used entries have to make room to stay within 'max_bytes'.
+    """
+
+    def __init__(self, max_bytes=1 << 26, max_age=3600,
+                 request_vars=('AUTHENTICATED_USER',), _now=time.time):
+        self._lock = allocate_lock()
+        self._entries = OrderedDict()
+        self._paths = {}
+        self._bytes = 0
+        self._now = _now
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.configure(max_bytes, max_age, request_vars)
+
+    def configure(self, max_bytes, max_age, request_vars):
+        self._lock.acquire()
+        try:
+            self.max_bytes = max_bytes
+            self.max_age = max_age
+            self.request_vars = tuple(request_vars)
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def _getKey(self, ob, view_name, keywords):
+        request_values = ()
+        if self.request_vars:
+            request = aq_get(ob, 'REQUEST', None, 1)
+            values = []
+            for name in self.request_vars:
+                value = None
+                if request is not None:
+                    value = request.get(name, None)
+                values.append(freeze(value))
+            request_values = tuple(values)
+        path = ob.getPhysicalPath()
+        return path, (path, view_name, freeze(keywords), request_values)
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._paths.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._paths[key[0]]
+
+    def _evict(self):
+        # Must be called with the lock held
+        while self._entries and self._bytes > self.max_bytes:
+            self._remove(iter(self._entries).next())
+            self.evictions += 1
+
+    def ZCache_get(self, ob, view_name='', keywords=None,
+                   mtime_func=None, default=None):
+        path, key = self._getKey(ob, view_name, keywords)
+        mtime = ob.ZCacheable_getModTime(mtime_func)
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if (entry.mtime < mtime or self.max_age and
+                entry.created + self.max_age < self._now()):
+                self._remove(key)
+                self.misses += 1
+                return default
+            # Move the entry to the most recently used end
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry.data
+        finally:
+            self._lock.release()
+
+    def ZCache_set(self, ob, data, view_name='', keywords=None,
+                   mtime_func=None):
+        if data is None:
+            return
+        size = estimate_size(data)
+        if size is None or size > self.max_bytes:
+            return
+        path, key = self._getKey(ob, view_name, keywords)
+        entry = _Entry(data, size, ob.ZCacheable_getModTime(mtime_func),
+                       self._now())
+        self._lock.acquire()
+        try:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._paths.setdefault(path, set()).add(key)
+            self._bytes += size
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def ZCache_invalidate(self, ob):
+        path = ob.getPhysicalPath()
+        self._lock.acquire()
+        try:
+            keys = list(self._paths.get(path, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        finally:
+            self._lock.release()
+        return 'Invalidated %d cache entries.' % len(keys)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._paths.clear()
+            self._bytes = 0
+        finally:
+            self._lock.release()
+
+    def getStatistics(self):
+        """Return a mapping of cache counters
+        """
+        self._lock.acquire()
+        try:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self._entries),
+                    'bytes': self._bytes,
+                    'max_bytes': self.max_bytes,
+                   }
+        finally:
+            self._lock.release()
+
+    def getEntryStatistics(self):
+        """Return the number of entries and bytes cached per object path
+        """
+        self._lock.acquire()
+        try:
+            result = []
+            for path, keys in self._paths.items():
+                size = 0
+                for key in keys:
+                    size += self._entries[key].size
+                result.append({'path': '/'.join(path),
+                               'entries': len(keys),
+                               'bytes': size})
+        finally:
+            self._lock.release()
+        result.sort(key=lambda info: info['path'])
+        return result
+
+
+# The caches are not persistent. They are shared by all threads and kept
+# by the cache id of their manager.
+caches = {}
+caches_lock = allocate_lock()
+
+
+class RAMCacheManager(CacheManager, SimpleItem):
+    """Cache manager keeping results in memory
+
+    The cached data is shared between all threads of this process, but
+    not with other ZEO clients.
+    """
+
+    meta_type = 'Memory Cache Manager'
+
+    max_bytes = 1 << 26
+    max_age = 3600
+    request_vars = ('AUTHENTICATED_USER',)
+
+    security = ClassSecurityInfo()
+
+    manage_options = (
+        {'label': 'Properties', 'action': 'manage_main'},
+        {'label': 'Statistics', 'action': 'manage_stats'},
+        ) + CacheManager.manage_options + SimpleItem.manage_options
+
+    security.declareProtected(view_management_screens, 'manage_main')
+    manage_main = PageTemplateFile('main.pt', _www)
+
+    security.declareProtected(view_management_screens, 'manage_stats')
+    manage_stats = PageTemplateFile('stats.pt', _www)
+
+    def __init__(self, id, title=''):
+        self.id = id
+        self.title = title
+        self._newCacheId()
+
+    def _newCacheId(self):
+        self._cache_id = '%s_%f' % (id(self), time.time())
+
+    security.declarePrivate('manage_afterAdd')
+    def manage_afterAdd(self, item, container):
+        if aq_base(self) is aq_base(item):
+            # A copy must not share the cache of the original, even if
+            # the original hasn't made its cache yet. A moved cache
+            # manager dropped its cache in manage_beforeDelete anyway.
+            self._newCacheId()
+        CacheManager.manage_afterAdd(self, item, container)
+
+    security.declarePrivate('manage_beforeDelete')
+    def manage_beforeDelete(self, item, container):
+        CacheManager.manage_beforeDelete(self, item, container)
+        if aq_base(self) is aq_base(item):
+            caches_lock.acquire()
+            try:
+                caches.pop(self._cache_id, None)
+            finally:
+                caches_lock.release()
+
+    security.declarePrivate('ZCacheManager_getCache')
+    def ZCacheManager_getCache(self):
+        cache = caches.get(self._cache_id)
+        if cache is None:
+            caches_lock.acquire()
+            try:
+                cache = caches.get(self._cache_id)
+                if cache is None:
+                    cache = RAMCache(self.max_bytes, self.max_age,
+                                     self.request_vars)
+                    caches[self._cache_id] = cache
+            finally:
+                caches_lock.release()
+        return cache
+
+    security.declareProtected(view_management_screens, 'getSettings')
+    def getSettings(self):
+        return {'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'request_vars': self.request_vars,
+               }
+
+    security.declareProtected(ChangeCacheSettingsPermission, 'setSettings')
+    def setSettings(self, title='', max_bytes=max_bytes, max_age=max_age,
+                    request_vars=request_vars, RESPONSE=None):
+        """Change the settings of this cache manager
+        """
+        self.title = str(title)
+        self.max_bytes = int(max_bytes)
+        self.max_age = int(max_age)
+        self.request_vars = tuple(filter(None, map(str, request_vars)))
+        self.ZCacheManager_getCache().configure(
+            self.max_bytes, self.max_age, self.request_vars)
+        if RESPONSE is not None:
+            RESPONSE.redirect(
+                '%s/manage_main?manage_tabs_message=Settings+changed.' %
+                self.absolute_url())
+
+    security.declareProtected(view_management_screens, 'getCacheStatistics')
+    def getCacheStatistics(self):
+        """Return the hit, miss and eviction counters of the cache
+        """
+        return self.ZCacheManager_getCache().getStatistics()
+
+    security.declareProtected(view_management_screens, 'getEntryStatistics')
+    def getEntryStatistics(self):
+        """Return the number of entries and bytes cached per object
+        """
+        return self.ZCacheManager_getCache().getEntryStatistics()
+
+    security.declareProtected(ChangeCacheSettingsPermission,
+                              'manage_invalidateAll')
+    def manage_invalidateAll(self, RESPONSE=None):
+        """Remove all entries from the cache
+        """
+        self.ZCacheManager_getCache().clear()
+        if RESPONSE is not None:
+            RESPONSE.redirect(
+                '%s/manage_stats?manage_tabs_message=Cache+cleared.' %
+                self.absolute_url())
+
+InitializeClass(RAMCacheManager)
+
+
+manage_addRAMCacheManagerForm = PageTemplateFile(
+    'add.pt', _www, __name__='manage_addRAMCacheManagerForm')
+
+def manage_addRAMCacheManager(self, id, title='', REQUEST=None):
+    """Add a RAM cache manager
+    """
+    self._setObject(id, RAMCacheManager(id, title))
+    if REQUEST is not None:
+        return self.manage_main(self, REQUEST)
@@ -0,0 +1,30 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Cache managers for Cacheable objects
+"""
+
+import HTTPCacheManager
+import RAMCacheManager
+
+
+def initialize(context):
+    context.registerClass(
+        RAMCacheManager.RAMCacheManager,
+        permission=RAMCacheManager.add_cache_managers,
+        constructors=(RAMCacheManager.manage_addRAMCacheManagerForm,
+                      RAMCacheManager.manage_addRAMCacheManager))
+    context.registerClass(
+        HTTPCacheManager.HTTPCacheManager,
+        permission=RAMCacheManager.add_cache_managers,
+        constructors=(HTTPCacheManager.manage_addHTTPCacheManagerForm,
+                      HTTPCacheManager.manage_addHTTPCacheManager))
@@ -0,0 +1 @@
+# CacheManagers test package
@@ -0,0 +1,223 @@
+import unittest
+
+import transaction
+
+
+class DummyRequest(dict):
+
+    def __init__(self):
+        from ZPublisher.HTTPResponse import HTTPResponse
+        self.RESPONSE = HTTPResponse()
+
+
+class DummyUser:
+
+    def __init__(self, name):
+        self.name = name
+
+    def getUserName(self):
+        return self.name
+
+
+class DummyCacheable:
+
+    def __init__(self, path, mtime=0):
+        self.path = path
+        self.mtime = mtime
+        self.REQUEST = DummyRequest()
+
+    def getPhysicalPath(self):
+        return self.path
+
+    def absolute_url_path(self):
+        return '/'.join(self.path)
+
+    def ZCacheable_getModTime(self, mtime_func=None):
+        return self.mtime
+
+
+class HTTPCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        from Products.CacheManagers import HTTPCacheManager
+        self._purge_all = HTTPCacheManager.purge_all
+        self.purged = []
+        HTTPCacheManager.purge_all = self.purged.extend
+        transaction.begin()
+
+    def tearDown(self):
+        from AccessControl.SecurityManagement import noSecurityManager
+        from Products.CacheManagers import HTTPCacheManager
+        HTTPCacheManager.purge_all = self._purge_all
+        transaction.abort()
+        noSecurityManager()
+
+    def _makeOne(self, **kw):
+        from Products.CacheManagers.HTTPCacheManager import HTTPCache
+        settings = {'max_age': 60,
+                    'surrogate_max_age': 0,
+                    'anonymous_only': True,
+                    'vary': 'Accept-Encoding',
+                    'proxy_urls': ('http://proxy1', 'http://proxy2/'),
+                    'purge_method': 'PURGE',
+                   }
+        settings.update(kw)
+        return HTTPCache(settings)
+
+    def _commit(self):
+        from Products.CacheManagers.HTTPCacheManager import PurgeQueue
+        hooks = [hook for hook, args, kws
+                 in transaction.get().getAfterCommitHooks()
+                 if isinstance(hook, PurgeQueue)]
+        transaction.commit()
+        for hook in hooks:
+            if hook.thread is not None:
+                hook.thread.join()
+
+    def test_get_returns_default(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        self.assertEqual(cache.ZCache_get(ob, default='default'), 'default')
+
+    def test_set_headers(self):
+        cache = self._makeOne(surrogate_max_age=3600)
+        ob = DummyCacheable(('', 'doc'), mtime=1000000000)
+        cache.ZCache_set(ob, None)
+        response = ob.REQUEST.RESPONSE
+        self.assertEqual(response.getHeader('Cache-Control'),
+                         'public, max-age=60')
+        self.assertEqual(response.getHeader('Surrogate-Control'),
+                         'max-age=3600')
+        self.assertEqual(response.getHeader('Last-Modified'),
+                         'Sun, 09 Sep 2001 01:46:40 GMT')
+        self.assertEqual(response.getHeader('Vary'), 'Accept-Encoding')
+        self.failUnless(response.getHeader('Expires'))
+        etag = response.getHeader('ETag')
+        self.failUnless(etag.startswith('"'))
+
+    def test_set_etag_depends_on_mtime(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'), mtime=1)
+        cache.ZCache_set(ob, None)
+        etag = ob.REQUEST.RESPONSE.getHeader('ETag')
+        ob.REQUEST = DummyRequest()
+        cache.ZCache_set(ob, None)
+        self.assertEqual(ob.REQUEST.RESPONSE.getHeader('ETag'), etag)
+        ob.REQUEST = DummyRequest()
+        ob.mtime = 2
+        cache.ZCache_set(ob, None)
+        self.assertNotEqual(ob.REQUEST.RESPONSE.getHeader('ETag'), etag)
+
+    def test_set_keeps_existing_etag_and_vary(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        response = ob.REQUEST.RESPONSE
+        response.setHeader('ETag', '"abc"')
+        response.setHeader('Vary', 'Cookie')
+        cache.ZCache_set(ob, None)
+        self.assertEqual(response.getHeader('ETag'), '"abc"')
+        self.assertEqual(response.getHeader('Vary'),
+                         'Cookie, Accept-Encoding')
+        cache.ZCache_set(ob, None)
+        self.assertEqual(response.getHeader('Vary'),
+                         'Cookie, Accept-Encoding')
+
+    def test_set_authenticated_user(self):
+        from AccessControl.SecurityManagement import newSecurityManager
+        newSecurityManager(None, DummyUser('bob'))
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        cache.ZCache_set(ob, None)
+        self.assertEqual(ob.REQUEST.RESPONSE.getHeader('Cache-Control'), None)
+        cache = self._makeOne(anonymous_only=False)
+        cache.ZCache_set(ob, None)
+        self.assertEqual(ob.REQUEST.RESPONSE.getHeader('Cache-Control'),
+                         'public, max-age=60')
+
+    def test_invalidate_purges_after_commit(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'folder', 'doc'))
+        cache.ZCache_invalidate(ob)
+        cache.ZCache_invalidate(ob)
+        self.assertEqual(self.purged, [])
+        self._commit()
+        self.assertEqual(self.purged,
+                         [('PURGE', 'http://proxy1/folder/doc'),
+                          ('PURGE', 'http://proxy2/folder/doc')])
+
+    def test_invalidate_abort_purges_nothing(self):
+        cache = self._makeOne(purge_method='BAN')
+        cache.ZCache_invalidate(DummyCacheable(('', 'doc')))
+        transaction.abort()
+        transaction.begin()
+        self._commit()
+        self.assertEqual(self.purged, [])
+
+    def test_invalidate_without_proxies(self):
+        cache = self._makeOne(proxy_urls=())
+        cache.ZCache_invalidate(DummyCacheable(('', 'doc')))
+        self._commit()
+        self.assertEqual(self.purged, [])
+
+
+class PurgeTests(unittest.TestCase):
+
+    def test_purge(self):
+        from BaseHTTPServer import BaseHTTPRequestHandler
+        from BaseHTTPServer import HTTPServer
+        import threading
+        from Products.CacheManagers.HTTPCacheManager import purge
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PURGE(self):
+                received.append((self.command, self.path))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        try:
+            status = purge('PURGE', 'http://127.0.0.1:%d/a/b?c=d' %
+                           server.server_port)
+        finally:
+            thread.join()
+            server.server_close()
+        self.assertEqual(status, 200)
+        self.assertEqual(received, [('PURGE', '/a/b?c=d')])
+
+
+class HTTPCacheManagerTests(unittest.TestCase):
+
+    def test_settings(self):
+        from Products.CacheManagers.HTTPCacheManager import HTTPCacheManager
+        manager = HTTPCacheManager('http_cache')
+        manager.setSettings('Title', '10', '20', True, ' Cookie ',
+                            ['', ' http://proxy '], 'BAN')
+        self.assertEqual(manager.getSettings(),
+                         {'max_age': 10,
+                          'surrogate_max_age': 20,
+                          'anonymous_only': True,
+                          'vary': 'Cookie',
+                          'proxy_urls': ('http://proxy',),
+                          'purge_method': 'BAN'})
+        cache = manager.ZCacheManager_getCache()
+        self.assertEqual(cache.purge_method, 'BAN')
+
+    def test_settings_invalid_purge_method(self):
+        from Products.CacheManagers.HTTPCacheManager import HTTPCacheManager
+        manager = HTTPCacheManager('http_cache')
+        self.assertRaises(ValueError, manager.setSettings,
+                          purge_method='DELETE')
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(HTTPCacheTests))
+    suite.addTest(unittest.makeSuite(PurgeTests))
+    suite.addTest(unittest.makeSuite(HTTPCacheManagerTests))
+    return suite
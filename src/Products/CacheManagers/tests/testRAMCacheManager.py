@@ -0,0 +1,227 @@
+import unittest
+
+
+class DummyRequest(dict):
+    pass
+
+
+class DummyUser:
+
+    def __init__(self, name):
+        self.name = name
+
+    def getUserName(self):
+        return self.name
+
+
+class DummyCacheable:
+
+    def __init__(self, path, mtime=0, request=None):
+        self.path = path
+        self.mtime = mtime
+        if request is None:
+            request = DummyRequest()
+        self.REQUEST = request
+
+    def getPhysicalPath(self):
+        return self.path
+
+    def ZCacheable_getModTime(self, mtime_func=None):
+        return self.mtime
+
+
+class RAMCacheTests(unittest.TestCase):
+
+    def _makeOne(self, max_bytes=1000, max_age=0, request_vars=(),
+                 _now=None):
+        from Products.CacheManagers.RAMCacheManager import RAMCache
+        if _now is None:
+            _now = lambda: 0
+        return RAMCache(max_bytes, max_age, request_vars, _now=_now)
+
+    def test_miss_then_hit(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        self.assertEqual(cache.ZCache_get(ob, default='missing'), 'missing')
+        cache.ZCache_set(ob, 'data')
+        self.assertEqual(cache.ZCache_get(ob), 'data')
+        stats = cache.getStatistics()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], 4)
+
+    def test_keys_include_view_name_and_keywords(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        cache.ZCache_set(ob, 'a', keywords={'x': [1, 2]})
+        cache.ZCache_set(ob, 'b', view_name='view', keywords={'x': [1, 2]})
+        self.assertEqual(cache.ZCache_get(ob, keywords={'x': [1, 2]}), 'a')
+        self.assertEqual(cache.ZCache_get(ob, 'view', {'x': [1, 2]}), 'b')
+        self.assertEqual(cache.ZCache_get(ob, keywords={'x': [1]}), None)
+
+    def test_keys_include_request_vars(self):
+        cache = self._makeOne(request_vars=('AUTHENTICATED_USER',))
+        ob = DummyCacheable(('', 'doc'))
+        ob.REQUEST['AUTHENTICATED_USER'] = DummyUser('alice')
+        cache.ZCache_set(ob, 'alice')
+        ob.REQUEST['AUTHENTICATED_USER'] = DummyUser('bob')
+        self.assertEqual(cache.ZCache_get(ob), None)
+        cache.ZCache_set(ob, 'bob')
+        ob.REQUEST['AUTHENTICATED_USER'] = DummyUser('alice')
+        self.assertEqual(cache.ZCache_get(ob), 'alice')
+
+    def test_modified_object_misses(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'), mtime=10)
+        cache.ZCache_set(ob, 'data')
+        ob.mtime = 20
+        self.assertEqual(cache.ZCache_get(ob), None)
+        self.assertEqual(cache.getStatistics()['entries'], 0)
+
+    def test_max_age(self):
+        now = [100]
+        cache = self._makeOne(max_age=10, _now=lambda: now[0])
+        ob = DummyCacheable(('', 'doc'))
+        cache.ZCache_set(ob, 'data')
+        now[0] = 110
+        self.assertEqual(cache.ZCache_get(ob), 'data')
+        now[0] = 111
+        self.assertEqual(cache.ZCache_get(ob), None)
+
+    def test_lru_eviction_within_byte_budget(self):
+        cache = self._makeOne(max_bytes=10)
+        a = DummyCacheable(('', 'a'))
+        b = DummyCacheable(('', 'b'))
+        c = DummyCacheable(('', 'c'))
+        cache.ZCache_set(a, 'aaaa')
+        cache.ZCache_set(b, 'bbbb')
+        # Using 'a' makes 'b' the least recently used entry
+        self.assertEqual(cache.ZCache_get(a), 'aaaa')
+        cache.ZCache_set(c, 'cccc')
+        self.assertEqual(cache.ZCache_get(b), None)
+        self.assertEqual(cache.ZCache_get(a), 'aaaa')
+        self.assertEqual(cache.ZCache_get(c), 'cccc')
+        stats = cache.getStatistics()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['bytes'], 8)
+
+    def test_too_large_and_none_not_cached(self):
+        cache = self._makeOne(max_bytes=10)
+        ob = DummyCacheable(('', 'doc'))
+        cache.ZCache_set(ob, 'x' * 11)
+        cache.ZCache_set(ob, None)
+        self.assertEqual(cache.getStatistics()['entries'], 0)
+
+    def test_replace_entry_accounts_size(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        cache.ZCache_set(ob, 'x' * 10)
+        cache.ZCache_set(ob, 'x' * 5)
+        stats = cache.getStatistics()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], 5)
+
+    def test_invalidate(self):
+        cache = self._makeOne()
+        ob = DummyCacheable(('', 'doc'))
+        other = DummyCacheable(('', 'other'))
+        cache.ZCache_set(ob, 'a')
+        cache.ZCache_set(ob, 'b', view_name='view')
+        cache.ZCache_set(other, 'c')
+        cache.ZCache_invalidate(ob)
+        self.assertEqual(cache.ZCache_get(ob), None)
+        self.assertEqual(cache.ZCache_get(ob, 'view'), None)
+        self.assertEqual(cache.ZCache_get(other), 'c')
+        self.assertEqual(cache.getStatistics()['invalidations'], 2)
+        self.assertEqual(cache.getEntryStatistics(),
+                         [{'path': '/other', 'entries': 1, 'bytes': 1}])
+
+    def test_configure_shrinks_cache(self):
+        cache = self._makeOne()
+        cache.ZCache_set(DummyCacheable(('', 'a')), 'aaaa')
+        cache.ZCache_set(DummyCacheable(('', 'b')), 'bbbb')
+        cache.configure(4, 0, ())
+        stats = cache.getStatistics()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['max_bytes'], 4)
+
+
+class RAMCacheManagerTests(unittest.TestCase):
+
+    def _makeFolder(self):
+        from OFS.DTMLMethod import DTMLMethod
+        from OFS.Folder import Folder
+        from Products.CacheManagers.RAMCacheManager \
+            import manage_addRAMCacheManager
+        root = Folder('root')
+        manage_addRAMCacheManager(root, 'cache')
+        root._setObject('doc', DTMLMethod('doc'))
+        root.doc.REQUEST = DummyRequest()
+        root.doc.ZCacheable_setManagerId('cache')
+        return root
+
+    def test_cacheable_uses_cache(self):
+        root = self._makeFolder()
+        root.doc.ZCacheable_set('result')
+        self.assertEqual(root.doc.ZCacheable_get(), 'result')
+        stats = root.cache.getCacheStatistics()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 1)
+        root.doc.ZCacheable_invalidate()
+        self.assertEqual(root.doc.ZCacheable_get(), None)
+
+    def test_setSettings(self):
+        root = self._makeFolder()
+        root.cache.setSettings('Title', '100', '60', ['', 'HTTP_HOST'])
+        self.assertEqual(root.cache.getSettings(),
+                         {'max_bytes': 100, 'max_age': 60,
+                          'request_vars': ('HTTP_HOST',)})
+        cache = root.cache.ZCacheManager_getCache()
+        self.assertEqual(cache.max_bytes, 100)
+        self.assertEqual(cache.request_vars, ('HTTP_HOST',))
+
+    def test_manage_invalidateAll(self):
+        root = self._makeFolder()
+        root.doc.ZCacheable_set('result')
+        root.cache.manage_invalidateAll()
+        self.assertEqual(root.doc.ZCacheable_get(), None)
+
+    def test_delete_drops_cache(self):
+        from Products.CacheManagers.RAMCacheManager import caches
+        root = self._makeFolder()
+        cache_id = root.cache._cache_id
+        root.cache.ZCacheManager_getCache()
+        self.failUnless(cache_id in caches)
+        root.manage_delObjects(['cache'])
+        self.failIf(cache_id in caches)
+
+    def test_copy_gets_own_cache(self):
+        from Products.CacheManagers.RAMCacheManager import RAMCacheManager
+        root = self._makeFolder()
+        original = root.cache
+        original.ZCacheManager_getCache()
+        copy = RAMCacheManager('copy')
+        copy._cache_id = original._cache_id
+        root._setObject('copy', copy)
+        self.assertNotEqual(root.copy._cache_id, original._cache_id)
+
+    def test_copy_gets_own_cache_before_original_is_used(self):
+        from Products.CacheManagers.RAMCacheManager import RAMCacheManager
+        from Products.CacheManagers.RAMCacheManager import caches
+        root = self._makeFolder()
+        original = root.cache
+        self.failIf(original._cache_id in caches)
+        copy = RAMCacheManager('copy')
+        copy._cache_id = original._cache_id
+        root._setObject('copy', copy)
+        self.assertNotEqual(root.copy._cache_id, original._cache_id)
+        self.failIf(root.copy.ZCacheManager_getCache() is
+                    original.ZCacheManager_getCache())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RAMCacheTests))
+    suite.addTest(unittest.makeSuite(RAMCacheManagerTests))
+    return suite
@@ -20,6 +20,9 @@ import urllib
 import zope.browserresource.directory
 import zope.browserresource.file
 from zope.browserresource.file import File
+from zope.browserresource.interfaces import IETag
+from zope.component import adapts
+from zope.component import queryMultiAdapter
 from zope.interface import implements
 from zope.traversing.browser import absoluteURL
 from zope.publisher.interfaces import NotFound
@@ -28,6 +31,8 @@ from zope.ptresource.ptresource import PageTemplate
 
 from Acquisition import aq_base
 from Products.Five.browser import BrowserView
+from ZPublisher.HTTPResponse import compress_static
+from ZPublisher.interfaces import IHTTPValidators
 
 
 _marker = object()
@@ -71,7 +76,44 @@ class PageTemplateResource(Resource, BrowserView):
         return pt(self.request)
 
 class FileResource(Resource, zope.browserresource.file.FileResource):
-    pass
+
+    def GET(self):
+        """Return the file data, gzip compressed if the client accepts it
+        """
+        data = super(FileResource, self).GET()
+        response = self.request.response
+        if data and response.getStatus() == 200:
+            # The compressed data is kept on the file, which is shared
+            # by all requests.
+            file = self.chooseContext()
+            compressed = compress_static(file, file.data, file.content_type,
+                                         self.request, response)
+            if compressed is not None:
+                return compressed
+        return data
+
+
+class FileResourceValidators(object):
+    """HTTP validators of file resources
+
+    Lets the publisher answer conditional requests for resources.
+    """
+    implements(IHTTPValidators)
+    adapts(FileResource)
+
+    def __init__(self, context):
+        self.context = context
+
+    def getETag(self):
+        resource = self.context
+        etag = queryMultiAdapter((resource, resource.request), IETag)
+        if etag is None:
+            return None
+        file = resource.chooseContext()
+        return etag(file.lmt, file.data)
+
+    def getLastModified(self):
+        return getattr(self.context.chooseContext(), 'lmt', None)
 
 
 class ResourceFactory(object):
@@ -0,0 +1,343 @@
+############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+############################################################################
+""" Session data container keeping its data outside of the ZODB.
+
+Only the settings of an External Session Data Container are persistent.
+The session data objects are pickled into an ISessionStore when the
+transaction using them commits, and loaded from it when they are first
+asked for in a transaction.
+"""
+from cPickle import dumps
+from cPickle import loads
+import threading
+
+from AccessControl.class_init import InitializeClass
+from AccessControl.SecurityInfo import ClassSecurityInfo
+from Acquisition import aq_base
+from App.special_dtml import DTMLFile
+from OFS.SimpleItem import SimpleItem
+import transaction
+from transaction.interfaces import IDataManager
+from zope.interface import implements
+
+from Products.Sessions.interfaces import ISessionDataContainer
+from Products.Sessions.SessionPermissions import ACCESS_CONTENTS_PERM
+from Products.Sessions.SessionPermissions import ACCESS_SESSIONDATA_PERM
+from Products.Sessions.SessionPermissions import MANAGE_CONTAINER_PERM
+from Products.Sessions.SessionPermissions import MGMT_SCREEN_PERM
+from Products.Sessions.SessionStore import getStore
+from Products.Transience.TransienceInterfaces import ItemWithId
+from Products.Transience.TransienceInterfaces import TransientItemContainer
+from Products.Transience.TransientObject import TransientObject
+
+ADD_EXTERNAL_CONTAINER_PERM = 'Add External Session Data Container'
+
+STORE_KINDS = ('memory', 'socket')
+
+# the data managers of the current transaction of each thread
+_local = threading.local()
+
+constructExternalSessionDataContainerForm = DTMLFile(
+    'dtml/addExternalDataContainer', globals())
+
+def constructExternalSessionDataContainer(self, id, title='', store='memory',
+                                          address='', timeout_mins=20,
+                                          max_bytes=1 << 26, REQUEST=None):
+    """ """
+    ob = ExternalSessionDataContainer(id, title, store, address,
+                                      timeout_mins, max_bytes)
+    self._setObject(id, ob)
+    if REQUEST is not None:
+        return self.manage_main(self, REQUEST, update_menu=1)
+
+
+class StoreDataManager:
+    """ Writes the session data objects used in a transaction to a
+    session store when the transaction commits
+
+    The objects are pickled in 'commit' and the changed ones are written
+    in one batch in 'tpc_vote'.  Sorting after the ZODB makes that happen
+    once all other resources have voted.
+    """
+
+    implements(IDataManager)
+
+    def __init__(self, name, store, timeout, txn):
+        self.name = name
+        self.store = store
+        self.timeout = timeout
+        self.transaction = txn
+        self.transaction_manager = transaction.manager
+        # key -> (pickle as loaded or None, session data object)
+        self._objects = {}
+        self._deleted = {}
+        self._pending = None
+        txn.join(self)
+
+    def get(self, key):
+        """ Return the session data object for 'key' or None """
+        if self._deleted.has_key(key):
+            return None
+        entry = self._objects.get(key)
+        if entry is None:
+            data = self.store.load([key]).get(key)
+            if data is None:
+                return None
+            entry = self._objects[key] = (data, loads(data))
+        return entry[1]
+
+    def add(self, key, ob):
+        self._deleted.pop(key, None)
+        self._objects[key] = (None, ob)
+
+    def delete(self, key):
+        self._objects.pop(key, None)
+        self._deleted[key] = 1
+
+    def _clear(self):
+        self._objects = {}
+        self._deleted = {}
+        self._pending = None
+
+    def sortKey(self):
+        return '~sessions:%s' % self.name
+
+    def abort(self, txn):
+        self._clear()
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        pending = {}
+        for key, (data, ob) in self._objects.items():
+            if not ob.isValid():
+                self._deleted[key] = 1
+                continue
+            new_data = dumps(ob, 1)
+            if new_data != data:
+                pending[key] = new_data
+        self._pending = pending
+
+    def tpc_vote(self, txn):
+        if self._pending:
+            self.store.store(self._pending, self.timeout)
+        if self._deleted:
+            self.store.delete(self._deleted.keys())
+
+    def tpc_finish(self, txn):
+        self._clear()
+
+    def tpc_abort(self, txn):
+        self._clear()
+
+
+class ExternalSessionDataContainer(SimpleItem):
+    """ A session data container keeping the session data objects in a
+    session store outside of the ZODB """
+
+    meta_type = 'External Session Data Container'
+
+    implements(ISessionDataContainer, ItemWithId, TransientItemContainer)
+
+    manage_options = (
+        {'label': 'Settings',
+         'action': 'manage_container',
+         },
+        {'label': 'Security',
+         'action': 'manage_access',
+         },
+        )
+
+    security = ClassSecurityInfo()
+    security.setPermissionDefault(MANAGE_CONTAINER_PERM, ['Manager'])
+    security.setPermissionDefault(MGMT_SCREEN_PERM, ['Manager'])
+    security.setPermissionDefault(ACCESS_CONTENTS_PERM,
+                                  ['Manager', 'Anonymous'])
+    security.setPermissionDefault(ACCESS_SESSIONDATA_PERM,
+                                  ['Manager', 'Anonymous'])
+    security.setDefaultAccess('deny')
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'manage_container')
+    manage_container = DTMLFile('dtml/manageExternalDataContainer',
+                                globals())
+
+    def __init__(self, id, title='', store='memory', address='',
+                 timeout_mins=20, max_bytes=1 << 26):
+        self.id = id
+        self.title = title
+        self.setStore(store, address, max_bytes)
+        self.setTimeoutMinutes(timeout_mins)
+
+    # helpers
+
+    def _getStore(self):
+        return getStore(self._store_kind, self._address, self._max_bytes)
+
+    def _getPath(self):
+        return '/'.join(self.getPhysicalPath())
+
+    def _getDataManager(self):
+        txn = transaction.get()
+        managers = getattr(_local, 'managers', None)
+        if managers is None:
+            managers = _local.managers = {}
+        path = self._getPath()
+        dm = managers.get(path)
+        if dm is None or dm.transaction is not txn:
+            dm = managers[path] = StoreDataManager(
+                path, self._getStore(), self._timeout_secs, txn)
+        return dm
+
+    def _getKey(self, k):
+        # keys are prefixed by the path of the container, so that
+        # containers can share a store
+        return '%s:%s' % (self._getPath(), k)
+
+    def _wrap(self, item):
+        item.setLastAccessed()
+        return item.__of__(self)
+
+    # ISessionDataContainer
+
+    security.declareProtected(ACCESS_SESSIONDATA_PERM, 'has_key')
+    def has_key(self, k):
+        return self._getDataManager().get(self._getKey(k)) is not None
+
+    security.declareProtected(ACCESS_SESSIONDATA_PERM, 'get')
+    def get(self, k, default=None):
+        item = self._getDataManager().get(self._getKey(k))
+        if item is None:
+            return default
+        return self._wrap(item)
+
+    security.declareProtected(ACCESS_SESSIONDATA_PERM, 'new_or_existing')
+    def new_or_existing(self, k):
+        dm = self._getDataManager()
+        key = self._getKey(k)
+        item = dm.get(key)
+        if item is None:
+            item = TransientObject(k)
+            dm.add(key, item)
+        return self._wrap(item)
+
+    security.declareProtected(ACCESS_SESSIONDATA_PERM, 'new')
+    def new(self, k):
+        if type(k) is not type(''):
+            raise TypeError, (k, "key is not a string type")
+        if self.has_key(k):
+            raise KeyError, "cannot duplicate key %s" % k
+        return self.new_or_existing(k)
+
+    def __getitem__(self, k):
+        item = self.get(k)
+        if item is None:
+            raise KeyError, k
+        return item
+
+    def __setitem__(self, k, v):
+        self._getDataManager().add(self._getKey(k), aq_base(v))
+
+    def __delitem__(self, k):
+        dm = self._getDataManager()
+        key = self._getKey(k)
+        if dm.get(key) is None:
+            raise KeyError, k
+        dm.delete(key)
+
+    def getId(self):
+        return self.id
+
+    # TransientItemContainer
+
+    security.declareProtected(MANAGE_CONTAINER_PERM, 'setTimeoutMinutes')
+    def setTimeoutMinutes(self, timeout_mins):
+        """ """
+        if type(timeout_mins) is not type(1):
+            raise TypeError, (timeout_mins, "Must be integer")
+        self._timeout_secs = timeout_mins * 60
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getTimeoutMinutes')
+    def getTimeoutMinutes(self):
+        """ """
+        return self._timeout_secs / 60
+
+    # The store expires the data objects by itself, so there is nothing
+    # which could call a delete notification.  Add notifications are not
+    # supported either.
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getAddNotificationTarget')
+    def getAddNotificationTarget(self):
+        return ''
+
+    security.declareProtected(MANAGE_CONTAINER_PERM,
+                              'setAddNotificationTarget')
+    def setAddNotificationTarget(self, f):
+        raise ValueError('%s does not support notifications' % self.meta_type)
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getDelNotificationTarget')
+    def getDelNotificationTarget(self):
+        return ''
+
+    security.declareProtected(MANAGE_CONTAINER_PERM,
+                              'setDelNotificationTarget')
+    def setDelNotificationTarget(self, f):
+        raise ValueError('%s does not support notifications' % self.meta_type)
+
+    # settings
+
+    security.declareProtected(MANAGE_CONTAINER_PERM, 'setStore')
+    def setStore(self, store, address='', max_bytes=1 << 26):
+        """ Use a 'memory' store of at most max_bytes bytes, or a 'socket'
+        store at address ('host:port') """
+        if store not in STORE_KINDS:
+            raise ValueError('Unknown session store %r' % store)
+        address = address.strip()
+        if store == 'socket':
+            host, port = (address.split(':', 1) + [''])[:2]
+            if not host or not port.isdigit():
+                raise ValueError('Address must be "host:port", not %r'
+                                 % address)
+        self._store_kind = store
+        self._address = address
+        self._max_bytes = int(max_bytes)
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getStoreKind')
+    def getStoreKind(self):
+        """ """
+        return self._store_kind
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getAddress')
+    def getAddress(self):
+        """ """
+        return self._address
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getMaxBytes')
+    def getMaxBytes(self):
+        """ """
+        return self._max_bytes
+
+    security.declareProtected(MANAGE_CONTAINER_PERM,
+                              'manage_changeExternalSessionDataContainer')
+    def manage_changeExternalSessionDataContainer(
+        self, title='', store='memory', address='', timeout_mins=20,
+        max_bytes=1 << 26, REQUEST=None):
+        """ Change the settings of this container """
+        self.title = title
+        self.setStore(store, address, max_bytes)
+        self.setTimeoutMinutes(timeout_mins)
+        if REQUEST is not None:
+            return self.manage_container(
+                self, REQUEST, manage_tabs_message='Changes saved.')
+
+InitializeClass(ExternalSessionDataContainer)
@@ -0,0 +1,322 @@
+############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+############################################################################
+""" Session stores keep pickled session data objects outside of the ZODB.
+
+o 'MemoryStore' keeps them in the memory of the Zope process.
+
+o 'SocketStore' keeps them in a shared server speaking the memcached
+  text protocol, so that several Zope processes see the same sessions.
+
+o 'StoreServer' is a minimal such server keeping its data in a
+  'MemoryStore', for testing and for development setups.
+"""
+from collections import OrderedDict
+from hashlib import md5
+from logging import getLogger
+import re
+import socket
+import SocketServer
+import threading
+import time
+
+from zope.interface import implements
+
+from Products.Sessions.interfaces import ISessionStore
+
+LOG = getLogger('SessionStore')
+
+bad_key_chars_in = re.compile('[\x00-\x20\x7f]').search
+
+
+class SessionStoreError(Exception):
+    """ A session store failed to load, store or delete session data """
+
+
+class MemoryStore:
+    """ A thread-safe, size bounded LRU store in the memory of the process
+    """
+
+    implements(ISessionStore)
+
+    def __init__(self, max_bytes=1 << 26, _time=time.time):
+        self.max_bytes = max_bytes
+        self._time = _time
+        self._lock = threading.Lock()
+        # key -> (expiration time or 0, data)
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+        return entry
+
+    def load(self, keys):
+        now = self._time()
+        result = {}
+        self._lock.acquire()
+        try:
+            for key in keys:
+                entry = self._drop(key)
+                if entry is None:
+                    continue
+                expires, data = entry
+                if expires and expires <= now:
+                    continue
+                # Move the entry to the most recently used end
+                self._entries[key] = entry
+                self._bytes += len(data)
+                result[key] = data
+        finally:
+            self._lock.release()
+        return result
+
+    def store(self, items, timeout=0):
+        expires = timeout and self._time() + timeout or 0
+        self._lock.acquire()
+        try:
+            for key, data in items.items():
+                self._drop(key)
+                if len(data) > self.max_bytes:
+                    LOG.warn('Session data for %r exceeds the size of the '
+                             'store, not stored' % key)
+                    continue
+                self._entries[key] = (expires, data)
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                key, entry = self._entries.popitem(last=False)
+                self._bytes -= len(entry[1])
+        finally:
+            self._lock.release()
+
+    def delete(self, keys):
+        self._lock.acquire()
+        try:
+            for key in keys:
+                self._drop(key)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def getSize(self):
+        """ Return the number of bytes of data in the store """
+        return self._bytes
+
+
+class SocketStore:
+    """ A client of a server speaking the memcached text protocol
+
+    Every thread uses its own connection.  Keys which memcached would
+    not accept are replaced by their MD5 digest.
+    """
+
+    implements(ISessionStore)
+
+    def __init__(self, address, socket_timeout=5.0):
+        if isinstance(address, basestring):
+            host, port = address.rsplit(':', 1)
+            address = (host, int(port))
+        self.address = address
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+
+    def _encodeKey(self, key):
+        if len(key) > 250 or bad_key_chars_in(key):
+            return 'md5:' + md5(key).hexdigest()
+        return key
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection(self.address,
+                                            self.socket_timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            sock, rfile = conn
+            rfile.close()
+            sock.close()
+
+    def _call(self, request, read_reply):
+        # A connection left over from an earlier request may have been
+        # closed by the server; retry once on a new connection then.
+        retry = getattr(self._local, 'conn', None) is not None
+        while 1:
+            try:
+                sock, rfile = self._connect()
+                sock.sendall(request)
+                return read_reply(rfile)
+            except (socket.error, EOFError), e:
+                self.close()
+                if not retry:
+                    raise SessionStoreError('Session store at %s:%s failed: %s'
+                                            % (self.address + (e,)))
+                retry = False
+
+    def _readLine(self, rfile):
+        line = rfile.readline()
+        if not line.endswith('\r\n'):
+            raise EOFError('connection closed')
+        return line[:-2]
+
+    def load(self, keys):
+        if not keys:
+            return {}
+        encoded = dict([(self._encodeKey(key), key) for key in keys])
+
+        def read_reply(rfile):
+            result = {}
+            while 1:
+                line = self._readLine(rfile)
+                if line == 'END':
+                    return result
+                parts = line.split()
+                if parts[0] != 'VALUE' or len(parts) < 4:
+                    raise SessionStoreError('Unexpected reply %r' % line)
+                length = int(parts[3])
+                data = rfile.read(length + 2)
+                if len(data) != length + 2:
+                    raise EOFError('connection closed')
+                key = encoded.get(parts[1])
+                if key is not None:
+                    result[key] = data[:-2]
+
+        return self._call('get %s\r\n' % ' '.join(encoded.keys()), read_reply)
+
+    def store(self, items, timeout=0):
+        if not items:
+            return
+        request = []
+        for key, data in items.items():
+            request.append('set %s 0 %d %d\r\n%s\r\n' % (
+                self._encodeKey(key), timeout, len(data), data))
+
+        def read_reply(rfile):
+            for i in range(len(items)):
+                line = self._readLine(rfile)
+                if line != 'STORED':
+                    raise SessionStoreError('Unexpected reply %r' % line)
+
+        self._call(''.join(request), read_reply)
+
+    def delete(self, keys):
+        if not keys:
+            return
+        request = ''.join(['delete %s\r\n' % self._encodeKey(key)
+                           for key in keys])
+
+        def read_reply(rfile):
+            for i in range(len(keys)):
+                line = self._readLine(rfile)
+                if line not in ('DELETED', 'NOT_FOUND'):
+                    raise SessionStoreError('Unexpected reply %r' % line)
+
+        self._call(request, read_reply)
+
+
+class StoreRequestHandler(SocketServer.StreamRequestHandler):
+    """ Handles the 'get', 'set', 'delete' and 'quit' commands of the
+    memcached text protocol """
+
+    def handle(self):
+        store = self.server.store
+        while 1:
+            line = self.rfile.readline()
+            if not line.endswith('\r\n'):
+                return
+            parts = line.split()
+            if not parts:
+                self.wfile.write('ERROR\r\n')
+                continue
+            command = parts[0]
+            if command == 'get' and len(parts) > 1:
+                reply = []
+                for key, data in store.load(parts[1:]).items():
+                    reply.append('VALUE %s 0 %d\r\n%s\r\n' % (
+                        key, len(data), data))
+                reply.append('END\r\n')
+                self.wfile.write(''.join(reply))
+            elif command == 'set' and len(parts) == 5:
+                length = int(parts[4])
+                data = self.rfile.read(length + 2)
+                if len(data) != length + 2:
+                    return
+                store.store({parts[1]: data[:-2]}, int(parts[3]))
+                self.wfile.write('STORED\r\n')
+            elif command == 'delete' and len(parts) == 2:
+                if store.load([parts[1]]):
+                    store.delete([parts[1]])
+                    self.wfile.write('DELETED\r\n')
+                else:
+                    self.wfile.write('NOT_FOUND\r\n')
+            elif command == 'quit':
+                return
+            else:
+                self.wfile.write('ERROR\r\n')
+
+
+class StoreServer(SocketServer.ThreadingTCPServer):
+    """ A minimal stand-in for a memcached server """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), store=None):
+        if store is None:
+            store = MemoryStore()
+        self.store = store
+        SocketServer.ThreadingTCPServer.__init__(self, address,
+                                                 StoreRequestHandler)
+
+    def getAddress(self):
+        return '%s:%d' % self.server_address[:2]
+
+    def start(self):
+        """ Serve requests in a daemon thread """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def getStore(kind, address='', max_bytes=1 << 26):
+    """ Return the store shared by all containers of the process with the
+    same settings """
+    if kind == 'memory':
+        spec = (kind, max_bytes)
+    elif kind == 'socket':
+        spec = (kind, address)
+    else:
+        raise ValueError('Unknown session store %r' % kind)
+    _stores_lock.acquire()
+    try:
+        store = _stores.get(spec)
+        if store is None:
+            if kind == 'memory':
+                store = MemoryStore(max_bytes)
+            else:
+                store = SocketStore(address)
+            _stores[spec] = store
+        return store
+    finally:
+        _stores_lock.release()
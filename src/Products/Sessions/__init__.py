@@ -18,6 +18,7 @@ from Products.Sessions.interfaces import SessionDataManagerErr  #BBB
 def initialize(context):
 
     import BrowserIdManager
+    import ExternalDataContainer
     import SessionDataManager
 
     context.registerClass(
@@ -34,6 +35,14 @@ def initialize(context):
                       SessionDataManager.constructSessionDataManager)
         )
 
+    context.registerClass(
+        ExternalDataContainer.ExternalSessionDataContainer,
+        permission=ExternalDataContainer.ADD_EXTERNAL_CONTAINER_PERM,
+        constructors=(
+            ExternalDataContainer.constructExternalSessionDataContainerForm,
+            ExternalDataContainer.constructExternalSessionDataContainer)
+        )
+
     # do module security declarations so folks can use some of the
     # module-level stuff in PythonScripts
     #
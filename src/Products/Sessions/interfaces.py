@@ -226,3 +226,47 @@ class SessionDataManagerErr(ValueError):
 
        from Products.Sessions.interfaces import SessionDataManagerErr
     """
+
+class ISessionDataContainer(Interface):
+    """ A container of Session Data Objects.
+
+    o A Session Data Manager finds its session data container at its
+      container path.  Transient Object Containers keep the session
+      data objects in the ZODB, External Session Data Containers in an
+      ISessionStore.
+    """
+    def has_key(key):
+        """ Return true if a Session Data Object is stored for 'key'.
+        """
+
+    def get(key, default=None):
+        """ Return the Session Data Object stored for 'key' or 'default'.
+        """
+
+    def new_or_existing(key):
+        """ Return the Session Data Object stored for 'key', creating and
+        storing a new one if there is none.
+        """
+
+class ISessionStore(Interface):
+    """ Storage for pickled Session Data Objects outside of the ZODB.
+
+    o A store is shared by all threads of a Zope process, and maybe by
+      several processes.  It does not take part in transactions; External
+      Session Data Containers write to it when a transaction commits.
+    """
+    def load(keys):
+        """ Return a mapping of those of 'keys' which are stored to their
+        data.
+        """
+
+    def store(items, timeout=0):
+        """ Store the data of a mapping of keys to data.
+
+        o The entries expire 'timeout' seconds later, never if 'timeout'
+          is 0.
+        """
+
+    def delete(keys):
+        """ Remove the entries for 'keys', if they are stored.
+        """
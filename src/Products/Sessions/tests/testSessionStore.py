@@ -0,0 +1,330 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+import unittest
+
+import transaction
+
+
+class FakeTime:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingStore:
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.loads = []
+        self.stores = []
+        self.deletes = []
+
+    def load(self, keys):
+        self.loads.append(list(keys))
+        return self.wrapped.load(keys)
+
+    def store(self, items, timeout=0):
+        self.stores.append(dict(items))
+        self.wrapped.store(items, timeout)
+
+    def delete(self, keys):
+        self.deletes.append(list(keys))
+        self.wrapped.delete(keys)
+
+
+class MemoryStoreTests(unittest.TestCase):
+
+    def _makeOne(self, max_bytes=100):
+        from Products.Sessions.SessionStore import MemoryStore
+        self.time = FakeTime()
+        return MemoryStore(max_bytes, _time=self.time)
+
+    def test_interface(self):
+        from zope.interface.verify import verifyClass
+        from Products.Sessions.interfaces import ISessionStore
+        from Products.Sessions.SessionStore import MemoryStore
+        verifyClass(ISessionStore, MemoryStore)
+
+    def test_store_load_delete(self):
+        store = self._makeOne()
+        store.store({'a': 'A', 'b': 'BB'})
+        self.assertEqual(store.load(['a', 'b', 'c']), {'a': 'A', 'b': 'BB'})
+        self.assertEqual(store.getSize(), 3)
+        store.delete(['a', 'c'])
+        self.assertEqual(store.load(['a', 'b']), {'b': 'BB'})
+        self.assertEqual(store.getSize(), 2)
+
+    def test_timeout(self):
+        store = self._makeOne()
+        store.store({'a': 'A'}, timeout=60)
+        store.store({'b': 'B'})
+        self.time.now += 59
+        self.assertEqual(store.load(['a', 'b']), {'a': 'A', 'b': 'B'})
+        self.time.now += 1
+        self.assertEqual(store.load(['a', 'b']), {'b': 'B'})
+        self.assertEqual(len(store), 1)
+
+    def test_least_recently_used_are_dropped(self):
+        store = self._makeOne(max_bytes=30)
+        store.store({'a': 'x' * 10})
+        store.store({'b': 'x' * 10})
+        store.store({'c': 'x' * 10})
+        store.load(['a'])
+        store.store({'d': 'x' * 10})
+        self.assertEqual(sorted(store.load(['a', 'b', 'c', 'd']).keys()),
+                         ['a', 'c', 'd'])
+        self.assertEqual(store.getSize(), 30)
+
+    def test_too_large_is_not_stored(self):
+        store = self._makeOne(max_bytes=5)
+        store.store({'a': 'A'})
+        store.store({'a': 'x' * 10})
+        self.assertEqual(store.load(['a']), {})
+        self.assertEqual(store.getSize(), 0)
+
+
+class SocketStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        from Products.Sessions.SessionStore import StoreServer
+        self.server = StoreServer()
+        self.thread = self.server.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _makeOne(self):
+        from Products.Sessions.SessionStore import SocketStore
+        return SocketStore(self.server.getAddress())
+
+    def test_interface(self):
+        from zope.interface.verify import verifyClass
+        from Products.Sessions.interfaces import ISessionStore
+        from Products.Sessions.SessionStore import SocketStore
+        verifyClass(ISessionStore, SocketStore)
+
+    def test_store_load_delete(self):
+        store = self._makeOne()
+        data = 'line\r\nEND\r\n\x00' * 100
+        store.store({'a': data, 'b': ''}, 60)
+        self.assertEqual(store.load(['a', 'b', 'c']), {'a': data, 'b': ''})
+        store.delete(['a', 'c'])
+        self.assertEqual(store.load(['a', 'b']), {'b': ''})
+        store.close()
+
+    def test_keys_memcached_would_refuse(self):
+        store = self._makeOne()
+        keys = ['with space', 'x' * 300]
+        store.store({keys[0]: '1', keys[1]: '2'})
+        self.assertEqual(store.load(keys), {keys[0]: '1', keys[1]: '2'})
+        self.assertEqual(self.server.store.load(keys), {})
+
+    def test_reconnect(self):
+        store = self._makeOne()
+        store.store({'a': 'A'})
+        # the server drops the connection
+        store._local.conn[0].shutdown(2)
+        self.assertEqual(store.load(['a']), {'a': 'A'})
+
+    def test_server_down(self):
+        from Products.Sessions.SessionStore import SessionStoreError
+        store = self._makeOne()
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertRaises(SessionStoreError, store.load, ['a'])
+
+
+class ExternalSessionDataContainerTests(unittest.TestCase):
+
+    def setUp(self):
+        from Products.Sessions.SessionStore import MemoryStore
+        transaction.abort()
+        self.store = CountingStore(MemoryStore())
+
+    def tearDown(self):
+        transaction.abort()
+
+    def _makeOne(self, timeout_mins=20):
+        from Products.Sessions.ExternalDataContainer \
+            import ExternalSessionDataContainer
+        container = ExternalSessionDataContainer('sessions',
+                                                 timeout_mins=timeout_mins)
+        container._getStore = lambda: self.store
+        return container
+
+    def test_interfaces(self):
+        from zope.interface.verify import verifyClass
+        from Products.Sessions.interfaces import ISessionDataContainer
+        from Products.Sessions.ExternalDataContainer \
+            import ExternalSessionDataContainer
+        verifyClass(ISessionDataContainer, ExternalSessionDataContainer)
+
+    def test_commit_stores_new_objects(self):
+        container = self._makeOne()
+        ob = container.new_or_existing('abc')
+        ob['x'] = 1
+        self.failUnless(container.has_key('abc'))
+        self.assertEqual(self.store.stores, [])
+        transaction.commit()
+        self.assertEqual(len(self.store.stores), 1)
+        self.assertEqual(self.store.stores[0].keys(), ['sessions:abc'])
+        ob = container.get('abc')
+        self.assertEqual(ob['x'], 1)
+        self.assertEqual(ob.getContainerKey(), 'abc')
+        self.failUnless(ob.aq_parent is container)
+
+    def test_abort_stores_nothing(self):
+        container = self._makeOne()
+        container.new_or_existing('abc')['x'] = 1
+        transaction.abort()
+        self.assertEqual(self.store.stores, [])
+        self.assertEqual(container.get('abc'), None)
+        self.failIf(container.has_key('abc'))
+
+    def test_objects_are_loaded_once_per_transaction(self):
+        container = self._makeOne()
+        container.new_or_existing('abc')['x'] = 1
+        transaction.commit()
+        self.store.loads = []
+        ob = container['abc']
+        self.failUnless(container.get('abc').aq_base is ob.aq_base)
+        self.failUnless(container.new_or_existing('abc').aq_base is
+                        ob.aq_base)
+        self.assertEqual(self.store.loads, [['sessions:abc']])
+
+    def test_unchanged_objects_are_not_stored(self):
+        container = self._makeOne()
+        container.new_or_existing('abc')['x'] = 1
+        container.new_or_existing('def')['y'] = 2
+        transaction.commit()
+        self.assertEqual(len(self.store.stores), 1)
+        self.assertEqual(len(self.store.stores[0]), 2)
+        container['abc']
+        container['def']['y'] = 3
+        transaction.commit()
+        self.assertEqual(self.store.stores[1].keys(), ['sessions:def'])
+        self.assertEqual(container['def']['y'], 3)
+
+    def test_timeout_is_passed_to_store(self):
+        container = self._makeOne(timeout_mins=1)
+        container.new_or_existing('abc')
+        stored = []
+        self.store.wrapped.store = lambda items, timeout: stored.append(timeout)
+        transaction.commit()
+        self.assertEqual(stored, [60])
+
+    def test_delete_and_invalidate(self):
+        container = self._makeOne()
+        container.new_or_existing('abc')
+        container.new_or_existing('def')
+        transaction.commit()
+        del container['abc']
+        container['def'].invalidate()
+        self.failIf(container.has_key('abc'))
+        self.failIf(container.has_key('def'))
+        self.assertRaises(KeyError, container.__delitem__, 'abc')
+        transaction.commit()
+        self.assertEqual(sorted(self.store.deletes[0]),
+                         ['sessions:abc', 'sessions:def'])
+        self.assertEqual(self.store.wrapped.load(['sessions:abc',
+                                                'sessions:def']), {})
+
+    def test_new(self):
+        container = self._makeOne()
+        container.new('abc')
+        self.assertRaises(KeyError, container.new, 'abc')
+        self.assertRaises(TypeError, container.new, 1)
+
+    def test_settings(self):
+        container = self._makeOne()
+        self.assertRaises(ValueError, container.setStore, 'disk')
+        self.assertRaises(ValueError, container.setStore, 'socket', 'host')
+        container.manage_changeExternalSessionDataContainer(
+            'Title', 'socket', ' localhost:11211 ', 10)
+        self.assertEqual(container.getStoreKind(), 'socket')
+        self.assertEqual(container.getAddress(), 'localhost:11211')
+        self.assertEqual(container.getTimeoutMinutes(), 10)
+        self.assertRaises(ValueError, container.setAddNotificationTarget,
+                          'script')
+
+    def test_shared_store(self):
+        from Products.Sessions.ExternalDataContainer \
+            import ExternalSessionDataContainer
+        from Products.Sessions.SessionStore import SocketStore
+        from Products.Sessions.SessionStore import StoreServer
+        server = StoreServer()
+        thread = server.start()
+        try:
+            one = ExternalSessionDataContainer('sessions', store='socket',
+                                               address=server.getAddress())
+            two = ExternalSessionDataContainer('sessions', store='socket',
+                                               address=server.getAddress())
+            # as if in two Zope processes
+            stores = [SocketStore(server.getAddress()) for i in range(2)]
+            one._getStore = lambda: stores[0]
+            two._getStore = lambda: stores[1]
+            one.new_or_existing('abc')['x'] = 1
+            transaction.commit()
+            self.assertEqual(two['abc']['x'], 1)
+            for store in stores:
+                store.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+class SessionDataManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        from OFS.Application import Application
+        from Products.Sessions.BrowserIdManager import BrowserIdManager
+        from Products.Sessions.SessionDataManager import SessionDataManager
+        from Products.Sessions.ExternalDataContainer \
+            import ExternalSessionDataContainer
+        from Testing import makerequest
+        transaction.abort()
+        root = Application()
+        root._setObject('browser_id_manager',
+                        BrowserIdManager('browser_id_manager'))
+        root._setObject('sessions', ExternalSessionDataContainer('sessions'))
+        root._setObject('session_data_manager',
+                        SessionDataManager('session_data_manager',
+                                           path='sessions'))
+        self.root = makerequest.makerequest(root)
+
+    def tearDown(self):
+        transaction.abort()
+
+    def test_sessions_survive_the_transaction(self):
+        sdm = self.root.session_data_manager
+        sd = sdm.getSessionData()
+        sd['x'] = 1
+        key = sd.getContainerKey()
+        transaction.commit()
+        self.assertEqual(sdm.getSessionDataByKey(key)['x'], 1)
+        self.failUnless(sdm.hasSessionData())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(MemoryStoreTests))
+    suite.addTest(unittest.makeSuite(SocketStoreTests))
+    suite.addTest(unittest.makeSuite(ExternalSessionDataContainerTests))
+    suite.addTest(unittest.makeSuite(SessionDataManagerTests))
+    return suite
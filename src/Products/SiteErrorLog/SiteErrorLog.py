@@ -18,6 +18,8 @@ import os
 import sys
 import time
 import logging
+from cgi import escape
+from collections import OrderedDict
 from random import random
 from thread import allocate_lock
 
@@ -47,6 +49,10 @@ log_to_event_log = 'Log to the Event Log'
 # do much harm.
 _rate_restrict_pool = {}
 
+# This dictionary maps exception name to the number of errors with that
+# name which weren't sent to the Event Log since the last one that was.
+_rate_restrict_suppressed = {}
+
 # The number of seconds that must elapse on average between sending two
 # exceptions of the same name into the the Event Log. one per minute.
 _rate_restrict_period = 60
@@ -56,12 +62,136 @@ _rate_restrict_period = 60
 # minute.
 _rate_restrict_burst = 5
 
+# The number of examples kept of each error.  The first occurrence of an
+# error and the ones numbered by a power of two are formatted and kept
+# as examples, the others are only counted.
+_keep_samples = 3
+
 _www = os.path.join(os.path.dirname(__file__), 'www')
 
 # temp_logs holds the logs.
-temp_logs = {}  # { oid -> [ traceback string ] }
+temp_logs = {}  # { oid -> ErrorLog }
+
+
+def fingerprint(strtype, tb):
+    """Returns the key under which errors are counted as the same.
+
+    That is the exception type and the code locations of the traceback.
+    """
+    if isinstance(tb, basestring):
+        return (strtype, tb)
+    locations = []
+    while tb is not None:
+        locations.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+        tb = tb.tb_next
+    return (strtype, tuple(locations))
 
-cleanup_lock = allocate_lock()
+
+class ErrorLog:
+    """The errors logged by a site error log, by fingerprint.
+
+    An entry counts the occurrences of an error and keeps some formatted
+    examples of it.  The log is shared between threads.
+    """
+
+    def __init__(self):
+        self.lock = allocate_lock()
+        self.entries = OrderedDict()  # { fingerprint -> entry }, oldest first
+
+    def occurred(self, key, strtype, now, keep_entries):
+        """Counts an occurrence of an error.
+
+        Returns the entry of the error and the number of the occurrence.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                entry = {
+                    'id': str(now) + str(random()), # Low chance of collision
+                    'type': strtype,
+                    'count': 0,
+                    'first_time': now,
+                    'samples': [],
+                    }
+            entry['count'] += 1
+            entry['time'] = now
+            self.entries[key] = entry
+            while len(self.entries) > keep_entries:
+                self.entries.popitem(last=False)
+            return entry, entry['count']
+        finally:
+            self.lock.release()
+
+    def addSample(self, entry, sample):
+        self.lock.acquire()
+        try:
+            samples = entry['samples']
+            samples.append(sample)
+            del samples[:-_keep_samples]
+        finally:
+            self.lock.release()
+
+    def forget(self, id):
+        self.lock.acquire()
+        try:
+            for key, entry in self.entries.items():
+                ids = [sample['id'] for sample in entry['samples']]
+                if entry['id'] == id or id in ids:
+                    del self.entries[key]
+        finally:
+            self.lock.release()
+
+    def trim(self, keep_entries):
+        self.lock.acquire()
+        try:
+            while len(self.entries) > keep_entries:
+                self.entries.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def _view(self, entry, sample):
+        res = sample.copy()
+        res.update({
+            'id': entry['id'],
+            'type': entry['type'],
+            'count': entry['count'],
+            'first_time': entry['first_time'],
+            'time': entry['time'],
+            'sample_time': sample['time'],
+            'sample_id': sample['id'],
+            'samples': [s.copy() for s in entry['samples']],
+            })
+        return res
+
+    def getEntries(self):
+        """Returns the entries with their latest example, most recent first.
+        """
+        self.lock.acquire()
+        try:
+            res = [self._view(entry, entry['samples'][-1])
+                   for entry in self.entries.values() if entry['samples']]
+        finally:
+            self.lock.release()
+        res.reverse()
+        return res
+
+    def getEntry(self, id):
+        """Returns an entry with the example of the given id.
+
+        The id of an entry stands for its latest example.
+        """
+        self.lock.acquire()
+        try:
+            for entry in self.entries.values():
+                for sample in entry['samples']:
+                    if sample['id'] == id:
+                        return self._view(entry, sample)
+                if entry['id'] == id and entry['samples']:
+                    return self._view(entry, entry['samples'][-1])
+            return None
+        finally:
+            self.lock.release()
 
 
 class SiteErrorLog (SimpleItem):
@@ -113,21 +243,13 @@ class SiteErrorLog (SimpleItem):
         """
         log = temp_logs.get(self._p_oid, None)
         if log is None:
-            log = []
-            temp_logs[self._p_oid] = log
+            log = temp_logs.setdefault(self._p_oid, ErrorLog())
         return log
 
     security.declareProtected(use_error_logging, 'forgetEntry')
     def forgetEntry(self, id, REQUEST=None):
         """Removes an entry from the error log."""
-        log = self._getLog()
-        cleanup_lock.acquire()
-        i=0
-        for entry in log:
-            if entry['id'] == id:
-                del log[i]
-            i += 1
-        cleanup_lock.release()
+        self._getLog().forget(id)
         if REQUEST is not None:
             REQUEST.RESPONSE.redirect(
                 '%s/manage_main?manage_tabs_message=Error+log+entry+was+removed.' %
@@ -144,72 +266,39 @@ class SiteErrorLog (SimpleItem):
 
         Called by SimpleItem's exception handler.
         Returns the url to view the error log entry
+
+        Repeated errors are only counted; the traceback and the request
+        are formatted for the examples kept of an error.
         """
         try:
             now = time.time()
             try:
-                tb_text = None
-                tb_html = None
-
                 strtype = str(getattr(info[0], '__name__', info[0]))
                 if strtype in self._ignored_exceptions:
                     return
 
-                if not isinstance(info[2], basestring):
-                    tb_text = ''.join(
-                        format_exception(*info, **{'as_html': 0}))
-                    tb_html = ''.join(
-                        format_exception(*info, **{'as_html': 1}))
-                else:
-                    tb_text = info[2]
-
+                log = self._getLog()
+                entry, count = log.occurred(fingerprint(strtype, info[2]),
+                                            strtype, now, self.keep_entries)
                 request = getattr(self, 'REQUEST', None)
                 url = None
-                username = None
-                userid   = None
-                req_html = None
-                try:
-                    strv = str(info[1])
-                except:
-                    strv = '<unprintable %s object>' % type(info[1]).__name__
                 if request:
                     url = request.get('URL', '?')
-                    usr = getSecurityManager().getUser()
-                    username = usr.getUserName()
-                    userid = usr.getId()
-                    try:
-                        req_html = str(request)
-                    except:
-                        pass
-                    if strtype == 'NotFound':
-                        strv = url
-                        next = request['TraversalRequestNameStack']
-                        if next:
-                            next = list(next)
-                            next.reverse()
-                            strv = '%s [ /%s ]' % (strv, '/'.join(next))
-
-                log = self._getLog()
-                entry_id = str(now) + str(random()) # Low chance of collision
-                log.append({
-                    'type': strtype,
-                    'value': strv,
-                    'time': now,
-                    'id': entry_id,
-                    'tb_text': tb_text,
-                    'tb_html': tb_html,
-                    'username': username,
-                    'userid': userid,
-                    'url': url,
-                    'req_html': req_html,
-                    })
-
-                cleanup_lock.acquire()
-                try:
-                    if len(log) >= self.keep_entries:
-                        del log[:-self.keep_entries]
-                finally:
-                    cleanup_lock.release()
+                if not count & (count - 1):
+                    # The first occurrence or one numbered by a power of two
+                    sample = self._makeSample(info, strtype, request)
+                    sample['time'] = now
+                    if count == 1:
+                        sample['id'] = entry['id']
+                    else:
+                        sample['id'] = str(now) + str(random())
+                    log.addSample(entry, sample)
+                    entry_id = sample['id']
+                    tb_text = sample['tb_text']
+                else:
+                    entry_id = entry['id']
+                    samples = entry['samples']
+                    tb_text = samples and samples[-1]['tb_text'] or strtype
             except:
                 LOG.error('Error while logging', exc_info=sys.exc_info())
             else:
@@ -219,13 +308,63 @@ class SiteErrorLog (SimpleItem):
         finally:
             info = None
 
+    def _makeSample(self, info, strtype, request):
+        # The HTML traceback is rendered from the text one when viewed
+        if not isinstance(info[2], basestring):
+            tb_text = ''.join(format_exception(*info, **{'as_html': 0}))
+        else:
+            tb_text = info[2]
+
+        url = None
+        username = None
+        userid   = None
+        req_html = None
+        try:
+            strv = str(info[1])
+        except:
+            strv = '<unprintable %s object>' % type(info[1]).__name__
+        if request:
+            url = request.get('URL', '?')
+            usr = getSecurityManager().getUser()
+            username = usr.getUserName()
+            userid = usr.getId()
+            try:
+                req_html = str(request)
+            except:
+                pass
+            if strtype == 'NotFound':
+                strv = url
+                next = request['TraversalRequestNameStack']
+                if next:
+                    next = list(next)
+                    next.reverse()
+                    strv = '%s [ /%s ]' % (strv, '/'.join(next))
+
+        return {
+            'value': strv,
+            'tb_text': tb_text,
+            'tb_html': None,
+            'username': username,
+            'userid': userid,
+            'url': url,
+            'req_html': req_html,
+            }
+
     def _do_copy_to_zlog(self,now,strtype,entry_id,url,tb_text):
         when = _rate_restrict_pool.get(strtype,0)
         if now>when:
             next_when = max(when, now-_rate_restrict_burst*_rate_restrict_period)
             next_when += _rate_restrict_period
             _rate_restrict_pool[strtype] = next_when
-            LOG.error('%s %s\n%s' % (entry_id, url, tb_text.rstrip()))
+            suppressed = _rate_restrict_suppressed.pop(strtype, 0)
+            if suppressed:
+                LOG.error('%s %s\n%s\n(%d more %s errors were not logged)' % (
+                    entry_id, url, tb_text.rstrip(), suppressed, strtype))
+            else:
+                LOG.error('%s %s\n%s' % (entry_id, url, tb_text.rstrip()))
+        else:
+            _rate_restrict_suppressed[strtype] = (
+                _rate_restrict_suppressed.get(strtype, 0) + 1)
 
     security.declareProtected(use_error_logging, 'getProperties')
     def getProperties(self):
@@ -252,6 +391,7 @@ class SiteErrorLog (SimpleItem):
             # Before turning on event logging, check the permission.
             self.checkEventLogPermission()
         self.keep_entries = int(keep_entries)
+        self._getLog().trim(self.keep_entries)
         self.copy_to_zlog = copy_to_zlog
         self._ignored_exceptions = tuple(
             filter(None, map(str, ignored_exceptions)))
@@ -264,12 +404,10 @@ class SiteErrorLog (SimpleItem):
     def getLogEntries(self):
         """Returns the entries in the log, most recent first.
 
-        Makes a copy to prevent changes.
+        An entry stands for all occurrences of an error, and holds the
+        fields of its latest example.  Makes a copy to prevent changes.
         """
-        # List incomprehension ;-)
-        res = [entry.copy() for entry in self._getLog()]
-        res.reverse()
-        return res
+        return self._getLog().getEntries()
 
     security.declareProtected(use_error_logging, 'getLogEntryById')
     def getLogEntryById(self, id):
@@ -277,10 +415,10 @@ class SiteErrorLog (SimpleItem):
 
         Makes a copy to prevent changes.  Returns None if not found.
         """
-        for entry in self._getLog():
-            if entry['id'] == id:
-                return entry.copy()
-        return None
+        entry = self._getLog().getEntry(id)
+        if entry is not None and entry['tb_html'] is None:
+            entry['tb_html'] = '<pre>%s</pre>' % escape(entry['tb_text'])
+        return entry
 
     security.declareProtected(use_error_logging, 'getLogEntryAsText')
     def getLogEntryAsText(self, id, RESPONSE=None):
@@ -16,6 +16,10 @@ import logging
 class SiteErrorLogTests(unittest.TestCase):
 
     def setUp(self):
+        from Products.SiteErrorLog import SiteErrorLog
+        SiteErrorLog.temp_logs.clear()
+        SiteErrorLog._rate_restrict_pool.clear()
+        SiteErrorLog._rate_restrict_suppressed.clear()
         transaction.begin()
         self.app = makerequest(Zope2.app())
         try:
@@ -142,6 +146,96 @@ class SiteErrorLogTests(unittest.TestCase):
         self.assertTrue(entry_id in self.log.buffer[-1].msg, 
                         (entry_id, self.log.buffer[-1].msg))
 
+    def _raise(self, elog, value="DummyAttribute"):
+        try:
+            raise AttributeError, value
+        except AttributeError:
+            return elog.raising(sys.exc_info())
+
+    def testRepeatedErrorsAreCounted(self):
+        elog = self.app.error_log
+        previous_log_length = len(elog.getLogEntries())
+        for i in range(5):
+            url = self._raise(elog, 'Dummy%d' % i)
+        entries = elog.getLogEntries()
+        self.assertEquals(len(entries), previous_log_length + 1)
+        entry = entries[0]
+        self.assertEquals(entry['count'], 5)
+        self.assertTrue(entry['first_time'] <= entry['time'])
+        # The first, second and fourth occurrence were kept as examples
+        self.assertEquals([sample['value'] for sample in entry['samples']],
+                          ['Dummy0', 'Dummy1', 'Dummy3'])
+        self.assertEquals(entry['value'], 'Dummy3')
+        # The last occurrence wasn't an example, its url shows the entry
+        self.assertTrue(url.endswith('showEntry?id=%s' % entry['id']))
+
+    def testGetLogEntryById(self):
+        elog = self.app.error_log
+        for i in range(2):
+            self._raise(elog, 'Dummy<%d>' % i)
+        entry = elog.getLogEntries()[0]
+        first, second = entry['samples']
+        self.assertEquals(first['id'], entry['id'])
+        self.assertEquals(elog.getLogEntryById(second['id'])['value'],
+                          'Dummy<1>')
+        found = elog.getLogEntryById(first['id'])
+        self.assertEquals(found['value'], 'Dummy<0>')
+        self.assertEquals(found['count'], 2)
+        self.assertTrue('Dummy&lt;0&gt;' in found['tb_html'])
+        self.assertEquals(elog.getLogEntryAsText(second['id']),
+                          second['tb_text'])
+        # Forgetting an example forgets the entry
+        elog.forgetEntry(second['id'])
+        self.assertEquals(elog.getLogEntryById(entry['id']), None)
+
+    def testKeepEntries(self):
+        elog = self.app.error_log
+        props = elog.getProperties()
+        elog.setProperties(2, copy_to_zlog=props['copy_to_zlog'])
+        for value in 'abc':
+            try:
+                raise ValueError, value
+            except ValueError:
+                elog.raising(sys.exc_info())
+            self._raise(elog, value)
+        self.assertEquals([(e['type'], e['value'], e['count'])
+                           for e in elog.getLogEntries()],
+                          [('AttributeError', 'b', 3), ('ValueError', 'b', 3)])
+        elog.setProperties(1, copy_to_zlog=props['copy_to_zlog'])
+        self.assertEquals(len(elog.getLogEntries()), 1)
+
+    def testCopyToZlogIsRateLimited(self):
+        from Products.SiteErrorLog import SiteErrorLog
+        import time
+        elog = self.app.error_log
+        self._raise(elog)
+        previous_messages = len(self.log.buffer)
+        SiteErrorLog._rate_restrict_pool['AttributeError'] = time.time() + 60
+        for i in range(3):
+            self._raise(elog)
+        self.assertEquals(len(self.log.buffer), previous_messages)
+        # Once the period is over, the next error reports the others
+        SiteErrorLog._rate_restrict_pool['AttributeError'] = 0
+        self._raise(elog)
+        self.assertEquals(len(self.log.buffer), previous_messages + 1)
+        self.assertTrue('(3 more AttributeError errors were not logged)'
+                        in self.log.buffer[-1].msg, self.log.buffer[-1].msg)
+
+    def testFingerprint(self):
+        from Products.SiteErrorLog.SiteErrorLog import fingerprint
+        tbs = []
+        for i in range(2):
+            for value in 'ab':
+                try:
+                    raise KeyError, value
+                except KeyError:
+                    tbs.append(sys.exc_info()[2])
+        self.assertEquals(fingerprint('KeyError', tbs[0]),
+                          fingerprint('KeyError', tbs[3]))
+        self.assertNotEquals(fingerprint('KeyError', tbs[0]),
+                             fingerprint('ValueError', tbs[0]))
+        self.assertEquals(fingerprint('KeyError', 'tb'), ('KeyError', 'tb'))
+
     def testCleanup(self):
         # Need to make sure that the __error_log__ hook gets cleaned up
         self.app._delObject('error_log')
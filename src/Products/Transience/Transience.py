@@ -22,6 +22,7 @@ import random
 import sys
 import thread
 import time
+from zlib import crc32
 
 from AccessControl.class_init import InitializeClass
 from AccessControl.SecurityInfo import ClassSecurityInfo
@@ -60,6 +61,7 @@ MANAGE_CONTAINER_PERM = 'Manage Transient Object Container'
 SPARE_BUCKETS = 15 # minimum number of buckets to keep "spare"
 BUCKET_CLASS = OOBTree # constructor for buckets
 DATA_CLASS = IOBTree # const for main data structure (timeslice->"bucket")
+REFRESH_DIVISOR = 4 # sharded: refresh items lazily within timeout/this
 STRICT = os.environ.get('Z_TOC_STRICT', '')
 DEBUG = int(os.environ.get('Z_TOC_DEBUG', 0))
 
@@ -85,10 +87,11 @@ constructTransientObjectContainerForm = HTMLFile(
 
 def constructTransientObjectContainer(self, id, title='', timeout_mins=20,
     addNotification=None, delNotification=None, limit=0, period_secs=20,
-    REQUEST=None):
+    shards=1, REQUEST=None):
     """ """
     ob = TransientObjectContainer(id, title, timeout_mins,
-        addNotification, delNotification, limit=limit, period_secs=period_secs)
+        addNotification, delNotification, limit=limit, period_secs=period_secs,
+        shards=shards)
     self._setObject(id, ob)
     if REQUEST is not None:
         return self.manage_main(self, REQUEST, update_menu=1)
@@ -133,6 +136,8 @@ class TransientObjectContainer(SimpleItem):
 
     _limit = 0
     _data = None
+    _shards = None
+    _shard_count = 1
     _inband_housekeeping = True
 
     security.setDefaultAccess('deny')
@@ -146,11 +151,12 @@ class TransientObjectContainer(SimpleItem):
     gc_lock = thread.allocate_lock()
 
     def __init__(self, id, title='', timeout_mins=20, addNotification=None,
-                 delNotification=None, limit=0, period_secs=20):
+                 delNotification=None, limit=0, period_secs=20, shards=1):
         self.id = id
         self.title=title
         self._setTimeout(timeout_mins, period_secs)
         self._setLimit(limit)
+        self._setShardCount(shards)
         self.setDelNotificationTarget(delNotification)
         self.setAddNotificationTarget(addNotification)
         self._reset()
@@ -199,8 +205,37 @@ class TransientObjectContainer(SimpleItem):
             raise TypeError, (escape(`limit`), "Must be integer")
         self._limit = limit
 
+    def _setShardCount(self, shards):
+        if type(shards) is not type(1):
+            raise TypeError, (escape(`shards`), "Must be integer")
+        if shards < 1:
+            raise ValueError('number of shards must be at least 1')
+        self._shard_count = shards
+
     def _reset(self):
         """ Reset ourselves to a sane state (deletes all content) """
+        if self._shard_count > 1:
+            # Keys are hashed into a number of independent shards, each
+            # of which has its own timeslice buckets and housekeeping
+            # counters.  Requests for keys in different shards don't
+            # write the same persistent objects, so they don't conflict.
+            self._shards = tuple([TransientShard()
+                                  for i in range(self._shard_count)])
+            for shard in self._shards:
+                self._resetShard(shard)
+            # forget the data structures of an unsharded layout
+            for name in ('_data', '_max_timeslice',
+                         '_last_finalized_timeslice', '_last_gc_timeslice',
+                         '_length', 'getLen'):
+                if self.__dict__.has_key(name):
+                    delattr(self, name)
+        else:
+            # An unsharded container is its own (and only) shard.
+            self._shards = None
+            self._resetShard(self)
+            self.getLen = self._length
+
+    def _resetShard(self, shard):
         # _data contains a mapping of f-of-time(int) (aka "slice") to
         # "bucket".  Each bucket will contain a set of transient items.
         # Transient items move automatically from bucket-to-bucket inside
@@ -212,7 +247,7 @@ class TransientObjectContainer(SimpleItem):
         # we subsequently extend _data with fresh buckets and remove old
         # buckets as necessary during normal operations (see
         # _replentish() and _gc()).
-        self._data = DATA_CLASS()
+        shard._data = DATA_CLASS()
 
         # populate _data with some number of buckets, each of which
         # is "current" for its timeslice key
@@ -222,24 +257,24 @@ class TransientObjectContainer(SimpleItem):
                 SPARE_BUCKETS*2,
                 self._period)
             for i in new_slices:
-                self._data[i] = BUCKET_CLASS()
+                shard._data[i] = BUCKET_CLASS()
             # max_timeslice is at any time during operations the highest
             # key value in _data.  Its existence is an optimization; getting
             # the maxKey of a BTree directly is read-conflict-prone.
-            self._max_timeslice = Increaser(max(new_slices))
+            shard._max_timeslice = Increaser(max(new_slices))
         else:
-            self._data[0] = BUCKET_CLASS() # sentinel value for non-expiring
-            self._max_timeslice = Increaser(0)
+            shard._data[0] = BUCKET_CLASS() # sentinel value for non-expiring
+            shard._max_timeslice = Increaser(0)
 
         # '_last_finalized_timeslice' is a value that indicates which
         # timeslice had its items last run through the finalization
         # process.  The finalization process calls the delete notifier for
         # each expired item.
-        self._last_finalized_timeslice = Increaser(-self._period)
+        shard._last_finalized_timeslice = Increaser(-self._period)
 
         # '_last_gc_timeslice' is a value that indicates in which
         # timeslice the garbage collection process was last run.
-        self._last_gc_timeslice = Increaser(-self._period)
+        shard._last_gc_timeslice = Increaser(-self._period)
         
         # our "_length" is the number of "active" data objects in _data.
         # it does not include items that are still kept in _data but need to
@@ -249,13 +284,33 @@ class TransientObjectContainer(SimpleItem):
         # because getting the length of a BTree is very expensive, and it
         # doesn't really tell us which ones are "active" anyway.
         try:
-            self._length.set(0)
+            shard._length.set(0)
         except AttributeError:
-            self._length = self.getLen = Length2()
+            shard._length = Length2()
+
+    def _getShards(self):
+        return self._shards or (self,)
+
+    def _getShard(self, k):
+        """ Return the shard which holds the item for key k """
+        shards = self._shards
+        if shards is None:
+            return self
+        return shards[(crc32(str(k)) & 0xffffffffL) % len(shards)]
+
+    def _getRefreshSlices(self):
+        # Sharded containers refresh items lazily: an item is only moved
+        # into the current bucket when its bucket is older than this many
+        # timeslices.  Items are kept as many timeslices longer to make up
+        # for it, so they never expire before the timeout.
+        if self._shards is None:
+            return 0
+        return self._timeout_slices / REFRESH_DIVISOR
 
     def _getCurrentSlices(self, now):
         if self._timeout_slices:
-            begin = now - (self._period * self._timeout_slices)
+            live_slices = self._timeout_slices + self._getRefreshSlices()
+            begin = now - (self._period * live_slices)
             # add add one to _timeout_slices below to account for the fact that
             # a call to this method may happen any time within the current
             # timeslice; calling it in the beginning of the timeslice can lead
@@ -264,7 +319,7 @@ class TransientObjectContainer(SimpleItem):
             # lead to sessions becoming invalid *later* than the timeout value
             # (also by a max of self._period), but in the common sessioning
             # case, that seems preferable.
-            num_slices = self._timeout_slices + 1
+            num_slices = live_slices + 1
         else:
             return [0] # sentinel for timeout value 0 (don't expire)
         DEBUG and TLOG('_getCurrentSlices, now = %s ' % now)
@@ -274,39 +329,45 @@ class TransientObjectContainer(SimpleItem):
         DEBUG and TLOG('_getCurrentSlices, result = %s' % result)
         return result
 
-    def _move_item(self, k, current_ts, default=None):
+    def _locate(self, k, current_ts):
+        """ Return the shard holding the item for key k and the timeslice
+        of the bucket it is in (None if there is no such item), moving
+        the item to the current bucket if necessary """
+        shard = self._getShard(k)
+
         if not self._timeout_slices:
             # special case for no timeout value
-            bucket = self._data.get(0)
-            return bucket.get(k, default)
+            if shard._data[0].has_key(k):
+                return shard, 0
+            return shard, None
 
         if self._inband_housekeeping:
-            self._housekeep(current_ts)
+            self._housekeep(current_ts, shard)
 
         else:
             # dont allow the TOC to stop working in an emergency bucket
             # shortage
-            if self._in_emergency_bucket_shortage(current_ts):
-                self._replentish(current_ts)
+            if self._in_emergency_bucket_shortage(current_ts, shard):
+                self._replentish(current_ts, shard)
 
         # SUBTLETY ALERTY TO SELF: do not "improve" the code below
         # unnecessarily, as it will end only in tears.  The lack of aliases
         # and the ordering is intentional.
 
-        STRICT and _assert(self._data.has_key(current_ts))
+        STRICT and _assert(shard._data.has_key(current_ts))
         current_slices = self._getCurrentSlices(current_ts)
         found_ts = None
 
         for ts in current_slices:
-            abucket = self._data.get(ts, None) # XXX ReadConflictError hotspot
+            abucket = shard._data.get(ts, None) # XXX ReadConflictError hotspot
 
             if abucket is None:
-                DEBUG and TLOG('_move_item: no bucket for ts %s' % ts)
+                DEBUG and TLOG('_locate: no bucket for ts %s' % ts)
                 continue
             DEBUG and TLOG(
-                '_move_item: bucket for ts %s is %s' % (ts, id(abucket)))
+                '_locate: bucket for ts %s is %s' % (ts, id(abucket)))
             DEBUG and TLOG(
-                '_move_item: keys for ts %s (bucket %s)-- %s' %
+                '_locate: keys for ts %s (bucket %s)-- %s' %
                 (ts, id(abucket), str(list(abucket.keys())))
                 )
             # uhghost?
@@ -314,44 +375,56 @@ class TransientObjectContainer(SimpleItem):
                 found_ts = ts
                 break
 
-        DEBUG and TLOG('_move_item: found_ts is %s' % found_ts)
+        DEBUG and TLOG('_locate: found_ts is %s' % found_ts)
 
         if found_ts is None:
-            DEBUG and TLOG('_move_item: returning default of %s' % default)
-            return default
+            return shard, None
+
+        refresh_ts = current_ts - (self._period * self._getRefreshSlices())
+
+        if found_ts >= refresh_ts:
+            # the item's bucket is recent enough, leave it where it is
+            # (for unsharded containers this is the current bucket)
+            return shard, found_ts
+
+        DEBUG and TLOG('_locate: current_ts (%s) != found_ts (%s), '
+                       'moving to current' % (current_ts, found_ts))
+        DEBUG and TLOG(
+            '_locate: keys for found_ts %s (bucket %s): %s' % (
+            found_ts, id(shard._data[found_ts]),
+            `list(shard._data[found_ts].keys())`)
+            )
+        shard._data[current_ts][k] = shard._data[found_ts][k]
+        if not issubclass(BUCKET_CLASS, Persistent):
+            # tickle persistence machinery
+            shard._data[current_ts] = shard._data[current_ts]
+        DEBUG and TLOG(
+            '_locate: copied item %s from %s to %s (bucket %s)' % (
+            k, found_ts, current_ts, id(shard._data[current_ts])))
+        del shard._data[found_ts][k]
+        if not issubclass(BUCKET_CLASS, Persistent):
+            # tickle persistence machinery
+            shard._data[found_ts] = shard._data[found_ts]
+        DEBUG and TLOG(
+            '_locate: deleted item %s from ts %s (bucket %s)' % (
+            k, found_ts, id(shard._data[found_ts]))
+            )
+        STRICT and _assert(shard._data[found_ts].get(k, None) is None)
+        STRICT and _assert(not shard._data[found_ts].has_key(k))
+        return shard, current_ts
 
-        if found_ts != current_ts:
+    def _move_item(self, k, current_ts, default=None):
+        shard, ts = self._locate(k, current_ts)
 
-            DEBUG and TLOG('_move_item: current_ts (%s) != found_ts (%s), '
-                           'moving to current' % (current_ts, found_ts))
-            DEBUG and TLOG(
-                '_move_item: keys for found_ts %s (bucket %s): %s' % (
-                found_ts, id(self._data[found_ts]),
-                `list(self._data[found_ts].keys())`)
-                )
-            self._data[current_ts][k] = self._data[found_ts][k]
-            if not issubclass(BUCKET_CLASS, Persistent):
-                # tickle persistence machinery
-                self._data[current_ts] = self._data[current_ts]
-            DEBUG and TLOG(
-                '_move_item: copied item %s from %s to %s (bucket %s)' % (
-                k, found_ts, current_ts, id(self._data[current_ts])))
-            del self._data[found_ts][k]
-            if not issubclass(BUCKET_CLASS, Persistent):
-                # tickle persistence machinery
-                self._data[found_ts] = self._data[found_ts]
-            DEBUG and TLOG(
-                '_move_item: deleted item %s from ts %s (bucket %s)' % (
-                k, found_ts, id(self._data[found_ts]))
-                )
-            STRICT and _assert(self._data[found_ts].get(k, None) is None)
-            STRICT and _assert(not self._data[found_ts].has_key(k))
+        if ts is None:
+            DEBUG and TLOG('_move_item: returning default of %s' % default)
+            return default
 
-        if getattr(self._data[current_ts][k], 'setLastAccessed', None):
-            self._data[current_ts][k].setLastAccessed()
-        DEBUG and TLOG('_move_item: returning %s from current_ts %s '
-                       % (k, current_ts))
-        return self._data[current_ts][k]
+        item = shard._data[ts][k]
+        if self._timeout_slices and getattr(item, 'setLastAccessed', None):
+            item.setLastAccessed()
+        DEBUG and TLOG('_move_item: returning %s from ts %s' % (k, ts))
+        return item
 
     def _all(self):
         if self._timeout_slices:
@@ -359,27 +432,17 @@ class TransientObjectContainer(SimpleItem):
         else:
             current_ts = 0
 
-        if self._inband_housekeeping:
-            self._housekeep(current_ts)
-
-        elif self._in_emergency_bucket_shortage(current_ts):
-            # if our scheduler fails, dont allow the TOC to stop working
-            self._replentish(current_ts, force=True)
+        for shard in self._getShards():
+            if self._inband_housekeeping:
+                self._housekeep(current_ts, shard)
 
-        STRICT and _assert(self._data.has_key(current_ts))
-        current = self._getCurrentSlices(current_ts)
+            elif self._in_emergency_bucket_shortage(current_ts, shard):
+                # if our scheduler fails, dont allow the TOC to stop working
+                self._replentish(current_ts, shard)
 
-        current.reverse() # overwrite older with newer
+            STRICT and _assert(shard._data.has_key(current_ts))
 
-        d = {}
-        for ts in current:
-            bucket = self._data.get(ts)
-            if bucket is None:
-                continue
-            for k,v in bucket.items():
-                d[k] = self._wrap(v)
-
-        return d
+        return self.raw(current_ts)
 
     def keys(self):
         return self._all().keys()
@@ -391,12 +454,13 @@ class TransientObjectContainer(SimpleItem):
         current.reverse() # overwrite older with newer
 
         d = {}
-        for ts in current:
-            bucket = self._data.get(ts, None)
-            if bucket is None:
-                continue
-            for k,v in bucket.items():
-                d[k] = self._wrap(v)
+        for shard in self._getShards():
+            for ts in current:
+                bucket = shard._data.get(ts, None)
+                if bucket is None:
+                    continue
+                for k,v in bucket.items():
+                    d[k] = self._wrap(v)
 
         return d
 
@@ -418,7 +482,7 @@ class TransientObjectContainer(SimpleItem):
         else:
             current_ts = 0
         item = self._move_item(k, current_ts, _marker)
-        STRICT and _assert(self._data.has_key(current_ts))
+        STRICT and _assert(self._getShard(k)._data.has_key(current_ts))
 
         if item is _marker:
             raise KeyError, k
@@ -431,30 +495,32 @@ class TransientObjectContainer(SimpleItem):
             current_ts = getCurrentTimeslice(self._period)
         else:
             current_ts = 0
-        item = self._move_item(k, current_ts, _marker)
-        STRICT and _assert(self._data.has_key(current_ts))
-        if item is _marker:
+        shard, ts = self._locate(k, current_ts)
+        STRICT and _assert(shard._data.has_key(current_ts))
+        if ts is None:
             # the key didnt already exist, this is a new item
 
-            length = self._length() # XXX ReadConflictError hotspot
+            if self._limit:
+                length = len(self) # XXX ReadConflictError hotspot
+
+                if length >= self._limit:
+                    LOG.warn('Transient object container %s max subobjects '
+                             'reached' % self.getId())
 
-            if self._limit and length >= self._limit:
-                LOG.warn('Transient object container %s max subobjects '
-                         'reached' % self.getId())
-                    
-                raise MaxTransientObjectsExceeded, (
-                 "%s exceeds maximum number of subobjects %s" %
-                 (length, self._limit))
+                    raise MaxTransientObjectsExceeded, (
+                     "%s exceeds maximum number of subobjects %s" %
+                     (length, self._limit))
 
-            self._length.increment(1)
+            shard._length.increment(1)
+            ts = current_ts
 
         DEBUG and TLOG('__setitem__: placing value for key %s in bucket %s' %
-                       (k, current_ts))
-        current_bucket = self._data[current_ts]
-        current_bucket[k] = v
+                       (k, ts))
+        bucket = shard._data[ts]
+        bucket[k] = v
         if not issubclass(BUCKET_CLASS, Persistent):
             # tickle persistence machinery
-            self._data[current_ts] = current_bucket
+            shard._data[ts] = bucket
         self.notifyAdd(v)
         # change the TO's last accessed time
         # dont use hasattr here (it hides conflict errors)
@@ -467,22 +533,33 @@ class TransientObjectContainer(SimpleItem):
             current_ts = getCurrentTimeslice(self._period)
         else:
             current_ts = 0
-        item = self._move_item(k, current_ts)
-        STRICT and _assert(self._data.has_key(current_ts))
-        bucket = self._data[current_ts]
+        shard, ts = self._locate(k, current_ts)
+        STRICT and _assert(shard._data.has_key(current_ts))
+        if ts is None:
+            raise KeyError, k
+        bucket = shard._data[ts]
+        item = bucket[k]
         del bucket[k]
         if not issubclass(BUCKET_CLASS, Persistent):
             # tickle persistence machinery
-            self._data[current_ts] = bucket
+            shard._data[ts] = bucket
 
         # XXX does increment(-1) make any sense here?
         # rationale from dunny: we are removing an item rather than simply
         # declaring it to be unused?
-        self._length.increment(-1)
+        shard._length.increment(-1)
         return current_ts, item
 
     def __len__(self):
-        return self._length()
+        if self._shards is None:
+            return self._length()
+        return sum([shard._length() for shard in self._shards])
+
+    security.declareProtected(MGMT_SCREEN_PERM, 'getLen')
+    def getLen(self):
+        """ Return the number of items in a sharded container (unsharded
+        containers have their length object as 'getLen') """
+        return len(self)
 
     security.declareProtected(ACCESS_TRANSIENTS_PERM, 'get')
     def get(self, k, default=None):
@@ -492,7 +569,7 @@ class TransientObjectContainer(SimpleItem):
         else:
             current_ts = 0
         item = self._move_item(k, current_ts, default)
-        STRICT and _assert(self._data.has_key(current_ts))
+        STRICT and _assert(self._getShard(k)._data.has_key(current_ts))
         if item is default:
             DEBUG and TLOG('get: returning default')
             return default
@@ -508,28 +585,39 @@ class TransientObjectContainer(SimpleItem):
         item = self._move_item(k, current_ts, _marker)
         DEBUG and TLOG('has_key: _move_item returned %s%s' %
                        (item, item is _marker and ' (marker)' or ''))
-        STRICT and _assert(self._data.has_key(current_ts))
+        STRICT and _assert(self._getShard(k)._data.has_key(current_ts))
         if item is not _marker:
             return True
         DEBUG and TLOG('has_key: returning false from for %s' % k)
         return False
 
     def _get_max_expired_ts(self, now):
-        return now - (self._period * (self._timeout_slices + 1))
-
-    def _in_emergency_bucket_shortage(self, now):
-        max_ts = self._max_timeslice()
+        live_slices = self._timeout_slices + self._getRefreshSlices()
+        return now - (self._period * (live_slices + 1))
+
+    def _in_emergency_bucket_shortage(self, now, shard=None):
+        if shard is None:
+            for shard in self._getShards():
+                if self._in_emergency_bucket_shortage(now, shard):
+                    return True
+            return False
+        max_ts = shard._max_timeslice()
         low = now/self._period
         high = max_ts/self._period
         required = high <= low
         return required
 
-    def _finalize(self, now):
+    def _finalize(self, now, shard=None):
         """ Call finalization handlers for the data in each stale bucket """
         if not self._timeout_slices:
             DEBUG and TLOG('_finalize: doing nothing (no timeout)')
             return # don't do any finalization if there is no timeout
 
+        if shard is None:
+            for shard in self._getShards():
+                self._finalize(now, shard)
+            return
+
         # The nature of sessioning is that when the timeslice rolls
         # over, all active threads will try to do a lot of work during
         # finalization if inband housekeeping is enabled, all but one
@@ -547,7 +635,7 @@ class TransientObjectContainer(SimpleItem):
 
         try:
             DEBUG and TLOG('_finalize: lock acquired successfully')
-            last_finalized = self._last_finalized_timeslice()
+            last_finalized = shard._last_finalized_timeslice()
 
             # we want to start finalizing from one timeslice after the
             # timeslice which we last finalized.
@@ -570,12 +658,12 @@ class TransientObjectContainer(SimpleItem):
                 # dance (ala _replentish and _gc) because it's important that
                 # buckets are finalized as soon as possible after they've
                 # expired in order to call the delete notifier "on time".
-                self._do_finalize_work(now, max_ts, start_finalize)
+                self._do_finalize_work(now, max_ts, start_finalize, shard)
 
         finally:
             self.finalize_lock.release()
 
-    def _do_finalize_work(self, now, max_ts, start_finalize):
+    def _do_finalize_work(self, now, max_ts, start_finalize, shard):
         # this is only separated from _finalize for readability; it
         # should generally not be called by anything but _finalize
         DEBUG and TLOG('_do_finalize_work: entering')
@@ -584,7 +672,7 @@ class TransientObjectContainer(SimpleItem):
         DEBUG and TLOG('_do_finalize_work: start_finalize is %s' %
                        start_finalize)
 
-        to_finalize = list(self._data.keys(start_finalize, max_ts))
+        to_finalize = list(shard._data.keys(start_finalize, max_ts))
         DEBUG and TLOG('_do_finalize_work: to_finalize is %s' % `to_finalize`)
 
         delta = 0
@@ -593,8 +681,8 @@ class TransientObjectContainer(SimpleItem):
 
             _assert(start_finalize <= key)
             _assert(key <= max_ts)
-            STRICT and _assert(self._data.has_key(key))
-            values = list(self._data[key].values())
+            STRICT and _assert(shard._data.has_key(key))
+            values = list(shard._data[key].values())
             DEBUG and TLOG('_do_finalize_work: values to notify from ts %s '
                            'are %s' % (key, `list(values)`))
 
@@ -604,35 +692,41 @@ class TransientObjectContainer(SimpleItem):
                 self.notifyDel(v)
 
         if delta:
-            self._length.decrement(delta)
+            shard._length.decrement(delta)
 
         DEBUG and TLOG('_do_finalize_work: setting _last_finalized_timeslice '
                        'to max_ts of %s' % max_ts)
 
-        self._last_finalized_timeslice.set(max_ts)
+        shard._last_finalized_timeslice.set(max_ts)
 
     def _invoke_finalize_and_gc(self):
         # for unit testing purposes only!
-        last_finalized = self._last_finalized_timeslice()
         now = getCurrentTimeslice(self._period) # for unit tests
-        start_finalize  = last_finalized + self._period
         max_ts = self._get_max_expired_ts(now)
-        self._do_finalize_work(now, max_ts, start_finalize)
-        self._do_gc_work(now)
+        for shard in self._getShards():
+            last_finalized = shard._last_finalized_timeslice()
+            start_finalize  = last_finalized + self._period
+            self._do_finalize_work(now, max_ts, start_finalize, shard)
+            self._do_gc_work(now, shard)
 
-    def _replentish(self, now):
+    def _replentish(self, now, shard=None):
         """ Add 'fresh' future or current buckets """
         if not self._timeout_slices:
             DEBUG and TLOG('_replentish: no timeout, doing nothing')
             return
-        
+
+        if shard is None:
+            for shard in self._getShards():
+                self._replentish(now, shard)
+            return
+
         # the difference between high and low naturally diminishes to
-        # zero as now approaches self._max_timeslice() during normal
+        # zero as now approaches shard._max_timeslice() during normal
         # operations.  If high <= low, it means we have no current bucket,
         # so we *really* need to replentish (having a current bucket is
         # an invariant for continued operation).
 
-        required = self._in_emergency_bucket_shortage(now)
+        required = self._in_emergency_bucket_shortage(now, shard)
         lock_acquired = self.replentish_lock.acquire(0)
 
         try:
@@ -645,8 +739,8 @@ class TransientObjectContainer(SimpleItem):
                     DEBUG and TLOG('_replentish: required, lock acquired)')
                 else:
                     DEBUG and TLOG('_replentish: required, lock NOT acquired)')
-                max_ts = self._max_timeslice()
-                self._do_replentish_work(now, max_ts)
+                max_ts = shard._max_timeslice()
+                self._do_replentish_work(now, max_ts, shard)
 
             elif lock_acquired:
                 # If replentish is optional, minimize the chance that
@@ -655,11 +749,11 @@ class TransientObjectContainer(SimpleItem):
                 # introducing a random element.
                 DEBUG and TLOG('_replentish: attempting optional replentish '
                                '(lock acquired)')
-                max_ts = self._max_timeslice()
+                max_ts = shard._max_timeslice()
                 low = now/self._period
                 high = max_ts/self._period
                 if roll(low, high, 'optional replentish'):
-                    self._do_replentish_work(now, max_ts)
+                    self._do_replentish_work(now, max_ts, shard)
 
             else:
                 # This is an optional replentish and we can't acquire
@@ -672,7 +766,7 @@ class TransientObjectContainer(SimpleItem):
             if lock_acquired:
                 self.replentish_lock.release()
 
-    def _do_replentish_work(self, now, max_ts):
+    def _do_replentish_work(self, now, max_ts, shard):
         DEBUG and TLOG('_do_replentish_work: entering')
         # this is only separated from _replentish for readability; it
         # should generally not be called by anything but _replentish
@@ -693,7 +787,7 @@ class TransientObjectContainer(SimpleItem):
             return
 
         if max_ts < now:
-            # the newest bucket in self._data is older than now!
+            # the newest bucket in shard._data is older than now!
             replentish_start = now
             replentish_end = now + (self._period * SPARE_BUCKETS)
 
@@ -714,16 +808,21 @@ class TransientObjectContainer(SimpleItem):
         DEBUG and TLOG('_do_replentish_work: buckets to add = %s'
                        % new_buckets)
         for k in new_buckets:
-            STRICT and _assert(not self._data.has_key(k))
-            self._data[k] = BUCKET_CLASS() # XXX ReadConflictError hotspot
+            STRICT and _assert(not shard._data.has_key(k))
+            shard._data[k] = BUCKET_CLASS() # XXX ReadConflictError hotspot
 
-        self._max_timeslice.set(max(new_buckets))
+        shard._max_timeslice.set(max(new_buckets))
 
-    def _gc(self, now=None):
+    def _gc(self, now=None, shard=None):
         """ Remove stale buckets """
         if not self._timeout_slices:
             return # dont do gc if there is no timeout
 
+        if shard is None:
+            for shard in self._getShards():
+                self._gc(now, shard)
+            return
+
         # give callers a good chance to do nothing (gc isn't as important
         # as replentishment or finalization)
         if not roll(0, 5, 'gc'):
@@ -738,7 +837,7 @@ class TransientObjectContainer(SimpleItem):
             if now is None:
                 now = getCurrentTimeslice(self._period) # for unit tests
 
-            last_gc = self._last_gc_timeslice()
+            last_gc = shard._last_gc_timeslice()
             gc_every = self._period * round(SPARE_BUCKETS / 2.0)
 
             if (now - last_gc) < gc_every:
@@ -749,12 +848,12 @@ class TransientObjectContainer(SimpleItem):
                 DEBUG and TLOG(
                     '_gc:  (%s -%s) > %s, gc invoked' % (now, last_gc,
                                                           gc_every))
-                self._do_gc_work(now)
+                self._do_gc_work(now, shard)
 
         finally:
             self.gc_lock.release()
 
-    def _do_gc_work(self, now):
+    def _do_gc_work(self, now, shard):
         # this is only separated from _gc for readability; it should
         # generally not be called by anything but _gc
 
@@ -762,20 +861,20 @@ class TransientObjectContainer(SimpleItem):
         # through finalization
         DEBUG and TLOG('_do_gc_work: entering')
 
-        max_ts = self._last_finalized_timeslice()
+        max_ts = shard._last_finalized_timeslice()
 
         DEBUG and TLOG('_do_gc_work: max_ts is %s' % max_ts)
-        to_gc = list(self._data.keys(None, max_ts))
+        to_gc = list(shard._data.keys(None, max_ts))
         DEBUG and TLOG('_do_gc_work: to_gc is: %s' % str(to_gc))
 
         for key in to_gc:
             _assert(key <= max_ts)
-            STRICT and _assert(self._data.has_key(key))
+            STRICT and _assert(shard._data.has_key(key))
             DEBUG and TLOG('_do_gc_work: deleting %s from _data' % key)
-            del self._data[key]
+            del shard._data[key]
 
         DEBUG and TLOG('_do_gc_work: setting last_gc_timeslice to %s' % now)
-        self._last_gc_timeslice.set(now)
+        shard._last_gc_timeslice.set(now)
 
     def notifyAdd(self, item):
         DEBUG and TLOG('notifyAdd with %s' % item)
@@ -876,6 +975,19 @@ class TransientObjectContainer(SimpleItem):
         """ """
         return self._period
 
+    security.declareProtected(MGMT_SCREEN_PERM, 'getShardCount')
+    def getShardCount(self):
+        """ """
+        return self._shard_count
+
+    security.declareProtected(MANAGE_CONTAINER_PERM, 'setShardCount')
+    def setShardCount(self, shards):
+        """ Change the number of shards the keys are hashed into (this
+        deletes all content) """
+        if shards != self.getShardCount():
+            self._setShardCount(shards)
+            self._reset()
+
     security.declareProtected(MGMT_SCREEN_PERM, 'getSubobjectLimit')
     def getSubobjectLimit(self):
         """ """
@@ -929,21 +1041,26 @@ class TransientObjectContainer(SimpleItem):
         # than necessary at the moment
         self._housekeep(getCurrentTimeslice(self._period))
 
-    def _housekeep(self, now):
-        self._finalize(now)
-        self._replentish(now)
-        self._gc(now)
+    def _housekeep(self, now, shard=None):
+        # housekeeps all shards unless a shard is given
+        self._finalize(now, shard)
+        self._replentish(now, shard)
+        self._gc(now, shard)
 
     security.declareProtected(MANAGE_CONTAINER_PERM,
         'manage_changeTransientObjectContainer')
     def manage_changeTransientObjectContainer(
         self, title='', timeout_mins=20, addNotification=None,
-        delNotification=None, limit=0, period_secs=20, REQUEST=None
+        delNotification=None, limit=0, period_secs=20, shards=None,
+        REQUEST=None
         ):
         """ Change an existing transient object container. """
         self.title = title
         self.setTimeoutMinutes(timeout_mins, period_secs)
         self.setSubobjectLimit(limit)
+        if shards is not None:
+            # leave the shard count (and the content) alone unless given
+            self.setShardCount(shards)
         if not addNotification:
             addNotification = None
         if not delNotification:
@@ -963,6 +1080,11 @@ class TransientObjectContainer(SimpleItem):
         # all of which used a very different transience implementation
         # can't make __len__ an instance variable in new-style classes
 
+        if state.get('_shards') is not None:
+            # sharded containers keep their data in the shards
+            self.__dict__.update(state)
+            return
+
         # f/w compat: 2.8 cannot use __len__ as an instance variable
         if not state.has_key('_length'):
             length = state.get('__len__', Length2())
@@ -1048,6 +1170,14 @@ def _assert(case):
     if not case:
         raise AssertionError
 
+class TransientShard(Persistent):
+    """
+    One of the independent parts of a sharded transient object container.
+    It holds the timeslice buckets ('_data') and the housekeeping counters
+    ('_max_timeslice', '_last_finalized_timeslice', '_last_gc_timeslice'
+    and '_length') for the keys hashed to it; the container does the work.
+    """
+
 class Increaser(Persistent):
     """
     A persistent object representing a typically increasing integer that
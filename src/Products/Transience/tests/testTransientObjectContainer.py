@@ -341,6 +341,130 @@ class TestTransientObjectContainer(TestCase):
             self.t.new(str(x))
 
 
+class TestShardedTransientObjectContainer(TestTransientObjectContainer):
+
+    def setUp(self):
+        TestTransientObjectContainer.setUp(self)
+        self.t = TransientObjectContainer('sdc', timeout_mins=self.timeout/60,
+                                          period_secs=self.period, shards=4)
+
+    def testGarbageCollection(self):
+        for x in range(0, 100):
+            self.t[x] = x
+        sleeptime = self.period * SPARE_BUCKETS
+        fauxtime.sleep(sleeptime)
+        self.t._invoke_finalize_and_gc()
+        for shard in self.t._shards:
+            max_ts = shard._last_finalized_timeslice()
+            for k in list(shard._data.keys()):
+                self.assert_(k > max_ts, "k %s < max_ts %s" % (k, max_ts))
+
+
+class TestShardLayout(TestCase):
+
+    def setUp(self):
+        Products.Transience.Transience.time = fauxtime
+        Products.Transience.TransientObject.time = fauxtime
+        Products.Transience.Transience.setStrict(1)
+        self.period = 20
+        self.t = TransientObjectContainer('sdc', timeout_mins=4,
+                                          period_secs=self.period, shards=4)
+
+    def tearDown(self):
+        self.t = None
+        Products.Transience.Transience.time = oldtime
+        Products.Transience.TransientObject.time = oldtime
+        Products.Transience.Transience.setStrict(0)
+
+    def _bucketsOf(self, k):
+        data = self.t._getShard(k)._data
+        return [ts for ts, bucket in data.items() if bucket.has_key(k)]
+
+    def testKeysAreSpreadOverShards(self):
+        for x in range(100):
+            self.t[str(x)] = x
+        self.assertEqual(self.t._data, None)
+        self.assertEqual(len(self.t), 100)
+        self.assertEqual(self.t.getLen(), 100)
+        lengths = [shard._length() for shard in self.t._shards]
+        self.assertEqual(sum(lengths), 100)
+        self.failIf(0 in lengths, lengths)
+        for x in range(100):
+            self.assertEqual(len(self._bucketsOf(str(x))), 1)
+            self.assertEqual(self.t[str(x)], x)
+
+    def testShardsHaveTheirOwnCounters(self):
+        shards = self.t._shards
+        counters = [(shard._data, shard._length, shard._max_timeslice,
+                     shard._last_finalized_timeslice,
+                     shard._last_gc_timeslice) for shard in shards]
+        for objects in zip(*counters):
+            self.assertEqual(len(dict([(id(ob), 1) for ob in objects])),
+                             len(shards))
+
+    def testRecentItemsAreNotMoved(self):
+        now = Products.Transience.Transience.getCurrentTimeslice(self.period)
+        self.t['a'] = 1
+        start_ts = self._bucketsOf('a')[0]
+        refresh = self.t._getRefreshSlices()
+        self.assertEqual(refresh, 3)
+        later = now + self.period * refresh
+        shard, ts = self.t._locate('a', later)
+        self.assertEqual(ts, start_ts)
+        self.assertEqual(self._bucketsOf('a'), [start_ts])
+        # the item doesn't expire before the timeout after the last access
+        self.failUnless('a' in self.t.raw(later + 4 * 60))
+
+    def testOldItemsAreMoved(self):
+        now = Products.Transience.Transience.getCurrentTimeslice(self.period)
+        self.t['a'] = 1
+        later = now + self.period * (self.t._getRefreshSlices() + 2)
+        shard, ts = self.t._locate('a', later)
+        self.assertEqual(ts, later)
+        self.assertEqual(self._bucketsOf('a'), [later])
+
+    def testReplacingDoesNotDuplicate(self):
+        self.t['a'] = 1
+        fauxtime.sleep(self.period)
+        self.t['a'] = 2
+        self.assertEqual(len(self._bucketsOf('a')), 1)
+        self.assertEqual(self.t['a'], 2)
+        self.assertEqual(len(self.t), 1)
+        del self.t['a']
+        self.assertEqual(self._bucketsOf('a'), [])
+        self.assertEqual(len(self.t), 0)
+
+    def testChangingSettingsKeepsShards(self):
+        self.t['a'] = 1
+        self.t.manage_changeTransientObjectContainer(
+            timeout_mins=4, period_secs=self.period)
+        self.assertEqual(self.t.getShardCount(), 4)
+        self.assertEqual(self.t['a'], 1)
+        self.t.manage_changeTransientObjectContainer(
+            timeout_mins=4, period_secs=self.period, shards=2)
+        self.assertEqual(self.t.getShardCount(), 2)
+        self.assertEqual(self.t.get('a'), None)
+
+    def testChangingShardCountResets(self):
+        self.t['a'] = 1
+        self.t.setShardCount(4)
+        self.assertEqual(self.t['a'], 1)
+        self.t.setShardCount(1)
+        self.assertEqual(self.t.getShardCount(), 1)
+        self.assertEqual(self.t._shards, None)
+        self.assertEqual(self.t.get('a'), None)
+        self.assertEqual(self.t._getRefreshSlices(), 0)
+        self.t['b'] = 1
+        self.assertEqual(self.t.getLen(), 1)
+        self.t.setShardCount(2)
+        self.failIf(self.t.__dict__.has_key('_length'))
+        self.assertEqual(len(self.t), 0)
+
+    def testInvalidShardCount(self):
+        self.assertRaises(ValueError, self.t.setShardCount, 0)
+        self.assertRaises(TypeError, self.t.setShardCount, '2')
+
+
 class TestSlowTransientObjectContainer(TestCase):
 
     def setUp(self):
@@ -425,5 +549,7 @@ def lsubtract(l1, l2):
 def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(TestTransientObjectContainer))
+    suite.addTest(makeSuite(TestShardedTransientObjectContainer))
+    suite.addTest(makeSuite(TestShardLayout))
     suite.addTest(makeSuite(TestSlowTransientObjectContainer))
     return suite
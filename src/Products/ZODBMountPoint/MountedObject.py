@@ -138,9 +138,13 @@ class MountedObject(SimpleItem):
     def _getMountedConnection(self, anyjar):
         # This creates the DB if it doesn't exist yet and adds it
         # to the multidatabase
-        self._getDB()
+        db = self._getDB()
         # Return a new or existing connection linked to the multidatabase set
-        return anyjar.get_connection(self._getDBName())
+        name = self._getDBName()
+        if name in anyjar.connections:
+            return anyjar.get_connection(name)
+        from App.ActivityMonitor import openConnection
+        return openConnection(db, lambda: anyjar.get_connection(name))
 
     def mount_error_(self):
         return self._v_connect_error
@@ -13,6 +13,7 @@
 """ Basic ZPublisher request management.
 """
 
+from time import time
 from urllib import quote as urllib_quote
 import xmlrpc
 
@@ -199,6 +200,7 @@ class BaseRequest:
     common={} # Common request data
     _auth=None
     _held=()
+    _timer=None # ZPublisher.timing.RequestTimer set by the publisher
 
     # Allow (reluctantly) access to unprotected attributes
     __allow_access_to_unprotected_subobjects__=1
@@ -334,6 +336,11 @@ class BaseRequest:
         if name == '.':
             return ob
 
+        # The component lookups done while traversing aren't cached here:
+        # the adapter registries already cache them by the interfaces
+        # provided and the name, and drop them when a registration changes.
+        # Which of attribute, item, view or acquisition finds a name depends
+        # on the object, not its class, so it can't be remembered either.
         if IPublishTraverse.providedBy(ob):
             ob2 = ob.publishTraverse(self, name)
         else:
@@ -556,6 +563,7 @@ class BaseRequest:
         # Do authorization checks
         user=groups=None
         i=0
+        validation_start = time()
 
         if 1:  # Always perform authentication.
 
@@ -620,6 +628,9 @@ class BaseRequest:
             request['AUTHENTICATED_USER']=user
             request['AUTHENTICATION_PATH']='/'.join(steps[:-i])
 
+        if self._timer is not None:
+            self._timer.add('validation', time() - validation_start)
+
         # Remove http request method from the URL.
         request['URL']=URL
 
@@ -649,6 +660,9 @@ class BaseRequest:
             pairs.append((f, tuple(args)))
 
     retry_count=0
+    # The oids of the objects conflicting in this request and the
+    # requests it retries
+    conflict_history=()
     def supports_retry(self): return 0
 
     def _hold(self, object):
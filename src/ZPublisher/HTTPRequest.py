@@ -19,11 +19,9 @@ from cgi import FieldStorage
 import codecs
 from copy import deepcopy
 import os
-import random
 import re
 import sys
 import tempfile
-import time
 from urllib import unquote
 from urllib import splittype
 from urllib import splitport
@@ -40,6 +38,7 @@ from AccessControl.tainted import TaintedString
 from ZPublisher.BaseRequest import BaseRequest
 from ZPublisher.BaseRequest import quote
 from ZPublisher.Converters import get_converter
+from ZPublisher.retrypolicy import policy as retry_policy
 
 # Flags
 SEQUENCE = 1
@@ -103,6 +102,25 @@ trusted_proxies = []
 class NestedLoopExit(Exception):
     pass
 
+class _ParsedOnDemand(object):
+    """An attribute of a request computed by a parsing method of the
+    request on first access
+
+    The parsing method stores the attribute in the instance, which
+    hides this descriptor from then on.
+    """
+
+    def __init__(self, name, parse):
+        self.name = name
+        self.parse = parse
+
+    def __get__(self, inst, cls=None):
+        if inst is None:
+            return self
+        getattr(inst, self.parse)()
+        return inst.__dict__[self.name]
+
+
 class HTTPRequest(BaseRequest):
     """ Model HTTP request data.
 
@@ -165,12 +183,21 @@ class HTTPRequest(BaseRequest):
     _file = None
     _urls = ()
 
+    # The form fields are converted and the cookies are parsed when they
+    # are first used.  Many requests never use them.
+    form = _ParsedOnDemand('form', '_parseForm')
+    taintedform = _ParsedOnDemand('taintedform', '_parseForm')
+    cookies = _ParsedOnDemand('cookies', '_parseCookies')
+    taintedcookies = _ParsedOnDemand('taintedcookies', '_parseCookies')
+    # The fields not converted yet and the keys they may produce
+    _form_fields = None
+    _form_names = None
+
     retry_max_count = 3
 
     def supports_retry(self):
         if self.retry_count < self.retry_max_count:
-            time.sleep(random.uniform(0, 2 ** (self.retry_count)))
-            return 1
+            return retry_policy.mayRetry(self)
 
     def retry(self):
         self.retry_count = self.retry_count + 1
@@ -180,6 +207,7 @@ class HTTPRequest(BaseRequest):
                            response=self.response.retry(),
                           )
         r.retry_count = self.retry_count
+        r.conflict_history = self.conflict_history
         return r
 
     def clear(self):
@@ -187,6 +215,7 @@ class HTTPRequest(BaseRequest):
         # removing tempfiles.
         self.stdin = None
         self._file = None
+        self._form_fields = self._form_names = None
         self.form.clear()
         # we want to clear the lazy dict here because BaseRequests don't have
         # one.  Without this, there's the possibility of memory leaking
@@ -331,8 +360,6 @@ class HTTPRequest(BaseRequest):
         get_env = environ.get
         self.response = response
         other = self.other = {'RESPONSE': response}
-        self.form = {}
-        self.taintedform = {}
         self.steps = []
         self._steps = []
         self._lazies = {}
@@ -427,13 +454,13 @@ class HTTPRequest(BaseRequest):
         other['URL'] = self.script = script
         other['method'] = environ.get('REQUEST_METHOD', 'GET').upper()
 
-        ################################################################
+    def _parseCookies(self):
         # Cookie values should *not* be appended to existing form
         # vars with the same name - they are more like default values
         # for names not otherwise specified in the form.
         cookies = {}
         taintedcookies = {}
-        k = get_env('HTTP_COOKIE','')
+        k = self.environ.get('HTTP_COOKIE','')
         if k:
             parse_cookie(k, cookies)
             for k, v in cookies.items():
@@ -446,28 +473,27 @@ class HTTPRequest(BaseRequest):
                     istainted = 1
                 if istainted:
                     taintedcookies[k] = v
-        self.cookies = cookies
-        self.taintedcookies = taintedcookies
+        # Keep what an application has set already
+        self.__dict__.setdefault('cookies', cookies)
+        self.__dict__.setdefault('taintedcookies', taintedcookies)
+
+    def _mayHaveCookie(self, key):
+        # Cookie names are parsed verbatim from the header
+        if 'cookies' in self.__dict__:
+            return True
+        try:
+            return key in self.environ.get('HTTP_COOKIE', '')
+        except (TypeError, UnicodeError):
+            return True
 
-    def processInputs(
-        self,
-        # "static" variables that we want to be local for speed
-        SEQUENCE=1,
-        DEFAULT=2,
-        RECORD=4,
-        RECORDS=8,
-        REC=12, # RECORD | RECORDS
-        EMPTY=16,
-        CONVERTED=32,
-        hasattr=hasattr,
-        getattr=getattr,
-        setattr=setattr,
-        search_type=re.compile('(:[a-zA-Z][-a-zA-Z0-9_]+|\\.[xy])$').search,
-        ):
+    def processInputs(self):
         """Process request inputs
 
         We need to delay input parsing so that it is done under
         publisher control for error handling purposes.
+
+        The body is read here, but the conversion of the form fields is
+        deferred until the form data is first used.
         """
         response = self.response
         environ = self.environ
@@ -478,9 +504,7 @@ class HTTPRequest(BaseRequest):
         else:
             fp = None
 
-        form = self.form
         other = self.other
-        taintedform = self.taintedform
 
         # If 'QUERY_STRING' is not present in environ
         # FieldStorage will try to get it from sys.argv[1]
@@ -510,644 +534,707 @@ class HTTPRequest(BaseRequest):
                 self._file = fs.file
         else:
             fslist = fs.list
-            tuple_items = {}
-            lt = type([])
-            CGI_name = isCGI_NAMEs
-            defaults = {}
-            tainteddefaults = {}
-            converter = None
-
-            for item in fslist:
-
-                isFileUpload = 0
-                key = item.name
-                if (hasattr(item,'file') and hasattr(item,'filename')
-                    and hasattr(item,'headers')):
-                    if (item.file and
-                        (item.filename is not None
-                         # RFC 1867 says that all fields get a content-type.
-                         # or 'content-type' in map(lower, item.headers.keys())
-                         )):
-                        item = FileUpload(item)
-                        isFileUpload = 1
-                    else:
-                        item = item.value
+            if (self._needsFields(fslist) or 'form' in self.__dict__ or
+                'taintedform' in self.__dict__):
+                meth = self._processFields(fslist, self.form,
+                                           self.taintedform)
+            elif fslist:
+                # The fields are converted when the form is first used
+                self._form_fields = fslist
+                self._form_names = self._getFieldKeys(fslist)
+
+        if meth:
+            if 'PATH_INFO' in environ:
+                path = environ['PATH_INFO']
+                while path[-1:] == '/':
+                    path = path[:-1]
+            else:
+                path = ''
+            other['PATH_INFO'] = path = "%s/%s" % (path,meth)
+            self._hacked_path = 1
+
+    def _processFields(
+        self,
+        fslist,
+        form,
+        taintedform,
+        # "static" variables that we want to be local for speed
+        SEQUENCE=1,
+        DEFAULT=2,
+        RECORD=4,
+        RECORDS=8,
+        REC=12, # RECORD | RECORDS
+        EMPTY=16,
+        CONVERTED=32,
+        hasattr=hasattr,
+        getattr=getattr,
+        setattr=setattr,
+        search_type=re.compile('(:[a-zA-Z][-a-zA-Z0-9_]+|\\.[xy])$').search,
+        ):
+        """Convert the fields of a form into form and taintedform
 
-                flags = 0
-                character_encoding = ''
-                # Variables for potentially unsafe values.
-                tainted = None
-                converter_type = None
+        Returns the name of the method to publish if a field asks for one.
+        """
+        meth = None
+        tuple_items = {}
+        lt = type([])
+        CGI_name = isCGI_NAMEs
+        defaults = {}
+        tainteddefaults = {}
+        converter = None
+
+        for item in fslist:
+
+            isFileUpload = 0
+            key = item.name
+            if (hasattr(item,'file') and hasattr(item,'filename')
+                and hasattr(item,'headers')):
+                if (item.file and
+                    (item.filename is not None
+                     # RFC 1867 says that all fields get a content-type.
+                     # or 'content-type' in map(lower, item.headers.keys())
+                     )):
+                    item = FileUpload(item)
+                    isFileUpload = 1
+                else:
+                    item = item.value
 
-                # Loop through the different types and set
-                # the appropriate flags
+            flags = 0
+            character_encoding = ''
+            # Variables for potentially unsafe values.
+            tainted = None
+            converter_type = None
 
-                # We'll search from the back to the front.
-                # We'll do the search in two steps.  First, we'll
-                # do a string search, and then we'll check it with
-                # a re search.
+            # Loop through the different types and set
+            # the appropriate flags
 
+            # We'll search from the back to the front.
+            # We'll do the search in two steps.  First, we'll
+            # do a string search, and then we'll check it with
+            # a re search.
 
-                l = key.rfind(':')
-                if l >= 0:
+
+            l = key.rfind(':')
+            if l >= 0:
+                mo = search_type(key,l)
+                if mo:
+                    l = mo.start(0)
+                else:
+                    l = -1
+
+                while l >= 0:
+                    type_name = key[l+1:]
+                    key = key[:l]
+                    c = get_converter(type_name, None)
+
+                    if c is not None:
+                        converter = c
+                        converter_type = type_name
+                        flags = flags | CONVERTED
+                    elif type_name == 'list':
+                        flags = flags | SEQUENCE
+                    elif type_name == 'tuple':
+                        tuple_items[key] = 1
+                        flags = flags | SEQUENCE
+                    elif (type_name == 'method' or type_name == 'action'):
+                        if l:
+                            meth = key
+                        else:
+                            meth = item
+                    elif (type_name == 'default_method' or type_name == \
+                          'default_action'):
+                        if not meth:
+                            if l:
+                                meth = key
+                            else:
+                                meth = item
+                    elif type_name == 'default':
+                        flags = flags | DEFAULT
+                    elif type_name == 'record':
+                        flags = flags | RECORD
+                    elif type_name == 'records':
+                        flags = flags | RECORDS
+                    elif type_name == 'ignore_empty':
+                        if not item:
+                            flags = flags | EMPTY
+                    elif has_codec(type_name):
+                        character_encoding = type_name
+
+                    l = key.rfind(':')
+                    if l < 0:
+                        break
                     mo = search_type(key,l)
                     if mo:
                         l = mo.start(0)
                     else:
                         l = -1
 
-                    while l >= 0:
-                        type_name = key[l+1:]
-                        key = key[:l]
-                        c = get_converter(type_name, None)
-
-                        if c is not None:
-                            converter = c
-                            converter_type = type_name
-                            flags = flags | CONVERTED
-                        elif type_name == 'list':
-                            flags = flags | SEQUENCE
-                        elif type_name == 'tuple':
-                            tuple_items[key] = 1
-                            flags = flags | SEQUENCE
-                        elif (type_name == 'method' or type_name == 'action'):
-                            if l:
-                                meth = key
-                            else:
-                                meth = item
-                        elif (type_name == 'default_method' or type_name == \
-                              'default_action'):
-                            if not meth:
-                                if l:
-                                    meth = key
-                                else:
-                                    meth = item
-                        elif type_name == 'default':
-                            flags = flags | DEFAULT
-                        elif type_name == 'record':
-                            flags = flags | RECORD
-                        elif type_name == 'records':
-                            flags = flags | RECORDS
-                        elif type_name == 'ignore_empty':
-                            if not item:
-                                flags = flags | EMPTY
-                        elif has_codec(type_name):
-                            character_encoding = type_name
-
-                        l = key.rfind(':')
-                        if l < 0:
-                            break
-                        mo = search_type(key,l)
-                        if mo:
-                            l = mo.start(0)
-                        else:
-                            l = -1
+            # Filter out special names from form:
+            if key in CGI_name or key[:5] == 'HTTP_':
+                continue
+
+            # If the key is tainted, mark it so as well.
+            tainted_key = key
+            if '<' in key:
+                tainted_key = TaintedString(key)
+
+            if flags:
 
-                # Filter out special names from form:
-                if key in CGI_name or key[:5] == 'HTTP_':
+                # skip over empty fields
+                if flags & EMPTY:
                     continue
 
-                # If the key is tainted, mark it so as well.
-                tainted_key = key
-                if '<' in key:
-                    tainted_key = TaintedString(key)
+                #Split the key and its attribute
+                if flags & REC:
+                    key = key.split(".")
+                    key, attr = ".".join(key[:-1]), key[-1]
 
-                if flags:
-
-                    # skip over empty fields
-                    if flags & EMPTY:
-                        continue
-
-                    #Split the key and its attribute
-                    if flags & REC:
-                        key = key.split(".")
-                        key, attr = ".".join(key[:-1]), key[-1]
-
-                        # Update the tainted_key if necessary
-                        tainted_key = key
-                        if '<' in key:
-                            tainted_key = TaintedString(key)
-
-                        # Attributes cannot hold a <.
-                        if '<' in attr:
-                            raise ValueError(
-                                "%s is not a valid record attribute name" %
-                                escape(attr))
-
-                    # defer conversion
-                    if flags & CONVERTED:
-                        try:
-                            if character_encoding:
-                                # We have a string with a specified character
-                                # encoding.  This gets passed to the converter
-                                # either as unicode, if it can handle it, or
-                                # crunched back down to utf-8 if it can not.
-                                item = unicode(item,character_encoding)
-                                if hasattr(converter,'convert_unicode'):
-                                    item = converter.convert_unicode(item)
-                                else:
-                                    item = converter(
-                                        item.encode(default_encoding))
+                    # Update the tainted_key if necessary
+                    tainted_key = key
+                    if '<' in key:
+                        tainted_key = TaintedString(key)
+
+                    # Attributes cannot hold a <.
+                    if '<' in attr:
+                        raise ValueError(
+                            "%s is not a valid record attribute name" %
+                            escape(attr))
+
+                # defer conversion
+                if flags & CONVERTED:
+                    try:
+                        if character_encoding:
+                            # We have a string with a specified character
+                            # encoding.  This gets passed to the converter
+                            # either as unicode, if it can handle it, or
+                            # crunched back down to utf-8 if it can not.
+                            item = unicode(item,character_encoding)
+                            if hasattr(converter,'convert_unicode'):
+                                item = converter.convert_unicode(item)
                             else:
-                                item = converter(item)
-
-                            # Flag potentially unsafe values
-                            if converter_type in ('string', 'required', 'text',
-                                                  'ustring', 'utext'):
-                                if not isFileUpload and '<' in item:
-                                    tainted = TaintedString(item)
-                            elif converter_type in ('tokens', 'lines',
-                                                    'utokens', 'ulines'):
-                                is_tainted = 0
-                                tainted = item[:]
-                                for i in range(len(tainted)):
-                                    if '<' in tainted[i]:
-                                        is_tainted = 1
-                                        tainted[i] = TaintedString(tainted[i])
-                                if not is_tainted:
-                                    tainted = None
-
-                        except:
-                            if (not item and not (flags & DEFAULT) and
-                                key in defaults):
-                                item = defaults[key]
+                                item = converter(
+                                    item.encode(default_encoding))
+                        else:
+                            item = converter(item)
+
+                        # Flag potentially unsafe values
+                        if converter_type in ('string', 'required', 'text',
+                                              'ustring', 'utext'):
+                            if not isFileUpload and '<' in item:
+                                tainted = TaintedString(item)
+                        elif converter_type in ('tokens', 'lines',
+                                                'utokens', 'ulines'):
+                            is_tainted = 0
+                            tainted = item[:]
+                            for i in range(len(tainted)):
+                                if '<' in tainted[i]:
+                                    is_tainted = 1
+                                    tainted[i] = TaintedString(tainted[i])
+                            if not is_tainted:
+                                tainted = None
+
+                    except:
+                        if (not item and not (flags & DEFAULT) and
+                            key in defaults):
+                            item = defaults[key]
+                            if flags & RECORD:
+                                item = getattr(item,attr)
+                            if flags & RECORDS:
+                                item = getattr(item[-1], attr)
+                            if tainted_key in tainteddefaults:
+                                tainted = tainteddefaults[tainted_key]
                                 if flags & RECORD:
-                                    item = getattr(item,attr)
+                                    tainted = getattr(tainted, attr)
                                 if flags & RECORDS:
-                                    item = getattr(item[-1], attr)
-                                if tainted_key in tainteddefaults:
-                                    tainted = tainteddefaults[tainted_key]
-                                    if flags & RECORD:
-                                        tainted = getattr(tainted, attr)
-                                    if flags & RECORDS:
-                                        tainted = getattr(tainted[-1], attr)
-                            else:
-                                raise
+                                    tainted = getattr(tainted[-1], attr)
+                        else:
+                            raise
 
-                    elif not isFileUpload and '<' in item:
-                        # Flag potentially unsafe values
-                        tainted = TaintedString(item)
+                elif not isFileUpload and '<' in item:
+                    # Flag potentially unsafe values
+                    tainted = TaintedString(item)
 
-                    # If the key is tainted, we need to store stuff in the
-                    # tainted dict as well, even if the value is safe.
-                    if '<' in tainted_key and tainted is None:
-                        tainted = item
+                # If the key is tainted, we need to store stuff in the
+                # tainted dict as well, even if the value is safe.
+                if '<' in tainted_key and tainted is None:
+                    tainted = item
 
-                    #Determine which dictionary to use
-                    if flags & DEFAULT:
-                        mapping_object = defaults
-                        tainted_mapping = tainteddefaults
-                    else:
-                        mapping_object = form
-                        tainted_mapping = taintedform
-
-                    #Insert in dictionary
-                    if key in mapping_object:
-                        if flags & RECORDS:
-                            #Get the list and the last record
-                            #in the list. reclist is mutable.
-                            reclist = mapping_object[key]
-                            x = reclist[-1]
-
-                            if tainted:
-                                # Store a tainted copy as well
-                                if tainted_key not in tainted_mapping:
-                                    tainted_mapping[tainted_key] = deepcopy(
-                                        reclist)
-                                treclist = tainted_mapping[tainted_key]
-                                lastrecord = treclist[-1]
-
-                                if not hasattr(lastrecord, attr):
-                                    if flags & SEQUENCE:
-                                        tainted = [tainted]
-                                    setattr(lastrecord, attr, tainted)
-                                else:
-                                    if flags & SEQUENCE:
-                                        getattr(lastrecord,
-                                            attr).append(tainted)
-                                    else:
-                                        newrec = record()
-                                        setattr(newrec, attr, tainted)
-                                        treclist.append(newrec)
-
-                            elif tainted_key in tainted_mapping:
-                                # If we already put a tainted value into this
-                                # recordset, we need to make sure the whole
-                                # recordset is built.
-                                treclist = tainted_mapping[tainted_key]
-                                lastrecord = treclist[-1]
-                                copyitem = item
-
-                                if not hasattr(lastrecord, attr):
-                                    if flags & SEQUENCE:
-                                        copyitem = [copyitem]
-                                    setattr(lastrecord, attr, copyitem)
-                                else:
-                                    if flags & SEQUENCE:
-                                        getattr(lastrecord,
-                                            attr).append(copyitem)
-                                    else:
-                                        newrec = record()
-                                        setattr(newrec, attr, copyitem)
-                                        treclist.append(newrec)
+                #Determine which dictionary to use
+                if flags & DEFAULT:
+                    mapping_object = defaults
+                    tainted_mapping = tainteddefaults
+                else:
+                    mapping_object = form
+                    tainted_mapping = taintedform
 
-                            if not hasattr(x,attr):
-                                #If the attribute does not
-                                #exist, setit
-                                if flags & SEQUENCE:
-                                    item = [item]
-                                setattr(x,attr,item)
-                            else:
+                #Insert in dictionary
+                if key in mapping_object:
+                    if flags & RECORDS:
+                        #Get the list and the last record
+                        #in the list. reclist is mutable.
+                        reclist = mapping_object[key]
+                        x = reclist[-1]
+
+                        if tainted:
+                            # Store a tainted copy as well
+                            if tainted_key not in tainted_mapping:
+                                tainted_mapping[tainted_key] = deepcopy(
+                                    reclist)
+                            treclist = tainted_mapping[tainted_key]
+                            lastrecord = treclist[-1]
+
+                            if not hasattr(lastrecord, attr):
                                 if flags & SEQUENCE:
-                                    # If the attribute is a
-                                    # sequence, append the item
-                                    # to the existing attribute
-                                    y = getattr(x, attr)
-                                    y.append(item)
-                                    setattr(x, attr, y)
-                                else:
-                                    # Create a new record and add
-                                    # it to the list
-                                    n = record()
-                                    setattr(n,attr,item)
-                                    mapping_object[key].append(n)
-                        elif flags & RECORD:
-                            b = mapping_object[key]
-                            if flags & SEQUENCE:
-                                item = [item]
-                                if not hasattr(b, attr):
-                                    # if it does not have the
-                                    # attribute, set it
-                                    setattr(b, attr, item)
-                                else:
-                                    # it has the attribute so
-                                    # append the item to it
-                                    setattr(b, attr, getattr(b, attr) + item)
+                                    tainted = [tainted]
+                                setattr(lastrecord, attr, tainted)
                             else:
-                                # it is not a sequence so
-                                # set the attribute
-                                setattr(b, attr, item)
-
-                            # Store a tainted copy as well if necessary
-                            if tainted:
-                                if tainted_key not in tainted_mapping:
-                                    tainted_mapping[tainted_key] = deepcopy(
-                                        mapping_object[key])
-                                b = tainted_mapping[tainted_key]
                                 if flags & SEQUENCE:
-                                    seq = getattr(b, attr, [])
-                                    seq.append(tainted)
-                                    setattr(b, attr, seq)
+                                    getattr(lastrecord,
+                                        attr).append(tainted)
                                 else:
-                                    setattr(b, attr, tainted)
-
-                            elif tainted_key in tainted_mapping:
-                                # If we already put a tainted value into this
-                                # record, we need to make sure the whole record
-                                # is built.
-                                b = tainted_mapping[tainted_key]
+                                    newrec = record()
+                                    setattr(newrec, attr, tainted)
+                                    treclist.append(newrec)
+
+                        elif tainted_key in tainted_mapping:
+                            # If we already put a tainted value into this
+                            # recordset, we need to make sure the whole
+                            # recordset is built.
+                            treclist = tainted_mapping[tainted_key]
+                            lastrecord = treclist[-1]
+                            copyitem = item
+
+                            if not hasattr(lastrecord, attr):
                                 if flags & SEQUENCE:
-                                    seq = getattr(b, attr, [])
-                                    seq.append(item)
-                                    setattr(b, attr, seq)
-                                else:
-                                    setattr(b, attr, item)
-
-                        else:
-                            # it is not a record or list of records
-                            found = mapping_object[key]
-
-                            if tainted:
-                                # Store a tainted version if necessary
-                                if tainted_key not in tainted_mapping:
-                                    copied = deepcopy(found)
-                                    if isinstance(copied, lt):
-                                        tainted_mapping[tainted_key] = copied
-                                    else:
-                                        tainted_mapping[tainted_key] = [copied]
-                                tainted_mapping[tainted_key].append(tainted)
-
-                            elif tainted_key in tainted_mapping:
-                                # We may already have encountered a tainted
-                                # value for this key, and the tainted_mapping
-                                # needs to hold all the values.
-                                tfound = tainted_mapping[tainted_key]
-                                if isinstance(tfound, lt):
-                                    tainted_mapping[tainted_key].append(item)
-                                else:
-                                    tainted_mapping[tainted_key] = [tfound,
-                                                                    item]
-
-                            if type(found) is lt:
-                                found.append(item)
+                                    copyitem = [copyitem]
+                                setattr(lastrecord, attr, copyitem)
                             else:
-                                found = [found,item]
-                                mapping_object[key] = found
-                    else:
-                        # The dictionary does not have the key
-                        if flags & RECORDS:
-                            # Create a new record, set its attribute
-                            # and put it in the dictionary as a list
-                            a = record()
-                            if flags & SEQUENCE:
-                                item = [item]
-                            setattr(a,attr,item)
-                            mapping_object[key] = [a]
-
-                            if tainted:
-                                # Store a tainted copy if necessary
-                                a = record()
                                 if flags & SEQUENCE:
-                                    tainted = [tainted]
-                                setattr(a, attr, tainted)
-                                tainted_mapping[tainted_key] = [a]
+                                    getattr(lastrecord,
+                                        attr).append(copyitem)
+                                else:
+                                    newrec = record()
+                                    setattr(newrec, attr, copyitem)
+                                    treclist.append(newrec)
 
-                        elif flags & RECORD:
-                            # Create a new record, set its attribute
-                            # and put it in the dictionary
+                        if not hasattr(x,attr):
+                            #If the attribute does not
+                            #exist, setit
                             if flags & SEQUENCE:
                                 item = [item]
-                            r = mapping_object[key] = record()
-                            setattr(r,attr,item)
-
-                            if tainted:
-                                # Store a tainted copy if necessary
-                                if flags & SEQUENCE:
-                                    tainted = [tainted]
-                                r = tainted_mapping[tainted_key] = record()
-                                setattr(r, attr, tainted)
+                            setattr(x,attr,item)
                         else:
-                            # it is not a record or list of records
                             if flags & SEQUENCE:
-                                item = [item]
-                            mapping_object[key] = item
-
-                            if tainted:
-                                # Store a tainted copy if necessary
-                                if flags & SEQUENCE:
-                                    tainted = [tainted]
-                                tainted_mapping[tainted_key] = tainted
+                                # If the attribute is a
+                                # sequence, append the item
+                                # to the existing attribute
+                                y = getattr(x, attr)
+                                y.append(item)
+                                setattr(x, attr, y)
+                            else:
+                                # Create a new record and add
+                                # it to the list
+                                n = record()
+                                setattr(n,attr,item)
+                                mapping_object[key].append(n)
+                    elif flags & RECORD:
+                        b = mapping_object[key]
+                        if flags & SEQUENCE:
+                            item = [item]
+                            if not hasattr(b, attr):
+                                # if it does not have the
+                                # attribute, set it
+                                setattr(b, attr, item)
+                            else:
+                                # it has the attribute so
+                                # append the item to it
+                                setattr(b, attr, getattr(b, attr) + item)
+                        else:
+                            # it is not a sequence so
+                            # set the attribute
+                            setattr(b, attr, item)
 
-                else:
-                    # This branch is for case when no type was specified.
-                    mapping_object = form
+                        # Store a tainted copy as well if necessary
+                        if tainted:
+                            if tainted_key not in tainted_mapping:
+                                tainted_mapping[tainted_key] = deepcopy(
+                                    mapping_object[key])
+                            b = tainted_mapping[tainted_key]
+                            if flags & SEQUENCE:
+                                seq = getattr(b, attr, [])
+                                seq.append(tainted)
+                                setattr(b, attr, seq)
+                            else:
+                                setattr(b, attr, tainted)
 
-                    if not isFileUpload and '<' in item:
-                        tainted = TaintedString(item)
-                    elif '<' in key:
-                        tainted = item
+                        elif tainted_key in tainted_mapping:
+                            # If we already put a tainted value into this
+                            # record, we need to make sure the whole record
+                            # is built.
+                            b = tainted_mapping[tainted_key]
+                            if flags & SEQUENCE:
+                                seq = getattr(b, attr, [])
+                                seq.append(item)
+                                setattr(b, attr, seq)
+                            else:
+                                setattr(b, attr, item)
 
-                    #Insert in dictionary
-                    if key in mapping_object:
+                    else:
                         # it is not a record or list of records
                         found = mapping_object[key]
 
                         if tainted:
                             # Store a tainted version if necessary
-                            if tainted_key not in taintedform:
+                            if tainted_key not in tainted_mapping:
                                 copied = deepcopy(found)
                                 if isinstance(copied, lt):
-                                    taintedform[tainted_key] = copied
+                                    tainted_mapping[tainted_key] = copied
                                 else:
-                                    taintedform[tainted_key] = [copied]
-                            elif not isinstance(taintedform[tainted_key], lt):
-                                taintedform[tainted_key] = [
-                                    taintedform[tainted_key]]
-                            taintedform[tainted_key].append(tainted)
-
-                        elif tainted_key in taintedform:
-                            # We may already have encountered a tainted value
-                            # for this key, and the taintedform needs to hold
-                            # all the values.
-                            tfound = taintedform[tainted_key]
+                                    tainted_mapping[tainted_key] = [copied]
+                            tainted_mapping[tainted_key].append(tainted)
+
+                        elif tainted_key in tainted_mapping:
+                            # We may already have encountered a tainted
+                            # value for this key, and the tainted_mapping
+                            # needs to hold all the values.
+                            tfound = tainted_mapping[tainted_key]
                             if isinstance(tfound, lt):
-                                taintedform[tainted_key].append(item)
+                                tainted_mapping[tainted_key].append(item)
                             else:
-                                taintedform[tainted_key] = [tfound, item]
+                                tainted_mapping[tainted_key] = [tfound,
+                                                                item]
 
                         if type(found) is lt:
                             found.append(item)
                         else:
                             found = [found,item]
                             mapping_object[key] = found
+                else:
+                    # The dictionary does not have the key
+                    if flags & RECORDS:
+                        # Create a new record, set its attribute
+                        # and put it in the dictionary as a list
+                        a = record()
+                        if flags & SEQUENCE:
+                            item = [item]
+                        setattr(a,attr,item)
+                        mapping_object[key] = [a]
+
+                        if tainted:
+                            # Store a tainted copy if necessary
+                            a = record()
+                            if flags & SEQUENCE:
+                                tainted = [tainted]
+                            setattr(a, attr, tainted)
+                            tainted_mapping[tainted_key] = [a]
+
+                    elif flags & RECORD:
+                        # Create a new record, set its attribute
+                        # and put it in the dictionary
+                        if flags & SEQUENCE:
+                            item = [item]
+                        r = mapping_object[key] = record()
+                        setattr(r,attr,item)
+
+                        if tainted:
+                            # Store a tainted copy if necessary
+                            if flags & SEQUENCE:
+                                tainted = [tainted]
+                            r = tainted_mapping[tainted_key] = record()
+                            setattr(r, attr, tainted)
                     else:
+                        # it is not a record or list of records
+                        if flags & SEQUENCE:
+                            item = [item]
                         mapping_object[key] = item
-                        if tainted:
-                            taintedform[tainted_key] = tainted
 
-            #insert defaults into form dictionary
-            if defaults:
-                for key, value in defaults.items():
-                    tainted_key = key
-                    if '<' in key:
-                        tainted_key = TaintedString(key)
+                        if tainted:
+                            # Store a tainted copy if necessary
+                            if flags & SEQUENCE:
+                                tainted = [tainted]
+                            tainted_mapping[tainted_key] = tainted
 
-                    if key not in form:
-                        # if the form does not have the key,
-                        # set the default
-                        form[key] = value
+            else:
+                # This branch is for case when no type was specified.
+                mapping_object = form
+
+                if not isFileUpload and '<' in item:
+                    tainted = TaintedString(item)
+                elif '<' in key:
+                    tainted = item
+
+                #Insert in dictionary
+                if key in mapping_object:
+                    # it is not a record or list of records
+                    found = mapping_object[key]
+
+                    if tainted:
+                        # Store a tainted version if necessary
+                        if tainted_key not in taintedform:
+                            copied = deepcopy(found)
+                            if isinstance(copied, lt):
+                                taintedform[tainted_key] = copied
+                            else:
+                                taintedform[tainted_key] = [copied]
+                        elif not isinstance(taintedform[tainted_key], lt):
+                            taintedform[tainted_key] = [
+                                taintedform[tainted_key]]
+                        taintedform[tainted_key].append(tainted)
+
+                    elif tainted_key in taintedform:
+                        # We may already have encountered a tainted value
+                        # for this key, and the taintedform needs to hold
+                        # all the values.
+                        tfound = taintedform[tainted_key]
+                        if isinstance(tfound, lt):
+                            taintedform[tainted_key].append(item)
+                        else:
+                            taintedform[tainted_key] = [tfound, item]
 
-                        if tainted_key in tainteddefaults:
-                            taintedform[tainted_key] = \
-                                tainteddefaults[tainted_key]
+                    if type(found) is lt:
+                        found.append(item)
                     else:
-                        #The form has the key
-                        tdefault = tainteddefaults.get(tainted_key, value)
-                        if isinstance(value, record):
-                            # if the key is mapped to a record, get the
-                            # record
-                            r = form[key]
-
-                            # First deal with tainted defaults.
-                            if tainted_key in taintedform:
-                                tainted = taintedform[tainted_key]
+                        found = [found,item]
+                        mapping_object[key] = found
+                else:
+                    mapping_object[key] = item
+                    if tainted:
+                        taintedform[tainted_key] = tainted
+
+        #insert defaults into form dictionary
+        if defaults:
+            for key, value in defaults.items():
+                tainted_key = key
+                if '<' in key:
+                    tainted_key = TaintedString(key)
+
+                if key not in form:
+                    # if the form does not have the key,
+                    # set the default
+                    form[key] = value
+
+                    if tainted_key in tainteddefaults:
+                        taintedform[tainted_key] = \
+                            tainteddefaults[tainted_key]
+                else:
+                    #The form has the key
+                    tdefault = tainteddefaults.get(tainted_key, value)
+                    if isinstance(value, record):
+                        # if the key is mapped to a record, get the
+                        # record
+                        r = form[key]
+
+                        # First deal with tainted defaults.
+                        if tainted_key in taintedform:
+                            tainted = taintedform[tainted_key]
+                            for k, v in tdefault.__dict__.items():
+                                if not hasattr(tainted, k):
+                                    setattr(tainted, k, v)
+
+                        elif tainted_key in tainteddefaults:
+                            # Find out if any of the tainted default
+                            # attributes needs to be copied over.
+                            missesdefault = 0
+                            for k, v in tdefault.__dict__.items():
+                                if not hasattr(r, k):
+                                    missesdefault = 1
+                                    break
+                            if missesdefault:
+                                tainted = deepcopy(r)
                                 for k, v in tdefault.__dict__.items():
                                     if not hasattr(tainted, k):
                                         setattr(tainted, k, v)
+                                taintedform[tainted_key] = tainted
 
-                            elif tainted_key in tainteddefaults:
-                                # Find out if any of the tainted default
-                                # attributes needs to be copied over.
-                                missesdefault = 0
-                                for k, v in tdefault.__dict__.items():
-                                    if not hasattr(r, k):
+                        for k, v in value.__dict__.items():
+                            # loop through the attributes and value
+                            # in the default dictionary
+                            if not hasattr(r, k):
+                                # if the form dictionary doesn't have
+                                # the attribute, set it to the default
+                                setattr(r,k,v)
+                        form[key] = r
+
+                    elif isinstance(value, lt):
+                        # the default value is a list
+                        l = form[key]
+                        if not isinstance(l, lt):
+                            l = [l]
+
+                        # First deal with tainted copies
+                        if tainted_key in taintedform:
+                            tainted = taintedform[tainted_key]
+                            if not isinstance(tainted, lt):
+                                tainted = [tainted]
+                            for defitem in tdefault:
+                                if isinstance(defitem, record):
+                                    for k, v in defitem.__dict__.items():
+                                        for origitem in tainted:
+                                            if not hasattr(origitem, k):
+                                                setattr(origitem, k, v)
+                                else:
+                                    if not defitem in tainted:
+                                        tainted.append(defitem)
+                            taintedform[tainted_key] = tainted
+
+                        elif tainted_key in tainteddefaults:
+                            missesdefault = 0
+                            for defitem in tdefault:
+                                if isinstance(defitem, record):
+                                    try:
+                                        for k, v in \
+                                            defitem.__dict__.items():
+                                            for origitem in l:
+                                                if not hasattr(
+                                                        origitem, k):
+                                                    missesdefault = 1
+                                                    raise NestedLoopExit
+                                    except NestedLoopExit:
+                                        break
+                                else:
+                                    if not defitem in l:
                                         missesdefault = 1
                                         break
-                                if missesdefault:
-                                    tainted = deepcopy(r)
-                                    for k, v in tdefault.__dict__.items():
-                                        if not hasattr(tainted, k):
-                                            setattr(tainted, k, v)
-                                    taintedform[tainted_key] = tainted
-
-                            for k, v in value.__dict__.items():
-                                # loop through the attributes and value
-                                # in the default dictionary
-                                if not hasattr(r, k):
-                                    # if the form dictionary doesn't have
-                                    # the attribute, set it to the default
-                                    setattr(r,k,v)
-                            form[key] = r
-
-                        elif isinstance(value, lt):
-                            # the default value is a list
-                            l = form[key]
-                            if not isinstance(l, lt):
-                                l = [l]
-
-                            # First deal with tainted copies
-                            if tainted_key in taintedform:
-                                tainted = taintedform[tainted_key]
-                                if not isinstance(tainted, lt):
-                                    tainted = [tainted]
+                            if missesdefault:
+                                tainted = deepcopy(l)
                                 for defitem in tdefault:
                                     if isinstance(defitem, record):
-                                        for k, v in defitem.__dict__.items():
+                                        for k, v in (
+                                                defitem.__dict__.items()):
                                             for origitem in tainted:
-                                                if not hasattr(origitem, k):
+                                                if not hasattr(
+                                                            origitem, k):
                                                     setattr(origitem, k, v)
                                     else:
                                         if not defitem in tainted:
                                             tainted.append(defitem)
                                 taintedform[tainted_key] = tainted
 
-                            elif tainted_key in tainteddefaults:
-                                missesdefault = 0
-                                for defitem in tdefault:
-                                    if isinstance(defitem, record):
-                                        try:
-                                            for k, v in \
-                                                defitem.__dict__.items():
-                                                for origitem in l:
-                                                    if not hasattr(
-                                                            origitem, k):
-                                                        missesdefault = 1
-                                                        raise NestedLoopExit
-                                        except NestedLoopExit:
-                                            break
-                                    else:
-                                        if not defitem in l:
-                                            missesdefault = 1
-                                            break
-                                if missesdefault:
-                                    tainted = deepcopy(l)
-                                    for defitem in tdefault:
-                                        if isinstance(defitem, record):
-                                            for k, v in (
-                                                    defitem.__dict__.items()):
-                                                for origitem in tainted:
-                                                    if not hasattr(
-                                                                origitem, k):
-                                                        setattr(origitem, k, v)
-                                        else:
-                                            if not defitem in tainted:
-                                                tainted.append(defitem)
-                                    taintedform[tainted_key] = tainted
-
-                            for x in value:
-                                # for each x in the list
-                                if isinstance(x, record):
-                                    # if the x is a record
-                                    for k, v in x.__dict__.items():
-
-                                        # loop through each
-                                        # attribute and value in
-                                        # the record
+                        for x in value:
+                            # for each x in the list
+                            if isinstance(x, record):
+                                # if the x is a record
+                                for k, v in x.__dict__.items():
 
-                                        for y in l:
+                                    # loop through each
+                                    # attribute and value in
+                                    # the record
 
-                                            # loop through each
-                                            # record in the form
-                                            # list if it doesn't
-                                            # have the attributes
-                                            # in the default
-                                            # dictionary, set them
+                                    for y in l:
 
-                                            if not hasattr(y, k):
-                                                setattr(y, k, v)
-                                else:
-                                    # x is not a record
-                                    if not x in l:
-                                        l.append(x)
-                            form[key] = l
-                        else:
-                            # The form has the key, the key is not mapped
-                            # to a record or sequence so do nothing
-                            pass
-
-            # Convert to tuples
-            if tuple_items:
-                for key in tuple_items.keys():
-                    # Split the key and get the attr
-                    k = key.split( ".")
-                    k,attr = '.'.join(k[:-1]), k[-1]
-                    a = attr
-                    new = ''
-                    # remove any type_names in the attr
-                    while not a =='':
-                        a = a.split( ":")
-                        a,new = ':'.join(a[:-1]), a[-1]
-                    attr = new
-                    if k in form:
-                        # If the form has the split key get its value
-                        tainted_split_key = k
-                        if '<' in k:
-                            tainted_split_key = TaintedString(k)
-                        item =form[k]
-                        if isinstance(item, record):
-                            # if the value is mapped to a record, check if it
-                            # has the attribute, if it has it, convert it to
-                            # a tuple and set it
-                            if hasattr(item,attr):
-                                value = tuple(getattr(item,attr))
-                                setattr(item,attr,value)
-                        else:
-                            # It is mapped to a list of  records
-                            for x in item:
-                                # loop through the records
-                                if hasattr(x, attr):
-                                    # If the record has the attribute
-                                    # convert it to a tuple and set it
-                                    value = tuple(getattr(x,attr))
-                                    setattr(x,attr,value)
-
-                        # Do the same for the tainted counterpart
-                        if tainted_split_key in taintedform:
-                            tainted = taintedform[tainted_split_key]
-                            if isinstance(item, record):
-                                seq = tuple(getattr(tainted, attr))
-                                setattr(tainted, attr, seq)
+                                        # loop through each
+                                        # record in the form
+                                        # list if it doesn't
+                                        # have the attributes
+                                        # in the default
+                                        # dictionary, set them
+
+                                        if not hasattr(y, k):
+                                            setattr(y, k, v)
                             else:
-                                for trec in tainted:
-                                    if hasattr(trec, attr):
-                                        seq = getattr(trec, attr)
-                                        seq = tuple(seq)
-                                        setattr(trec, attr, seq)
+                                # x is not a record
+                                if not x in l:
+                                    l.append(x)
+                        form[key] = l
                     else:
-                        # the form does not have the split key
-                        tainted_key = key
-                        if '<' in key:
-                            tainted_key = TaintedString(key)
-                        if key in form:
-                            # if it has the original key, get the item
-                            # convert it to a tuple
-                            item = form[key]
-                            item = tuple(form[key])
-                            form[key] = item
-
-                        if tainted_key in taintedform:
-                            tainted = tuple(taintedform[tainted_key])
-                            taintedform[tainted_key] = tainted
+                        # The form has the key, the key is not mapped
+                        # to a record or sequence so do nothing
+                        pass
+
+        # Convert to tuples
+        if tuple_items:
+            for key in tuple_items.keys():
+                # Split the key and get the attr
+                k = key.split( ".")
+                k,attr = '.'.join(k[:-1]), k[-1]
+                a = attr
+                new = ''
+                # remove any type_names in the attr
+                while not a =='':
+                    a = a.split( ":")
+                    a,new = ':'.join(a[:-1]), a[-1]
+                attr = new
+                if k in form:
+                    # If the form has the split key get its value
+                    tainted_split_key = k
+                    if '<' in k:
+                        tainted_split_key = TaintedString(k)
+                    item =form[k]
+                    if isinstance(item, record):
+                        # if the value is mapped to a record, check if it
+                        # has the attribute, if it has it, convert it to
+                        # a tuple and set it
+                        if hasattr(item,attr):
+                            value = tuple(getattr(item,attr))
+                            setattr(item,attr,value)
+                    else:
+                        # It is mapped to a list of  records
+                        for x in item:
+                            # loop through the records
+                            if hasattr(x, attr):
+                                # If the record has the attribute
+                                # convert it to a tuple and set it
+                                value = tuple(getattr(x,attr))
+                                setattr(x,attr,value)
+
+                    # Do the same for the tainted counterpart
+                    if tainted_split_key in taintedform:
+                        tainted = taintedform[tainted_split_key]
+                        if isinstance(item, record):
+                            seq = tuple(getattr(tainted, attr))
+                            setattr(tainted, attr, seq)
+                        else:
+                            for trec in tainted:
+                                if hasattr(trec, attr):
+                                    seq = getattr(trec, attr)
+                                    seq = tuple(seq)
+                                    setattr(trec, attr, seq)
+                else:
+                    # the form does not have the split key
+                    tainted_key = key
+                    if '<' in key:
+                        tainted_key = TaintedString(key)
+                    if key in form:
+                        # if it has the original key, get the item
+                        # convert it to a tuple
+                        item = form[key]
+                        item = tuple(form[key])
+                        form[key] = item
+
+                    if tainted_key in taintedform:
+                        tainted = tuple(taintedform[tainted_key])
+                        taintedform[tainted_key] = tainted
+
+        return meth
+
+    def _needsFields(self, fslist):
+        # Fields with a suffix can't wait: a converter (:int, :date, a
+        # registered one ...) may refuse the value, which must be raised
+        # here like before, and :method or :action change the path to
+        # traverse. Only plain fields are converted when first used.
+        for item in fslist:
+            if ':' in item.name:
+                return True
+        return False
+
+    def _getFieldKeys(self, fslist):
+        # The form keys the plain fields produce: their names
+        keys = {}
+        for item in fslist:
+            keys[item.name] = 1
+        return keys
 
-        if meth:
-            if 'PATH_INFO' in environ:
-                path = environ['PATH_INFO']
-                while path[-1:] == '/':
-                    path = path[:-1]
-            else:
-                path = ''
-            other['PATH_INFO'] = path = "%s/%s" % (path,meth)
-            self._hacked_path = 1
+    def _parseForm(self):
+        form = self.__dict__.get('form', {})
+        taintedform = self.__dict__.get('taintedform', {})
+        fslist = self._form_fields
+        self._form_fields = self._form_names = None
+        try:
+            if fslist is not None:
+                self._processFields(fslist, form, taintedform)
+        finally:
+            self.form = form
+            self.taintedform = taintedform
 
     def postProcessInputs(self):
         """Process the values in request.form to decode strings to unicode.
@@ -1342,32 +1429,37 @@ class HTTPRequest(BaseRequest):
                 del self._lazies[key]
                 return v
 
-        # Return tainted data first (marked as suspect)
-        if returnTaints:
-            v = self.taintedform.get(key, _marker)
+        # Don't convert the form fields for keys they can't produce
+        form_names = self._form_names
+        if (form_names is None or key in form_names or
+            'form' in self.__dict__):
+            # Return tainted data first (marked as suspect)
+            if returnTaints:
+                v = self.taintedform.get(key, _marker)
+                if v is not _marker:
+                    other[key] = v
+                    return v
+
+            # Untrusted data *after* trusted data
+            v = self.form.get(key, _marker)
             if v is not _marker:
                 other[key] = v
                 return v
 
-        # Untrusted data *after* trusted data
-        v = self.form.get(key, _marker)
-        if v is not _marker:
-            other[key] = v
-            return v
+        if self._mayHaveCookie(key):
+            # Return tainted data first (marked as suspect)
+            if returnTaints:
+                v = self.taintedcookies.get(key, _marker)
+                if v is not _marker:
+                    other[key] = v
+                    return v
 
-        # Return tainted data first (marked as suspect)
-        if returnTaints:
-            v = self.taintedcookies.get(key, _marker)
+            # Untrusted data *after* trusted data
+            v = self.cookies.get(key, _marker)
             if v is not _marker:
                 other[key] = v
                 return v
 
-        # Untrusted data *after* trusted data
-        v = self.cookies.get(key, _marker)
-        if v is not _marker:
-            other[key] = v
-            return v
-
         return default
 
     def __getitem__(self, key, default=_marker, returnTaints=0):
@@ -1597,9 +1689,159 @@ def sane_environment(env):
 
 
 class ZopeFieldStorage(FieldStorage):
+    """FieldStorage which avoids copying uploaded data around
+
+    o A request body which is not form data (e.g. a PUT) is used as is
+      if it is available in a seekable file, instead of being copied into
+      another temporary file.
+
+    o The parts of multipart bodies are read in large blocks and written
+      straight to their temporary files, rather than line by line.
+
+    o The name of the temporary file a part was spooled to is kept, so the
+      file can be handed off (e.g. linked into a blob) without copying it
+      again. See 'FileUpload._spooled_filename'.
+    """
+
+    bufsize = 1 << 16
+    spooled_filename = None
 
     def make_file(self, binary=None):
-        return tempfile.NamedTemporaryFile("w+b")
+        f = tempfile.NamedTemporaryFile("w+b")
+        self.spooled_filename = f.name
+        return f
+
+    def read_binary(self):
+        fp = self.fp
+        if not self.outerboundary and self.length >= 0:
+            try:
+                seekable = fp.tell() == 0
+            except (AttributeError, IOError):
+                seekable = False
+            if seekable:
+                # The whole body is in fp already
+                self.file = fp
+                return
+        FieldStorage.read_binary(self)
+
+    def read_multi(self, environ, keep_blank_values, strict_parsing):
+        if not isinstance(self.fp, _BlockReader):
+            self.fp = _BlockReader(self.fp)
+        FieldStorage.read_multi(self, environ, keep_blank_values,
+                                strict_parsing)
+
+    def read_lines_to_outerboundary(self):
+        fp = self.fp
+        if not isinstance(fp, _BlockReader):
+            return FieldStorage.read_lines_to_outerboundary(self)
+        # FieldStorage.__write spools to a temporary file once the data
+        # gets big.
+        write = self._FieldStorage__write
+        next = '--' + self.outerboundary
+        last = next + '--'
+        delimiter = '\n' + next
+        # The tail of the buffer which may hold the start of a delimiter
+        keep = len(delimiter) + 1
+        # Start with a newline, so a boundary right at the start of the
+        # part is found as well.
+        buf = '\n'
+        start = 1
+        pos = 0
+        while 1:
+            i = buf.find(delimiter, pos)
+            if i < 0:
+                data = fp.read_block()
+                if not data:
+                    self.done = -1
+                    # The line break before a boundary belongs to the
+                    # boundary.
+                    if buf.endswith('\r\n'):
+                        buf = buf[:-2]
+                    elif buf.endswith('\n'):
+                        buf = buf[:-1]
+                    if len(buf) > start:
+                        write(buf[start:])
+                    return
+                if len(buf) - keep > start:
+                    write(buf[start:-keep])
+                    buf = buf[-keep:]
+                    start = 0
+                buf = buf + data
+                pos = 0
+                continue
+            end = buf.find('\n', i + 1)
+            if end < 0 and len(buf) - i < len(last) + 256:
+                data = fp.read_block()
+                if data:
+                    buf = buf + data
+                    pos = i
+                    continue
+            if end < 0:
+                end = len(buf)
+            line = buf[i + 1:end + 1].strip()
+            if line == next or line == last:
+                if i > 0 and buf[i - 1] == '\r':
+                    i = i - 1
+                if i > start:
+                    write(buf[start:i])
+                fp.unread(buf[end + 1:])
+                if line == last:
+                    self.done = 1
+                return
+            pos = i + 1
+
+
+class _BlockReader:
+    """Buffer a request body, so it can be read in large blocks
+
+    Data read too far can be pushed back with 'unread'.
+    """
+
+    blocksize = 1 << 20
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._buf = ''
+
+    def read_block(self):
+        buf = self._buf
+        if buf:
+            self._buf = ''
+            return buf
+        return self._fp.read(self.blocksize)
+
+    def unread(self, data):
+        self._buf = data + self._buf
+
+    def read(self, size=-1):
+        buf = self._buf
+        if size < 0:
+            self._buf = ''
+            return buf + self._fp.read()
+        if len(buf) < size:
+            buf = buf + self._fp.read(size - len(buf))
+        self._buf = buf[size:]
+        return buf[:size]
+
+    def readline(self, size=-1):
+        buf = self._buf
+        while True:
+            i = buf.find('\n')
+            if i >= 0:
+                i = i + 1
+                break
+            if size >= 0 and len(buf) >= size:
+                i = size
+                break
+            data = self._fp.read(self.blocksize)
+            if not data:
+                i = len(buf)
+                break
+            buf = buf + data
+        if size >= 0 and i > size:
+            i = size
+        self._buf = buf[i:]
+        return buf[:i]
 
 
 # Original version: zope.publisher.browser.FileUpload
@@ -1637,6 +1879,10 @@ class FileUpload:
 
         self.headers = aFieldStorage.headers
         self.filename = aFieldStorage.filename
+        # The name of the temporary file holding the upload, which may be
+        # linked or renamed instead of copying the data.
+        self._spooled_filename = getattr(aFieldStorage, 'spooled_filename',
+                                         None)
 
         # Add an assertion to the rfc822.Message object that implements
         # self.headers so that managed code can access them.
@@ -13,12 +13,14 @@
 """ CGI Response Output formatter
 """
 from cgi import escape
+from collections import OrderedDict
 import os
 import re
 from string import maketrans
 from string import translate
 import struct
 import sys
+from thread import allocate_lock
 import types
 from urllib import quote
 import zlib
@@ -128,6 +130,156 @@ otherTypes = os.environ.get('DONT_GZIP_MAJOR_MIME_TYPES','').lower()
 if otherTypes:
     uncompressableMimeMajorTypes += tuple(otherTypes.split(','))
 
+
+
+def is_compressible(content_type):
+    """Return whether a body of the given content type should be gzip'd
+    """
+    major = content_type.split('/')[0].strip().lower()
+    return major not in uncompressableMimeMajorTypes
+
+
+class GzipCompressor:
+    """Incremental gzip compression of a response body
+
+    'compress' returns the compressed data available so far, 'finish'
+    returns the rest of it, including the gzip trailer.
+    """
+
+    def __init__(self, level=6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                            -zlib.MAX_WBITS,
+                                            zlib.DEF_MEM_LEVEL, 0)
+        self._crc = zlib.crc32('')
+        self._size = 0
+        self._started = False
+
+    def _header(self):
+        if self._started:
+            return ''
+        self._started = True
+        return _gzip_header
+
+    def compress(self, data, flush=False):
+        """Compress 'data'
+
+        If 'flush' is true, everything passed in so far can be
+        decompressed from the returned data, so that streamed output
+        reaches the client without delay.
+        """
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        chunks = [self._header(), self._compressor.compress(data)]
+        if flush:
+            chunks.append(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        return ''.join(chunks)
+
+    def finish(self):
+        return ''.join([self._header(), self._compressor.flush(),
+                        struct.pack("<LL", self._crc & 0xffffffffL,
+                                    self._size & 0xffffffffL)])
+
+
+def gzip_compress(data):
+    """Return 'data' gzip compressed
+    """
+    compressor = GzipCompressor()
+    return compressor.compress(data) + compressor.finish()
+
+
+class CompressedBodyCache:
+    """A thread-safe, size bounded LRU cache of compressed bodies
+
+    The entries are keyed by the validator of the response (its 'ETag'
+    or 'Last-Modified' header), its content type and the body length.
+    The CRC of the body is stored along and checked on lookup, which is
+    much cheaper than compressing the body again.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = allocate_lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key, crc):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] != crc:
+                # The body has changed without its validator
+                self._bytes -= len(entry[1])
+                return None
+            # Move the entry to the most recently used end
+            self._entries[key] = entry
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    def set(self, key, crc, data):
+        if len(data) > self.max_bytes:
+            return
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+            self._entries[key] = (crc, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                key, entry = self._entries.popitem(last=False)
+                self._bytes -= len(entry[1])
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._bytes = 0
+        finally:
+            self._lock.release()
+
+# The environment variable COMPRESSED_BODY_CACHE_SIZE can be set to the
+# number of bytes of compressed bodies kept in memory; 0 disables the cache.
+compressed_bodies = CompressedBodyCache(
+    int(os.environ.get('COMPRESSED_BODY_CACHE_SIZE', 1 << 24)))
+
+
+def compress_static(ob, data, content_type, REQUEST, RESPONSE):
+    """Return the gzip compressed data of a static resource, or None
+
+    The data is compressed on the first request accepting it and kept on
+    'ob' (which must not be persistent). 'data' may be a callable
+    returning the data, so that it is only loaded when needed. If the
+    compressed data is returned, the 'Content-Encoding' and
+    'Content-Length' headers have been set on the response.
+    """
+    if not is_compressible(content_type):
+        return None
+    compressed = getattr(ob, '_gzip_data', None)
+    if compressed == '':
+        # Compressing didn't pay off
+        return None
+    RESPONSE._varyOnAcceptEncoding()
+    if REQUEST.get('HTTP_ACCEPT_ENCODING', '').find('gzip') == -1:
+        return None
+    if compressed is None:
+        if callable(data):
+            data = data()
+        compressed = gzip_compress(data)
+        if len(compressed) >= len(data):
+            compressed = ''
+        ob._gzip_data = compressed
+        if not compressed:
+            return None
+    RESPONSE.setHeader('Content-Encoding', 'gzip')
+    RESPONSE.setHeader('Content-Length', len(compressed))
+    return compressed
+
+
 _CRLF = re.compile(r'\r[\n]?')
 
 def _scrubHeader(name, value):
@@ -486,11 +638,13 @@ class HTTPResponse(BaseResponse):
                 self.body = body
 
         content_type = self.headers.get('content-type')
+        # An encoded (e.g. precompressed) body must be left alone
+        encoded = 'content-encoding' in self.headers
 
         # Some browsers interpret certain characters in Latin 1 as html
         # special characters. These cannot be removed by html_quote,
         # because this is not the case for all encodings.
-        if (content_type == 'text/html' or
+        if not encoded and (content_type == 'text/html' or
             content_type and latin1_alias_match(content_type) is not None):
             body = '&lt;'.join(body.split('\213'))
             body = '&gt;'.join(body.split('\233'))
@@ -511,39 +665,52 @@ class HTTPResponse(BaseResponse):
 
         self.setHeader('content-length', len(self.body))
 
-        self.insertBase()
+        if not encoded:
+            self.insertBase()
 
-        if self.use_HTTP_content_compression and \
-            self.headers.get('content-encoding', 'gzip') == 'gzip':
+        if self.use_HTTP_content_compression and not encoded:
             # use HTTP content encoding to compress body contents unless
             # this response already has another type of content encoding
-            if content_type.split('/')[0] not in uncompressableMimeMajorTypes:
+            if is_compressible(content_type):
                 # only compress if not listed as uncompressable
                 body = self.body
                 startlen = len(body)
-                co = zlib.compressobj(6,zlib.DEFLATED,-zlib.MAX_WBITS,
-                                      zlib.DEF_MEM_LEVEL,0)
-                chunks = [_gzip_header, co.compress(body),
-                          co.flush(),
-                          struct.pack("<ll",zlib.crc32(body),startlen)]
-                z = "".join(chunks)
+                z = self._compressBody(body, content_type)
                 newlen = len(z)
                 if newlen < startlen:
                     self.body = z
                     self.setHeader('content-length', newlen)
                     self.setHeader('content-encoding','gzip')
-                    if self.use_HTTP_content_compression == 1:
-                        # use_HTTP_content_compression == 1 if force was
-                        # NOT used in enableHTTPCompression().
-                        # If we forced it, then Accept-Encoding
-                        # was ignored anyway, so cache should not
-                        # vary on it. Otherwise if not forced, cache should
-                        # respect Accept-Encoding client header
-                        vary = self.getHeader('Vary')
-                        if vary is None or 'Accept-Encoding' not in vary:
-                            self.appendHeader('Vary', 'Accept-Encoding')
+                    self._varyOnAcceptEncoding()
         return self
 
+    def _compressBody(self, body, content_type):
+        # Bodies of responses with a validator are compressed once per
+        # version of the object they come from.
+        validator = (self.headers.get('etag') or
+                     self.headers.get('last-modified'))
+        if validator is None or not compressed_bodies.max_bytes:
+            return gzip_compress(body)
+        key = (validator, content_type, len(body))
+        crc = zlib.crc32(body)
+        z = compressed_bodies.get(key, crc)
+        if z is None:
+            z = gzip_compress(body)
+            compressed_bodies.set(key, crc, z)
+        return z
+
+    def _varyOnAcceptEncoding(self):
+        if self.use_HTTP_content_compression == 2:
+            # use_HTTP_content_compression == 2 if force was used in
+            # enableHTTPCompression(). If we forced it, then
+            # Accept-Encoding was ignored anyway, so cache should not
+            # vary on it. Otherwise if not forced, cache should
+            # respect Accept-Encoding client header
+            return
+        vary = self.getHeader('Vary')
+        if vary is None or 'Accept-Encoding' not in vary:
+            self.appendHeader('Vary', 'Accept-Encoding')
+
     def enableHTTPCompression(self, REQUEST={}, force=0, disable=0, query=0):
         """Enable HTTP Content Encoding with gzip compression if possible
 
@@ -573,7 +740,10 @@ class HTTPResponse(BaseResponse):
            has been previously requested.
 
            In setBody, the major mime type is used to determine if content
-           encoding should actually be performed.
+           encoding should actually be performed. Bodies of responses with
+           an ETag or Last-Modified header are only compressed once per
+           version. Output passed to write is compressed incrementally,
+           unless a Content-Length header has been set.
 
            By default, image types are not compressed.
            Additional major mime types can be specified by setting the
@@ -862,6 +1032,36 @@ class HTTPResponse(BaseResponse):
         return body
 
     _wrote = None
+    _stream_compressor = None
+
+    def _startStreamCompression(self):
+        """Set up gzip compression of streamed output
+
+        Must be called before the headers are sent. Output is only
+        compressed if its length hasn't been announced already.
+        """
+        if (not self.use_HTTP_content_compression or
+            'content-length' in self.headers or
+            'content-encoding' in self.headers or
+            not is_compressible(self.headers.get('content-type', ''))):
+            return
+        self._stream_compressor = GzipCompressor()
+        self.setHeader('content-encoding', 'gzip')
+        self._varyOnAcceptEncoding()
+
+    def _compressStream(self, data):
+        if self._stream_compressor is None:
+            return data
+        return self._stream_compressor.compress(data, flush=True)
+
+    def _finishStreamCompression(self):
+        """Return the end of the compressed output stream, or ''
+        """
+        compressor = self._stream_compressor
+        if compressor is None:
+            return ''
+        self._stream_compressor = None
+        return compressor.finish()
 
     def _cookie_list(self):
         cookie_list = []
@@ -932,7 +1132,8 @@ class HTTPResponse(BaseResponse):
                 html_search=re.compile('<html>',re.I).search,
                 ):
         if self._wrote:
-            return ''       # Streaming output was used.
+            # Streaming output was used.
+            return self._finishStreamCompression()
 
         status, headers = self.finalize()
         body = self.body
@@ -968,8 +1169,9 @@ class HTTPResponse(BaseResponse):
 
             notify(PubBeforeStreaming(self))
 
+            self._startStreamCompression()
             self.outputBody()
             self._wrote = 1
             self.stdout.flush()
 
-        self.stdout.write(data)
+        self.stdout.write(self._compressStream(data))
@@ -23,6 +23,7 @@ from zope.publisher.interfaces.browser import IBrowserPage
 from zope.publisher.skinnable import setDefaultSkin
 from zope.security.management import newInteraction, endInteraction
 
+from .conditional import handle_conditional_request
 from .mapply import mapply
 from .maybe_lock import allocate_lock
 from .pubevents import PubAfterTraversal
@@ -33,6 +34,8 @@ from .pubevents import PubStart
 from .pubevents import PubSuccess
 from .Request import Request
 from .Response import Response
+from .retrypolicy import policy as retry_policy
+from .timing import RequestTimer
 
 
 class Retry(Exception):
@@ -84,6 +87,7 @@ def publish(request, module_name, after_list, debug=0,
 
     parents=None
     response=None
+    request._timer = timer = RequestTimer()
 
     try:
         notify(PubStart(request))
@@ -91,6 +95,7 @@ def publish(request, module_name, after_list, debug=0,
         newInteraction()
 
         request.processInputs()
+        timer.mark('inputs')
 
         request_get=request.get
         response=request.response
@@ -125,25 +130,34 @@ def publish(request, module_name, after_list, debug=0,
             request.postProcessInputs()
 
         notify(PubAfterTraversal(request))
+        timer.mark('traversal')
 
         if transactions_manager:
             transactions_manager.recordMetaData(object, request)
 
-        result=mapply(object, request.args, request,
-                      call_object,1,
-                      missing_name,
-                      dont_publish_class,
-                      request, bind=1)
+        if handle_conditional_request(request, response, object):
+            # Answered with '304 Not Modified'
+            result = response
+        else:
+            result=mapply(object, request.args, request,
+                          call_object,1,
+                          missing_name,
+                          dont_publish_class,
+                          request, bind=1)
+        timer.mark('call')
 
         if result is not response:
             response.setBody(result)
+        timer.mark('response')
 
         notify(PubBeforeCommit(request))
 
         if transactions_manager:
             transactions_manager.commit()
+        timer.mark('commit')
         endInteraction()
 
+        timer.finish(request, response)
         notify(PubSuccess(request))
 
         return response
@@ -192,6 +206,7 @@ def publish(request, module_name, after_list, debug=0,
                             transactions_manager.abort()
                 finally:
                     endInteraction()
+                    timer.finish(request, response, failed=True)
                     notify(PubFailure(request, exc_info, retry))
 
             # Only reachable if Retry is raised and request supports retry.
@@ -201,10 +216,17 @@ def publish(request, module_name, after_list, debug=0,
             # Set the default layer/skin on the newly generated request
             if ISkinnable.providedBy(newrequest):
                 setDefaultSkin(newrequest)
+            # Requests which keep conflicting on the same object are
+            # retried one at a time
+            oid = retry_policy.serialize(newrequest)
             try:
                 return publish(newrequest, module_name, after_list, debug)
             finally:
-                newrequest.close()
+                try:
+                    newrequest.close()
+                finally:
+                    if oid is not None:
+                        retry_policy.release(oid)
 
         else:
             # Note: 'abort's can fail. Nevertheless, we want end request handling
@@ -216,6 +238,7 @@ def publish(request, module_name, after_list, debug=0,
                         transactions_manager.abort()
             finally:
                 endInteraction()
+                timer.finish(request, response, failed=True)
                 notify(PubFailure(request, exc_info, False))
             raise
 
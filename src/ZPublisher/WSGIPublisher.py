@@ -22,6 +22,7 @@ from zope.event import notify
 from zope.publisher.skinnable import setDefaultSkin
 from ZServer.medusa.http_date import build_http_date
 
+from ZPublisher.conditional import handle_conditional_request
 from ZPublisher.HTTPRequest import HTTPRequest
 from ZPublisher.HTTPResponse import HTTPResponse
 from ZPublisher.mapply import mapply
@@ -32,6 +33,7 @@ from ZPublisher.Publish import get_module_info
 from ZPublisher.Publish import missing_name
 from ZPublisher.pubevents import PubStart, PubBeforeCommit, PubAfterTraversal
 from ZPublisher.Iterators import IStreamIterator
+from ZPublisher.timing import RequestTimer
 
 _NOW = None     # overwrite for testing
 def _now():
@@ -45,13 +47,22 @@ class WSGIResponse(HTTPResponse):
     This Response object knows nothing about ZServer, but tries to be
     compatible with the ZServerHTTPResponse.
 
-    Most significantly, streaming is not (yet) supported.
+    If a WSGI 'start_response' callable has been handed to the response
+    (see 'publish_module'), output passed to 'write' is streamed: the
+    headers are finalized and sent on the first write, and every chunk is
+    passed straight to the 'write' callable returned by the server.
+    Without it, written data is buffered in 'stdout'.
     """
     _streaming = _chunking = 0
     _http_version = None
     _server_version = None
     _http_connection = None
 
+    # The WSGI 'start_response' callable, and the 'write' callable it
+    # returned once streaming has started.
+    _start_response = None
+    _server_write = None
+
     # Set this value to 1 if streaming output in
     # HTTP/1.1 should use chunked encoding
     http_chunk = 0
@@ -121,13 +132,25 @@ class WSGIResponse(HTTPResponse):
         computation of a response to proceed.
         """
         if not self._streaming:
-            
+
             notify(PubBeforeStreaming(self))
-            
+
             self._streaming = 1
-            self.stdout.flush()
+            self._startStreamCompression()
+            if self._start_response is not None:
+                # Send the headers now, they can't be changed anymore.
+                status, headers = self.finalize()
+                self._server_write = self._start_response(status, headers)
+                self._wrote = 1
+            else:
+                self.stdout.flush()
 
-        self.stdout.write(data)
+        data = self._compressStream(data)
+        if self._server_write is not None:
+            if data:
+                self._server_write(data)
+        else:
+            self.stdout.write(data)
 
     def setBody(self, body, title='', is_error=0):
         if isinstance(body, file) or IStreamIterator.providedBy(body):
@@ -164,8 +187,10 @@ def publish(request, module_name,
      transactions_manager,
     ) = _get_module_info(module_name)
 
+    request._timer = timer = RequestTimer()
     notify(PubStart(request))
     request.processInputs()
+    timer.mark('inputs')
     response = request.response
 
     if bobo_after is not None:
@@ -187,24 +212,34 @@ def publish(request, module_name,
     request['PARENTS'] = [object]
     object = request.traverse(path, validated_hook=validated_hook)
     notify(PubAfterTraversal(request))
+    timer.mark('traversal')
 
     if transactions_manager:
         transactions_manager.recordMetaData(object, request)
 
-    result = mapply(object,
-                    request.args,
-                    request,
-                    call_object,
-                    1,
-                    missing_name,
-                    dont_publish_class,
-                    request,
-                    bind=1,
-                    )
+    if handle_conditional_request(request, response, object):
+        # Answered with '304 Not Modified'
+        result = response
+    else:
+        result = mapply(object,
+                        request.args,
+                        request,
+                        call_object,
+                        1,
+                        missing_name,
+                        dont_publish_class,
+                        request,
+                        bind=1,
+                        )
+    timer.mark('call')
 
     if result is not response:
         response.setBody(result)
+    timer.mark('response')
 
+    # The transaction is committed by the WSGI middleware, after the
+    # timings have been reported.
+    timer.finish(request, response)
     notify(PubBeforeCommit(request))
     return response
 
@@ -246,6 +281,7 @@ def publish_module(environ, start_response,
     response._http_version = environ['SERVER_PROTOCOL'].split('/')[1]
     response._http_connection = environ.get('CONNECTION_TYPE', 'close')
     response._server_version = environ.get('SERVER_SOFTWARE')
+    response._start_response = start_response
 
     request = _request_factory(environ['wsgi.input'], environ, response)
 
@@ -260,23 +296,36 @@ def publish_module(environ, start_response,
     try:
         response = _publish(request, 'Zope2')
     except Unauthorized, v:
+        if response._wrote:
+            # Too late, the headers have been sent already.
+            raise
         response._unauthorized()
     except Redirect, v:
+        if response._wrote:
+            raise
         response.redirect(v)
 
-    # Start the WSGI server response
-    status, headers = response.finalize()
-    start_response(status, headers)
+    # Start the WSGI server response, unless streaming output already did.
+    if not getattr(response, '_wrote', None):
+        status, headers = response.finalize()
+        start_response(status, headers)
 
     body = response.body
 
     if isinstance(body, file) or IStreamIterator.providedBy(body):
         result = body
     else:
-        # If somebody used response.write, that data will be in the
+        # Streamed output has been passed to the server already. Anything
+        # written to a response which wasn't able to stream (for example
+        # a replacement response returned by the publisher) is in the
         # stdout StringIO, so we put that before the body.
-        # XXX This still needs verification that it really works.
         result = (stdout.getvalue(), response.body)
+        finish = getattr(response, '_finishStreamCompression', None)
+        tail = finish is not None and finish()
+        if tail:
+            # Compressed streamed output must be terminated, there's no
+            # way to append a body to it.
+            result = (stdout.getvalue(), tail)
 
     if 'repoze.tm.active' not in environ:
         request.close() # this aborts the transation!
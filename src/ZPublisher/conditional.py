@@ -0,0 +1,132 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Conditional request support.
+
+The publisher answers conditional GET and HEAD requests ('If-None-Match'
+and 'If-Modified-Since') with '304 Not Modified' before calling the
+published object, if the object can be adapted to 'IHTTPValidators'.
+"""
+
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+
+from ZPublisher.interfaces import IHTTPValidators
+
+# Names of methods which publish the object they are bound to, rather than
+# some other view of it.
+DEFAULT_METHODS = ('index_html', 'GET', 'HEAD')
+
+
+def _validators_and_instance(ob):
+    # The adapter of a published object, or of the instance a default
+    # method is bound to, and that object or instance
+    validators = IHTTPValidators(ob, None)
+    if validators is None:
+        self = getattr(ob, 'im_self', None)
+        if (self is not None and
+            getattr(ob, '__name__', None) in DEFAULT_METHODS):
+            validators = IHTTPValidators(self, None)
+            ob = self
+    return validators, ob
+
+
+def get_validators(ob):
+    """Return the 'IHTTPValidators' adapter of a published object or None
+    """
+    return _validators_and_instance(ob)[0]
+
+
+def quote_etag(etag):
+    if etag.startswith('"') or etag.startswith('W/"'):
+        return etag
+    return '"%s"' % etag
+
+
+def parse_etags(header):
+    """Return the list of entity tags in an 'If-None-Match' header
+
+    Weak tags are returned without the 'W/' prefix, as they are compared
+    with the weak comparison function anyway.
+    """
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def parse_http_date(header):
+    """Return the seconds since the epoch of an HTTP date, or None
+    """
+    # Some clients append '; length=...'
+    header = header.split(';')[0]
+    try:
+        return long(mktime_tz(parsedate_tz(header)))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def is_not_modified(request, etag, last_modified):
+    """Return whether a request's conditions allow a '304 Not Modified'
+    """
+    header = request.get_header('If-None-Match', None)
+    if header is not None:
+        # If-Modified-Since must be ignored if If-None-Match is given
+        if etag is None:
+            return False
+        tags = parse_etags(header)
+        if '*' in tags:
+            return True
+        etag = quote_etag(etag)
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        return etag in tags
+    header = request.get_header('If-Modified-Since', None)
+    if header is not None and last_modified:
+        mod_since = parse_http_date(header)
+        return mod_since is not None and long(last_modified) <= mod_since
+    return False
+
+
+def handle_conditional_request(request, response, ob):
+    """Answer a conditional request for a published object with 304
+
+    Returns True if the response has been set up as '304 Not Modified';
+    the object must not be called then. Otherwise the entity tag of the
+    object, if it has one, is set on the response.
+
+    Objects with a 'precondition' (see 'OFS.Image.File') are always
+    called, so that the precondition is checked before anything is
+    told about them; they answer conditional requests themselves.
+    """
+    environ = getattr(request, 'environ', None)
+    if (environ is None or
+        environ.get('REQUEST_METHOD', 'GET').upper() not in ('GET', 'HEAD')):
+        return False
+    validators, instance = _validators_and_instance(ob)
+    if validators is None or getattr(instance, 'precondition', None):
+        return False
+    etag = validators.getETag()
+    last_modified = None
+    if (request.get_header('If-None-Match', None) is None and
+        request.get_header('If-Modified-Since', None) is not None):
+        last_modified = validators.getLastModified()
+    if etag is not None:
+        response.setHeader('ETag', quote_etag(etag))
+    if not is_not_modified(request, etag, last_modified):
+        return False
+    response.setStatus(304)
+    return True
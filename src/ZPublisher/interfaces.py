@@ -60,6 +60,26 @@ class IPubBeforeStreaming(Interface):
     response = Attribute(u"The current HTTP response")
 
 
+class IHTTPValidators(Interface):
+    """Cache validators of a published object.
+
+    If the object published for a GET or HEAD request can be adapted to
+    this interface, conditional requests are answered with '304 Not
+    Modified' without calling the object. See 'ZPublisher.conditional'.
+    """
+
+    def getETag():
+        """Return the entity tag of the object, or None.
+
+        The tag may be returned with or without the surrounding quotes.
+        """
+
+    def getLastModified():
+        """Return the time of the last modification of the object in
+        seconds since the epoch, or None.
+        """
+
+
 # Exceptions
 
 class UseTraversalDefault(Exception):
@@ -0,0 +1,224 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Retry policy for requests failing with a conflict error
+
+The publisher retries a request failing with a ConflictError up to
+'retry_max_count' times.  The policy decides how:
+
+- Before a retry the publisher sleeps a random time between zero and
+  'base_delay * 2 ** retry_count' seconds, at most 'max_delay' seconds.
+
+- Each URL may be retried at most 'budget' times per 'budget_window'
+  seconds (no limit if 'budget' is 0).  Once the budget of a URL is used
+  up, its conflict errors are reported to the user instead of retried,
+  so that a hot spot cannot multiply the load of the site.
+
+- A request which conflicted 'serialize_after' times on the same object
+  is retried while holding a lock for that object, so that the requests
+  fighting over it in this process are retried one after the other
+  (never if 'serialize_after' is 0).
+
+The conflicts are counted by the oid and class of the conflicting
+object, which the Control Panel shows.
+"""
+
+import logging
+import random
+import threading
+from thread import allocate_lock
+import time
+
+from ZODB.utils import oid_repr
+
+LOG = logging.getLogger('ZPublisher.Conflict')
+
+# At most this many URLs have a retry budget at the same time
+MAX_BUDGETS = 1000
+
+# At most this many objects are counted
+MAX_OBJECTS = 1000
+
+
+class RetryPolicy:
+    """Decides if and when requests failing with a conflict are retried
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=10.0, budget=0,
+                 budget_window=60.0, serialize_after=2,
+                 _time=time.time, _sleep=time.sleep, _random=random.random):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.budget_window = budget_window
+        self.serialize_after = serialize_after
+        self._time = _time
+        self._sleep = _sleep
+        self._random = _random
+        self._lock = allocate_lock()
+        # oid -> [lock, number of requests using it]
+        self._oid_locks = {}
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.since = self._time()
+            self.conflicts = 0
+            self.retries = 0
+            self.refused = 0
+            self.serialized = 0
+            # (oid, class name) -> number of conflicts
+            self._objects = {}
+            # URL -> [start of the window, number of retries]
+            self._budgets = {}
+        finally:
+            self._lock.release()
+
+    def recordConflict(self, request, error):
+        """Count a conflict error raised while publishing the request
+
+        Returns the number of conflicts on the same object since the
+        counters were reset.
+        """
+        oid = getattr(error, 'oid', None)
+        key = (oid, getattr(error, 'class_name', None))
+        self._lock.acquire()
+        try:
+            self.conflicts += 1
+            if key not in self._objects and len(self._objects) >= MAX_OBJECTS:
+                # Forget the objects which conflicted once
+                for k, count in self._objects.items():
+                    if count == 1:
+                        del self._objects[k]
+            count = self._objects[key] = self._objects.get(key, 0) + 1
+        finally:
+            self._lock.release()
+        history = getattr(request, 'conflict_history', None)
+        if history is not None:
+            request.conflict_history = history + (oid,)
+        return count
+
+    def getDelay(self, retry_count):
+        """Return the seconds to wait before the next retry
+        """
+        return self._random() * min(self.max_delay,
+                                    self.base_delay * 2 ** retry_count)
+
+    def _spendBudget(self, url):
+        now = self._time()
+        self._lock.acquire()
+        try:
+            entry = self._budgets.get(url)
+            if entry is None or entry[0] + self.budget_window <= now:
+                if url not in self._budgets and (
+                    len(self._budgets) >= MAX_BUDGETS):
+                    for k, (start, count) in self._budgets.items():
+                        if start + self.budget_window <= now:
+                            del self._budgets[k]
+                    if len(self._budgets) >= MAX_BUDGETS:
+                        self._budgets.clear()
+                entry = self._budgets[url] = [now, 0]
+            if entry[1] >= self.budget:
+                self.refused += 1
+                return False
+            entry[1] += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def mayRetry(self, request):
+        """Return whether the request may be retried, after waiting
+        """
+        if self.budget:
+            url = request.get('PATH_INFO', '')
+            if not self._spendBudget(url):
+                LOG.warning('Retry budget of %s used up, not retrying' % url)
+                return False
+        self._lock.acquire()
+        self.retries += 1
+        self._lock.release()
+        delay = self.getDelay(request.retry_count)
+        if delay > 0:
+            self._sleep(delay)
+        return True
+
+    def serialize(self, request):
+        """Acquire the lock of the object the request keeps conflicting on
+
+        Returns the oid whose lock is held, which must be passed to
+        'release' once the retried request is done, or None.  A thread
+        holds at most one such lock at a time, so retries can't deadlock.
+        """
+        if not self.serialize_after:
+            return None
+        if getattr(self._local, 'oid', None) is not None:
+            return None
+        history = getattr(request, 'conflict_history', None)
+        if not history:
+            return None
+        oid = history[-1]
+        if oid is None or list(history).count(oid) < self.serialize_after:
+            return None
+        self._lock.acquire()
+        try:
+            entry = self._oid_locks.get(oid)
+            if entry is None:
+                entry = self._oid_locks[oid] = [allocate_lock(), 0]
+            entry[1] += 1
+            self.serialized += 1
+        finally:
+            self._lock.release()
+        LOG.info('Serializing retries of %s conflicting on oid %s'
+                 % (request.get('PATH_INFO', ''), oid_repr(oid)))
+        entry[0].acquire()
+        self._local.oid = oid
+        return oid
+
+    def release(self, oid):
+        self._local.oid = None
+        self._lock.acquire()
+        try:
+            entry = self._oid_locks[oid]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._oid_locks[oid]
+            entry[0].release()
+        finally:
+            self._lock.release()
+
+    def getStatistics(self, limit=20):
+        """Return a mapping of the counters and of the objects with the
+        most conflicts
+        """
+        self._lock.acquire()
+        try:
+            objects = [(count, oid, class_name)
+                       for (oid, class_name), count in self._objects.items()]
+            stats = {'since': self.since,
+                     'conflicts': self.conflicts,
+                     'retries': self.retries,
+                     'refused': self.refused,
+                     'serialized': self.serialized,
+                    }
+        finally:
+            self._lock.release()
+        objects.sort(reverse=True)
+        stats['objects'] = [{'oid': oid is not None and oid_repr(oid) or '',
+                             'class_name': class_name or '',
+                             'count': count,
+                            }
+                            for count, oid, class_name in objects[:limit]]
+        return stats
+
+policy = RetryPolicy()
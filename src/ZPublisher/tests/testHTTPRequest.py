@@ -78,6 +78,14 @@ class HTTPRequestTests(unittest.TestCase):
         self._noFormValuesInOther(req)
         return req
 
+    def _processInputsDeferred(self, query_string):
+        # Like _processInputs, without using the form
+        env = {'SERVER_NAME': 'testingharnas', 'SERVER_PORT': '80'}
+        env['QUERY_STRING'] = query_string
+        req = self._makeOne(environ=env)
+        req.processInputs()
+        return req
+
     def _noTaintedValues(self, req):
         self.assertFalse(req.taintedform.keys())
 
@@ -640,6 +648,68 @@ class HTTPRequestTests(unittest.TestCase):
         self.assertEquals(req.cookies['multi2'],
                           'cookie data with unquoted spaces')
 
+    def test_processInputs_defers_conversion(self):
+        req = self._processInputsDeferred('num=42&rec.a=A')
+        self.assertFalse('form' in req.__dict__)
+        # Keys the fields can't produce don't need the conversion
+        self.assertEqual(req.get('other'), None)
+        self.assertEqual(req.get('rec'), None)
+        self.assertFalse('form' in req.__dict__)
+        self.assertEqual(req.get('num'), '42')
+        self.assertTrue('form' in req.__dict__)
+        self.assertEqual(req.form['rec.a'], 'A')
+
+    def test_processInputs_typed_fields_are_not_deferred(self):
+        req = self._processInputsDeferred('num:int=42&rec.a:record=A&l:list=x')
+        self.assertTrue('form' in req.__dict__)
+        self.assertEqual(req.form['num'], 42)
+        self.assertEqual(req.form['rec'].a, 'A')
+        self.assertEqual(req.form['l'], ['x'])
+
+    def test_processInputs_deferred_tainting(self):
+        req = self._processInputsDeferred('tainted=%3Cscript%3E')
+        self.assertTrue(self._valueIsOrHoldsTainted(
+            req.get('tainted', returnTaints=1)))
+        self.assertEqual(req.taintedform.keys(), ['tainted'])
+        self._taintedKeysAlsoInForm(req)
+
+    def test_processInputs_conversion_error(self):
+        env = {'SERVER_NAME': 'testingharnas', 'SERVER_PORT': '80',
+               'QUERY_STRING': 'a=1&n:int=notanint&z=2'}
+        req = self._makeOne(environ=env)
+        self.assertRaises(ValueError, req.processInputs)
+        # What was converted before the error is kept
+        self.assertEqual(req.form, {'a': '1'})
+        self.assertEqual(req.has_key('a'), 1)
+
+    def test_processInputs_method_field_is_not_deferred(self):
+        req = self._processInputsDeferred('x=X&submit:method=Go')
+        self.assertTrue('form' in req.__dict__)
+        self.assertEqual(req.other['PATH_INFO'], '/submit')
+
+    def test_processInputs_merges_into_form_in_use(self):
+        req = self._makeOne(environ={'QUERY_STRING': 'b=B'})
+        req.form['a'] = 'A'
+        req.processInputs()
+        self.assertEqual(req.form, {'a': 'A', 'b': 'B'})
+
+    def test_cookies_are_parsed_on_demand(self):
+        env = {'HTTP_COOKIE': 'foo=bar; tainted="<script>"'}
+        req = self._makeOne(environ=env)
+        self.assertEqual(req.get('nocookie'), None)
+        self.assertFalse('cookies' in req.__dict__)
+        self.assertEqual(req.get('foo'), 'bar')
+        self.assertTrue(self._valueIsOrHoldsTainted(
+            req.get('tainted', returnTaints=1)))
+        self.assertEqual(req.taintedcookies.keys(), ['tainted'])
+
+    def test_cookies_set_by_application_are_kept(self):
+        req = self._makeOne(environ={'HTTP_COOKIE': 'foo=bar'})
+        req.cookies = {'other': 'cookie'}
+        self.assertEqual(req.taintedcookies, {})
+        self.assertEqual(req.cookies, {'other': 'cookie'})
+        self.assertEqual(req.get('other'), 'cookie')
+
     def test_postProcessInputs(self):
         from ZPublisher.HTTPRequest import default_encoding
 
@@ -707,6 +777,68 @@ class HTTPRequestTests(unittest.TestCase):
         f.seek(0)
         self.assertEqual(f.xreadlines(),f)
 
+    def test_processInputs_w_multipart_crlf(self):
+        from StringIO import StringIO
+        s = StringIO(TEST_FILE_DATA_CRLF)
+        req = self._makeOne(stdin=s, environ=TEST_ENVIRON.copy())
+        req.processInputs()
+        self.assertEqual(req.form['title'], 'A title')
+        f = req.form['file']
+        self.assertEqual(f.filename, 'file')
+        self.assertEqual(f.read(), 'line 1\r\n--12345 not a boundary\r\n')
+
+    def test_processInputs_w_multipart_boundary_across_blocks(self):
+        from StringIO import StringIO
+        from ZPublisher.HTTPRequest import _BlockReader
+        for blocksize in range(1, len(TEST_FILE_DATA_CRLF) + 1):
+            s = StringIO(TEST_FILE_DATA_CRLF)
+            req = self._makeOne(stdin=s, environ=TEST_ENVIRON.copy())
+            orig_blocksize = _BlockReader.blocksize
+            _BlockReader.blocksize = blocksize
+            try:
+                req.processInputs()
+            finally:
+                _BlockReader.blocksize = orig_blocksize
+            self.assertEqual(req.form['title'], 'A title')
+            self.assertEqual(req.form['file'].read(),
+                             'line 1\r\n--12345 not a boundary\r\n')
+
+    def test_processInputs_w_multipart_empty_part(self):
+        from StringIO import StringIO
+        s = StringIO(TEST_EMPTYFILE_DATA)
+        req = self._makeOne(stdin=s, environ=TEST_ENVIRON.copy())
+        req.processInputs()
+        self.assertEqual(req.form['title'], '')
+
+    def test_processInputs_w_large_input_keeps_spooled_filename(self):
+        from StringIO import StringIO
+        s = StringIO(TEST_LARGEFILE_DATA)
+        req = self._makeOne(stdin=s, environ=TEST_ENVIRON.copy())
+        req.processInputs()
+        f = req.form.get('file')
+        self.assertEqual(f._spooled_filename, f.name)
+        self.assertEqual(f.read(), 'test %s\n' % ('test' * 1000))
+
+    def test_processInputs_w_small_input_not_spooled(self):
+        from StringIO import StringIO
+        s = StringIO(TEST_FILE_DATA)
+        req = self._makeOne(stdin=s, environ=TEST_ENVIRON.copy())
+        req.processInputs()
+        f = req.form.get('file')
+        self.assertEqual(f._spooled_filename, None)
+
+    def test_processInputs_w_body_reuses_input_file(self):
+        from StringIO import StringIO
+        s = StringIO('<doc>Not a form</doc>')
+        env = {'REQUEST_METHOD': 'PUT',
+               'CONTENT_TYPE': 'text/xml',
+               'CONTENT_LENGTH': str(len(s.getvalue())),
+              }
+        req = self._makeOne(stdin=s, environ=env)
+        req.processInputs()
+        self.failUnless(req.get('BODYFILE') is s)
+        self.assertEqual(req.get('BODY'), '<doc>Not a form</doc>')
+
     def test__authUserPW_simple( self ):
         import base64
         user_id = 'user'
@@ -1104,6 +1236,28 @@ test %s
 
 ''' % ('test' * 1000)
 
+TEST_FILE_DATA_CRLF = (
+    'preamble\r\n'
+    '--12345\r\n'
+    'Content-Disposition: form-data; name="title"\r\n'
+    '\r\n'
+    'A title\r\n'
+    '--12345\r\n'
+    'Content-Disposition: form-data; name="file"; filename="file"\r\n'
+    'Content-Type: application/octet-stream\r\n'
+    '\r\n'
+    'line 1\r\n'
+    '--12345 not a boundary\r\n'
+    '\r\n'
+    '--12345--\r\n'
+    'epilogue\r\n')
+
+TEST_EMPTYFILE_DATA = '''--12345
+Content-Disposition: form-data; name="title"
+
+--12345--
+'''
+
 
 def test_suite():
     suite = unittest.TestSuite()
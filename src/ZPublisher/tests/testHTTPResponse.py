@@ -703,6 +703,98 @@ class HTTPResponseTests(unittest.TestCase):
         response.setBody('foo' * 100) # body must get smaller on compression
         self.assertEqual(response.getHeader('Vary'), None)
 
+    def test_setBody_compression_body_already_encoded(self):
+        BEFORE = '\037\213<head>' * 100
+        response = self._makeOne()
+        response.setHeader('Content-Type', 'text/html')
+        response.setHeader('Content-Encoding', 'gzip')
+        response.setBase('http://example.com/')
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.setBody(BEFORE)
+        self.assertEqual(response.body, BEFORE)
+        self.assertEqual(response.getHeader('Content-Length'), str(len(BEFORE)))
+
+    def test_setBody_compression_gunzips(self):
+        import zlib
+        BEFORE = 'foo' * 100
+        response = self._makeOne()
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.setBody(BEFORE)
+        self.assertEqual(response.getHeader('Content-Encoding'), 'gzip')
+        self.assertEqual(zlib.decompress(response.body, 16 + zlib.MAX_WBITS),
+                         BEFORE)
+
+    def test_setBody_compression_cached_by_validator(self):
+        from ZPublisher import HTTPResponse as module
+        calls = []
+        def _gzip_compress(data):
+            calls.append(data)
+            return original(data)
+        original, module.gzip_compress = module.gzip_compress, _gzip_compress
+        module.compressed_bodies.clear()
+        try:
+            for body in ('foo' * 100, 'foo' * 100, 'bar' * 100):
+                response = self._makeOne()
+                response.setHeader('ETag', '"abc"')
+                response.enableHTTPCompression(
+                    {'HTTP_ACCEPT_ENCODING': 'gzip'})
+                response.setBody(body)
+                self.assertEqual(module.zlib.decompress(
+                    response.body, 16 + module.zlib.MAX_WBITS), body)
+        finally:
+            module.gzip_compress = original
+            module.compressed_bodies.clear()
+        # The same body isn't compressed twice, another body with the
+        # same validator is.
+        self.assertEqual(calls, ['foo' * 100, 'bar' * 100])
+
+    def test_setBody_compression_not_cached_wo_validator(self):
+        from ZPublisher import HTTPResponse as module
+        module.compressed_bodies.clear()
+        response = self._makeOne()
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.setBody('foo' * 100)
+        self.assertEqual(module.compressed_bodies._entries, {})
+
+    def test_write_compression(self):
+        import zlib
+        from StringIO import StringIO
+        stdout = StringIO()
+        response = self._makeOne(stdout=stdout)
+        response.setHeader('Content-Type', 'text/plain')
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.write('foo' * 100)
+        response.write('bar' * 100)
+        stdout.write(str(response))
+        headers, body = stdout.getvalue().split('\r\n\r\n', 1)
+        self.assertTrue('Content-Encoding: gzip' in headers)
+        self.assertTrue('Vary: Accept-Encoding' in headers)
+        self.assertEqual(zlib.decompress(body, 16 + zlib.MAX_WBITS),
+                         'foo' * 100 + 'bar' * 100)
+
+    def test_write_compression_each_chunk_decompressible(self):
+        import zlib
+        from StringIO import StringIO
+        stdout = StringIO()
+        response = self._makeOne(stdout=stdout)
+        response.setHeader('Content-Type', 'text/plain')
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.write('foo' * 100)
+        body = stdout.getvalue().split('\r\n\r\n', 1)[1]
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(body), 'foo' * 100)
+
+    def test_write_compression_w_content_length(self):
+        from StringIO import StringIO
+        stdout = StringIO()
+        response = self._makeOne(stdout=stdout)
+        response.setHeader('Content-Type', 'text/plain')
+        response.setHeader('Content-Length', '300')
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.write('foo' * 100)
+        self.assertEqual(str(response), '')
+        self.assertTrue(stdout.getvalue().endswith('foo' * 100))
+
     def test_redirect_defaults(self):
         URL = 'http://example.com'
         response = self._makeOne()
@@ -1296,7 +1388,112 @@ class HTTPResponseTests(unittest.TestCase):
     # def test_exception_* WAAAAAA!
 
 
+class GzipTests(unittest.TestCase):
+
+    def test_gzip_compress(self):
+        import gzip
+        from StringIO import StringIO
+        from ZPublisher.HTTPResponse import gzip_compress
+        data = 'Kilroy was here!' * 1000
+        compressed = gzip_compress(data)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         data)
+
+    def test_gzip_compress_empty(self):
+        import gzip
+        from StringIO import StringIO
+        from ZPublisher.HTTPResponse import gzip_compress
+        compressed = gzip_compress('')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         '')
+
+    def test_compressor_incremental(self):
+        import gzip
+        from StringIO import StringIO
+        from ZPublisher.HTTPResponse import GzipCompressor
+        compressor = GzipCompressor()
+        chunks = [compressor.compress('foo' * 100, flush=True),
+                  compressor.compress('bar' * 100),
+                  compressor.finish()]
+        compressed = ''.join(chunks)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         'foo' * 100 + 'bar' * 100)
+
+    def test_compressed_body_cache(self):
+        from ZPublisher.HTTPResponse import CompressedBodyCache
+        cache = CompressedBodyCache(10)
+        cache.set('a', 1, 'aaaa')
+        cache.set('b', 2, 'bbbb')
+        self.assertEqual(cache.get('a', 1), 'aaaa')
+        # 'b' is the least recently used entry
+        cache.set('c', 3, 'cccc')
+        self.assertEqual(cache.get('b', 2), None)
+        self.assertEqual(cache.get('a', 1), 'aaaa')
+        self.assertEqual(cache.get('c', 3), 'cccc')
+        cache.set('d', 4, 'd' * 11)
+        self.assertEqual(cache.get('d', 4), None)
+        # A stale entry is dropped
+        self.assertEqual(cache.get('a', 5), None)
+        self.assertEqual(cache._bytes, 4)
+
+
+class CompressStaticTests(unittest.TestCase):
+
+    def _callFUT(self, ob, data, content_type, accept='gzip'):
+        from ZPublisher.HTTPResponse import HTTPResponse
+        from ZPublisher.HTTPResponse import compress_static
+        self.response = HTTPResponse()
+        request = {'HTTP_ACCEPT_ENCODING': accept}
+        return compress_static(ob, data, content_type, request,
+                               self.response)
+
+    def test_compressed_once(self):
+        import zlib
+        class Static:
+            pass
+        ob = Static()
+        loaded = []
+        def data():
+            loaded.append(1)
+            return 'foo' * 100
+        compressed = self._callFUT(ob, data, 'text/css')
+        self.assertEqual(zlib.decompress(compressed, 16 + zlib.MAX_WBITS),
+                         'foo' * 100)
+        self.assertEqual(self.response.getHeader('Content-Encoding'), 'gzip')
+        self.assertEqual(self.response.getHeader('Content-Length'),
+                         str(len(compressed)))
+        self.assertEqual(self.response.getHeader('Vary'), 'Accept-Encoding')
+        self.assertTrue(self._callFUT(ob, data, 'text/css') is compressed)
+        self.assertEqual(loaded, [1])
+
+    def test_not_accepted(self):
+        class Static:
+            pass
+        self.assertEqual(self._callFUT(Static(), 'foo' * 100, 'text/css',
+                                       accept='deflate'), None)
+        self.assertEqual(self.response.getHeader('Content-Encoding'), None)
+        self.assertEqual(self.response.getHeader('Vary'), 'Accept-Encoding')
+
+    def test_uncompressible(self):
+        class Static:
+            pass
+        self.assertEqual(self._callFUT(Static(), 'foo' * 100, 'image/png'),
+                         None)
+        self.assertEqual(self.response.getHeader('Vary'), None)
+
+    def test_too_short(self):
+        class Static:
+            pass
+        ob = Static()
+        self.assertEqual(self._callFUT(ob, 'foo', 'text/css'), None)
+        self.assertEqual(ob._gzip_data, '')
+        self.assertEqual(self._callFUT(ob, 'foo', 'text/css'), None)
+        self.assertEqual(self.response.getHeader('Vary'), None)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(HTTPResponseTests, 'test'))
+    suite.addTest(unittest.makeSuite(GzipTests, 'test'))
+    suite.addTest(unittest.makeSuite(CompressStaticTests, 'test'))
     return suite
@@ -136,6 +136,57 @@ class WSGIResponseTests(unittest.TestCase):
                                 time.gmtime(time.mktime(WHEN)))
         self.assertTrue(('Date', whenstr) in headers)
 
+    def test_write_wo_start_response_buffers_in_stdout(self):
+        from StringIO import StringIO
+        stdout = StringIO()
+        response = self._makeOne(stdout=stdout)
+        response.write('abc')
+        response.write('def')
+        self.assertTrue(response._streaming)
+        self.assertFalse(response._wrote)
+        self.assertEqual(stdout.getvalue(), 'abcdef')
+
+    def test_write_w_start_response_streams(self):
+        from StringIO import StringIO
+        stdout = StringIO()
+        written = []
+        start_response = DummyCallable()
+        start_response._result = written.append
+        response = self._makeOne(stdout=stdout)
+        response._http_version = '1.1'
+        response._start_response = start_response
+        response.setHeader('Content-Type', 'text/csv')
+        response.write('abc')
+        self.assertTrue(response._wrote)
+        (status, headers), kw = start_response._called_with
+        self.assertEqual(status, '200 OK')
+        self.assertTrue(('Content-Type', 'text/csv') in headers)
+        self.assertFalse([x for x in headers if x[0] == 'Content-Length'])
+        # Headers are only sent once.
+        start_response._called_with = None
+        response.write('def')
+        self.assertEqual(start_response._called_with, None)
+        self.assertEqual(written, ['abc', 'def'])
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_write_w_start_response_notifies_PubBeforeStreaming(self):
+        from zope.component import provideHandler
+        from zope.testing.cleanup import cleanUp
+        from ZPublisher.interfaces import IPubBeforeStreaming
+        events = []
+        provideHandler(events.append, (IPubBeforeStreaming,))
+        try:
+            start_response = DummyCallable()
+            start_response._result = lambda data: None
+            response = self._makeOne()
+            response._start_response = start_response
+            response.write('abc')
+            response.write('def')
+            self.assertEqual(len(events), 1)
+            self.assertTrue(events[0].response is response)
+        finally:
+            cleanUp()
+
     #def test___str__already_wrote_not_chunking(self):
     #    response = self._makeOne()
     #    response._wrote = True
@@ -326,6 +377,36 @@ class Test_publish_module(unittest.TestCase):
         self.assertEqual(_after1._called_with, ((), {}))
         self.assertEqual(_after2._called_with, ((), {}))
 
+    def test_streams_output_written_to_response(self):
+        written = []
+        def _publish(request, module_name):
+            response = request.response
+            response.setHeader('Content-Type', 'text/plain')
+            response.write('abc')
+            self.assertEqual(written, ['abc'])
+            response.write('def')
+            return response
+        environ = self._makeEnviron()
+        start_response = DummyCallable()
+        start_response._result = written.append
+        app_iter = self._callFUT(environ, start_response, _publish)
+        self.assertEqual(written, ['abc', 'def'])
+        self.assertEqual(''.join(app_iter), '')
+        (status, headers), kw = start_response._called_with
+        self.assertEqual(status, '200 OK')
+        self.assertTrue(('Content-Type', 'text/plain') in headers)
+
+    def test_does_not_swallow_Unauthorized_after_streaming(self):
+        from zExceptions import Unauthorized
+        def _publish(request, module_name):
+            request.response.write('abc')
+            raise Unauthorized('TESTING')
+        environ = self._makeEnviron()
+        start_response = DummyCallable()
+        start_response._result = lambda data: None
+        self.assertRaises(Unauthorized,
+                          self._callFUT, environ, start_response, _publish)
+
     def test_swallows_Unauthorized(self):
         from zExceptions import Unauthorized
         environ = self._makeEnviron()
@@ -480,6 +561,9 @@ class DummyResponse(object):
 
     body = property(lambda self: self._body, setBody)
 
+    def setHeader(self, name, value):
+        self._headers = self._headers + [(name, value)]
+
 class DummyCallable(object):
     _called_with = _raise = _result = None
 
@@ -0,0 +1,198 @@
+import unittest
+
+from zope.component.testing import tearDown as cleanUp
+
+
+class DummyValidators:
+
+    def __init__(self, etag=None, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.calls = []
+
+    def getETag(self):
+        self.calls.append('getETag')
+        return self.etag
+
+    def getLastModified(self):
+        self.calls.append('getLastModified')
+        return self.last_modified
+
+
+class DummyContent:
+
+    def __init__(self, validators):
+        self.validators = validators
+
+    def index_html(self):
+        return 'CONTENT'
+
+    def other(self):
+        return 'OTHER'
+
+
+def _validators_of(ob):
+    return ob.validators
+
+
+class ConditionalTestBase(unittest.TestCase):
+
+    def setUp(self):
+        from zope.component import provideAdapter
+        from ZPublisher.interfaces import IHTTPValidators
+        provideAdapter(_validators_of, (DummyContent,), IHTTPValidators)
+
+    def tearDown(self):
+        cleanUp()
+
+    def _makeRequest(self, **environ):
+        from StringIO import StringIO
+        from ZPublisher.HTTPRequest import HTTPRequest
+        from ZPublisher.HTTPResponse import HTTPResponse
+        environ.setdefault('REQUEST_METHOD', 'GET')
+        environ.setdefault('SERVER_NAME', 'localhost')
+        environ.setdefault('SERVER_PORT', '8080')
+        return HTTPRequest(StringIO(), environ, HTTPResponse())
+
+
+class GetValidatorsTests(ConditionalTestBase):
+
+    def _callFUT(self, ob):
+        from ZPublisher.conditional import get_validators
+        return get_validators(ob)
+
+    def test_adaptable(self):
+        validators = DummyValidators()
+        self.failUnless(self._callFUT(DummyContent(validators))
+                        is validators)
+
+    def test_not_adaptable(self):
+        self.assertEqual(self._callFUT(object()), None)
+
+    def test_default_method(self):
+        validators = DummyValidators()
+        ob = DummyContent(validators)
+        self.failUnless(self._callFUT(ob.index_html) is validators)
+
+    def test_other_method(self):
+        ob = DummyContent(DummyValidators())
+        self.assertEqual(self._callFUT(ob.other), None)
+
+
+class ParseTests(unittest.TestCase):
+
+    def test_parse_etags(self):
+        from ZPublisher.conditional import parse_etags
+        self.assertEqual(parse_etags('"a", W/"b",,"c"'),
+                         ['"a"', '"b"', '"c"'])
+
+    def test_parse_http_date(self):
+        from ZPublisher.conditional import parse_http_date
+        self.assertEqual(parse_http_date('Sun, 09 Sep 2001 01:46:40 GMT'),
+                         1000000000)
+        self.assertEqual(
+            parse_http_date('Sun, 09 Sep 2001 01:46:40 GMT; length=10'),
+            1000000000)
+        self.assertEqual(parse_http_date('garbage'), None)
+
+
+class IsNotModifiedTests(ConditionalTestBase):
+
+    def _callFUT(self, request, etag, last_modified):
+        from ZPublisher.conditional import is_not_modified
+        return is_not_modified(request, etag, last_modified)
+
+    def test_unconditional(self):
+        request = self._makeRequest()
+        self.failIf(self._callFUT(request, 'abc', 1000000000))
+
+    def test_if_none_match(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='"xyz", "abc"')
+        self.failUnless(self._callFUT(request, 'abc', None))
+        self.failUnless(self._callFUT(request, '"abc"', None))
+        self.failUnless(self._callFUT(request, 'W/"abc"', None))
+        self.failIf(self._callFUT(request, 'def', None))
+        self.failIf(self._callFUT(request, None, None))
+
+    def test_if_none_match_star(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='*')
+        self.failUnless(self._callFUT(request, 'abc', None))
+
+    def test_if_none_match_overrides_if_modified_since(self):
+        request = self._makeRequest(
+            HTTP_IF_NONE_MATCH='"xyz"',
+            HTTP_IF_MODIFIED_SINCE='Sun, 09 Sep 2001 01:46:40 GMT')
+        self.failIf(self._callFUT(request, 'abc', 1000000000))
+
+    def test_if_modified_since(self):
+        request = self._makeRequest(
+            HTTP_IF_MODIFIED_SINCE='Sun, 09 Sep 2001 01:46:40 GMT')
+        self.failUnless(self._callFUT(request, None, 1000000000))
+        self.failUnless(self._callFUT(request, None, 999999999.5))
+        self.failIf(self._callFUT(request, None, 1000000001))
+        self.failIf(self._callFUT(request, None, None))
+
+
+class HandleConditionalRequestTests(ConditionalTestBase):
+
+    def _callFUT(self, request, ob):
+        from ZPublisher.conditional import handle_conditional_request
+        return handle_conditional_request(request, request.response, ob)
+
+    def test_not_adaptable(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='*')
+        self.failIf(self._callFUT(request, object()))
+        self.assertEqual(request.response.getStatus(), 200)
+
+    def test_sets_etag(self):
+        request = self._makeRequest()
+        ob = DummyContent(DummyValidators('abc', 1000000000))
+        self.failIf(self._callFUT(request, ob))
+        self.assertEqual(request.response.getHeader('ETag'), '"abc"')
+        # Last-Modified is only asked for if it's needed
+        self.assertEqual(ob.validators.calls, ['getETag'])
+
+    def test_not_modified(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='"abc"')
+        ob = DummyContent(DummyValidators('abc'))
+        self.failUnless(self._callFUT(request, ob.index_html))
+        self.assertEqual(request.response.getStatus(), 304)
+        self.assertEqual(request.response.getHeader('ETag'), '"abc"')
+
+    def test_not_modified_since(self):
+        request = self._makeRequest(
+            HTTP_IF_MODIFIED_SINCE='Sun, 09 Sep 2001 01:46:40 GMT')
+        ob = DummyContent(DummyValidators(None, 1000000000))
+        self.failUnless(self._callFUT(request, ob))
+        self.assertEqual(request.response.getStatus(), 304)
+
+    def test_precondition(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='"abc"')
+        ob = DummyContent(DummyValidators('abc'))
+        ob.precondition = 'check'
+        self.failIf(self._callFUT(request, ob.index_html))
+        self.assertEqual(request.response.getStatus(), 200)
+        self.assertEqual(request.response.getHeader('ETag'), None)
+        self.assertEqual(ob.validators.calls, [])
+
+    def test_modified(self):
+        request = self._makeRequest(HTTP_IF_NONE_MATCH='"abc"')
+        ob = DummyContent(DummyValidators('def'))
+        self.failIf(self._callFUT(request, ob))
+        self.assertEqual(request.response.getStatus(), 200)
+
+    def test_post(self):
+        request = self._makeRequest(REQUEST_METHOD='POST',
+                                    HTTP_IF_NONE_MATCH='*')
+        ob = DummyContent(DummyValidators('abc'))
+        self.failIf(self._callFUT(request, ob))
+        self.assertEqual(ob.validators.calls, [])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(GetValidatorsTests))
+    suite.addTest(unittest.makeSuite(ParseTests))
+    suite.addTest(unittest.makeSuite(IsNotModifiedTests))
+    suite.addTest(unittest.makeSuite(HandleConditionalRequestTests))
+    return suite
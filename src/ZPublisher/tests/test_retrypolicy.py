@@ -0,0 +1,154 @@
+import threading
+import unittest
+
+
+class DummyClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyRequest(dict):
+
+    retry_count = 0
+    conflict_history = ()
+
+    def __init__(self, path='/counter'):
+        self['PATH_INFO'] = path
+
+
+class DummyConflict(Exception):
+
+    def __init__(self, oid, class_name='Products.Counter.Counter'):
+        self.oid = oid
+        self.class_name = class_name
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from ZPublisher.retrypolicy import RetryPolicy
+        self.clock = DummyClock()
+        self.sleeps = []
+        kw.setdefault('_random', lambda: 0.5)
+        return RetryPolicy(_time=self.clock, _sleep=self.sleeps.append, **kw)
+
+    def test_delay_grows_exponentially_up_to_max(self):
+        policy = self._makeOne(base_delay=0.1, max_delay=0.5,
+                               _random=lambda: 1.0)
+        self.assertEqual([policy.getDelay(n) for n in range(4)],
+                         [0.1, 0.2, 0.4, 0.5])
+
+    def test_delay_is_jittered(self):
+        policy = self._makeOne(base_delay=1.0, _random=lambda: 0.25)
+        self.assertEqual(policy.getDelay(2), 1.0)
+
+    def test_mayRetry_sleeps(self):
+        policy = self._makeOne(base_delay=1.0)
+        request = DummyRequest()
+        request.retry_count = 1
+        self.failUnless(policy.mayRetry(request))
+        self.assertEqual(self.sleeps, [1.0])
+        self.assertEqual(policy.retries, 1)
+
+    def test_no_delay(self):
+        policy = self._makeOne(base_delay=0)
+        self.failUnless(policy.mayRetry(DummyRequest()))
+        self.assertEqual(self.sleeps, [])
+
+    def test_budget_per_url(self):
+        policy = self._makeOne(budget=2, budget_window=60)
+        self.failUnless(policy.mayRetry(DummyRequest('/a')))
+        self.failUnless(policy.mayRetry(DummyRequest('/a')))
+        self.failIf(policy.mayRetry(DummyRequest('/a')))
+        self.failUnless(policy.mayRetry(DummyRequest('/b')))
+        self.assertEqual(policy.refused, 1)
+        self.clock.now += 60
+        self.failUnless(policy.mayRetry(DummyRequest('/a')))
+
+    def test_budgets_are_bounded(self):
+        from ZPublisher import retrypolicy
+        policy = self._makeOne(budget=1)
+        for i in range(retrypolicy.MAX_BUDGETS + 10):
+            policy.mayRetry(DummyRequest('/%d' % i))
+        self.failUnless(len(policy._budgets) <= retrypolicy.MAX_BUDGETS)
+
+    def test_recordConflict_counts_per_object(self):
+        policy = self._makeOne()
+        request = DummyRequest()
+        self.assertEqual(policy.recordConflict(request, DummyConflict('a')), 1)
+        self.assertEqual(policy.recordConflict(request, DummyConflict('b')), 1)
+        self.assertEqual(policy.recordConflict(None, DummyConflict('a')), 2)
+        self.assertEqual(policy.recordConflict(None, Exception()), 1)
+        self.assertEqual(request.conflict_history, ('a', 'b'))
+        stats = policy.getStatistics()
+        self.assertEqual(stats['conflicts'], 4)
+        self.assertEqual(stats['objects'][0],
+                         {'oid': repr('a'), 'count': 2,
+                          'class_name': 'Products.Counter.Counter'})
+        self.assertEqual(len(stats['objects']), 3)
+
+    def test_oids_are_shown_in_hex(self):
+        from ZODB.utils import p64
+        policy = self._makeOne()
+        policy.recordConflict(None, DummyConflict(p64(42)))
+        self.assertEqual(policy.getStatistics()['objects'][0]['oid'], '0x2a')
+
+    def test_reset(self):
+        policy = self._makeOne()
+        policy.recordConflict(None, DummyConflict('a'))
+        policy.mayRetry(DummyRequest())
+        policy.reset()
+        stats = policy.getStatistics()
+        self.assertEqual((stats['conflicts'], stats['retries'],
+                          stats['objects']), (0, 0, []))
+
+    def test_serialize_after_repeated_conflicts(self):
+        policy = self._makeOne(serialize_after=2)
+        request = DummyRequest()
+        request.conflict_history = ('a',)
+        self.assertEqual(policy.serialize(request), None)
+        request.conflict_history = ('a', 'b')
+        self.assertEqual(policy.serialize(request), None)
+        request.conflict_history = ('a', 'b', 'a')
+        self.assertEqual(policy.serialize(request), 'a')
+        # A thread holds at most one lock
+        self.assertEqual(policy.serialize(request), None)
+        policy.release('a')
+        self.assertEqual(policy._oid_locks, {})
+        self.assertEqual(policy.serialized, 1)
+
+    def test_serialize_disabled(self):
+        policy = self._makeOne(serialize_after=0)
+        request = DummyRequest()
+        request.conflict_history = ('a', 'a', 'a')
+        self.assertEqual(policy.serialize(request), None)
+
+    def test_serialized_retries_wait_for_each_other(self):
+        policy = self._makeOne(serialize_after=1)
+        request = DummyRequest()
+        request.conflict_history = ('a',)
+        self.assertEqual(policy.serialize(request), 'a')
+        events = []
+
+        def retry():
+            oid = policy.serialize(request)
+            events.append('retried')
+            policy.release(oid)
+
+        thread = threading.Thread(target=retry)
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(events, [])
+        events.append('released')
+        policy.release('a')
+        thread.join()
+        self.assertEqual(events, ['released', 'retried'])
+        self.assertEqual(policy._oid_locks, {})
+
+
+def test_suite():
+    return unittest.makeSuite(RetryPolicyTests)
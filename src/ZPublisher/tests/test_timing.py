@@ -0,0 +1,202 @@
+import logging
+import unittest
+
+
+class DummyClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyConnection:
+
+    def __init__(self):
+        self.loads = self.stores = 0
+
+    def getTransferCounts(self, clear=False):
+        return self.loads, self.stores
+
+
+class DummyResponse:
+
+    debug_mode = False
+    status = 200
+
+    def __init__(self):
+        self.headers = {}
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+
+class DummyHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class RequestTimerTests(unittest.TestCase):
+
+    def setUp(self):
+        from ZPublisher import timing
+        self._statistics = timing.statistics
+        timing.statistics = timing.TimingStatistics()
+
+    def tearDown(self):
+        from ZPublisher import timing
+        timing.statistics = self._statistics
+
+    def _makeOne(self):
+        from ZPublisher.timing import RequestTimer
+        self.clock = DummyClock()
+        return RequestTimer(_time=self.clock)
+
+    def test_mark(self):
+        timer = self._makeOne()
+        self.clock.now += 0.5
+        timer.mark('inputs')
+        self.clock.now += 1.0
+        timer.mark('call')
+        self.assertEqual(timer.items(), [('inputs', 0.5), ('call', 1.0)])
+        self.assertEqual(timer.total(), 1.5)
+
+    def test_nested_phase(self):
+        timer = self._makeOne()
+        self.clock.now += 2.0
+        timer.add('validation', 0.5)
+        timer.mark('traversal')
+        self.assertEqual(timer.items(), [('traversal', 1.5),
+                                         ('validation', 0.5)])
+        self.assertEqual(timer.total(), 2.0)
+
+    def test_connection_counts(self):
+        timer = self._makeOne()
+        connection = DummyConnection()
+        connection.loads = 10
+        timer.watchConnection(connection)
+        connection.loads = 15
+        timer.mark('traversal')
+        connection.loads = 17
+        connection.stores = 3
+        timer.mark('commit')
+        self.assertEqual(timer.loads, {'traversal': 5, 'commit': 2})
+        self.assertEqual(timer.stores, {'traversal': 0, 'commit': 3})
+
+    def test_connection_counts_cleared(self):
+        timer = self._makeOne()
+        connection = DummyConnection()
+        connection.loads = 10
+        timer.watchConnection(connection)
+        connection.loads = 2
+        timer.mark('traversal')
+        connection.loads = 3
+        timer.mark('call')
+        self.assertEqual(timer.loads, {'call': 1})
+
+    def test_asHeader(self):
+        timer = self._makeOne()
+        self.clock.now += 0.002
+        timer.mark('inputs')
+        self.clock.now += 0.010
+        timer.mark('call')
+        self.assertEqual(timer.asHeader(),
+                         'inputs;dur=2.0, call;dur=10.0, total;dur=12.0')
+
+    def test_finish_debug_mode(self):
+        timer = self._makeOne()
+        self.clock.now += 0.001
+        timer.mark('inputs')
+        response = DummyResponse()
+        timer.finish({}, response)
+        self.assertEqual(response.headers, {})
+        response.debug_mode = True
+        timer.finish({}, response)
+        self.assertEqual(response.headers['Server-Timing'],
+                         'inputs;dur=1.0, total;dur=1.0')
+
+    def test_finish_logs(self):
+        from ZPublisher import timing
+        handler = DummyHandler()
+        timing.LOG.addHandler(handler)
+        level = timing.LOG.level
+        timing.LOG.setLevel(logging.DEBUG)
+        try:
+            timer = self._makeOne()
+            self.clock.now += 0.25
+            timer.mark('call')
+            timer.finish({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/foo'},
+                         DummyResponse())
+        finally:
+            timing.LOG.removeHandler(handler)
+            timing.LOG.setLevel(level)
+        self.assertEqual([r.getMessage() for r in handler.records],
+                         ['GET /foo 200 total=0.2500 call=0.2500'])
+
+    def test_finish_failed(self):
+        from ZPublisher import timing
+        timer = self._makeOne()
+        self.clock.now += 1.0
+        timer.mark('inputs')
+        self.clock.now += 2.0
+        timer.finish({}, None, failed=True)
+        self.assertEqual(timer.total(), 3.0)
+        stats = timing.statistics.getStatistics()
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['slowest'], 3.0)
+
+
+class TimingStatisticsTests(unittest.TestCase):
+
+    def _makeOne(self):
+        from ZPublisher.timing import TimingStatistics
+        return TimingStatistics()
+
+    def _makeTimer(self, **durations):
+        from ZPublisher.timing import RequestTimer
+        clock = DummyClock()
+        timer = RequestTimer(_time=clock)
+        for phase, seconds in durations.items():
+            clock.now += seconds
+            timer.mark(phase)
+        return timer
+
+    def test_record(self):
+        from ZPublisher.timing import BUCKETS
+        stats = self._makeOne()
+        stats.record(self._makeTimer(call=0.0005))
+        stats.record(self._makeTimer(call=0.0015))
+        stats.record(self._makeTimer(call=100))
+        result = stats.getStatistics()
+        self.assertEqual(result['requests'], 3)
+        self.assertEqual(result['failures'], 0)
+        self.assertEqual(result['slowest'], 100)
+        phases = result['phases']
+        self.assertEqual([p['phase'] for p in phases], ['call', 'total'])
+        call = phases[0]
+        self.assertEqual(call['count'], 3)
+        self.assertEqual(call['histogram'],
+                         [1, 1] + [0] * (len(BUCKETS) - 2) + [1])
+        self.assertEqual(len(stats.getBuckets()), len(BUCKETS) + 1)
+
+    def test_reset(self):
+        stats = self._makeOne()
+        stats.record(self._makeTimer(call=1))
+        stats.reset()
+        result = stats.getStatistics()
+        self.assertEqual(result['requests'], 0)
+        self.assertEqual(result['phases'], [])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RequestTimerTests))
+    suite.addTest(unittest.makeSuite(TimingStatisticsTests))
+    return suite
@@ -0,0 +1,241 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""Per-request phase timing
+
+The publisher records the time spent in each phase of a request:
+
+- 'inputs': parsing the request body and query string,
+
+- 'traversal': traversing to the published object,
+
+- 'validation': authenticating and authorizing the user,
+
+- 'call': calling the published object,
+
+- 'response': setting the body of the response,
+
+- 'commit': committing the transaction.
+
+Besides the durations, the number of objects loaded and stored by the
+ZODB connection of the request are counted per phase.
+
+The timings of a request are logged to the 'ZPublisher.timing' logger
+(at DEBUG level, or at INFO level if the request took longer than the
+number of seconds in the PUBLISHER_SLOW_REQUEST environment variable),
+sent in a 'Server-Timing' response header in debug mode and added to
+the histograms of 'statistics', which the Control Panel shows.
+"""
+
+from bisect import bisect_left
+import logging
+import os
+from thread import allocate_lock
+import time
+
+LOG = logging.getLogger('ZPublisher.timing')
+
+PHASES = ('inputs', 'traversal', 'validation', 'call', 'response', 'commit')
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0)
+
+# Requests taking longer than this many seconds are logged at INFO level
+slow_request = float(os.environ.get('PUBLISHER_SLOW_REQUEST', 0)) or None
+
+
+class RequestTimer:
+    """The timings of one request
+
+    'mark' ends the current phase. Nested phases (validation happens
+    during traversal) are reported with 'add' and not counted for the
+    phase they are nested in.
+    """
+
+    def __init__(self, _time=time.time):
+        self._time = _time
+        self.start = self._last = _time()
+        self.durations = {}
+        self.loads = {}
+        self.stores = {}
+        self._nested = 0.0
+        self._connection = None
+        self._counts = (0, 0)
+
+    def watchConnection(self, connection):
+        """Count the loads and stores of a ZODB connection
+        """
+        self._connection = connection
+        self._counts = connection.getTransferCounts()
+
+    def _countTransfers(self, phase):
+        if self._connection is None:
+            return
+        try:
+            counts = self._connection.getTransferCounts()
+        except Exception:
+            # The connection has been closed
+            self._connection = None
+            return
+        loads = counts[0] - self._counts[0]
+        stores = counts[1] - self._counts[1]
+        # Counters are reset when an activity monitor gets them
+        if loads >= 0 and stores >= 0:
+            self.loads[phase] = self.loads.get(phase, 0) + loads
+            self.stores[phase] = self.stores.get(phase, 0) + stores
+        self._counts = counts
+
+    def add(self, phase, seconds):
+        """Record the duration of a phase nested in the current one
+        """
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+        self._nested += seconds
+
+    def mark(self, phase):
+        """End the current phase
+        """
+        now = self._time()
+        seconds = max(now - self._last - self._nested, 0.0)
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+        self._last = now
+        self._nested = 0.0
+        self._countTransfers(phase)
+
+    def total(self):
+        return self._last - self.start
+
+    def items(self):
+        """Return (phase, seconds) pairs in publishing order
+        """
+        return [(phase, self.durations[phase])
+                for phase in PHASES if phase in self.durations]
+
+    def asHeader(self):
+        """Return the value of a 'Server-Timing' header
+        """
+        entries = ['%s;dur=%.1f' % (phase, seconds * 1000)
+                   for phase, seconds in self.items()]
+        entries.append('total;dur=%.1f' % (self.total() * 1000))
+        return ', '.join(entries)
+
+    def asLogLine(self, method, path, status):
+        entries = ['%s %s %s total=%.4f' % (method, path, status,
+                                            self.total())]
+        entries.extend(['%s=%.4f' % item for item in self.items()])
+        if self.loads or self.stores:
+            entries.append('loads=%d' % sum(self.loads.values()))
+            entries.append('stores=%d' % sum(self.stores.values()))
+            entries.append('commit_loads=%d' % self.loads.get('commit', 0))
+        return ' '.join(entries)
+
+    def finish(self, request, response, failed=False):
+        """Report the timings of a finished request
+        """
+        self._connection = None
+        if failed:
+            # Include the time spent on the error
+            self._last = self._time()
+        total = self.total()
+        if (response is not None and getattr(response, 'debug_mode', 0) and
+            not getattr(response, '_wrote', None)):
+            response.setHeader('Server-Timing', self.asHeader())
+        if slow_request is not None and total >= slow_request:
+            level = logging.INFO
+        else:
+            level = logging.DEBUG
+        if LOG.isEnabledFor(level):
+            status = failed and 'failed' or getattr(response, 'status', '-')
+            LOG.log(level, self.asLogLine(request.get('REQUEST_METHOD', '-'),
+                                          request.get('PATH_INFO', '/'),
+                                          status))
+        statistics.record(self, failed)
+
+
+class TimingStatistics:
+    """Histograms of the phase durations of all requests of this process
+    """
+
+    def __init__(self):
+        self._lock = allocate_lock()
+        self.reset()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.since = time.time()
+            self.requests = 0
+            self.failures = 0
+            self.slowest = None
+            self._histograms = {}
+            self._sums = {}
+            self._loads = 0
+            self._stores = 0
+        finally:
+            self._lock.release()
+
+    def record(self, timer, failed=False):
+        items = timer.items() + [('total', timer.total())]
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            if failed:
+                self.failures += 1
+            for phase, seconds in items:
+                histogram = self._histograms.get(phase)
+                if histogram is None:
+                    histogram = self._histograms[phase] = (
+                        [0] * (len(BUCKETS) + 1))
+                histogram[bisect_left(BUCKETS, seconds)] += 1
+                self._sums[phase] = self._sums.get(phase, 0.0) + seconds
+            self._loads += sum(timer.loads.values())
+            self._stores += sum(timer.stores.values())
+            if self.slowest is None or timer.total() > self.slowest:
+                self.slowest = timer.total()
+        finally:
+            self._lock.release()
+
+    def getBuckets(self):
+        """Return the labels of the histogram buckets
+        """
+        labels = ['<= %gms' % (bound * 1000) for bound in BUCKETS]
+        labels.append('> %gms' % (BUCKETS[-1] * 1000))
+        return labels
+
+    def getStatistics(self):
+        """Return a mapping of the aggregated timings
+        """
+        self._lock.acquire()
+        try:
+            phases = []
+            for phase in PHASES + ('total',):
+                histogram = self._histograms.get(phase)
+                if histogram is None:
+                    continue
+                count = sum(histogram)
+                phases.append({'phase': phase,
+                               'count': count,
+                               'mean': self._sums[phase] / count,
+                               'histogram': list(histogram),
+                              })
+            return {'since': self.since,
+                    'requests': self.requests,
+                    'failures': self.failures,
+                    'slowest': self.slowest,
+                    'loads': self._loads,
+                    'stores': self._stores,
+                    'phases': phases,
+                   }
+        finally:
+            self._lock.release()
+
+statistics = TimingStatistics()
@@ -0,0 +1,272 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""HTTP server polled with epoll
+
+asyncore.poll asks every dispatcher of the socket map whether it is
+readable or writable and passes all of them to select() on each turn of
+the main loop, so thousands of idle keep-alive connections cost CPU on
+every request, and select() can't watch more than FD_SETSIZE sockets at
+all.
+
+The EpollPoller keeps its epoll registrations between calls.  It only
+asks the dispatchers which had an event, which were touched, or which
+don't know about it (the other servers, the triggers), so an idle
+keep-alive connection costs nothing until its client sends something.
+A dispatcher cooperates by setting 'epoll_aware' and by touching its
+file descriptor whenever its interest may change other than through its
+own events: when it is added to or removed from the socket map, and when
+a worker thread pushes output.  It may also provide 'check_idle(now)',
+which the poller calls every SWEEP_INTERVAL seconds.
+
+zepoll_server and zepoll_channel are the HTTP server and channel of
+HTTPServer cooperating that way.  The server drains its accept queue on
+each event, and the channels close keep-alive connections that were idle
+for 'keep_alive_timeout' seconds.  Requests are still handled by the
+zhttp_handler, published by the PubCore threads and answered through
+ZServerHTTPResponse.
+"""
+
+import asyncore
+from collections import deque
+from errno import EINTR
+import select
+import socket
+import time
+
+from ZServer.HTTPServer import zhttp_channel
+from ZServer.HTTPServer import zhttp_server
+
+available = hasattr(select, 'epoll')
+
+# The number of connections accepted per event on a listening socket
+ACCEPT_BATCH = 64
+
+# The seconds between the calls to 'check_idle'
+SWEEP_INTERVAL = 5.0
+
+
+class EpollPoller:
+    """Polls the dispatchers of an asyncore socket map with epoll
+
+    An instance is called like asyncore.poll.
+    """
+
+    def __init__(self, _time=time.time):
+        self._time = _time
+        self._epoll = None
+        self._map = None
+        # fd -> dispatcher
+        self._objects = {}
+        # fd -> registered event mask, 0 when not registered
+        self._masks = {}
+        # The fds of the dispatchers which aren't epoll aware
+        self._unaware = set()
+        # The fds to look at on the next call, appended from any thread
+        self._touched = deque()
+        self._next_sweep = 0
+
+    def touch(self, fd):
+        """Look at the dispatcher of 'fd' again on the next call
+        """
+        if self._map is not None and fd is not None:
+            self._touched.append(fd)
+
+    def _reset(self, map):
+        if self._epoll is not None:
+            self._epoll.close()
+        self._epoll = select.epoll()
+        self._map = map
+        self._objects.clear()
+        self._masks.clear()
+        self._unaware.clear()
+        self._touched.clear()
+
+    def _forget(self, fd):
+        del self._objects[fd]
+        self._unaware.discard(fd)
+        if self._masks.pop(fd):
+            try:
+                self._epoll.unregister(fd)
+            except (IOError, OSError, ValueError):
+                # The socket was closed, which unregistered it
+                pass
+
+    def _update(self, fd, obj):
+        objects = self._objects
+        if fd in objects and objects[fd] is not obj:
+            # The fd was reused by another dispatcher
+            self._forget(fd)
+        if fd not in objects:
+            objects[fd] = obj
+            self._masks[fd] = 0
+            if not getattr(obj, 'epoll_aware', False):
+                self._unaware.add(fd)
+        mask = 0
+        if obj.readable():
+            mask = select.EPOLLIN | select.EPOLLPRI
+        if obj.writable() and not obj.accepting:
+            mask |= select.EPOLLOUT
+        old = self._masks[fd]
+        if mask == old:
+            return
+        epoll = self._epoll
+        if not mask:
+            epoll.unregister(fd)
+        elif not old:
+            try:
+                epoll.register(fd, mask)
+            except IOError:
+                # Still registered for the socket of a forgotten dispatcher
+                epoll.modify(fd, mask)
+        else:
+            epoll.modify(fd, mask)
+        self._masks[fd] = mask
+
+    def _check(self, fd):
+        obj = self._map.get(fd)
+        if obj is None:
+            if fd in self._objects:
+                self._forget(fd)
+        else:
+            self._update(fd, obj)
+
+    def __call__(self, timeout=0.0, map=None):
+        if map is None:
+            map = asyncore.socket_map
+        if map is not self._map:
+            self._reset(map)
+        objects = self._objects
+
+        check = set(self._unaware)
+        touched = self._touched
+        while touched:
+            check.add(touched.popleft())
+        for fd in check:
+            self._check(fd)
+        # Dispatchers removed from the map were looked at above, so the
+        # map only differs when dispatchers were added without a touch
+        if len(map) != len(objects):
+            for fd in objects.viewkeys() - map.viewkeys():
+                self._forget(fd)
+            for fd in map.viewkeys() - objects.viewkeys():
+                self._update(fd, map[fd])
+
+        try:
+            events = self._epoll.poll(timeout)
+        except (IOError, select.error), e:
+            if e.args[0] != EINTR:
+                raise
+            events = ()
+        for fd, flags in events:
+            obj = map.get(fd)
+            if obj is None:
+                continue
+            asyncore.readwrite(obj, flags)
+            touched.append(fd)
+
+        now = self._time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + SWEEP_INTERVAL
+            for fd, obj in objects.items():
+                if fd not in self._unaware:
+                    check_idle = getattr(obj, 'check_idle', None)
+                    if check_idle is not None:
+                        check_idle(now)
+
+
+_poller = None
+
+def getPoller():
+    """Return the poller of the main loop
+    """
+    global _poller
+    if _poller is None:
+        _poller = EpollPoller()
+    return _poller
+
+def install():
+    """Make the main loop poll its sockets with epoll
+    """
+    import Lifetime
+    Lifetime.setPoller(getPoller())
+
+
+class zepoll_channel(zhttp_channel):
+    "http channel polled with epoll"
+
+    epoll_aware = True
+    keep_alive_timeout = 300
+
+    def __init__(self, server, conn, addr):
+        self.last_activity = time.time()
+        zhttp_channel.__init__(self, server, conn, addr)
+        self.keep_alive_timeout = server.keep_alive_timeout
+
+    def add_channel(self, map=None):
+        zhttp_channel.add_channel(self, map)
+        getPoller().touch(self._fileno)
+
+    def del_channel(self, map=None):
+        fd = self._fileno
+        zhttp_channel.del_channel(self, map)
+        getPoller().touch(fd)
+
+    def push(self, producer, send=1):
+        # Worker threads push the response, making the channel writable
+        zhttp_channel.push(self, producer, send)
+        getPoller().touch(self._fileno)
+
+    push_with_producer = push
+
+    def handle_read(self):
+        self.last_activity = time.time()
+        zhttp_channel.handle_read(self)
+
+    def done(self):
+        self.last_activity = time.time()
+        zhttp_channel.done(self)
+
+    def check_idle(self, now):
+        "close the connection if it was kept alive for too long"
+        if (self.keep_alive_timeout and
+            now - self.last_activity > self.keep_alive_timeout and
+            not self.working and not self.queue and
+            self.current_request is None and not self.in_buffer and
+            not self.producer_fifo):
+            self.close()
+
+
+class zepoll_server(zhttp_server):
+    "http server polled with epoll"
+
+    channel_class = zepoll_channel
+    keep_alive_timeout = 300
+
+    def handle_accept(self):
+        # Accept the connections waiting in the listen queue
+        from ZServer import CONNECTION_LIMIT
+        for i in range(ACCEPT_BATCH):
+            if len(asyncore.socket_map) >= CONNECTION_LIMIT:
+                break
+            try:
+                pair = self.accept()
+            except socket.error:
+                self.log_info('warning: server accept() threw an exception',
+                              'warning')
+                break
+            if pair is None:
+                # EWOULDBLOCK, the queue is empty
+                break
+            self.total_clients.increment()
+            conn, addr = pair
+            self.channel_class(self, conn, addr)
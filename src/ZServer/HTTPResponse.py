@@ -64,10 +64,13 @@ class ZServerHTTPResponse(HTTPResponse):
 
     def __str__(self):
         if self._wrote:
+            data = self._finishStreamCompression()
             if self._chunking:
+                if data:
+                    return '%x\r\n%s\r\n0\r\n\r\n' % (len(data), data)
                 return '0\r\n\r\n'
             else:
-                return ''
+                return data
 
         headers = self.headers
         body = self.body
@@ -181,9 +184,11 @@ class ZServerHTTPResponse(HTTPResponse):
                 except: pass
 
             self._streaming = 1
+            self._startStreamCompression()
             stdout.write(str(self))
             self._wrote = 1
 
+        data = self._compressStream(data)
         if not data: return
 
         if self._chunking:
@@ -38,7 +38,9 @@ import posixpath
 import thread
 import time
 import socket
+import _socket
 from cStringIO import StringIO
+from errno import EAGAIN, EINVAL, ENOSYS, EWOULDBLOCK
 
 from PubCore import handle
 from HTTPResponse import make_response
@@ -57,6 +59,7 @@ from asyncore import compact_traceback, dispatcher
 
 from ZServer import ZOPE_VERSION, ZSERVER_VERSION
 from ZServer import requestCloseOnExec
+from ZServer.Producers import sendfile
 import DebugLogger
 from medusa import logger
 
@@ -365,6 +368,38 @@ class zhttp_channel(http_channel):
 
     push_with_producer=push
 
+    # the most bytes passed to one sendfile() call
+    sendfile_size = 1<<24
+
+    def initiate_send(self):
+        # Let the kernel send files, unless the socket does more than TCP
+        if (sendfile is not None and self.producer_fifo and self.connected
+            and type(self.socket) in (socket.socket, _socket.socket)):
+            first = self.producer_fifo_first()
+            get_range = getattr(first, 'sendfile_range', None)
+            info = get_range is not None and get_range()
+            if info:
+                fileno, offset, size = info
+                try:
+                    sent = sendfile(self.socket.fileno(), fileno, offset,
+                                    min(size, self.sendfile_size))
+                except (OSError, IOError), why:
+                    if why.args[0] in (EAGAIN, EWOULDBLOCK):
+                        return
+                    if why.args[0] not in (EINVAL, ENOSYS):
+                        self.handle_error()
+                        return
+                    # sendfile can't send this file, read it instead
+                    first.sendfile_range = None
+                    sent = 0
+                if sent:
+                    first.sent(sent)
+                    self.server.bytes_out.increment(sent)
+                    if sent == size:
+                        self.producer_fifo_pop()
+                    return
+        return http_channel.initiate_send(self)
+
     def clean_shutdown_control(self,phase,time_in_this_phase):
         if phase==3:
             # This is the shutdown phase where we are trying to finish processing
@@ -12,11 +12,55 @@
 ##############################################################################
 """
 ZServer pipe utils. These producers basically function as callbacks.
+
+Producers of the content of a file also provide 'sendfile_range()',
+returning the descriptor, offset and size of what is left to produce,
+or None, and 'sent(size)', which skips what was sent; channels use them
+to send the file with sendfile() instead of reading it in Python.
 """
 
 import asyncore
+import os
 import sys
 
+from ZPublisher.Iterators import filestream_iterator
+
+
+def _getSendfile():
+    # Return a function like os.sendfile(out_fd, in_fd, offset, count),
+    # or None if the platform has none
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+    try:
+        from sendfile import sendfile
+        return sendfile
+    except ImportError:
+        pass
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        _sendfile = libc.sendfile64
+    except (ImportError, OSError, AttributeError):
+        return None
+    _sendfile.argtypes = (ctypes.c_int, ctypes.c_int,
+                          ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t)
+    _sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        sent = _sendfile(out_fd, in_fd, ctypes.byref(ctypes.c_int64(offset)),
+                         count)
+        if sent < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return sent
+
+    return sendfile
+
+sendfile = _getSendfile()
+
+
 class ShutdownProducer:
     "shuts down medusa"
     def more(self):
@@ -57,6 +101,7 @@ class file_part_producer:
         self.lock=lock
         self.start=start
         self.end=end
+        self._flushed=0
 
     def more(self):
         end=self.end
@@ -87,6 +132,30 @@ class file_part_producer:
 
         return data
 
+    def sendfile_range(self):
+        if not self.end or self.start >= self.end:
+            return None
+        try:
+            fileno = self.file.fileno()
+        except AttributeError:
+            return None
+        if not self._flushed:
+            # our part was written before we were created, but may
+            # still be buffered
+            self.lock.acquire()
+            try:
+                self.file.flush()
+            finally:
+                self.lock.release()
+            self._flushed = 1
+        return fileno, self.start, self.end - self.start
+
+    def sent(self, size):
+        self.start = self.start + size
+        if self.start >= self.end:
+            self.end = 0
+            del self.file
+
 class file_close_producer:
     def __init__(self, file):
         self.file=file
@@ -99,11 +168,36 @@ class file_close_producer:
         return ''
 
 class iterator_producer:
+    # the offset and end of what is left of a file iterator once
+    # sendfile_range was called
+    _offset = None
+    _end = None
+
     def __init__(self, iterator):
         self.iterator = iterator
 
     def more(self):
+        if self._offset is not None:
+            self.iterator.seek(self._offset)
+            self._offset = None
         try:
             return self.iterator.next()
         except StopIteration:
             return ''
+
+    def sendfile_range(self):
+        iterator = self.iterator
+        if (not isinstance(iterator, filestream_iterator) or
+            iterator.__class__.next.im_func is not
+            filestream_iterator.next.im_func):
+            # not all the rest of the file is produced
+            return None
+        if self._offset is None:
+            self._offset = iterator.tell()
+            self._end = len(iterator)
+        if self._offset >= self._end:
+            return None
+        return iterator.fileno(), self._offset, self._end - self._offset
+
+    def sent(self, size):
+        self._offset = self._offset + size
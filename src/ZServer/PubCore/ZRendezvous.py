@@ -11,91 +11,233 @@
 #
 ##############################################################################
 
+from collections import deque
+import logging
 import thread
+import threading
+import time
+
 from ZServerPublisher import ZServerPublisher
 
+LOG = logging.getLogger('ZServerPublisher')
+
+# Request classes, in order of priority. Cheap requests for static assets
+# are served first, so they don't wait behind slow pages, followed by
+# the requests received on the management port, so the site can still be
+# administered under load.
+STATIC = 'static'
+MANAGE = 'manage'
+DEFAULT = 'default'
+REQUEST_CLASSES = (STATIC, MANAGE, DEFAULT)
+
+STATIC_PREFIXES = ('++resource++', 'misc_', 'p_')
+STATIC_EXTENSIONS = ('css', 'js', 'png', 'gif', 'jpg', 'jpeg', 'ico', 'svg',
+                     'woff', 'ttf', 'eot', 'map')
+
+# Published module names which can be answered with a 503 response when
+# their queue is full. Other protocols (FTP, clock server) are never shed.
+SHEDDABLE = ('Zope2', 'Zope2WSGI')
+
+SHED_MESSAGE = ('<html><head><title>Service Unavailable</title></head>'
+                '<body><p>The server is currently overloaded, please try '
+                'again later.</p></body></html>')
+
+
+def classify_request(name, request, management_port=None):
+    """Return the request class for a queued request.
+
+    'request' is either a ZPublisher request or, for WSGI, the environ.
+    Requests received by the server listening on 'management_port' are
+    management requests.
+    """
+    if name == 'Zope2':
+        environ = getattr(request, 'environ', {})
+    elif name == 'Zope2WSGI':
+        environ = request
+    else:
+        return DEFAULT
+    # SERVER_PORT is set by the server which received the request, not by
+    # the client, so only the clients reaching that port can jump the queue
+    if (management_port and
+        environ.get('SERVER_PORT') == str(management_port)):
+        return MANAGE
+    path = environ.get('PATH_INFO', '')
+    steps = [step for step in path.split('/') if step]
+    if not steps:
+        return DEFAULT
+    if steps[0] in STATIC_PREFIXES or steps[-1].startswith('++resource++'):
+        return STATIC
+    if steps[-1].rsplit('.', 1)[-1].lower() in STATIC_EXTENSIONS:
+        return STATIC
+    return DEFAULT
+
+
 class ZRendevous:
     """Worker thread pool
 
+    Requests are queued per request class (see 'classify_request') and
+    the worker threads always take the oldest request of the highest
+    priority class that has any. A request which has been waiting for
+    more than 'max_wait' seconds is served before anything else, so lower
+    classes can't be starved by a flood of higher priority requests.
+
+    If 'management_port' is set, the requests received on that port are
+    served before the other requests except static resources.
+
+    If 'max_depth' is set, a request arriving while the queue of its class
+    already holds that many requests is rejected with a '503 Service
+    Unavailable' response instead of being queued.
+
     For better or worse, we hide locking sementics from the worker
     threads.  The worker threads do no locking.
-    """ 
-
-    def __init__(self, n=1):
-        sync = thread.allocate_lock()
-        self._acquire = sync.acquire
-        self._release = sync.release
-        pool = []
-        self._lists = (
-            pool, # Collection of locks representing threads are not
-                  # waiting for work to do
-            [],   # Request queue
-            [],   # Pool of locks representing threads that are
-                  # waiting (ready) for work to do.
-            )
-        
-        self._acquire() # callers will block
+    """
+
+    def __init__(self, n=1, max_depth=0, max_wait=5.0, management_port=None,
+                 classify=classify_request, _now=time.time):
+        self._cond = threading.Condition(threading.Lock())
+        self._queues = dict([(c, deque()) for c in REQUEST_CLASSES])
+        self._stats = dict([(c, _QueueStats()) for c in REQUEST_CLASSES])
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.management_port = management_port
+        self._classify = classify
+        self._now = _now
+        while n > 0:
+            thread.start_new_thread(ZServerPublisher, (self.accept,))
+            n = n - 1
+
+    def accept(self):
+        """Return a request from the request queues
+
+        If no requests are queued, then block until there is one.
+        """
+        cond = self._cond
+        cond.acquire()
         try:
-            while n > 0:
-                l = thread.allocate_lock()
-                l.acquire()
-                pool.append(l)
-                thread.start_new_thread(ZServerPublisher,
-                                        (self.accept,))
-                n = n-1
+            while True:
+                klass = self._next_class()
+                if klass is not None:
+                    break
+                cond.wait()
+            queued, name, request, response = self._queues[klass].popleft()
+            self._stats[klass].accepted(self._now() - queued)
+            return name, request, response
         finally:
-            self._release() # let callers through now
+            cond.release()
 
-    def accept(self):
-        """Return a request from the request queue
+    def _next_class(self):
+        # Must be called with the lock held
+        queues = self._queues
+        oldest = None
+        for klass in REQUEST_CLASSES:
+            queue = queues[klass]
+            if queue and (oldest is None or queue[0][0] < oldest[0]):
+                oldest = queue[0][0], klass
+        if oldest is None:
+            return None
+        if self.max_wait and self._now() - oldest[0] > self.max_wait:
+            return oldest[1]
+        for klass in REQUEST_CLASSES:
+            if queues[klass]:
+                return klass
 
-        If no requests are in the request queue, then block until
-        there is nonw.
+    def handle(self, name, request, response):
+        """Queue a request for processing
         """
-        self._acquire() # prevent other calls to protect data structures
+        klass = self._classify(name, request, self.management_port)
+        if klass not in self._queues:
+            klass = DEFAULT
+        cond = self._cond
+        cond.acquire()
         try:
-            pool, requests, ready = self._lists
-            while not requests:
-                # There are no requests in the queue. Wait until there are.
+            queue = self._queues[klass]
+            if (self.max_depth and len(queue) >= self.max_depth and
+                name in SHEDDABLE):
+                self._stats[klass].rejected += 1
+                shed = True
+            else:
+                queue.append((self._now(), name, request, response))
+                self._stats[klass].queued(len(queue))
+                shed = False
+                # Wake up one of the threads waiting for work
+                cond.notify()
+        finally:
+            cond.release()
+        if shed:
+            self._shed(name, request, response)
 
-                # This thread is waiting, to remove a lock from the collection
-                # of locks corresponding to threads not waiting for work
-                l = pool.pop()
+    def _shed(self, name, request, response):
+        """Answer a request with '503 Service Unavailable'
+        """
+        try:
+            if name == 'Zope2WSGI':
+                write = response('503 Service Unavailable',
+                                 [('Content-Type', 'text/html'),
+                                  ('Content-Length', str(len(SHED_MESSAGE))),
+                                  ('Retry-After', '1')])
+                write(SHED_MESSAGE)
+                request['wsgi.output']._close = 1
+                request['wsgi.output'].close()
+            else:
+                response.setStatus(503)
+                response.setHeader('Retry-After', '1')
+                response.setHeader('Content-Type', 'text/html')
+                response.setBody(SHED_MESSAGE)
+                response.outputBody()
+                response._finish()
+        except:
+            LOG.error('exception while rejecting a request', exc_info=True)
 
-                # And add it to the collection of locks representing threads
-                # ready and waiting for work.
-                ready.append(l)
-                self._release() # allow other calls
+    def queueLength(self):
+        """Return the number of requests waiting for a worker thread
+        """
+        return sum([len(q) for q in self._queues.values()])
 
-                # Now try to acquire the lock. We will block until
-                # someone calls handle to queue a request and releases the lock
-                # which handle finds in the ready queue
-                l.acquire()
+    def getStatistics(self):
+        """Return a mapping of request class to queue statistics
+        """
+        cond = self._cond
+        cond.acquire()
+        try:
+            result = {}
+            for klass in REQUEST_CLASSES:
+                info = self._stats[klass].info()
+                info['queued'] = len(self._queues[klass])
+                result[klass] = info
+            return result
+        finally:
+            cond.release()
 
-                self._acquire() # prevent calls so we can update
-                                # not waiting pool
-                pool.append(l)
 
-            # return the *first* request
-            return requests.pop(0)
+class _QueueStats:
+    """Counters for one request class
+    """
 
-        finally:
-            self._release() # allow calls
+    def __init__(self):
+        self.handled = 0
+        self.rejected = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
 
-    def handle(self, name, request, response):
-        """Queue a request for processing
-        """
-        self._acquire() # prevent other calls to protect data structs
-        try:
-            pool, requests, ready = self._lists
-            # queue request
-            requests.append((name, request, response))
-            if ready:
-                # If any threads are ready and waiting for work
-                # then remove one of the locks from the ready pool
-                # and release it, letting the waiting thread go forward
-                # and consume the request
-                ready.pop().release()
+    def queued(self, length):
+        if length > self.max_queued:
+            self.max_queued = length
 
-        finally:
-            self._release()
+    def accepted(self, wait):
+        self.handled += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def info(self):
+        if self.handled:
+            mean_wait = self.total_wait / self.handled
+        else:
+            mean_wait = 0.0
+        return {'handled': self.handled,
+                'rejected': self.rejected,
+                'max_queued': self.max_queued,
+                'mean_wait': mean_wait,
+                'max_wait': self.max_wait,
+               }
@@ -14,12 +14,20 @@
 import ZRendezvous
 
 _handle=None
+_pool=None
 _n=1
+_max_depth=0
+_max_wait=5.0
+_management_port=None
 
 def handle(*args, **kw):
-    global _handle
+    global _handle, _pool
 
-    if _handle is None: _handle=ZRendezvous.ZRendevous(_n).handle
+    if _handle is None:
+        _pool=ZRendezvous.ZRendevous(_n, max_depth=_max_depth,
+                                     max_wait=_max_wait,
+                                     management_port=_management_port)
+        _handle=_pool.handle
 
     return apply(_handle, args, kw)
 
@@ -30,3 +38,38 @@ def setNumberOfThreads(n):
     _n=n
     global setNumberOfThreads
     del setNumberOfThreads
+
+def setMaxQueueDepth(n):
+    """Set the number of requests queued per request class before new
+    requests of that class are rejected (0 means unlimited).
+    """
+    global _max_depth
+    _max_depth=n
+    if _pool is not None:
+        _pool.max_depth=n
+
+def setMaxQueueWait(seconds):
+    """Set the number of seconds after which a queued request is served
+    before requests of higher priority classes (0 means never).
+    """
+    global _max_wait
+    _max_wait=seconds
+    if _pool is not None:
+        _pool.max_wait=seconds
+
+def setManagementPort(port):
+    """Set the port of the HTTP server whose requests are served as
+    management requests (None means there is none).
+    """
+    global _management_port
+    _management_port=port
+    if _pool is not None:
+        _pool.management_port=port
+
+def getQueueStatistics():
+    """Return the queue statistics of the worker thread pool, or an empty
+    mapping if no request has been handled yet.
+    """
+    if _pool is None:
+        return {}
+    return _pool.getStatistics()
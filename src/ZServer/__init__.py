@@ -43,6 +43,9 @@ from PCGIServer import PCGIServer
 from FCGIServer import FCGIServer
 from FTPServer import FTPServer
 from PubCore import setNumberOfThreads
+from PubCore import setMaxQueueDepth
+from PubCore import setMaxQueueWait
+from PubCore import setManagementPort
 from medusa.monitor import secure_monitor_server
 
 ### end declarations
@@ -97,6 +97,26 @@ class HTTPServerFactory(ServerFactory):
             return HTTPServer.zhttp_handler(self.module, '', self.cgienv)
 
 
+class EpollHTTPServerFactory(HTTPServerFactory):
+
+    def __init__(self, section):
+        from ZServer import EpollHTTPServer
+        if not EpollHTTPServer.available:
+            raise ZConfig.ConfigurationError(
+                "The 'epoll-http-server' section needs epoll, "
+                "which is not available on this platform")
+        HTTPServerFactory.__init__(self, section)
+        self.server_class = EpollHTTPServer.zepoll_server
+        self.keep_alive_timeout = section.keep_alive_timeout
+
+    def create(self):
+        from ZServer import EpollHTTPServer
+        server = HTTPServerFactory.create(self)
+        server.keep_alive_timeout = self.keep_alive_timeout
+        EpollHTTPServer.install()
+        return server
+
+
 class WebDAVSourceServerFactory(HTTPServerFactory):
 
     def __init__(self, section):
@@ -134,6 +134,33 @@ class ZServerConfigurationTestCase(BaseTest, WarningInterceptor):
         self.assertEqual(server.port, 9381)
         server.close()
 
+    def test_epoll_http_factory(self):
+        import asyncore
+        import Lifetime
+        from ZServer import EpollHTTPServer
+        if not EpollHTTPServer.available:
+            return
+        factory = self.load_factory("""\
+            <epoll-http-server>
+              address 81
+              keep-alive-timeout 30
+            </epoll-http-server>
+            """)
+        self.assert_(isinstance(factory,
+                                ZServer.datatypes.EpollHTTPServerFactory))
+        self.assertEqual(factory.port, 81)
+        self.assertEqual(factory.keep_alive_timeout, 30)
+        self.check_prepare(factory)
+        try:
+            server = factory.create()
+            self.assert_(isinstance(server, EpollHTTPServer.zepoll_server))
+            self.assertEqual(server.port, 9381)
+            self.assertEqual(server.keep_alive_timeout, 30)
+            self.assert_(Lifetime._poll is EpollHTTPServer.getPoller())
+            server.close()
+        finally:
+            Lifetime.setPoller(asyncore.poll)
+
     def test_http_over_ipv6(self):
         factory = self.load_factory("""\
             <http-server>
@@ -0,0 +1,241 @@
+import asyncore
+import socket
+import unittest
+
+from ZServer import EpollHTTPServer
+
+
+class CountingDispatcher(asyncore.dispatcher):
+
+    epoll_aware = False
+
+    def __init__(self, sock, map):
+        asyncore.dispatcher.__init__(self, sock, map)
+        self.asked = 0
+        self.received = []
+        self.output = ''
+
+    def readable(self):
+        self.asked += 1
+        return True
+
+    def writable(self):
+        return bool(self.output)
+
+    def handle_read(self):
+        data = self.recv(1024)
+        if data:
+            self.received.append(data)
+
+    def handle_write(self):
+        sent = self.send(self.output)
+        self.output = self.output[sent:]
+
+
+class AwareDispatcher(CountingDispatcher):
+
+    epoll_aware = True
+
+
+class EpollPollerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.map = {}
+        self.clients = []
+
+    def tearDown(self):
+        for obj in self.map.values():
+            obj.close()
+        for sock in self.clients:
+            sock.close()
+
+    def _makeOne(self):
+        from ZServer.EpollHTTPServer import EpollPoller
+        self.now = 1000.0
+        return EpollPoller(_time=lambda: self.now)
+
+    def _connect(self, factory=CountingDispatcher):
+        client, server = socket.socketpair()
+        self.clients.append(client)
+        return client, factory(server, self.map)
+
+    def test_reads(self):
+        poller = self._makeOne()
+        client, obj = self._connect()
+        poller(0, self.map)
+        self.assertEqual(obj.received, [])
+        client.send('hello')
+        poller(1, self.map)
+        self.assertEqual(obj.received, ['hello'])
+
+    def test_writes(self):
+        poller = self._makeOne()
+        client, obj = self._connect()
+        poller(0, self.map)
+        obj.output = 'hello'
+        poller(0, self.map)
+        self.assertEqual(client.recv(1024), 'hello')
+
+    def test_idle_aware_dispatchers_are_not_asked(self):
+        poller = self._makeOne()
+        client, unaware = self._connect()
+        client, aware = self._connect(AwareDispatcher)
+        for i in range(5):
+            poller(0, self.map)
+        self.assertEqual(unaware.asked, 5)
+        self.assertEqual(aware.asked, 1)
+        client.send('hello')
+        poller(1, self.map)
+        poller(0, self.map)
+        self.assertEqual(aware.received, ['hello'])
+        self.assertEqual(aware.asked, 2)
+
+    def test_touch(self):
+        poller = self._makeOne()
+        client, aware = self._connect(AwareDispatcher)
+        poller(0, self.map)
+        aware.output = 'hello'
+        poller(0, self.map)
+        self.assertEqual(aware.output, 'hello')
+        poller.touch(aware._fileno)
+        poller(0, self.map)
+        self.assertEqual(client.recv(1024), 'hello')
+
+    def test_closed_dispatchers_are_forgotten(self):
+        poller = self._makeOne()
+        client, obj = self._connect()
+        poller(0, self.map)
+        fd = obj._fileno
+        obj.close()
+        poller(0, self.map)
+        self.failIf(fd in poller._objects)
+        self.failIf(fd in poller._unaware)
+
+    def test_reused_fd(self):
+        poller = self._makeOne()
+        client, old = self._connect(AwareDispatcher)
+        poller(0, self.map)
+        fd = old._fileno
+        old.close()
+        client.close()
+        client, new = self._connect(AwareDispatcher)
+        self.assertEqual(new._fileno, fd)
+        # the dispatcher replaced another one with the same fd
+        poller.touch(fd)
+        poller(0, self.map)
+        client.send('hello')
+        poller(1, self.map)
+        self.assertEqual(new.received, ['hello'])
+
+    def test_check_idle(self):
+        poller = self._makeOne()
+        client, aware = self._connect(AwareDispatcher)
+        checked = []
+        aware.check_idle = checked.append
+        poller(0, self.map)
+        self.assertEqual(checked, [1000.0])
+        self.now += 1
+        poller(0, self.map)
+        self.assertEqual(checked, [1000.0])
+        self.now += EpollHTTPServer.SWEEP_INTERVAL
+        poller(0, self.map)
+        self.assertEqual(len(checked), 2)
+
+
+class Handler:
+
+    def match(self, request):
+        return 1
+
+    def handle_request(self, request):
+        request['Content-Type'] = 'text/plain'
+        request['Content-Length'] = 5
+        request.push('hello')
+        request.done()
+
+
+class EpollHTTPServerTests(unittest.TestCase):
+
+    def setUp(self):
+        from ZServer.AccessLogger import access_logger
+        from ZServer.EpollHTTPServer import EpollPoller
+        self.poller = EpollPoller()
+        self._old_poller = EpollHTTPServer._poller
+        EpollHTTPServer._poller = self.poller
+        self.server = EpollHTTPServer.zepoll_server(
+            '127.0.0.1', 0, logger_object=access_logger)
+        self.server.install_handler(Handler())
+        self.clients = []
+
+    def tearDown(self):
+        for sock in self.clients:
+            sock.close()
+        for obj in asyncore.socket_map.values():
+            if isinstance(obj, EpollHTTPServer.zepoll_channel):
+                obj.close()
+        self.server.close()
+        EpollHTTPServer._poller = self._old_poller
+
+    def _connect(self):
+        client = socket.create_connection(('127.0.0.1',
+                                           self.server.server_port))
+        client.settimeout(5)
+        self.clients.append(client)
+        return client
+
+    def _channels(self):
+        return [obj for obj in asyncore.socket_map.values()
+                if isinstance(obj, EpollHTTPServer.zepoll_channel)]
+
+    def _request(self, client):
+        client.send('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = ''
+        for i in range(20):
+            self.poller(0.1, asyncore.socket_map)
+            client.setblocking(0)
+            try:
+                response += client.recv(4096)
+            except socket.error:
+                pass
+            if response.endswith('hello'):
+                break
+        return response
+
+    def test_keep_alive(self):
+        client = self._connect()
+        response = self._request(client)
+        self.failUnless(response.startswith('HTTP/1.1 200'), response)
+        self.failUnless(response.endswith('\r\n\r\nhello'), response)
+        self.assertEqual(self._request(client), response)
+        self.assertEqual(len(self._channels()), 1)
+
+    def test_accept_queue_is_drained(self):
+        for i in range(3):
+            self._connect()
+        for i in range(5):
+            self.poller(0.1, asyncore.socket_map)
+            if len(self._channels()) == 3:
+                break
+        self.assertEqual(len(self._channels()), 3)
+
+    def test_idle_connections_are_closed(self):
+        self.server.keep_alive_timeout = 60
+        client = self._connect()
+        self._request(client)
+        # the exhausted producer is dropped on the next write event
+        self.poller(0.1, asyncore.socket_map)
+        channel, = self._channels()
+        self.failIf(channel.producer_fifo)
+        channel.check_idle(channel.last_activity + 30)
+        self.failIf(channel.closed)
+        channel.check_idle(channel.last_activity + 61)
+        self.failUnless(channel.closed)
+        self.assertEqual(self._channels(), [])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    if EpollHTTPServer.available:
+        suite.addTest(unittest.makeSuite(EpollPollerTests))
+        suite.addTest(unittest.makeSuite(EpollHTTPServerTests))
+    return suite
@@ -0,0 +1,176 @@
+import errno
+import os
+import socket
+import tempfile
+import thread
+import unittest
+
+
+class FilePartProducerTests(unittest.TestCase):
+
+    def _makeOne(self, file, start, end):
+        from ZServer.Producers import file_part_producer
+        return file_part_producer(file, thread.allocate_lock(), start, end)
+
+    def test_more(self):
+        t = tempfile.TemporaryFile()
+        t.write('x' * 10 + 'y' * 100000)
+        producer = self._makeOne(t, 10, 100010)
+        self.assertEqual(producer.more(), 'y' * (1 << 16))
+        self.assertEqual(producer.more(), 'y' * (100000 - (1 << 16)))
+        self.assertEqual(producer.more(), '')
+
+    def test_sendfile_range(self):
+        t = tempfile.TemporaryFile()
+        t.write('x' * 10 + 'y' * 100)
+        producer = self._makeOne(t, 10, 110)
+        fileno, offset, size = producer.sendfile_range()
+        self.assertEqual((fileno, offset, size), (t.fileno(), 10, 100))
+        # the buffered data was flushed
+        self.assertEqual(os.fstat(fileno).st_size, 110)
+        producer.sent(60)
+        self.assertEqual(producer.sendfile_range(), (t.fileno(), 70, 40))
+        producer.sent(40)
+        self.assertEqual(producer.sendfile_range(), None)
+        self.assertEqual(producer.more(), '')
+
+    def test_no_file(self):
+        from StringIO import StringIO
+        producer = self._makeOne(StringIO('abc'), 0, 3)
+        self.assertEqual(producer.sendfile_range(), None)
+        self.assertEqual(producer.more(), 'abc')
+
+
+class IteratorProducerTests(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, 'abcdef')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _makeOne(self, iterator):
+        from ZServer.Producers import iterator_producer
+        return iterator_producer(iterator)
+
+    def test_sendfile_range(self):
+        from ZPublisher.Iterators import filestream_iterator
+        iterator = filestream_iterator(self.path, 'rb', streamsize=2)
+        producer = self._makeOne(iterator)
+        self.assertEqual(producer.more(), 'ab')
+        self.assertEqual(producer.sendfile_range(),
+                         (iterator.fileno(), 2, 4))
+        producer.sent(1)
+        self.assertEqual(producer.sendfile_range(),
+                         (iterator.fileno(), 3, 3))
+        # falls back to reading where sendfile stopped
+        self.assertEqual(producer.more(), 'de')
+        self.assertEqual(producer.sendfile_range(),
+                         (iterator.fileno(), 5, 1))
+        producer.sent(1)
+        self.assertEqual(producer.sendfile_range(), None)
+        self.assertEqual(producer.more(), '')
+
+    def test_not_a_file(self):
+        producer = self._makeOne(iter(['abc']))
+        self.assertEqual(producer.sendfile_range(), None)
+
+    def test_range_iterator(self):
+        from ZPublisher.Iterators import filestream_iterator
+
+        class range_iterator(filestream_iterator):
+            def next(self):
+                return filestream_iterator.next(self)[:1]
+
+        producer = self._makeOne(range_iterator(self.path, 'rb'))
+        self.assertEqual(producer.sendfile_range(), None)
+
+
+class DummyServer:
+
+    def __init__(self):
+        from ZServer.medusa.counter import counter
+        self.bytes_out = counter()
+
+
+class ChannelSendfileTests(unittest.TestCase):
+
+    def setUp(self):
+        from ZServer import HTTPServer
+        self.map = {}
+        self.client, conn = socket.socketpair()
+        self.channel = HTTPServer.zhttp_channel(DummyServer(), conn, None)
+        self.channel.del_channel()
+        self.calls = []
+        self._old_sendfile = HTTPServer.sendfile
+
+    def tearDown(self):
+        from ZServer import HTTPServer
+        HTTPServer.sendfile = self._old_sendfile
+        self.channel.close()
+        self.client.close()
+
+    def _useSendfile(self, error=None):
+        from ZServer import HTTPServer
+
+        def sendfile(out_fd, in_fd, offset, count):
+            self.calls.append((offset, count))
+            if error is not None:
+                raise OSError(error, os.strerror(error))
+            return self._old_sendfile(out_fd, in_fd, offset, count)
+
+        HTTPServer.sendfile = sendfile
+
+    def _send(self, *producers):
+        for producer in producers:
+            self.channel.push(producer, 0)
+        received = ''
+        while self.channel.producer_fifo:
+            self.channel.initiate_send()
+            self.client.setblocking(0)
+            try:
+                received += self.client.recv(1 << 20)
+            except socket.error:
+                pass
+        return received
+
+    def _fileProducer(self, data):
+        from ZServer.Producers import file_part_producer
+        t = tempfile.TemporaryFile()
+        t.write(data)
+        return file_part_producer(t, thread.allocate_lock(), 0, len(data))
+
+    def test_sendfile(self):
+        from ZServer.Producers import sendfile
+        if sendfile is None:
+            return
+        self._useSendfile()
+        received = self._send('head', self._fileProducer('x' * 1000), 'tail')
+        self.assertEqual(received, 'head' + 'x' * 1000 + 'tail')
+        self.assertEqual(self.calls, [(0, 1000)])
+        self.assertEqual(self.channel.server.bytes_out.as_long(), 1008)
+
+    def test_sendfile_unsupported(self):
+        from ZServer.Producers import sendfile
+        if sendfile is None:
+            return
+        self._useSendfile(errno.EINVAL)
+        received = self._send(self._fileProducer('x' * 1000))
+        self.assertEqual(received, 'x' * 1000)
+        self.assertEqual(self.calls, [(0, 1000)])
+
+    def test_no_sendfile(self):
+        from ZServer import HTTPServer
+        HTTPServer.sendfile = None
+        received = self._send(self._fileProducer('x' * 1000))
+        self.assertEqual(received, 'x' * 1000)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(FilePartProducerTests))
+    suite.addTest(unittest.makeSuite(IteratorProducerTests))
+    suite.addTest(unittest.makeSuite(ChannelSendfileTests))
+    return suite
@@ -0,0 +1,209 @@
+##############################################################################
+#
+# Copyright (c) 2011 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Tests for the ZServer worker thread pool."""
+
+import unittest
+
+
+class ClassifyRequestTests(unittest.TestCase):
+
+    def _callFUT(self, name, request, management_port=None):
+        from ZServer.PubCore.ZRendezvous import classify_request
+        return classify_request(name, request, management_port)
+
+    def _request(self, path, **environ):
+        return DummyRequest(PATH_INFO=path, **environ)
+
+    def test_default(self):
+        self.assertEqual(self._callFUT('Zope2', self._request('/')),
+                         'default')
+        self.assertEqual(self._callFUT('Zope2', self._request('/a/b')),
+                         'default')
+
+    def test_management_port(self):
+        for path in ('/', '/a/manage_main', '/a/page'):
+            self.assertEqual(
+                self._callFUT('Zope2', self._request(path, SERVER_PORT='8081'),
+                              8081),
+                'manage')
+
+    def test_other_port(self):
+        self.assertEqual(
+            self._callFUT('Zope2', self._request('/a/manage_main',
+                                                 SERVER_PORT='8080'), 8081),
+            'default')
+
+    def test_no_management_port(self):
+        self.assertEqual(
+            self._callFUT('Zope2', self._request('/a/manage_main',
+                                                 SERVER_PORT='8080')),
+            'default')
+
+    def test_forged_credentials(self):
+        # Headers sent by the client don't make a management request
+        self.assertEqual(
+            self._callFUT('Zope2', self._request(
+                '/manage_main', SERVER_PORT='8080',
+                HTTP_AUTHORIZATION='Basic x'), 8081),
+            'default')
+
+    def test_static(self):
+        for path in ('/misc_/OFSP/Folder_icon.gif', '/p_/logo',
+                     '/a/++resource++zmi/style.css', '/a/b/script.js'):
+            self.assertEqual(self._callFUT('Zope2', self._request(path)),
+                             'static')
+
+    def test_wsgi_environ(self):
+        environ = {'PATH_INFO': '/manage', 'SERVER_PORT': '8081'}
+        self.assertEqual(self._callFUT('Zope2WSGI', environ, 8081), 'manage')
+
+    def test_other_protocols(self):
+        self.assertEqual(self._callFUT('Zope2FTP', object()), 'default')
+
+
+class ZRendevousTests(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from ZServer.PubCore.ZRendezvous import ZRendevous
+        self.now = 1000.0
+        # Don't start any worker threads, the tests call accept directly.
+        return ZRendevous(0, _now=lambda: self.now, **kw)
+
+    def _handle(self, pool, path, name='Zope2', **environ):
+        request = DummyRequest(PATH_INFO=path, **environ)
+        response = DummyResponse()
+        pool.handle(name, request, response)
+        return request, response
+
+    def test_fifo_within_class(self):
+        pool = self._makeOne()
+        one, _ = self._handle(pool, '/one')
+        two, _ = self._handle(pool, '/two')
+        self.assertEqual(pool.queueLength(), 2)
+        self.assertTrue(pool.accept()[1] is one)
+        self.assertTrue(pool.accept()[1] is two)
+        self.assertEqual(pool.queueLength(), 0)
+
+    def test_priorities(self):
+        pool = self._makeOne(management_port=8081)
+        page, _ = self._handle(pool, '/page')
+        manage, _ = self._handle(pool, '/manage_main', SERVER_PORT='8081')
+        static, _ = self._handle(pool, '/style.css')
+        self.assertTrue(pool.accept()[1] is static)
+        self.assertTrue(pool.accept()[1] is manage)
+        self.assertTrue(pool.accept()[1] is page)
+
+    def test_starved_request_goes_first(self):
+        pool = self._makeOne(max_wait=2.0)
+        page, _ = self._handle(pool, '/page')
+        self.now += 3
+        static, _ = self._handle(pool, '/style.css')
+        self.assertTrue(pool.accept()[1] is page)
+        self.assertTrue(pool.accept()[1] is static)
+
+    def test_sheds_load_when_queue_full(self):
+        pool = self._makeOne(max_depth=1)
+        self._handle(pool, '/one')
+        request, response = self._handle(pool, '/two')
+        self.assertEqual(response.status, 503)
+        self.assertTrue(response._finished)
+        # Other classes have queues of their own
+        request, response = self._handle(pool, '/style.css')
+        self.assertEqual(response.status, None)
+        self.assertEqual(pool.queueLength(), 2)
+        stats = pool.getStatistics()
+        self.assertEqual(stats['default']['rejected'], 1)
+        self.assertEqual(stats['default']['queued'], 1)
+        self.assertEqual(stats['static']['rejected'], 0)
+
+    def test_sheds_wsgi_load(self):
+        pool = self._makeOne(max_depth=1)
+        pool.handle('Zope2WSGI', {'PATH_INFO': '/one'}, None)
+        output = DummyOutput()
+        environ = {'PATH_INFO': '/two', 'wsgi.output': output}
+        pool.handle('Zope2WSGI', environ, output.start_response)
+        self.assertEqual(output.status, '503 Service Unavailable')
+        self.assertTrue(output.closed)
+
+    def test_does_not_shed_other_protocols(self):
+        pool = self._makeOne(max_depth=1)
+        self._handle(pool, '/one', name='Zope2FTP')
+        request, response = self._handle(pool, '/two', name='Zope2FTP')
+        self.assertEqual(response.status, None)
+        self.assertEqual(pool.queueLength(), 2)
+
+    def test_statistics_wait_times(self):
+        pool = self._makeOne()
+        self._handle(pool, '/one')
+        self._handle(pool, '/two')
+        self.now += 2
+        pool.accept()
+        self.now += 2
+        pool.accept()
+        stats = pool.getStatistics()['default']
+        self.assertEqual(stats['handled'], 2)
+        self.assertEqual(stats['max_queued'], 2)
+        self.assertEqual(stats['max_wait'], 4.0)
+        self.assertEqual(stats['mean_wait'], 3.0)
+
+
+class DummyRequest:
+
+    def __init__(self, **environ):
+        self.environ = environ
+
+
+class DummyResponse:
+    status = None
+    _finished = False
+
+    def __init__(self):
+        self.headers = {}
+
+    def setStatus(self, status):
+        self.status = status
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def setBody(self, body):
+        self.body = body
+
+    def outputBody(self):
+        pass
+
+    def _finish(self):
+        self._finished = True
+
+
+class DummyOutput:
+    status = None
+    closed = False
+    _close = 0
+
+    def start_response(self, status, headers):
+        self.status = status
+        return self.write
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(ClassifyRequestTests),
+        unittest.makeSuite(ZRendevousTests),
+    ))
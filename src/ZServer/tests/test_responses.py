@@ -279,6 +279,31 @@ class ZServerHTTPResponseTestCase(unittest.TestCase):
         response.addHeader('foo', 'bar')
         self.assertTrue('Foo: bar' in str(response))
 
+    def testStreamingCompressedChunked(self):
+        import zlib
+        channel = DummyChannel()
+        response = ZServerHTTPResponse(stdout=channel)
+        response._http_version = '1.1'
+        response._http_connection = 'keep-alive'
+        response.setHeader('content-type', 'text/plain')
+        response.enableHTTPCompression({'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response.write('datachunk1' * 100)
+        response.write('datachunk2' * 100)
+        response.outputBody()
+        headers, body = channel.all().split('\r\n\r\n', 1)
+        self.assertTrue('Transfer-Encoding: chunked' in headers)
+        self.assertTrue('Content-Encoding: gzip' in headers)
+        data = []
+        while body:
+            size, body = body.split('\r\n', 1)
+            size = int(size, 16)
+            data.append(body[:size])
+            self.assertEqual(body[size:size+2], '\r\n')
+            body = body[size+2:]
+        self.assertEqual(data[-1], '')
+        self.assertEqual(zlib.decompress(''.join(data), 16 + zlib.MAX_WBITS),
+                         'datachunk1' * 100 + 'datachunk2' * 100)
+
 class _Reporter(object):
     def __init__(self): self.events = []
     def __call__(self, event): self.events.append(event)
@@ -37,6 +37,7 @@ from App.config import getConfiguration
 from zExceptions import Redirect
 from zExceptions import Unauthorized
 from ZODB.POSException import ConflictError
+from ZPublisher.retrypolicy import policy as retry_policy
 from zope.component import queryMultiAdapter
 from zope.event import notify
 from zope.processlifetime import DatabaseOpened
@@ -121,7 +122,7 @@ def startup():
     Globals.BobobaseName = DB.getName()
 
     if DB.getActivityMonitor() is None:
-        from ZODB.ActivityMonitor import ActivityMonitor
+        from App.ActivityMonitor import ActivityMonitor
         DB.setActivityMonitor(ActivityMonitor())
 
     Globals.DB = DB
@@ -187,19 +188,21 @@ class ZPublisherExceptionHook:
 
     def logConflicts(self, v, REQUEST):
         self.conflict_errors += 1
+        object_conflicts = retry_policy.recordConflict(REQUEST, v)
         level = getattr(getConfiguration(), 'conflict_error_log_level', 0)
         if not self.conflict_logger.isEnabledFor(level):
             return False
         self.conflict_logger.log(
             level,
             "%s at %s: %s (%d conflicts (%d unresolved) "
-            "since startup at %s)",
+            "since startup at %s, %d on this object)",
             v.__class__.__name__,
             REQUEST.get('PATH_INFO', '<unknown>'),
             v,
             self.conflict_errors,
             self.unresolved_conflict_errors,
-            startup_time)
+            startup_time,
+            object_conflicts)
         return True
 
     def __call__(self, published, REQUEST, t, v, traceback):
@@ -154,6 +154,24 @@ class ExceptionHookTest(ExceptionHookTestCase):
         self.call_no_exc(hook, None, None, f)
         self.assertEquals(hook.conflict_errors, 2)
 
+    def testConflictErrorIsRecordedOnRequest(self):
+        from ZODB.POSException import ConflictError
+        from ZPublisher.retrypolicy import policy
+        class Conflicting(object):
+            _p_oid = '\0' * 7 + '\1'
+        def f():
+            raise ConflictError(object=Conflicting())
+        request = self._makeRequest()
+        policy.reset()
+        hook = self._makeOne()
+        self.call_no_exc(hook, None, request, f)
+        self.call_no_exc(hook, None, request, f)
+        self.assertEquals(request.conflict_history, (Conflicting._p_oid,) * 2)
+        objects = policy.getStatistics()['objects']
+        self.assertEquals(objects[0]['oid'], '0x01')
+        self.assertEquals(objects[0]['count'], 2)
+        policy.reset()
+
     def testRetryRaisesOriginalException(self):
         from ZPublisher import Retry
         class CustomException(Exception):
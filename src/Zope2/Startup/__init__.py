@@ -182,6 +182,9 @@ class ZopeStarter:
         # Increase the number of threads
         import ZServer
         ZServer.setNumberOfThreads(self.cfg.zserver_threads)
+        ZServer.setMaxQueueDepth(self.cfg.zserver_max_queue_depth)
+        ZServer.setMaxQueueWait(self.cfg.zserver_max_queue_wait)
+        ZServer.setManagementPort(self.cfg.zserver_management_port)
         ZServer.CONNECTION_LIMIT = self.cfg.max_listen_sockets
 
     def serverListen(self):
@@ -182,7 +182,7 @@ class ZopeDatabase(ZODBDatabase):
             DB.klass = self.config.connection_class
         if self.config.class_factory is not None:
             DB.classFactory = self.config.class_factory
-        from ZODB.ActivityMonitor import ActivityMonitor
+        from App.ActivityMonitor import ActivityMonitor
         DB.setActivityMonitor(ActivityMonitor())
         return DB
 
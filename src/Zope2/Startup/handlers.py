@@ -145,6 +145,13 @@ def root_handler(config):
         from ZPublisher import HTTPRequest
         HTTPRequest.retry_max_count = config.max_conflict_retries
 
+    # set up the ConflictError retry policy
+    from ZPublisher.retrypolicy import policy
+    policy.base_delay = config.conflict_retry_delay
+    policy.max_delay = config.conflict_retry_max_delay
+    policy.budget = config.conflict_retry_budget
+    policy.serialize_after = config.conflict_serialize_after
+
 
 def handleConfig(config, multihandler):
     handlers = {}
@@ -182,6 +182,27 @@ class ZopeStarterTestCase(LoggingTestHelper, unittest.TestCase):
         from ZServer.PubCore import _n
         self.assertEqual(_n, 10)
 
+    def testZServerMaxQueueDepth(self):
+        conf = self.load_config_text("""
+            instancehome <<INSTANCE_HOME>>
+           zserver-max-queue-depth 50""")
+        self.assertEqual(conf.zserver_max_queue_depth, 50)
+
+    def testZServerMaxQueueWait(self):
+        conf = self.load_config_text("""
+            instancehome <<INSTANCE_HOME>>
+           zserver-max-queue-wait 2.5""")
+        self.assertEqual(conf.zserver_max_queue_wait, 2.5)
+
+    def testZServerManagementPort(self):
+        conf = self.load_config_text("""
+            instancehome <<INSTANCE_HOME>>""")
+        self.assertEqual(conf.zserver_management_port, None)
+        conf = self.load_config_text("""
+            instancehome <<INSTANCE_HOME>>
+           zserver-management-port 8081""")
+        self.assertEqual(conf.zserver_management_port, 8081)
+
     def testSetupServers(self):
         # We generate a random port number to test against, so that multiple
         # test runs of this at the same time can succeed
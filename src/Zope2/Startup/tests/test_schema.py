@@ -198,6 +198,26 @@ class StartupTestCase(unittest.TestCase):
             """)
         self.assertEqual(conf.max_conflict_retries, 15)
 
+    def test_conflict_retry_policy(self):
+        conf, handler = self.load_config_text("""\
+            instancehome <<INSTANCE_HOME>>
+            """)
+        self.assertEqual(conf.conflict_retry_delay, 1.0)
+        self.assertEqual(conf.conflict_retry_max_delay, 10.0)
+        self.assertEqual(conf.conflict_retry_budget, 0)
+        self.assertEqual(conf.conflict_serialize_after, 2)
+        conf, handler = self.load_config_text("""\
+            instancehome <<INSTANCE_HOME>>
+            conflict-retry-delay 0.1
+            conflict-retry-max-delay 2
+            conflict-retry-budget 100
+            conflict-serialize-after 0
+            """)
+        self.assertEqual(conf.conflict_retry_delay, 0.1)
+        self.assertEqual(conf.conflict_retry_max_delay, 2.0)
+        self.assertEqual(conf.conflict_retry_budget, 100)
+        self.assertEqual(conf.conflict_serialize_after, 0)
+
     def test_default_zpublisher_encoding(self):
         conf, dummy = self.load_config_text("""\
             instancehome <<INSTANCE_HOME>>
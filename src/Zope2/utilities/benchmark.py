@@ -0,0 +1,511 @@
+##############################################################################
+#
+# Copyright (c) 2002 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+"""HTTP benchmark of the ZServer front ends
+
+Starts Zope in this process on a DemoStorage or a FileStorage, adds the
+objects the scenarios need, serves it with one of the ZServer HTTP front
+ends and drives it with concurrent HTTP/1.1 clients.  For each scenario
+the requests per second and the 50th, 95th and 99th percentile of the
+latency are reported.
+"""
+
+import getopt
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# The user the scenarios authenticate as
+USER = 'bench'
+PASSWORD = 'bench'
+
+PAGE = """\
+<html><body><table>
+<tr tal:repeat="i python:range(100)">
+<td tal:content="i">1</td><td tal:content="template/title_or_id">id</td>
+</tr>
+</table></body></html>
+"""
+
+FORM = """\
+<p tal:content="python:len(request.form)">0</p>
+"""
+
+PROPFIND = """\
+<?xml version="1.0" encoding="utf-8"?>
+<propfind xmlns="DAV:"><allprop/></propfind>
+"""
+
+SERVERS = ('http', 'wsgi', 'epoll')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class Scenario:
+    """A request sent over and over
+    """
+
+    def __init__(self, name, method, path, headers=(), body=''):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.headers = list(headers)
+        self.body = body
+
+    def request(self, host, keep_alive=True):
+        """Return the request as sent on the wire
+        """
+        lines = ['%s %s HTTP/1.1' % (self.method, self.path),
+                 'Host: %s' % host]
+        lines.extend(self.headers)
+        if self.body or self.method == 'POST':
+            lines.append('Content-Length: %d' % len(self.body))
+        if not keep_alive:
+            lines.append('Connection: close')
+        return '\r\n'.join(lines) + '\r\n\r\n' + self.body
+
+
+def getScenarios():
+    """Return the scenarios by name
+    """
+    auth = 'Authorization: Basic %s' % (
+        '%s:%s' % (USER, PASSWORD)).encode('base64').strip()
+    form = '&'.join(['field%d=value%d' % (i, i) for i in range(20)])
+    scenarios = [
+        Scenario('image', 'GET', '/p_/zopelogo_png'),
+        Scenario('template', 'GET', '/bench/page'),
+        Scenario('file', 'GET', '/bench/file'),
+        Scenario('post', 'POST', '/bench/form',
+                 ['Content-Type: application/x-www-form-urlencoded'], form),
+        Scenario('propfind', 'PROPFIND', '/bench/',
+                 [auth, 'Depth: 1', 'Content-Type: text/xml'], PROPFIND),
+        ]
+    return dict([(scenario.name, scenario) for scenario in scenarios])
+
+SCENARIOS = ('image', 'template', 'file', 'post', 'propfind')
+
+
+class HTTPConnection:
+    """A client connection which reads the responses to pipelined requests
+    """
+
+    def __init__(self, address, timeout=30.0):
+        self.address = address
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = ''
+
+    def open(self):
+        self.sock = socket.create_connection(self.address, self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = ''
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, data):
+        if self.sock is None:
+            self.open()
+        self.sock.sendall(data)
+
+    def _recv(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionClosed
+        self.buffer += data
+
+    def _readLine(self):
+        while 1:
+            i = self.buffer.find('\r\n')
+            if i >= 0:
+                line = self.buffer[:i]
+                self.buffer = self.buffer[i + 2:]
+                return line
+            self._recv()
+
+    def _skip(self, size):
+        while size > 0:
+            if not self.buffer:
+                self._recv()
+            n = min(size, len(self.buffer))
+            self.buffer = self.buffer[n:]
+            size -= n
+
+    def _skipToEnd(self):
+        size = len(self.buffer)
+        self.buffer = ''
+        try:
+            while 1:
+                self._recv()
+                size += len(self.buffer)
+                self.buffer = ''
+        except ConnectionClosed:
+            return size
+
+    def readResponse(self):
+        """Read a response, returning its status and body size
+        """
+        version, status = self._readLine().split(None, 2)[:2]
+        headers = {}
+        while 1:
+            line = self._readLine()
+            if not line:
+                break
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        close = connection == 'close' or (
+            version == 'HTTP/1.0' and connection != 'keep-alive')
+        if 'content-length' in headers:
+            size = int(headers['content-length'])
+            self._skip(size)
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            size = 0
+            while 1:
+                chunk = int(self._readLine().split(';')[0], 16)
+                if not chunk:
+                    break
+                self._skip(chunk)
+                self._readLine()
+                size += chunk
+            while self._readLine():
+                # trailers
+                pass
+        else:
+            size = self._skipToEnd()
+            close = True
+        if close:
+            self.close()
+        return int(status), size
+
+
+def percentile(values, p):
+    """Return the 'p' percentile of the sorted 'values' (nearest rank)
+    """
+    if not values:
+        return 0.0
+    rank = int(len(values) * p / 100.0 + 0.5)
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Result:
+    """The measurements of a scenario
+    """
+
+    def __init__(self, name, latencies, errors, elapsed):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies) + self.errors
+
+    @property
+    def rate(self):
+        if not self.elapsed:
+            return 0.0
+        return len(self.latencies) / self.elapsed
+
+    def percentile(self, p):
+        return percentile(self.latencies, p)
+
+    def asDict(self):
+        return {'scenario': self.name,
+                'requests': self.requests,
+                'errors': self.errors,
+                'seconds': self.elapsed,
+                'requests_per_second': self.rate,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+               }
+
+
+class Client:
+    """Sends 'requests' requests of a scenario over 'concurrency'
+    connections, 'pipeline' requests at a time per connection
+    """
+
+    def __init__(self, address, concurrency=10, keep_alive=True,
+                 pipeline=1, timeout=30.0):
+        self.address = address
+        self.concurrency = concurrency
+        self.keep_alive = keep_alive
+        self.pipeline = keep_alive and max(pipeline, 1) or 1
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _take(self):
+        self._lock.acquire()
+        try:
+            n = min(self.pipeline, self._left)
+            self._left -= n
+            return n
+        finally:
+            self._lock.release()
+
+    def _work(self, data, latencies, errors):
+        conn = HTTPConnection(self.address, self.timeout)
+        try:
+            while 1:
+                n = self._take()
+                if not n:
+                    break
+                start = time.time()
+                done = 0
+                try:
+                    conn.send(data * n)
+                    while done < n:
+                        status, size = conn.readResponse()
+                        done += 1
+                        if status >= 400:
+                            errors.append(status)
+                        else:
+                            latencies.append(time.time() - start)
+                        if conn.sock is None and done < n:
+                            # closed before answering the pipelined requests
+                            raise ConnectionClosed
+                except (socket.error, ConnectionClosed, ValueError):
+                    errors.extend([None] * (n - done))
+                    conn.close()
+                if not self.keep_alive:
+                    conn.close()
+        finally:
+            conn.close()
+
+    def run(self, scenario, requests):
+        """Return the Result of sending 'requests' requests
+        """
+        data = scenario.request('%s:%s' % self.address, self.keep_alive)
+        latencies = []
+        errors = []
+        self._left = requests
+        threads = [threading.Thread(target=self._work,
+                                    args=(data, latencies, errors))
+                   for i in range(self.concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return Result(scenario.name, latencies, len(errors),
+                      time.time() - start)
+
+
+def setupFixture(app, file_size=1 << 20):
+    """Add the objects the scenarios use to 'app'
+    """
+    import transaction
+    from OFS.Folder import manage_addFolder
+    from OFS.Image import manage_addFile
+    from Products.PageTemplates.ZopePageTemplate \
+        import manage_addPageTemplate
+    manage_addFolder(app, 'bench')
+    folder = app.bench
+    manage_addPageTemplate(folder, 'page', text=PAGE)
+    manage_addPageTemplate(folder, 'form', text=FORM)
+    manage_addFile(folder, 'file', file='x' * file_size,
+                   content_type='application/octet-stream')
+    for i in range(20):
+        manage_addFolder(folder, 'folder%d' % i)
+    app.acl_users._doAddUser(USER, PASSWORD, ['Manager'], [])
+    transaction.commit()
+
+
+def startZope(storage='demo', file_size=1 << 20):
+    """Start Zope in this process with the objects of the scenarios
+    """
+    if storage == 'file':
+        os.environ['TEST_FILESTORAGE'] = os.path.join(
+            tempfile.mkdtemp(), 'Data.fs')
+    elif storage != 'demo':
+        raise BenchmarkError('Unknown storage %r' % storage)
+    # Imported for its side effect: it installs Zope2 with the demo or
+    # TEST_FILESTORAGE database and the standard products
+    from Testing import ZopeTestCase
+    import Zope2
+    app = Zope2.app()
+    try:
+        setupFixture(app, file_size)
+    finally:
+        app._p_jar.close()
+
+
+def startServer(kind='http', threads=4, host='127.0.0.1'):
+    """Serve Zope with a ZServer front end in a thread
+
+    Returns the address of the server.
+    """
+    import asyncore
+    from ZServer import setNumberOfThreads
+    from ZServer import HTTPServer
+    from ZServer.AccessLogger import access_logger
+    setNumberOfThreads(threads)
+    poll = asyncore.poll
+    if kind == 'http':
+        server = HTTPServer.zhttp_server(host, 0, logger_object=access_logger)
+        handler = HTTPServer.zhttp_handler('Zope2', '')
+    elif kind == 'wsgi':
+        server = HTTPServer.zhttp_server(host, 0, logger_object=access_logger)
+        handler = HTTPServer.zwsgi_handler('Zope2', '')
+    elif kind == 'epoll':
+        from ZServer import EpollHTTPServer
+        if not EpollHTTPServer.available:
+            raise BenchmarkError('epoll is not available on this platform')
+        server = EpollHTTPServer.zepoll_server(
+            host, 0, logger_object=access_logger)
+        handler = HTTPServer.zhttp_handler('Zope2', '')
+        poll = EpollHTTPServer.getPoller()
+    else:
+        raise BenchmarkError('Unknown server %r' % kind)
+    server.install_handler(handler)
+
+    def loop():
+        while asyncore.socket_map:
+            poll(30.0, asyncore.socket_map)
+
+    thread = threading.Thread(target=loop)
+    thread.setDaemon(True)
+    thread.start()
+    return host, server.server_port
+
+
+def report(results, out=sys.stdout):
+    print >> out, '%-10s %8s %7s %9s %9s %9s %9s' % (
+        'scenario', 'requests', 'errors', 'req/s',
+        'p50 ms', 'p95 ms', 'p99 ms')
+    for result in results:
+        print >> out, '%-10s %8d %7d %9.1f %9.2f %9.2f %9.2f' % (
+            result.name, result.requests, result.errors, result.rate,
+            result.percentile(50) * 1000, result.percentile(95) * 1000,
+            result.percentile(99) * 1000)
+
+
+def usage():
+    return """\
+Usage: %s [options] [scenario ...]
+
+Benchmarks a ZServer front end, running the scenarios
+(%s) or all of them.
+
+Options:
+
+  -s, --server KIND       front end: %s (default http)
+  -c, --concurrency N     number of client connections (default 10)
+  -n, --requests N        requests per scenario (default 1000)
+  -p, --pipeline DEPTH    requests sent at once per connection (default 1)
+  -k, --no-keep-alive     use a new connection per request
+  -t, --threads N         number of ZServer threads (default 4)
+  -w, --warmup N          requests sent before measuring (default 100)
+  --storage KIND          demo or file (default demo)
+  --file-size BYTES       size of the downloaded file (default 1048576)
+  --json                  print the results as JSON
+""" % (os.path.basename(sys.argv[0]), ', '.join(SCENARIOS),
+       ', '.join(SERVERS))
+
+
+def main(argv=sys.argv):
+    try:
+        opts, args = getopt.getopt(
+            argv[1:], 's:c:n:p:kt:w:h',
+            ['server=', 'concurrency=', 'requests=', 'pipeline=',
+             'no-keep-alive', 'threads=', 'warmup=', 'storage=',
+             'file-size=', 'json', 'help'])
+    except getopt.error, e:
+        print >> sys.stderr, e
+        print >> sys.stderr, usage()
+        sys.exit(2)
+    server = 'http'
+    concurrency = 10
+    requests = 1000
+    pipeline = 1
+    keep_alive = True
+    threads = 4
+    warmup = 100
+    storage = 'demo'
+    file_size = 1 << 20
+    as_json = False
+    try:
+        for opt, value in opts:
+            if opt in ('-h', '--help'):
+                print usage()
+                sys.exit(0)
+            elif opt in ('-s', '--server'):
+                server = value
+            elif opt in ('-c', '--concurrency'):
+                concurrency = int(value)
+            elif opt in ('-n', '--requests'):
+                requests = int(value)
+            elif opt in ('-p', '--pipeline'):
+                pipeline = int(value)
+            elif opt in ('-k', '--no-keep-alive'):
+                keep_alive = False
+            elif opt in ('-t', '--threads'):
+                threads = int(value)
+            elif opt in ('-w', '--warmup'):
+                warmup = int(value)
+            elif opt == '--storage':
+                storage = value
+            elif opt == '--file-size':
+                file_size = int(value)
+            elif opt == '--json':
+                as_json = True
+    except ValueError, e:
+        print >> sys.stderr, e
+        sys.exit(2)
+
+    scenarios = getScenarios()
+    for name in args:
+        if name not in scenarios:
+            print >> sys.stderr, 'Unknown scenario %r' % name
+            sys.exit(2)
+    try:
+        startZope(storage, file_size)
+        address = startServer(server, threads)
+    except BenchmarkError, e:
+        print >> sys.stderr, e
+        sys.exit(2)
+
+    client = Client(address, concurrency, keep_alive, pipeline)
+    results = []
+    for name in args or SCENARIOS:
+        if warmup:
+            client.run(scenarios[name], warmup)
+        results.append(client.run(scenarios[name], requests))
+
+    if as_json:
+        import json
+        print json.dumps({'server': server,
+                          'storage': storage,
+                          'concurrency': concurrency,
+                          'pipeline': client.pipeline,
+                          'keep_alive': keep_alive,
+                          'results': [r.asDict() for r in results],
+                         }, indent=2)
+    else:
+        report(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+##############################################################################
+#
+# Copyright (c) 2010 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE
+#
+##############################################################################
+""" Move the data of the Files and Images of a Zope site into blobs """
+
+import sys
+from Zope2.utilities.finder import ZopeFinder
+
+
+def convertblobs(app, path='', batch_size=100):
+    from OFS.Image import convertToBlobs
+    ob = app
+    if path.strip('/'):
+        ob = app.unrestrictedTraverse(path.strip('/'))
+    return convertToBlobs(ob, batch_size)
+
+
+def main(argv=sys.argv):
+    try:
+        path = argv[1]
+    except IndexError:
+        path = ''
+    try:
+        batch_size = int(argv[2])
+    except IndexError:
+        batch_size = 100
+    except ValueError:
+        print "%s [<path> [<batch size>]]" % argv[0]
+        sys.exit(255)
+    finder = ZopeFinder(argv)
+    finder.filter_warnings()
+    app = finder.get_app()
+    converted = convertblobs(app, path, batch_size)
+    print "%d objects converted." % converted
+
+if __name__ == '__main__':
+    main()
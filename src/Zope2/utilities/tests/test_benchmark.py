@@ -0,0 +1,140 @@
+import socket
+import threading
+import unittest
+
+
+class FakeServer:
+    """Answers each connection with canned data
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.address = self.sock.getsockname()
+        self.received = []
+        self.closed = False
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def serve(self):
+        while 1:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            if self.closed:
+                conn.close()
+                return
+            self.received.append(conn.recv(65536))
+            conn.sendall(self.data)
+            conn.close()
+
+    def close(self):
+        # wake up the thread waiting in accept()
+        self.closed = True
+        socket.create_connection(self.address).close()
+        self.thread.join()
+        self.sock.close()
+
+
+class PercentileTests(unittest.TestCase):
+
+    def test_percentile(self):
+        from Zope2.utilities.benchmark import percentile
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_result(self):
+        from Zope2.utilities.benchmark import Result
+        result = Result('image', [0.3, 0.1, 0.2], 1, 2.0)
+        self.assertEqual(result.requests, 4)
+        self.assertEqual(result.rate, 1.5)
+        self.assertEqual(result.percentile(50), 0.2)
+        self.assertEqual(result.asDict()['p99'], 0.3)
+
+
+class ScenarioTests(unittest.TestCase):
+
+    def test_request(self):
+        from Zope2.utilities.benchmark import Scenario
+        scenario = Scenario('post', 'POST', '/form',
+                            ['Content-Type: text/plain'], 'abc')
+        self.assertEqual(scenario.request('localhost:8080'),
+                         'POST /form HTTP/1.1\r\n'
+                         'Host: localhost:8080\r\n'
+                         'Content-Type: text/plain\r\n'
+                         'Content-Length: 3\r\n\r\nabc')
+        self.failUnless('Connection: close\r\n' in
+                        scenario.request('localhost', keep_alive=False))
+
+    def test_all_scenarios_exist(self):
+        from Zope2.utilities.benchmark import getScenarios
+        from Zope2.utilities.benchmark import SCENARIOS
+        self.assertEqual(sorted(getScenarios().keys()), sorted(SCENARIOS))
+
+
+class HTTPConnectionTests(unittest.TestCase):
+
+    def _makeOne(self, data):
+        from Zope2.utilities.benchmark import HTTPConnection
+        self.server = FakeServer(data)
+        conn = HTTPConnection(self.server.address, timeout=5)
+        conn.send('GET / HTTP/1.1\r\n\r\n')
+        return conn
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_pipelined_responses(self):
+        conn = self._makeOne(
+            'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello'
+            'HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\n\r\n'
+            '3\r\nabc\r\n2;x=y\r\nde\r\n0\r\n\r\n'
+            'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nrest')
+        self.assertEqual(conn.readResponse(), (200, 5))
+        self.assertEqual(conn.readResponse(), (404, 5))
+        self.failIf(conn.sock is None)
+        self.assertEqual(conn.readResponse(), (200, 4))
+        self.failUnless(conn.sock is None)
+        self.assertEqual(self.server.received, ['GET / HTTP/1.1\r\n\r\n'])
+
+    def test_closed_early(self):
+        from Zope2.utilities.benchmark import ConnectionClosed
+        conn = self._makeOne('HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhe')
+        self.assertRaises(ConnectionClosed, conn.readResponse)
+        conn.close()
+
+
+class ClientTests(unittest.TestCase):
+
+    def test_errors_are_counted(self):
+        from Zope2.utilities.benchmark import Client
+        from Zope2.utilities.benchmark import Scenario
+        server = FakeServer('HTTP/1.1 500 Error\r\nContent-Length: 0\r\n\r\n'
+                            'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        try:
+            client = Client(server.address, concurrency=2, pipeline=3)
+            result = client.run(Scenario('x', 'GET', '/'), 6)
+        finally:
+            server.close()
+        # each connection gets one error, one success and is closed
+        # before the third response
+        self.assertEqual(result.requests, 6)
+        self.assertEqual(len(result.latencies), 2)
+        self.assertEqual(result.errors, 4)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(PercentileTests))
+    suite.addTest(unittest.makeSuite(ScenarioTests))
+    suite.addTest(unittest.makeSuite(HTTPConnectionTests))
+    suite.addTest(unittest.makeSuite(ClientTests))
+    return suite
@@ -295,17 +295,28 @@ class Resource(Base, LockableItem):
         from webdav.davcmds import PropFind
         self.dav__init(REQUEST, RESPONSE)
         cmd = PropFind(REQUEST)
-        result = cmd.apply(self)
         # work around MSIE DAV bug for creation and modified date
-        if (REQUEST.get_header('User-Agent') ==
-            'Microsoft Data Access Internet Publishing Provider DAV 1.1'):
-            result = result.replace('<n:getlastmodified xmlns:n="DAV:">',
-                                    '<n:getlastmodified xmlns:n="DAV:" xmlns:b="urn:uuid:c2f41010-65b3-11d1-a29f-00aa00c14882/" b:dt="dateTime.rfc1123">')
-            result = result.replace('<n:creationdate xmlns:n="DAV:">',
-                                    '<n:creationdate xmlns:n="DAV:" xmlns:b="urn:uuid:c2f41010-65b3-11d1-a29f-00aa00c14882/" b:dt="dateTime.tz">')
+        msie = (REQUEST.get_header('User-Agent') ==
+            'Microsoft Data Access Internet Publishing Provider DAV 1.1')
         RESPONSE.setStatus(207)
         RESPONSE.setHeader('Content-Type', 'text/xml; charset="utf-8"')
-        RESPONSE.setBody(result)
+        # A multistatus too big for one part is streamed as the objects
+        # are visited, the parts ending with a response element.
+        parts = cmd.iterate(self)
+        result = parts.next()
+        streaming = 0
+        for part in parts:
+            if msie:
+                result = msie_dates(result)
+            RESPONSE.write(result)
+            streaming = 1
+            result = part
+        if msie:
+            result = msie_dates(result)
+        if streaming:
+            RESPONSE.write(result)
+        else:
+            RESPONSE.setBody(result)
         return RESPONSE
 
     security.declareProtected(manage_properties, 'PROPPATCH')
@@ -667,3 +678,11 @@ class Resource(Base, LockableItem):
         return []
 
 InitializeClass(Resource)
+
+
+def msie_dates(result):
+    result = result.replace('<n:getlastmodified xmlns:n="DAV:">',
+                            '<n:getlastmodified xmlns:n="DAV:" xmlns:b="urn:uuid:c2f41010-65b3-11d1-a29f-00aa00c14882/" b:dt="dateTime.rfc1123">')
+    result = result.replace('<n:creationdate xmlns:n="DAV:">',
+                            '<n:creationdate xmlns:n="DAV:" xmlns:b="urn:uuid:c2f41010-65b3-11d1-a29f-00aa00c14882/" b:dt="dateTime.tz">')
+    return result
@@ -107,13 +107,53 @@ class PropFind:
         if result is None:
             result=StringIO()
             depth=self.depth
-            url=urlfix(self.request['URL'], 'PROPFIND')
-            url=urlbase(url)
-            result.write('<?xml version="1.0" encoding="utf-8"?>\n' \
-                         '<d:multistatus xmlns:d="DAV:">\n')
+            url=self.url()
+            result.write(self.header)
+        for data in self.responses(obj, url, depth):
+            result.write(data)
+        if not top:
+            return result
+        result.write(self.footer)
+
+        return result.getvalue()
+
+    header='<?xml version="1.0" encoding="utf-8"?>\n' \
+           '<d:multistatus xmlns:d="DAV:">\n'
+    footer='</d:multistatus>'
+
+    # The bytes of responses collected before a part of the multistatus
+    # is generated by iterate
+    batch_size=1 << 16
+
+    def url(self):
+        url=urlfix(self.request['URL'], 'PROPFIND')
+        return urlbase(url)
+
+    def iterate(self, obj, batch_size=None):
+        """Generate the multistatus document in parts
+
+        A part holds the responses for batch_size bytes or more, so
+        the document can be sent while the objects are visited.
+        """
+        if batch_size is None:
+            batch_size=self.batch_size
+        batch=[self.header]
+        size=0
+        for data in self.responses(obj, self.url(), self.depth):
+            batch.append(data)
+            size=size+len(data)
+            if size >= batch_size:
+                yield ''.join(batch)
+                batch=[]
+                size=0
+        batch.append(self.footer)
+        yield ''.join(batch)
+
+    def responses(self, obj, url, depth):
+        """Generate the response elements for obj and its subobjects"""
         iscol=isDavCollection(obj)
         if iscol and url[-1] != '/': url=url+'/'
-        result.write('<d:response>\n<d:href>%s</d:href>\n' % safe_quote(url))
+        result=['<d:response>\n<d:href>%s</d:href>\n' % safe_quote(url)]
         if hasattr(aq_base(obj), 'propertysheets'):
             propsets=obj.propertysheets.values()
             obsheets=obj.propertysheets
@@ -124,22 +164,22 @@ class PropFind:
         if self.allprop:
             stats=[]
             for ps in propsets:
-                if hasattr(aq_base(ps), 'dav__allprop'):
+                if _sheetInfo(ps)[0]:
                     stats.append(ps.dav__allprop())
             stats=''.join(stats) or '<d:status>200 OK</d:status>\n'
-            result.write(stats)
+            result.append(stats)
         elif self.propname:
             stats=[]
             for ps in propsets:
-                if hasattr(aq_base(ps), 'dav__propnames'):
+                if _sheetInfo(ps)[1]:
                     stats.append(ps.dav__propnames())
             stats=''.join(stats) or '<d:status>200 OK</d:status>\n'
-            result.write(stats)
+            result.append(stats)
         elif self.propnames:
             rdict={}
             for name, ns in self.propnames:
                 ps=obsheets.get(ns, None)
-                if ps is not None and hasattr(aq_base(ps), 'dav__propstat'):
+                if ps is not None and _sheetInfo(ps)[2]:
                     stat=ps.dav__propstat(name, rdict)
                 else:
                     prop='<n:%s xmlns:n="%s"/>' % (name, ns)
@@ -151,38 +191,61 @@ class PropFind:
             keys=rdict.keys()
             keys.sort()
             for key in keys:
-                result.write('<d:propstat>\n' \
-                             '  <d:prop>\n' \
-                             )
-                map(result.write, rdict[key])
-                result.write('  </d:prop>\n' \
-                             '  <d:status>HTTP/1.1 %s</d:status>\n' \
-                             '</d:propstat>\n' % key
-                             )
+                result.append('<d:propstat>\n' \
+                              '  <d:prop>\n' \
+                              )
+                result.extend(rdict[key])
+                result.append('  </d:prop>\n' \
+                              '  <d:status>HTTP/1.1 %s</d:status>\n' \
+                              '</d:propstat>\n' % key
+                              )
         else:
             raise BadRequest, 'Invalid request'
-        result.write('</d:response>\n')
+        result.append('</d:response>\n')
+        yield ''.join(result)
         if depth in ('1', 'infinity') and iscol:
+            depth = depth=='infinity' and depth or 0
             for ob in obj.listDAVObjects():
-                if hasattr(ob,"meta_type"):
-                    if ob.meta_type=="Broken Because Product is Gone":
-                        continue
-                dflag=hasattr(ob, '_p_changed') and (ob._p_changed == None)
-                if hasattr(ob, '__locknull_resource__'):
+                # Ask the class, which doesn't load a ghost
+                broken, locknull, resource = _classInfo(aq_base(ob))
+                if broken or locknull or not resource:
                     # Do nothing, a null resource shouldn't show up to DAV
-                    if dflag:
-                        ob._p_deactivate()
-                elif hasattr(ob, '__dav_resource__'):
-                    uri = urljoin(url, absattr(ob.getId()))
-                    depth = depth=='infinity' and depth or 0
-                    self.apply(ob, uri, depth, result, top=0)
-                    if dflag:
-                        ob._p_deactivate()
-        if not top:
-            return result
-        result.write('</d:multistatus>')
-
-        return result.getvalue()
+                    continue
+                dflag=hasattr(ob, '_p_changed') and (ob._p_changed == None)
+                uri = urljoin(url, absattr(ob.getId()))
+                for data in self.responses(ob, uri, depth):
+                    yield data
+                if dflag:
+                    ob._p_deactivate()
+
+
+# class -> (broken, lock null resource, DAV resource)
+_class_info={}
+
+def _classInfo(ob):
+    klass=ob.__class__
+    info=_class_info.get(klass)
+    if info is None:
+        info=_class_info[klass]=(
+            getattr(klass, 'meta_type', None)=='Broken Because Product is Gone',
+            hasattr(klass, '__locknull_resource__'),
+            hasattr(klass, '__dav_resource__'),
+            )
+    return info
+
+# property sheet class -> (dav__allprop, dav__propnames, dav__propstat)
+_sheet_info={}
+
+def _sheetInfo(ps):
+    klass=aq_base(ps).__class__
+    info=_sheet_info.get(klass)
+    if info is None:
+        info=_sheet_info[klass]=(
+            hasattr(klass, 'dav__allprop'),
+            hasattr(klass, 'dav__propnames'),
+            hasattr(klass, 'dav__propstat'),
+            )
+    return info
 
 
 class PropPatch:
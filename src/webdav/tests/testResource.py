@@ -204,6 +204,53 @@ class TestResource(unittest.TestCase):
         from webdav.common import Locked
         self.assertRaises(Locked, inst.dav__simpleifhandler, request, response)
 
+    def _propfind(self, batch_size=None, agent=None, body=None):
+        from OFS.Folder import Folder
+        from webdav.davcmds import PropFind
+        environ = {'HTTP_DEPTH': '1', 'REQUEST_METHOD': 'PROPFIND'}
+        if agent:
+            environ['HTTP_USER_AGENT'] = agent
+        request, response = make_request_response(environ)
+        request['URL'] = 'http://foo/folder/PROPFIND'
+        if body is not None:
+            request['BODY'] = body
+        folder = Folder('folder')
+        for i in range(10):
+            folder._setObject('f%d' % i, Folder('f%d' % i), set_owner=0,
+                              suppress_events=True)
+        old_batch_size = PropFind.batch_size
+        if batch_size is not None:
+            PropFind.batch_size = batch_size
+        noSecurityManager()
+        try:
+            folder.PROPFIND(request, response)
+        finally:
+            PropFind.batch_size = old_batch_size
+        return response
+
+    def test_PROPFIND(self):
+        response = self._propfind()
+        self.assertEqual(response.getStatus(), 207)
+        self.assertEqual(response.body.count('<d:response>'), 11)
+        self.assertFalse(response.stdout.getvalue())
+
+    def test_PROPFIND_streaming(self):
+        response = self._propfind(batch_size=1)
+        self.assertEqual(response.body, '')
+        output = response.stdout.getvalue()
+        self.assertTrue(output.startswith('Status: 207'), output)
+        self.assertTrue(output.endswith('</d:multistatus>'), output)
+        self.assertEqual(output.count('<d:response>'), 11)
+
+    def test_PROPFIND_streaming_ms_dates(self):
+        body = ('<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop>'
+                '<d:creationdate/></d:prop></d:propfind>')
+        response = self._propfind(batch_size=1, agent=MS_DAV_AGENT + ' 1.1',
+                                  body=body)
+        output = response.stdout.getvalue()
+        self.assertEqual(output.count('<n:creationdate xmlns:n="DAV:" '
+                                      'xmlns:b='), 11)
+
 
 def test_suite():
     return unittest.TestSuite((
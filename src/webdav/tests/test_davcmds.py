@@ -137,9 +137,88 @@ class TestDeleteCollection(unittest.TestCase):
         self.assertRaises(Locked, cmd.apply, obj, None, sm, '/foo/DELETE')
 
 
+class _DummyRequest(dict):
+
+    def __init__(self, headers, **kw):
+        dict.__init__(self, kw)
+        self.headers = headers
+
+    def get_header(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class TestPropFind(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from webdav.davcmds import PropFind
+
+        return PropFind
+
+    def _makeOne(self, depth='infinity', body=''):
+        request = _DummyRequest({'Depth': depth},
+                                URL='http://example.com/root/PROPFIND',
+                                BODY=body)
+        return self._getTargetClass()(request)
+
+    def _makeTree(self):
+        from OFS.Folder import Folder
+        from OFS.SimpleItem import SimpleItem
+        root = Folder('root')
+        for i in range(5):
+            root._setObject('f%d' % i, Folder('f%d' % i))
+            folder = root._getOb('f%d' % i)
+            folder._setObject('item', SimpleItem('item'))
+        return root
+
+    def test_iterate(self):
+        cmd = self._makeOne()
+        root = self._makeTree()
+        parts = list(cmd.iterate(root, batch_size=1))
+        self.assertEqual(''.join(parts), cmd.apply(root))
+        # the responses for root, its folders and their items
+        self.assertEqual(len(parts), 1 + 5 + 5 + 1)
+        self.assertTrue(parts[0].startswith('<?xml'))
+        for part in parts[:-1]:
+            self.assertTrue(part.endswith('</d:response>\n'), part)
+        self.assertEqual(parts[-1], '</d:multistatus>')
+
+    def test_iterate_one_part(self):
+        cmd = self._makeOne()
+        root = self._makeTree()
+        parts = list(cmd.iterate(root))
+        self.assertEqual(parts, [cmd.apply(root)])
+        self.assertEqual(parts[0].count('<d:response>'), 11)
+
+    def test_depth_1(self):
+        cmd = self._makeOne('1')
+        result = cmd.apply(self._makeTree())
+        self.assertEqual(result.count('<d:response>'), 6)
+        self.assertTrue('<d:href>/root/f0/</d:href>' in result)
+
+    def test_propnames(self):
+        body = ('<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop>'
+                '<d:resourcetype/><d:foo/></d:prop></d:propfind>')
+        cmd = self._makeOne('0', body)
+        result = cmd.apply(self._makeTree())
+        self.assertTrue('<d:status>HTTP/1.1 404 Not Found</d:status>'
+                        in result)
+        self.assertTrue('<n:resourcetype xmlns:n="DAV:"><n:collection/>'
+                        '</n:resourcetype>' in result)
+
+    def test_null_resources_are_skipped(self):
+        from webdav.NullResource import LockNullResource
+        cmd = self._makeOne('1')
+        root = self._makeTree()
+        root._setObject('null', LockNullResource('null'))
+        result = cmd.apply(root)
+        self.assertEqual(result.count('<d:response>'), 6)
+        self.assertFalse('null' in result)
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(TestUnlock),
         unittest.makeSuite(TestPropPatch),
         unittest.makeSuite(TestDeleteCollection),
+        unittest.makeSuite(TestPropFind),
         ))